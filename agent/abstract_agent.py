@@ -26,13 +26,17 @@
 #
 # Class Structure:
 #   Class: AbstractAgent(object)
-#     __init__(dm_file, db_file, cfg_file_name, debug=False)
+#     __init__(dm_file, db_file, net_intf, cfg_file_name, debug=False, shared_agent=None)
+#     get_database()
 #     get_msg_handler()
+#     is_known_controller(endpoint_id)
 #     get_value_change_notif_poller()
 #     set_value_change_notif_poller(poller)
 #     init_subscriptions()
 #     start_listening()
 #     clean_up() :: Abstract Method
+#     _reconcile_subscriptions(path)
+#     _reconcile_subscription(subscription_path)
 #     _get_supported_protocol() :: Abstract Method
 #     _get_notification_sender(notif, controller_id, mtp_path) :: Abstract Method
 #     _get_periodic_notif_handler(agent_id, controller_id, mtp_path,
@@ -40,37 +44,48 @@
 #   Class: BindingListener(threading.Thread)
 #     __init__(thread_name, binding, msg_handler, timeout=15)
 #     run()
-#   Class: AbstractPeriodicNotifHandler(threading.Thread)
-#     __init__(database, thread_name, from_id, to_id, subscription_id, param)
-#     run()
-#     _handle_periodic(notif) :: Abstract Method
-#   Class: AbstractValueChangeNotifPoller(threading.Thread)
-#     __init__(agent_db, poll_duration)
-#     run()
-#     add_param(param, agent_id, controller_id, mtp_param_path, subscription_id)
-#     remove_param(param)
-#     _handle_value_change(param, value, to_id, from_id, subscription_id, mtp_param_path) :: Abstract Method
-#   Class: NotificationSender(threading.Thread)
-#     __init__(self, notif):
-#     run():
+#   Class: RequestProcessor(object)
+#     __init__(msg_handler, resp_cache_size=100)
+#     process(payload, to_addr)
+#   Class: AbstractPeriodicNotifHandler(object)
+#     __init__(database, handler_name, from_id, to_id, subscription_id, param)
+#     set_binding(binding)
+#     get_path()
+#     get_next_notif_time(now)
+#     send_notif()
+#     _handle_periodic_record(serialized_record) :: Abstract Method
 #
 """
 
 
-import time
+import os
+import re
+import math
 import logging
 import threading
 import importlib
+import collections
 import prometheus_client
 
 from agent import utils
 from agent import notify
 from agent import agent_db
+from agent import notif_outbox
+from agent import object_notifier
 from agent import request_handler
+from agent import notif_sender_pool
+from agent import periodic_notif_scheduler
 
 
 GPIO_PIN = "gpio.pin"
 CAMERA_IMAGE_DIR = "camera.image.dir"
+VALUE_CHANGE_BATCH_WINDOW = "value.change.batch.window"
+PERIODIC_NOTIF_MAX_JITTER = "periodic.notif.max.jitter"
+NOTIF_SENDER_POOL_SIZE = "notif.sender.pool.size"
+NOTIF_SENDER_QUEUE_SIZE = "notif.sender.queue.size"
+NOTIF_OUTBOX_FILE = "notif.outbox.file"
+NOTIF_OUTBOX_MAX_ENTRIES = "notif.outbox.max.entries"
+NOTIF_OUTBOX_RETRY_INTERVAL = "notif.outbox.retry.interval"
 
 # pylint: disable-msg=no-value-for-parameter
 INCOMING_REQ_SUMMARY_METRIC = \
@@ -81,55 +96,121 @@ NUM_PROTO_VIOLATIONS_METRIC = \
     prometheus_client.Counter("number_of_proto_violations",
                               "Number of Protocol Violations detected")
 # pylint: disable-msg=no-value-for-parameter
-NUM_VC_PARAMS_GAUGE_METRIC = \
-    prometheus_client.Gauge("number_of_value_change_params",
-                            "Number of ValueChange Parameters being monitored")
-# pylint: disable-msg=no-value-for-parameter
-NUM_VC_NOTIFS_COUNTER_METRIC = \
-    prometheus_client.Counter("number_of_value_change_notifs",
-                              "Number of ValueChange Notifications sent")
+NUM_DUPLICATE_REQS_METRIC = \
+    prometheus_client.Counter("number_of_duplicate_requests",
+                              "Number of duplicate Requests answered with their earlier Response")
+
+MIN_NOTIF_INTERVAL_PARAM = "X_ARRIS-COM_MinNotifInterval"
+
+# Changes within a Subscription, or to these Controller Parameters, re-process the affected Subscriptions
+SUBSCRIPTION_PATH_REGEX = re.compile(r"^(Device\.LocalAgent\.Subscription\.\d+\.)")
+CONTROLLER_PATH_REGEX = re.compile(r"^(Device\.LocalAgent\.Controller\.\d+\.)"
+                                   r"(Enable|EndpointID|MTP\.\d+\.(Enable|Protocol)?)?$")
 
 
 class AbstractAgent:
     """An Abstract USP Agent that can be built upon for a specific binding"""
-    def __init__(self, dm_file, db_file, net_intf, cfg_file_name, debug=False):
-        """Initialize the Abstract Agent"""
+    def __init__(self, dm_file, db_file, net_intf, cfg_file_name, debug=False, shared_agent=None):
+        """Initialize the Abstract Agent
+            - a shared_agent provides the Database and Message Handler instead of loading them, and takes care
+              of the Subscriptions and Notifications; this Agent then only runs its MTP's Bindings"""
         self._service_map = {}
-        self._periodic_handler_list = []
+        self._notif_outbox = None
+        self._notif_sender_pool = None
+        self._periodic_notif_scheduler = None
         self._boot_notif_sender_list = []
         self._cfg_file_name = cfg_file_name
         self._value_change_notif_poller = None
+        self._object_notifier = None
+        self._is_shared = shared_agent is not None
+
+        # Format: { Subscription Path : [ (Remove Function, Remove Args) ] } - what each Subscription added
+        self._subscription_dict = {}
+        self._subscription_lock = threading.RLock()
         self._logger = logging.getLogger(self.__class__.__name__)
 
-        self._db = agent_db.Database(dm_file, db_file, net_intf)
-        self._endpoint_id = self._db.get("Device.LocalAgent.EndpointID")
+        if self._is_shared:
+            self._db = shared_agent.get_database()
+            self._endpoint_id = self._db.get("Device.LocalAgent.EndpointID")
+            self._msg_handler = shared_agent.get_msg_handler()
+        else:
+            self._db = agent_db.Database(dm_file, db_file, net_intf)
+            self._endpoint_id = self._db.get("Device.LocalAgent.EndpointID")
 
-        self._load_services()
-        self._msg_handler = request_handler.UspRequestHandler(self._endpoint_id, self._db,
-                                                              self._service_map, debug)
+            self._load_services()
+            self._msg_handler = request_handler.UspRequestHandler(self._endpoint_id, self._db,
+                                                                  self._service_map, debug)
+
+            default_cfg = {PERIODIC_NOTIF_MAX_JITTER: 5, NOTIF_SENDER_POOL_SIZE: 2, NOTIF_SENDER_QUEUE_SIZE: 1000,
+                           NOTIF_OUTBOX_FILE: os.path.splitext(db_file)[0] + "-outbox.db",
+                           NOTIF_OUTBOX_MAX_ENTRIES: 10000, NOTIF_OUTBOX_RETRY_INTERVAL: 30}
+            cfg_mgr = utils.ConfigMgr(self._cfg_file_name, default_cfg)
+            self._periodic_notif_scheduler = periodic_notif_scheduler.PeriodicNotifScheduler(
+                self._db, float(cfg_mgr.get_cfg_item(PERIODIC_NOTIF_MAX_JITTER)))
+            self._notif_sender_pool = notif_sender_pool.NotificationSenderPool(
+                int(cfg_mgr.get_cfg_item(NOTIF_SENDER_POOL_SIZE)), int(cfg_mgr.get_cfg_item(NOTIF_SENDER_QUEUE_SIZE)))
+
+            # Notifications of Subscriptions with NotifRetry are kept until the Controller sends a NotifyResp
+            self._notif_outbox = notif_outbox.NotificationOutbox(
+                cfg_mgr.get_cfg_item(NOTIF_OUTBOX_FILE), int(cfg_mgr.get_cfg_item(NOTIF_OUTBOX_MAX_ENTRIES)),
+                float(cfg_mgr.get_cfg_item(NOTIF_OUTBOX_RETRY_INTERVAL)))
+            self._msg_handler.set_notify_resp_listener(self._notif_outbox.acknowledge)
+            self._msg_handler.set_operation_complete_listener(self._handle_operation_complete)
+
+    def get_database(self):
+        """Retrieve the Agent's Database"""
+        return self._db
 
     def get_msg_handler(self):
         """Retrieve the Internal Message Handler"""
         return self._msg_handler
 
+    def is_known_controller(self, endpoint_id):
+        """Return True if the Endpoint ID belongs to one of the Device.LocalAgent.Controller instances"""
+        for controller_path in self._db.find_instances("Device.LocalAgent.Controller."):
+            if self._db.get(controller_path + "EndpointID") == endpoint_id:
+                return True
+
+        return False
+
     def get_value_change_notif_poller(self):
         """Retrieve the Value Change Notification Poller"""
         return self._value_change_notif_poller
 
     def set_value_change_notif_poller(self, poller):
-        """Set the Value Change Notification Poller"""
+        """Set the Value Change Notification Poller
+            - value.change.batch.window (milliseconds, 0 disables batching) is how long the Value Changes
+              for a Controller are collected before they are sent together"""
+        cfg_mgr = utils.ConfigMgr(self._cfg_file_name, {VALUE_CHANGE_BATCH_WINDOW: 0})
+        poller.set_batch_window(float(cfg_mgr.get_cfg_item(VALUE_CHANGE_BATCH_WINDOW)) / 1000)
+        poller.set_outbox(self._notif_outbox)
         self._value_change_notif_poller = poller
 
+        # The shared Agent sends the ObjectCreation, ObjectDeletion, and OperationComplete Notifications
+        if not self._is_shared:
+            self._object_notifier = object_notifier.ObjectNotifier(self._db, poller)
+
     def init_subscriptions(self):
-        """Initialize the Subscription Handling"""
+        """Initialize the Subscription Handling
+            - afterwards, changes to the Subscription and Controller Tables only re-process the affected
+              Subscriptions, adding/removing their Notifications without a restart"""
+        if self._is_shared:
+            self._logger.debug("Subscriptions are handled by the shared Agent")
+            return
+
         subscription_instances = self._db.find_instances("Device.LocalAgent.Subscription.")
 
-        for instance in subscription_instances:
-            if self._db.get(instance + "Enable"):
-                self._handle_subscription(instance)
-            else:
-                subscription_id = self._db.get(instance + "ID")
-                self._logger.info("Skipping disabled Subscription [%s]", subscription_id)
+        with self._subscription_lock:
+            for instance in subscription_instances:
+                if self._db.get(instance + "Enable"):
+                    self._handle_subscription(instance)
+                else:
+                    subscription_id = self._db.get(instance + "ID")
+                    self._logger.info("Skipping disabled Subscription [%s]", subscription_id)
+
+        self._db.add_update_listener(self._handle_db_update)
+        self._db.add_insert_listener(self._handle_db_object_change)
+        self._db.add_delete_listener(self._handle_db_object_change)
 
     def start_listening(self, timeout=15):
         """
@@ -137,17 +218,24 @@ class AbstractAgent:
         NOTE: This does not actually listen to any binding, that needs to be done by the
                class that extends the AbstractAgent by extending/overriding this method
         """
-        # Start all of the Boot Notification issuers
+        if self._is_shared:
+            # The shared Agent starts the Notifications for all of its MTPs
+            return
+
+        # Start the Notification Sender Pool, and queue all of the Boot Notifications
+        self._notif_sender_pool.start()
         for boot_notif in self._boot_notif_sender_list:
-            boot_notif.start()
+            self._notif_sender_pool.send(boot_notif)
 
-        # Start all of the Periodic Notification handlers
-        for periodic_handler in self._periodic_handler_list:
-            periodic_handler.start()
+        # Start the Periodic Notification Scheduler Thread, which issues all of the Periodic Notifications
+        self._periodic_notif_scheduler.start()
 
-        # Start the Value Change Notification Poller Thread
+        # Start the Value Change Notification Poller Thread, and the Thread that retries its unacknowledged
+        #  Notifications (including those left in the Outbox by a previous run)
         if self._value_change_notif_poller is not None:
             self._value_change_notif_poller.start()
+            self._object_notifier.start()
+            notif_outbox.OutboxRetryThread(self._notif_outbox, self._value_change_notif_poller.send_record).start()
         else:
             self._logger.warning("ValueChange Notification Poller isn't configured!")
 
@@ -200,9 +288,59 @@ class AbstractAgent:
 
         return target_class
 
+    def _handle_db_update(self, param, value):
+        """Database Update Listener - re-process the Subscriptions affected by the change"""
+        self._reconcile_subscriptions(param)
+
+    def _handle_db_object_change(self, instance_path):
+        """Database Insert/Delete Listener - re-process the Subscriptions affected by the change"""
+        self._reconcile_subscriptions(instance_path)
+
+    def _reconcile_subscriptions(self, path):
+        """Re-process the Subscription that the path is within, or the Subscriptions of the Controller that
+            the path is within if it changes where (or whether) the Controller is notified"""
+        subscription_match = SUBSCRIPTION_PATH_REGEX.match(path)
+        controller_match = CONTROLLER_PATH_REGEX.match(path)
+
+        if subscription_match is not None:
+            self._reconcile_subscription(subscription_match.group(1))
+        elif controller_match is not None:
+            controller_path = controller_match.group(1)
+
+            with self._subscription_lock:
+                for subscription_path in self._db.find_instances("Device.LocalAgent.Subscription."):
+                    if self._db.get(subscription_path + "Recipient") == controller_path:
+                        self._reconcile_subscription(subscription_path)
+
+    def _reconcile_subscription(self, subscription_path):
+        """Remove what the Subscription added, and then handle it again if it still exists and is enabled"""
+        with self._subscription_lock:
+            self._remove_subscription(subscription_path)
+
+            try:
+                if self._db.get(subscription_path + "Enable"):
+                    self._logger.info("Re-processing Subscription [%s] after a change", subscription_path)
+                    self._handle_subscription(subscription_path)
+                else:
+                    self._logger.info("Subscription [%s] is disabled", subscription_path)
+            except agent_db.NoSuchPathError:
+                self._logger.info("Subscription [%s] (or its Controller) no longer exists", subscription_path)
+                self._remove_subscription(subscription_path)
+
+    def _remove_subscription(self, subscription_path):
+        """Remove the Boot Notifications, Periodic Notifications, and ValueChange Parameters that were added
+            for the Subscription"""
+        for remove_func, remove_args in self._subscription_dict.pop(subscription_path, []):
+            remove_func(*remove_args)
+
+    def _add_subscription_item(self, subscription_path, remove_func, *remove_args):
+        """Keep track of something added for the Subscription, along with how to remove it"""
+        self._subscription_dict.setdefault(subscription_path, []).append((remove_func, remove_args))
+
     def _handle_subscription(self, subscription_path):
         """Handle a Subscription object"""
-        supported_notifs = ["Event", "ValueChange"]
+        supported_notifs = ["Event", "ValueChange", object_notifier.OBJECT_CREATION, object_notifier.OBJECT_DELETION,
+                            object_notifier.OPERATION_COMPLETE]
         subscription_id = self._db.get(subscription_path + "ID")
         notif_type = self._db.get(subscription_path + "NotifType")
         controller_path = self._db.get(subscription_path + "Recipient")
@@ -219,6 +357,9 @@ class AbstractAgent:
                             self._handle_event(subscription_path, controller_id, mtp_path, subscription_id)
                         elif notif_type == "ValueChange":
                             self._handle_value_change(subscription_path, controller_id, mtp_path, subscription_id)
+                        else:
+                            self._handle_object_notif(subscription_path, controller_id, mtp_path, subscription_id,
+                                                      notif_type)
                 else:
                     self._logger.warning(
                         "Skipping Subscription [%s] because there are no enabled/matching MTPs for the controller",
@@ -254,7 +395,7 @@ class AbstractAgent:
         for event_path in ref_event_list:
             if event_path:
                 if event_path.strip() == supported_boot_event:
-                    self._handle_boot(controller_id, mtp_path, subscription_id)
+                    self._handle_boot(subscription_path, controller_id, mtp_path, subscription_id)
                 elif event_path.strip() == supported_periodic_event:
                     self._handle_periodic(subscription_path, controller_id, mtp_path, subscription_id)
                 else:
@@ -262,13 +403,15 @@ class AbstractAgent:
                         "Skipping Unrecognized Reference Path [%s] in Event Subscription [%s]",
                         event_path, subscription_id)
 
-    def _handle_boot(self, controller_id, mtp_path, subscription_id):
-        """Handle a Subscription for a Boot Notification"""
+    def _handle_boot(self, subscription_path, controller_id, mtp_path, subscription_id):
+        """Handle a Subscription for a Boot Notification
+            - only Boot Notifications known when the Agent starts are sent"""
         boot_notif = notify.BootNotification(self._endpoint_id, controller_id,
                                              subscription_id, self._db)
         notif_sender = self._get_notification_sender(boot_notif, controller_id, mtp_path)
         if notif_sender is not None:
             self._boot_notif_sender_list.append(notif_sender)
+            self._add_subscription_item(subscription_path, self._boot_notif_sender_list.remove, notif_sender)
             self._logger.info("Processed Boot Subscription [%s] for MTP [%s] on Controller [%s]",
                               subscription_id, mtp_path, controller_id)
         else:
@@ -283,7 +426,9 @@ class AbstractAgent:
         periodic_handler = self._get_periodic_notif_handler(self._endpoint_id, controller_id,
                                                             mtp_path, subscription_id, param_path)
         if periodic_handler is not None:
-            self._periodic_handler_list.append(periodic_handler)
+            self._periodic_notif_scheduler.add_handler(periodic_handler)
+            self._add_subscription_item(subscription_path, self._periodic_notif_scheduler.remove_handler,
+                                        periodic_handler)
             self._logger.info("Processed Periodic Subscription [%s] for MTP [%s] on Controller [%s]",
                               subscription_id, mtp_path, controller_id)
         else:
@@ -295,12 +440,33 @@ class AbstractAgent:
         """Handle a Subscription for a ValueChange Notification"""
         ref_list = self._db.get(subscription_path + "ReferenceList")
         ref_param_list = ref_list.split(",")
+        min_notif_interval = self._get_min_notif_interval(subscription_path)
         if self._value_change_notif_poller is not None:
+            notif_retry, notif_expiration = self._get_notif_retry(subscription_path)
+            self._value_change_notif_poller.set_notif_retry(subscription_id, controller_id,
+                                                            notif_retry, notif_expiration)
+            self._add_subscription_item(subscription_path, self._value_change_notif_poller.set_notif_retry,
+                                        subscription_id, controller_id, False)
+
             for param_path in ref_param_list:
-                if param_path.strip():
+                param_path = param_path.strip()
+                if param_path:
                     try:
-                        self._value_change_notif_poller.add_param(param_path.strip(), self._endpoint_id,
-                                                                  controller_id, mtp_path, subscription_id)
+                        # Object Paths and Wild-carded Paths are resolved to (and kept in sync with) their Parameters
+                        if param_path.endswith(".") or "*" in param_path:
+                            self._add_subscription_item(subscription_path,
+                                                        self._value_change_notif_poller.remove_reference, param_path,
+                                                        self._endpoint_id, controller_id, mtp_path, subscription_id)
+                            self._value_change_notif_poller.add_reference(param_path, self._endpoint_id,
+                                                                          controller_id, mtp_path, subscription_id,
+                                                                          min_notif_interval)
+                        else:
+                            self._value_change_notif_poller.add_param(param_path, self._endpoint_id,
+                                                                      controller_id, mtp_path, subscription_id,
+                                                                      min_notif_interval)
+                            self._add_subscription_item(subscription_path,
+                                                        self._value_change_notif_poller.remove_param, param_path,
+                                                        controller_id, mtp_path, subscription_id)
                         self._logger.info(
                             "Processed ValueChange Subscription [%s] for MTP [%s] on Controller [%s] - %s",
                             subscription_id, mtp_path, controller_id, param_path)
@@ -313,6 +479,58 @@ class AbstractAgent:
                 "Skipping Subscription [%s] because ValueChange Notification Poller isn't configured",
                 subscription_id)
 
+    def _handle_object_notif(self, subscription_path, controller_id, mtp_path, subscription_id, notif_type):
+        """Handle a Subscription with an ObjectCreation or ObjectDeletion NotifType, whose ReferenceList
+            holds the (possibly Wild-carded) Tables to send the Notifications for, or with an OperationComplete
+            NotifType, whose ReferenceList holds the (possibly Wild-carded) Commands to send them for"""
+        ref_list = self._db.get(subscription_path + "ReferenceList")
+
+        if self._value_change_notif_poller is not None:
+            notif_retry, notif_expiration = self._get_notif_retry(subscription_path)
+            self._value_change_notif_poller.set_notif_retry(subscription_id, controller_id,
+                                                            notif_retry, notif_expiration)
+            self._add_subscription_item(subscription_path, self._value_change_notif_poller.set_notif_retry,
+                                        subscription_id, controller_id, False)
+
+            for table_path in ref_list.split(","):
+                table_path = table_path.strip()
+                if table_path.endswith("()" if notif_type == object_notifier.OPERATION_COMPLETE else "."):
+                    self._object_notifier.add_subscriber(notif_type, table_path, self._endpoint_id,
+                                                         controller_id, mtp_path, subscription_id)
+                    self._add_subscription_item(subscription_path, self._object_notifier.remove_subscriber,
+                                                notif_type, table_path, controller_id, mtp_path, subscription_id)
+                    self._logger.info("Processed %s Subscription [%s] for MTP [%s] on Controller [%s] - %s",
+                                      notif_type, subscription_id, mtp_path, controller_id, table_path)
+                elif table_path:
+                    self._logger.warning("Skipping %s on Path [%s]; Subscription [%s] - Not a Table or Command",
+                                         notif_type, table_path, subscription_id)
+        else:
+            self._logger.warning(
+                "Skipping Subscription [%s] because ValueChange Notification Poller isn't configured",
+                subscription_id)
+
+    def _handle_operation_complete(self, command, command_key, output_arg_dict, cmd_failure):
+        """Operation Complete Listener - send an OperationComplete Notification to the Subscribers of the Command"""
+        if self._object_notifier is not None:
+            self._object_notifier.queue_operation_complete(command, command_key, output_arg_dict, cmd_failure)
+
+    def _get_min_notif_interval(self, subscription_path):
+        """Retrieve the minimum number of seconds between ValueChange Notifications for the Subscription
+            (0, meaning every change is sent, if the Subscription doesn't have one)"""
+        try:
+            return float(self._db.get(subscription_path + MIN_NOTIF_INTERVAL_PARAM))
+        except agent_db.NoSuchPathError:
+            return 0
+
+    def _get_notif_retry(self, subscription_path):
+        """Retrieve a tuple of the Subscription's NotifRetry and NotifExpiration (False and 0 if it doesn't
+            have them)"""
+        try:
+            return (self._db.get(subscription_path + "NotifRetry"),
+                    int(self._db.get(subscription_path + "NotifExpiration")))
+        except agent_db.NoSuchPathError:
+            return False, 0
+
     def _get_supported_protocol(self):
         """Return the supported Protocol as a String: CoAP, STOMP, HTTP/2, WebSockets"""
         raise NotImplementedError()
@@ -334,7 +552,7 @@ class BindingListener(threading.Thread):
         threading.Thread.__init__(self, name="BindingListener-" + thread_name)
         self._binding = binding
         self._timeout = timeout
-        self._msg_handler = msg_handler
+        self._request_processor = RequestProcessor(msg_handler)
         self._logger = logging.getLogger(self.__class__.__name__)
 
     def run(self):
@@ -354,29 +572,79 @@ class BindingListener(threading.Thread):
         except GeneratorExit:
             self._logger.info("STOMP Binding Listener is Shutting Down as requested...")
 
-    @INCOMING_REQ_SUMMARY_METRIC.time()
     def _handle_request(self, queue_item):
         """Handle a Request/Response interaction"""
-        resp_msg = None
+        to_addr = queue_item.get_reply_to_addr()
 
         try:
-            req_msg, req_record, resp_msg, serialized_resp_record = \
-                self._msg_handler.handle_request(queue_item.get_payload())
+            serialized_resp_record = self._request_processor.process(queue_item.get_payload(), to_addr)
 
-            to_addr = queue_item.get_reply_to_addr()
-            if to_addr is not None:
-                self._log_messages(req_msg, req_record, resp_msg, to_addr)
+            if serialized_resp_record is not None:
                 self._binding.send_msg(serialized_resp_record, to_addr)
+        # pylint: disable-msg=broad-except
+        except Exception as err:
+            # A Request that wasn't answered is left unacknowledged, so that the Broker delivers it again
+            self._logger.error("Failed to handle a Request from Endpoint Address [%s]: %s", to_addr, err)
+            return
+
+        # Only acknowledge the Request once the Response has been sent (or if there is no Response)
+        self._binding.ack_msg(queue_item)
+
+        # TODO: Check with the self._msg_handler if should shutdown, and raise a GeneratorExit
+
+
+class RequestProcessor:
+    """Process an incoming Request into a serialized Response; shared by the Binding Listener
+        and by Bindings that handle Requests directly on their own AsyncIO Event Loop"""
+    def __init__(self, msg_handler, resp_cache_size=100):
+        """Initialize the Request Processor
+            - the Responses to the last resp_cache_size Requests are kept, so that a Request delivered again
+              (e.g. by a STOMP Broker, after its Response failed to send) isn't run twice"""
+        self._msg_handler = msg_handler
+        self._resp_cache_size = resp_cache_size
+        self._resp_cache_lock = threading.Lock()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        # Format: { Serialized Request Record : Serialized Response Record }
+        self._resp_cache = collections.OrderedDict()
+
+    @INCOMING_REQ_SUMMARY_METRIC.time()
+    def process(self, payload, to_addr):
+        """Handle the incoming Request and return the serialized Response Record to send to the
+            provided address, or None if there is no Response to send
+            - a duplicate of a recent Request (same Record, so same msg_id) gets the Response it already got,
+              as running it again isn't safe (an Operate would take another picture)"""
+        serialized_resp_record = None
+
+        with self._resp_cache_lock:
+            if payload in self._resp_cache:
+                self._logger.info("Answering a duplicate Request with its earlier Response")
+                NUM_DUPLICATE_REQS_METRIC.inc()
+                return self._resp_cache[payload]
+
+        try:
+            req_msg, req_record, resp_msg, serialized_record = self._msg_handler.handle_request(payload)
+
+            if serialized_record is None:
+                self._logger.debug("Nothing to send in response to a [%s] from Endpoint ID [%s]",
+                                   req_msg.body.response.WhichOneof("resp_type"), req_record.from_id)
+            elif to_addr is not None:
+                self._log_messages(req_msg, req_record, resp_msg, to_addr)
+                serialized_resp_record = serialized_record
             else:
                 self._logger.warning("Response not sent because an address could not be determined!")
-
-            # TODO: Check with the self._msg_handler if should shutdown, and raise a GeneratorExit
         except request_handler.ProtocolViolationError:
             # Error already logged in the USP Protocol Tool, nothing to do
             self._logger.debug("USP Protocol Violation Encountered - dropping the Request")
             NUM_PROTO_VIOLATIONS_METRIC.inc()
 
-        return resp_msg
+        if serialized_resp_record is not None and self._resp_cache_size > 0:
+            with self._resp_cache_lock:
+                self._resp_cache[payload] = serialized_resp_record
+                if len(self._resp_cache) > self._resp_cache_size:
+                    self._resp_cache.popitem(last=False)
+
+        return serialized_resp_record
 
     def _log_messages(self, req_msg, req_record, resp_msg, to_addr):
         """Logging Helper Static Method"""
@@ -392,17 +660,19 @@ class BindingListener(threading.Thread):
             self._logger.warning("Sending an Unknown Response")
 
 
-class AbstractPeriodicNotifHandler(threading.Thread):
+class AbstractPeriodicNotifHandler:
     """An Abstract Periodic Notification Handler that is extended for specific bindings such that
-        a Periodic Notification is issued via the appropriate binding every Interval"""
-    def __init__(self, database, thread_name, from_id, to_id, subscription_id, path_to_periodic_params):
+        a Periodic Notification is issued via the appropriate binding every Interval
+        - the PeriodicNotifScheduler decides when to send the Notification"""
+    def __init__(self, database, handler_name, from_id, to_id, subscription_id, path_to_periodic_params):
         """Initialize the Periodic Notification Handler"""
-        threading.Thread.__init__(self, name="PeriodicNotifHandler-" + thread_name)
+        self.name = "PeriodicNotifHandler-" + handler_name
         self._db = database
         self._to_id = to_id
         self._from_id = from_id
         self._path = path_to_periodic_params
         self._subscription_id = subscription_id
+        self._notif_template = notify.NotificationTemplate(from_id, to_id, subscription_id)
         self._logger = logging.getLogger(self.__class__.__name__)
         self._binding = None
 
@@ -410,135 +680,33 @@ class AbstractPeriodicNotifHandler(threading.Thread):
         """Configure the USP Binding to use when sending the Notification"""
         self._binding = binding
 
-    def run(self):
-        """Thread execution code - issue a Periodic Notification every periodic_interval seconds"""
-        binding_exists = True
-        periodic_interval_param_name = self._path + "PeriodicNotifInterval"
+    def get_path(self):
+        """Retrieve the path to the PeriodicNotifInterval and PeriodicNotifTime Parameters"""
+        return self._path
 
-        while binding_exists:
-            try:
-                periodic_interval = int(self._db.get(periodic_interval_param_name))
-                self._logger.info("Waiting %d seconds before next Periodic Notification", periodic_interval)
-                time.sleep(periodic_interval)
-
-                self._logger.info("Sending a Periodic Notification to %s", self._to_id)
-                notif = notify.PeriodicNotification(self._from_id, self._to_id,
-                                                    self._subscription_id, self._path)
-                notif_record = notif.wrap_notif_in_record(notif.generate_notif_msg())
-                binding_exists = self._handle_periodic_record(notif_record)
-            except agent_db.NoSuchPathError:
-                binding_exists = False
-                self._logger.warning("Periodic Notification Failure : No Periodic Interval [%s]",
-                                     periodic_interval_param_name)
+    def get_next_notif_time(self, now):
+        """Return a tuple of the next time (after now) that a Periodic Notification is due, or None if the
+            interval isn't valid, and the interval; throw a NoSuchPathError if the Parameters don't exist
+            - Notifications are aligned to PeriodicNotifTime (every interval from then), unless it is
+              the Unknown Time, in which case the next Notification is an interval from now"""
+        periodic_interval = int(self._db.get(self._path + "PeriodicNotifInterval"))
+        reference_time = utils.TimeHelper.get_str_as_time(self._db.get(self._path + "PeriodicNotifTime"))
 
-        self._logger.warning("Periodic Notification Handler named [%s] shutting down", self.name)
+        if periodic_interval <= 0:
+            return None, periodic_interval
 
-    def _handle_periodic_record(self, notif_record):
-        """Handle the Binding Specific Periodic Notification"""
-        raise NotImplementedError()
+        if reference_time is None:
+            return now + periodic_interval, periodic_interval
 
+        num_intervals = math.floor((now - reference_time) / periodic_interval) + 1
+        return reference_time + num_intervals * periodic_interval, periodic_interval
 
-class AbstractValueChangeNotifPoller(threading.Thread):
-    """An Abstract Value Change Notification Poller that is extended for specific bindings such that
-        ValueChange Notifications can be issued when a Parameter's Value has Changed"""
-    TO_ID = "to.id"
-    FROM_ID = "from.id"
-    MTP = "mtp.path"
-    SUBSCRIPTION_ID = "subscription.id"
-
-    def __init__(self, agent_database, poll_duration=0.5):
-        """Initialize the Value Change Notification Poller Thread"""
-        threading.Thread.__init__(self, name="ValueChangeNotifPoller")
-        self._db = agent_database
-        self._param_cache = {}
-        self._param_poll_list = []
-        self._notif_details_dict = {}
-        self._cache_lock = threading.Lock()
-        self._poll_duration = poll_duration
-        self._logger = logging.getLogger(self.__class__.__name__)
+    def send_notif(self):
+        """Send a Periodic Notification, and return False if the Binding no longer exists"""
+        self._logger.info("Sending a Periodic Notification to %s", self._to_id)
+        _, serialized_record = self._notif_template.generate_periodic_record()
+        return self._handle_periodic_record(serialized_record)
 
-    def run(self):
-        """Thread execution code - poll for a value change and then
-             send the ValueChange Notification"""
-        while True:
-            time.sleep(self._poll_duration)
-
-            for param in self._param_poll_list:
-                self._logger.debug("Checking %s for a Value Change", param)
-                value = self._db.get(param)
-                with self._cache_lock:
-                    if value != self._param_cache[param]:
-                        self._logger.info("Value Change detected for %s", param)
-                        self._param_cache[param] = value
-                        notif_details = self._notif_details_dict[param]
-                        to_id = notif_details[self.TO_ID]
-                        from_id = notif_details[self.FROM_ID]
-                        subscription_id = notif_details[self.SUBSCRIPTION_ID]
-                        mtp_param_path = notif_details[self.MTP]
-                        NUM_VC_NOTIFS_COUNTER_METRIC.inc()
-                        self._handle_value_change(param, value, to_id, from_id,
-                                                  subscription_id, mtp_param_path)
-
-    def add_param(self, param, agent_id, controller_id, mtp_param_path, subscription_id):
-        """Add a Parameter to the Polling List"""
-        self._logger.info("Adding %s to the ValueChange Notification Poller", param)
-        NUM_VC_PARAMS_GAUGE_METRIC.inc()
-        value_change_notif_details_dict = {}
-        value_change_notif_details_dict[self.FROM_ID] = agent_id
-        value_change_notif_details_dict[self.TO_ID] = controller_id
-        value_change_notif_details_dict[self.SUBSCRIPTION_ID] = subscription_id
-        value_change_notif_details_dict[self.MTP] = mtp_param_path
-
-        with self._cache_lock:
-            self._param_cache[param] = self._db.get(param)
-            self._param_poll_list.append(param)
-            self._notif_details_dict[param] = value_change_notif_details_dict
-
-    def remove_param(self, param):
-        """Remove a Parameter from the Polling List"""
-        self._logger.info("Removing %s from the ValueChange Notification Poller", param)
-        NUM_VC_PARAMS_GAUGE_METRIC.dec()
-
-        with self._cache_lock:
-            del self._param_cache[param]
-            self._param_poll_list.remove(param)
-            del self._notif_details_dict[param]
-
-    def _handle_value_change(self, param, value, to_id, from_id, subscription_id, mtp_param_path):
-        """Handle the Binding Specific Value Change Processing"""
-        raise NotImplementedError()
-
-
-class NotificationSender(threading.Thread):
-    """A Generic Notification Sender"""
-    def __init__(self, notif, binding, num_retries=3, retry_interval=2):
-        """Initialize the Notification Sender"""
-        self._binding = binding
-        self._num_retries = num_retries
-        self._retry_interval = retry_interval
-        self._notif_msg = notif.generate_notif_msg()
-        self._subscription_id = self._notif_msg.body.request.notify.subscription_id
-        self._notif_record = notif.wrap_notif_in_record(self._notif_msg)
-        self._logger = logging.getLogger(self.__class__.__name__)
-        threading.Thread.__init__(self, name="NotificationSender" + self._subscription_id)
-
-    def run(self):
-        """Thread execution code - send the Notification"""
-        to_addr = None
-        retry_count = 0
-
-        while to_addr is None and retry_count <= self._num_retries:
-            to_addr = self._retrieve_to_addr()
-            if to_addr is None:
-                self._logger.info("Waiting %d seconds before attempting to resolve address", self._retry_interval)
-                time.sleep(self._retry_interval)
-                retry_count += 1
-
-        if to_addr is not None:
-            self._binding.send_msg(self._notif_record.SerializeToString(), to_addr)
-        else:
-            self._logger.warning("Failed to send Notification - could not retrieve destination address")
-
-    def _retrieve_to_addr(self):
-        """Retrieve the MTP specific address that indicates where the notification is to be sent"""
+    def _handle_periodic_record(self, serialized_record):
+        """Handle the Binding Specific Periodic Notification"""
         raise NotImplementedError()
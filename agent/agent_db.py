@@ -27,9 +27,10 @@ SOFTWARE.
 #  - Dictionary as a database (key=full parameter path, value=parameter value)
 #  - The database is initialized from a JSON formatted file
 #  - Get command for full parameter path
-#  - Update command for full parameter path
-#  - Insert command for tables
-#  - Delete command for tables
+#  - Update command for full parameter path (Update Listeners are called with the new value)
+#  - Computed check for values that are calculated when retrieved (e.g. UpTime)
+#  - Insert command for tables (Insert Listeners are called with the new instance path)
+#  - Delete command for tables (Delete Listeners are called with the deleted instance path)
 #  - Find commands for wild-carded or partial parameter paths (returns full parameter paths)
 #  --- find_params: find parameter paths
 #  --- find_instances: find multi-object instance partial paths
@@ -83,6 +84,13 @@ DB_FIND_IMPL_OBJECTS_SUMMARY_METRIC = \
                               "Time spent handling Database FindImplObjects Call")
 
 
+# Values that are place-holders for a value computed by get()
+COMPUTED_VALUES = ["__UPTIME__", "__IPADDR__", "__CURR_TIME__", "__NUM_ENTRIES__"]
+
+# The Parameters of a Device.LocalAgent.Request.{i}. object (the Request of an asynchronous Operate)
+REQUEST_PARAM_LIST = ["Originator", "Command", "CommandKey", "Status"]
+
+
 class Database:
     """Represents a simple database"""
     def __init__(self, dm_filename, db_filename, net_intf):
@@ -91,12 +99,17 @@ class Database:
         self._db_filename = db_filename
         self._file_write_lock = threading.Lock()
         self._new_inst_num_lock = threading.Lock()
+        self._update_listener_list = []
+        self._insert_listener_list = []
+        self._delete_listener_list = []
         self._start_time = time.time()
         self._supported_insert_path_list = [
-            "Device.Services.HomeAutomation.{i}.Camera.{i}.Pic."
+            "Device.Services.HomeAutomation.{i}.Camera.{i}.Pic.",
+            "Device.LocalAgent.Request."
         ]
         self._supported_delete_path_list = [
-            "Device.Services.HomeAutomation.{i}.Camera.{i}.Pic.{i}."
+            "Device.Services.HomeAutomation.{i}.Camera.{i}.Pic.{i}.",
+            "Device.LocalAgent.Request.{i}."
         ]
 
         logger = logging.getLogger(self.__class__.__name__)
@@ -155,9 +168,37 @@ class Database:
         if path in self._db:
             self._db[path] = value
             self._save()
+
+            for listener in self._update_listener_list:
+                listener(path, value)
         else:
             raise NoSuchPathError(path)
 
+    def add_update_listener(self, listener):
+        """Register a callable(path, value) that is called each time a value is updated
+            - it is called on the updating Thread, so it must not block"""
+        self._update_listener_list.append(listener)
+
+    def remove_update_listener(self, listener):
+        """Unregister an Update Listener"""
+        self._update_listener_list.remove(listener)
+
+    def add_insert_listener(self, listener):
+        """Register a callable(instance_path) that is called each time an object instance is inserted"""
+        self._insert_listener_list.append(listener)
+
+    def add_delete_listener(self, listener):
+        """Register a callable(instance_path) that is called each time an object instance is deleted"""
+        self._delete_listener_list.append(listener)
+
+    def is_computed(self, path):
+        """Determine if the value of the incoming path is computed when retrieved (e.g. UpTime), and so
+            changes without an update; throw a NoSuchPathError if the path doesn't exist"""
+        if path not in self._db:
+            raise NoSuchPathError(path)
+
+        return self._db[path] in COMPUTED_VALUES
+
     @DB_FIND_PARAMS_SUMMARY_METRIC.time()
     def find_params(self, path):
         """Retrieve a set of parameter paths that match the incoming path"""
@@ -386,8 +427,15 @@ class Database:
                 if dm_regex_str == "Device.Services.HomeAutomation.{i}.Camera.{i}.Pic.":
                     self._db[partial_path + str(next_inst_num) + ".URL"] = ""
                     self._save()
+                elif dm_regex_str == "Device.LocalAgent.Request.":
+                    for param in REQUEST_PARAM_LIST:
+                        self._db[partial_path + str(next_inst_num) + "." + param] = ""
+                    self._save()
                 else:
                     raise NotImplementedError()
+
+                for listener in self._insert_listener_list:
+                    listener(partial_path + str(next_inst_num) + ".")
             else:
                 raise NoSuchPathError(partial_path)
         else:
@@ -412,8 +460,15 @@ class Database:
                 if dm_regex_str == "Device.Services.HomeAutomation.{i}.Camera.{i}.Pic.{i}.":
                     del self._db[partial_path + "URL"]
                     self._save()
+                elif dm_regex_str == "Device.LocalAgent.Request.{i}.":
+                    for param in REQUEST_PARAM_LIST:
+                        del self._db[partial_path + param]
+                    self._save()
                 else:
                     raise NotImplementedError()
+
+                for listener in self._delete_listener_list:
+                    listener(partial_path)
             else:
                 raise NoSuchPathError(partial_path)
         else:
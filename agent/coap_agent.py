@@ -25,13 +25,14 @@
 #
 # Functionality:
 #   Class: CoapAgent(abstract_agent.AbstractAgent)
-#     __init__(dm_file, db_file, cfg_file_name="cfg/agent.json", debug=False)
+#     __init__(dm_file, db_file, net_intf, port=5683, cfg_file_name="cfg/agent.json", debug=False, async_mode=False,
+#              shared_agent=None)
 #     start_listening(timeout=15)
 #     clean_up()
 #   Class: CoapPeriodicNotifHandler(abstract_agent.AbstractPeriodicNotifHandler)
 #     __init__(database, mtp_param_path, from_id, to_id, subscription_id, param, controller_url)
 #     set_binding(binding)
-#   Class: CoapValueChangeNotifPoller(abstract_agent.AbstractValueChangeNotifPoller)
+#   Class: CoapValueChangeNotifPoller(value_change_notif_poller.AbstractValueChangeNotifPoller)
 #     __init__(agent_db, poll_duration=0.5)
 #     set_binding(binding)
 #
@@ -40,18 +41,27 @@
 
 from agent import mdns
 from agent import utils
-from agent import notify
 from agent import agent_db
 from agent import abstract_agent
+from agent import notif_sender_pool
 from agent import coap_usp_binding
+from agent import value_change_notif_poller
+
+
+COAP_BLOCK_SIZE = "coap.block.size"
+COAP_MAX_PAYLOAD_SIZE = "coap.max.payload.size"
 
 
 class CoapAgent(abstract_agent.AbstractAgent):
     """A USP Agent that uses the CoAP Binding"""
-    def __init__(self, dm_file, db_file, net_intf, port=5683, cfg_file_name="cfg/agent.json", debug=False):
-        """Initialize the CoAP Agent"""
-        abstract_agent.AbstractAgent.__init__(self, dm_file, db_file, net_intf, cfg_file_name, debug)
+    def __init__(self, dm_file, db_file, net_intf, port=5683, cfg_file_name="cfg/agent.json", debug=False,
+                 async_mode=False, shared_agent=None):
+        """Initialize the CoAP Agent
+            - async_mode handles Requests on the CoAP Event Loop instead of via a Binding Listener"""
+        abstract_agent.AbstractAgent.__init__(self, dm_file, db_file, net_intf, cfg_file_name, debug,
+                                             shared_agent)
         self._can_start = True
+        self._async_mode = async_mode
 
         # Initialize the underlying Agent DB MTP details for CoAP
         resource_path = 'usp'
@@ -65,8 +75,13 @@ class CoapAgent(abstract_agent.AbstractAgent):
                 self._mdns_listener = mdns.Listener()
                 self._mdns_listener.listen()
 
-                self._binding = coap_usp_binding.CoapUspBinding(ip_addr, self._endpoint_id, port,
-                                                                resource_path=resource_path, debug=debug)
+                cfg_mgr = utils.ConfigMgr(cfg_file_name, {COAP_BLOCK_SIZE: 1024, COAP_MAX_PAYLOAD_SIZE: 65536})
+                self._binding = coap_usp_binding.CoapUspBinding(
+                    ip_addr, self._endpoint_id, port, resource_path=resource_path,
+                    block_size=int(cfg_mgr.get_cfg_item(COAP_BLOCK_SIZE)),
+                    max_payload_size=int(cfg_mgr.get_cfg_item(COAP_MAX_PAYLOAD_SIZE)), debug=debug)
+                if self._async_mode:
+                    self._binding.set_request_processor(abstract_agent.RequestProcessor(self.get_msg_handler()))
                 self._binding.listen(url)
 
                 self._mdns_announcer = mdns.Announcer(ip_addr, port, resource_path, self._endpoint_id)
@@ -92,10 +107,14 @@ class CoapAgent(abstract_agent.AbstractAgent):
         if self._can_start:
             abstract_agent.AbstractAgent.start_listening(self)
 
-            msg_handler = self.get_msg_handler()
-            listener = abstract_agent.BindingListener("CoAP", self._binding, msg_handler, timeout)
-            listener.start()
-            listener.join()
+            if self._async_mode:
+                # Requests are handled on the CoAP Event Loop, so just wait for it to terminate
+                self._binding.get_listen_thread().join()
+            else:
+                msg_handler = self.get_msg_handler()
+                listener = abstract_agent.BindingListener("CoAP", self._binding, msg_handler, timeout)
+                listener.start()
+                listener.join()
 
     def clean_up(self):
         """Clean up the USP Binding"""
@@ -116,7 +135,8 @@ class CoapAgent(abstract_agent.AbstractAgent):
         return "CoAP"
 
     def _init_db_for_mtp(self, host, port, path):
-        """Enable the LocalAgent MTPs for the supported protocol and Disable all other LocalAgent MTPs"""
+        """Enable the LocalAgent MTPs for the supported protocol and Disable all other LocalAgent MTPs
+            (unless the Database is shared with the other MTPs)"""
         coap_mtp_count = 0
         agent_mtp_instances = self._db.find_instances("Device.LocalAgent.MTP.")
 
@@ -127,7 +147,7 @@ class CoapAgent(abstract_agent.AbstractAgent):
                 self._db.update(agent_mtp_path + "CoAP.Host", host)
                 self._db.update(agent_mtp_path + "CoAP.Port", str(port))
                 self._db.update(agent_mtp_path + "CoAP.Path", path)
-            else:
+            elif not self._is_shared:
                 self._db.update(agent_mtp_path + "Enable", False)
 
         return coap_mtp_count
@@ -186,7 +206,7 @@ class CoapPeriodicNotifHandler(abstract_agent.AbstractPeriodicNotifHandler):
         """Configure the mDNS Listener to use when sending the Notification"""
         self._mdns_listener = listener
 
-    def _handle_periodic_record(self, notif_record):
+    def _handle_periodic_record(self, serialized_record):
         """Handle the CoAP Periodic Notification"""
         if self._binding is not None:
             if self._mdns_listener is not None:
@@ -197,7 +217,7 @@ class CoapPeriodicNotifHandler(abstract_agent.AbstractPeriodicNotifHandler):
                                      self._db.get(self._mtp_param_path + "CoAP.Path")
                     self._logger.info("Sending a Periodic Notification to ID [%s] over MTP [%s] at: %s",
                                       self._to_id, self._mtp_param_path, controller_url)
-                    self._binding.send_msg(notif_record.SerializeToString(), controller_url)
+                    self._binding.send_msg(serialized_record, controller_url)
                 else:
                     self._logger.warning("Unable to send the Periodic Notification - Can't Resolve Host Name")
             else:
@@ -208,50 +228,51 @@ class CoapPeriodicNotifHandler(abstract_agent.AbstractPeriodicNotifHandler):
         return True
 
 
-class CoapValueChangeNotifPoller(abstract_agent.AbstractValueChangeNotifPoller):
+class CoapValueChangeNotifPoller(value_change_notif_poller.AbstractValueChangeNotifPoller):
     """Poll Parameters for Value Change Notifications via a CoAP Binding"""
     def __init__(self, agent_database, poll_duration=0.5):
         """Initialize the STOMP Value Change Notification Poller"""
-        abstract_agent.AbstractValueChangeNotifPoller.__init__(self, agent_database, poll_duration)
+        value_change_notif_poller.AbstractValueChangeNotifPoller.__init__(self, agent_database, poll_duration)
         self._binding = None
         self._mdns_listener = None
 
     def set_binding(self, binding):
         """Configure the CoAP Binding to use when sending the Notification"""
         self._binding = binding
+        self.invalidate_routes()
 
     def set_mdns_listener(self, listener):
-        """Configure the mDNS Listener to use when sending the Notification"""
+        """Configure the mDNS Listener to use when sending the Notification
+            - the Routes are resolved again whenever the mDNS Listener learns of a change"""
         self._mdns_listener = listener
+        self._mdns_listener.add_change_listener(self.invalidate_routes)
+        self.invalidate_routes()
 
-    def _handle_value_change(self, param, value, to_id, from_id, subscription_id, mtp_param_path):
-        """Handle the Binding Specific Value Change Processing"""
-        notif = notify.ValueChangeNotification(from_id, to_id, subscription_id, param, value)
-        if self._binding is not None:
-            if self._mdns_listener is not None:
-                resolved_ip_addr = self._mdns_listener.resolve_host(self._db.get(mtp_param_path + "CoAP.Host"))
-                if resolved_ip_addr is not None:
-                    controller_url = "coap://" + resolved_ip_addr + ":" + \
-                                     str(self._db.get(mtp_param_path + "CoAP.Port")) + "/" + \
-                                     self._db.get(mtp_param_path + "CoAP.Path")
-                    notif_record = notif.wrap_notif_in_record(notif.generate_notif_msg())
-
-                    self._logger.info("Sending a ValueChange Notification to ID [%s] over MTP [%s] at: %s",
-                                      to_id, mtp_param_path, controller_url)
-                    self._binding.send_msg(notif_record.SerializeToString(), controller_url)
-                else:
-                    self._logger.warning("Unable to send the ValueChange Notification - Can't Resolve Host Name")
-            else:
-                self._logger.warning("Unable to send the ValueChange Notification - mDNS Listener not registered")
-        else:
+    def _resolve_route(self, to_id, mtp_param_path):
+        """Resolve the CoAP Binding and the Controller's CoAP URL (via mDNS) for the Controller's MTP"""
+        if self._binding is None:
             self._logger.warning("Unable to send the ValueChange Notification - No Binding")
+            return None
+
+        if self._mdns_listener is None:
+            self._logger.warning("Unable to send the ValueChange Notification - mDNS Listener not registered")
+            return None
+
+        resolved_ip_addr = self._mdns_listener.resolve_host(self._db.get(mtp_param_path + "CoAP.Host"))
+        if resolved_ip_addr is None:
+            self._logger.warning("Unable to send the ValueChange Notification - Can't Resolve Host Name")
+            return None
+
+        controller_url = "coap://" + resolved_ip_addr + ":" + str(self._db.get(mtp_param_path + "CoAP.Port")) + \
+                         "/" + self._db.get(mtp_param_path + "CoAP.Path")
+        return self._binding, controller_url
 
 
-class CoapNotificationSender(abstract_agent.NotificationSender):
+class CoapNotificationSender(notif_sender_pool.NotificationSender):
     """A CoAP specific implementation of the Abstract Notification Sender"""
     def __init__(self, notif, binding, mdns_listener, host, port, path):
         """Initialize the CoAP Notification Sender"""
-        abstract_agent.NotificationSender.__init__(self, notif, binding)
+        notif_sender_pool.NotificationSender.__init__(self, notif, binding)
         self._host = host
         self._port = port
         self._path = path
@@ -0,0 +1,174 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+# File Name: coap_blockwise.py
+#
+# Description: Block-wise Transfer (RFC 7959) helpers for the CoAP USP Binding
+#
+# Class Structure:
+#  - BlockwiseReassembler(object)
+#    - __init__(max_payload_size=65536, ttl=60)
+#    - add_block(key, block_number, more, size_exponent, payload, total_size=None)
+#    - discard(key)
+#  - BlockwiseError(Exception)
+#  - BlockwiseIncompleteError(BlockwiseError)
+#  - BlockwiseTooLargeError(BlockwiseError)
+#  - get_size_exponent(block_size)
+#  - get_block_size(size_exponent)
+#  - get_block(payload, block_number, size_exponent)
+#
+"""
+
+import time
+import logging
+
+
+MIN_SIZE_EXPONENT = 0    # 16 byte blocks
+MAX_SIZE_EXPONENT = 6    # 1024 byte blocks
+
+
+class BlockwiseReassembler:
+    """Reassemble the Block1 blocks of incoming Requests into a single payload"""
+    def __init__(self, max_payload_size=65536, ttl=60):
+        """Initialize the Block-wise Reassembler
+            - max_payload_size is the largest reassembled payload that will be accepted
+            - ttl is the number of seconds that an incomplete transfer is kept around"""
+        self._ttl = ttl
+        self._transfers = {}
+        self._max_payload_size = max_payload_size
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def add_block(self, key, block_number, more, size_exponent, payload, total_size=None):
+        """Add a Block to the transfer identified by the key; return the reassembled payload once the
+            last Block has been added, otherwise return None
+            - total_size is the value of the Size1 Option (if present), used to preallocate the buffer"""
+        self._purge_expired()
+
+        if block_number == 0:
+            if total_size is not None and total_size > self._max_payload_size:
+                raise BlockwiseTooLargeError("Indicated size [{}] exceeds the maximum of [{}]"
+                                             .format(total_size, self._max_payload_size))
+
+            self._logger.debug("Starting a new Block-wise transfer for [%s]", key)
+            self._transfers[key] = _BlockwiseTransfer(total_size)
+        elif key not in self._transfers:
+            raise BlockwiseIncompleteError("Beginning of the Block-wise transfer is unknown")
+
+        transfer = self._transfers[key]
+        offset = block_number * get_block_size(size_exponent)
+
+        if offset != transfer.get_length():
+            self.discard(key)
+            raise BlockwiseIncompleteError("Block [{}] received out of order".format(block_number))
+
+        if offset + len(payload) > self._max_payload_size:
+            self.discard(key)
+            raise BlockwiseTooLargeError("Reassembled payload exceeds the maximum of [{}]"
+                                         .format(self._max_payload_size))
+
+        transfer.write(offset, payload)
+
+        if more:
+            return None
+
+        self.discard(key)
+        self._logger.debug("Completed the Block-wise transfer for [%s]", key)
+        return transfer.get_payload()
+
+    def discard(self, key):
+        """Discard any partial transfer associated with the key"""
+        if key in self._transfers:
+            del self._transfers[key]
+
+    def _purge_expired(self):
+        """Remove any incomplete transfers that are older than the TTL"""
+        expiration = time.time() - self._ttl
+
+        for key in [key for key, transfer in self._transfers.items() if transfer.get_create_time() < expiration]:
+            self._logger.warning("Expiring an incomplete Block-wise transfer for [%s]", key)
+            del self._transfers[key]
+
+
+class _BlockwiseTransfer:
+    """A single Block-wise transfer being reassembled"""
+    def __init__(self, total_size=None):
+        """Preallocate the buffer when the total size is known up front"""
+        self._length = 0
+        self._create_time = time.time()
+        self._buffer = bytearray(total_size) if total_size else bytearray()
+
+    def get_length(self):
+        """Retrieve the number of bytes received so far"""
+        return self._length
+
+    def get_create_time(self):
+        """Retrieve the time the transfer was started"""
+        return self._create_time
+
+    def write(self, offset, payload):
+        """Copy the payload into the buffer at the offset; grows the buffer if it was not preallocated"""
+        end = offset + len(payload)
+        self._buffer[offset:end] = payload
+        self._length = end
+
+    def get_payload(self):
+        """Retrieve the reassembled payload"""
+        return bytes(memoryview(self._buffer)[:self._length])
+
+
+class BlockwiseError(Exception):
+    """A CoAP Block-wise Transfer Error"""
+    pass
+
+
+class BlockwiseIncompleteError(BlockwiseError):
+    """A Block-wise Transfer Error for blocks that do not continue a known transfer (4.08)"""
+    pass
+
+
+class BlockwiseTooLargeError(BlockwiseError):
+    """A Block-wise Transfer Error for payloads that exceed the maximum size (4.13)"""
+    pass
+
+
+def get_size_exponent(block_size):
+    """Convert a Block Size (a power of 2 between 16 and 1024) into a Block Option SZX value"""
+    size_exponent = block_size.bit_length() - 5
+
+    if block_size & (block_size - 1) or not MIN_SIZE_EXPONENT <= size_exponent <= MAX_SIZE_EXPONENT:
+        raise BlockwiseError("Invalid Block Size [{}]: must be a power of 2 between 16 and 1024".format(block_size))
+
+    return size_exponent
+
+
+def get_block_size(size_exponent):
+    """Convert a Block Option SZX value into a Block Size"""
+    return 2 ** (size_exponent + 4)
+
+
+def get_block(payload, block_number, size_exponent):
+    """Retrieve the Block of the payload for the block number; returns the Block and the 'more' flag"""
+    block_size = get_block_size(size_exponent)
+    start = block_number * block_size
+    end = min(start + block_size, len(payload))
+
+    return bytes(memoryview(payload)[start:end]), end < len(payload)
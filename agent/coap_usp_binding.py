@@ -26,43 +26,53 @@
 # Class Structure:
 #  - MyCoapResource(aiocoap.resource.Resource)
 #    - __init__(binding, debug=False)
+#    - needs_blockwise_assembly(request)
 #    - render_get(request)
 #    - render_put(request)
 #    - render_delete(request)
 #    - render_post(request)
 #    - get_link_description()
+#    - _process_payload(request, reply_to_addr)
+#    - _log_request_failure(request_task)
 #  - CoapReceivingThread(threading.Thread)
 #    - __init__(event_loop, resource_tree, listening_port)
+#    - get_context()
 #    - run()
 #  - CoapSendingThread(threading.Thread)
-#    - __init__(serialized_msg, to_addr, debug=False)
+#    - __init__(serialized_msg, to_addr, size_exponent, debug=False)
 #    - run()
 #  - CoapUspBinding(generic_usp_binding.GenericUspBinding)
-#    - __init__(listen_port=5683, sending_thr_timeout=5, debug=False)
+#    - __init__(listen_port=5683, sending_thr_timeout=5, block_size=1024, max_payload_size=65536, debug=False)
 #    - validate_payload(payload)
+#    - get_size_exponent()
+#    - get_max_payload_size()
+#    - reassemble_block(remote, reply_to_addr, block1, payload, total_size)
+#    - set_request_processor(request_processor, max_workers=1)
+#    - is_async_mode()
+#    - handle_request(payload, reply_to_addr) :: Coroutine
 #    - send_msg(serialized_msg, to_addr)
 #    - listen()
+#    - get_listen_thread()
 #    - clean_up()
+#  - build_usp_post(serialized_msg, to_addr, reply_to)
+#  - send_usp_post(context, serialized_msg, to_addr, reply_to, size_exponent) :: Coroutine
 #
 """
 
 import logging
 import threading
+import concurrent.futures
 
 import asyncio
 import aiocoap
 import aiocoap.error
 import aiocoap.resource
 
+from agent import record_header
+from agent import coap_blockwise
 from agent import generic_usp_binding
 
 
-try:
-    from asyncio import ensure_future as asyncio_ensure_future
-except ImportError:
-    from asyncio import async as asyncio_ensure_future
-
-
 class MyCoapResource(aiocoap.resource.Resource):
     """A CoAP Resource for receiving USP messages"""
     def __init__(self, binding, debug=False):
@@ -72,26 +82,27 @@ class MyCoapResource(aiocoap.resource.Resource):
         self._binding = binding
         self._logger = logging.getLogger(self.__class__.__name__)
 
-    @asyncio.coroutine
-    def render_get(self, request):
+    async def needs_blockwise_assembly(self, request):
+        """Receive each Block1 block of a Block-wise transfer, so that it is reassembled by the Binding
+            (which limits the size of the payload) instead of by the CoAP library"""
+        return False
+
+    async def render_get(self, request):
         """CoAP Resource for USP - handle the GET Method"""
         self._logger.warning("GET:: Received a CoAP Request on the USP Resource; only POST is allowed")
         return aiocoap.Message(code=aiocoap.Code.METHOD_NOT_ALLOWED)
 
-    @asyncio.coroutine
-    def render_put(self, request):
+    async def render_put(self, request):
         """CoAP Resource for USP - handle the PUT Method"""
         self._logger.warning("PUT:: Received a CoAP Request on the USP Resource; only POST is allowed")
         return aiocoap.Message(code=aiocoap.Code.METHOD_NOT_ALLOWED)
 
-    @asyncio.coroutine
-    def render_delete(self, request):
+    async def render_delete(self, request):
         """CoAP Resource for USP - handle the DELETE Method"""
         self._logger.warning("DELETE:: Received a CoAP Request on the USP Resource; only POST is allowed")
         return aiocoap.Message(code=aiocoap.Code.METHOD_NOT_ALLOWED)
 
-    @asyncio.coroutine
-    def render_post(self, request):
+    async def render_post(self, request):
         """CoAP Resource for USP - handle the POST Method"""
         self._logger.info("POST:: Received a CoAP Request on the USP Resource")
         self._logger.debug("Payload received: [%s]", request.payload)
@@ -106,17 +117,7 @@ class MyCoapResource(aiocoap.resource.Resource):
             reply_to_addr = self._binding.validate_uri_query(request.opt.uri_query)
             if reply_to_addr is not None:
                 self._logger.debug("Incoming CoAP POST Request URI-Query Validated")
-
-                if self._binding.validate_payload(request.payload):
-                    self._logger.debug("Incoming CoAP POST Request Payload Validated")
-                    asyncio.get_event_loop().call_soon(self._binding.push, request.payload, reply_to_addr)
-                    response = aiocoap.Message(code=aiocoap.Code.CHANGED)
-                    self._logger.info("Responding to the CoAP Request with a 2.04 Status Code")
-                else:
-                    # Failed Payload Validation, respond with 4.00
-                    self._logger.warning("The payload of the Incoming CoAP Request failed the Binding's validation")
-                    response = aiocoap.Message(code=aiocoap.Code.BAD_REQUEST)
-                    self._logger.info("Responding to the CoAP Request with a 4.00 Status Code")
+                response = self._process_payload(request, reply_to_addr)
             else:
                 # Failed 'reply-to' URI-Query Validation, respond with 4.00
                 self._logger.warning("The 'reply-to' address on the Incoming CoAP Request is missing")
@@ -142,6 +143,67 @@ class MyCoapResource(aiocoap.resource.Resource):
 
         return link
 
+    def _process_payload(self, request, reply_to_addr):
+        """Reassemble (for Block-wise transfers), validate, and dispatch the payload of a USP POST Request"""
+        payload = request.payload
+        block1 = request.opt.block1
+        final_block1 = None
+
+        if block1 is not None:
+            try:
+                payload = self._binding.reassemble_block(request.remote, reply_to_addr, block1, payload,
+                                                         request.opt.size1)
+            except coap_blockwise.BlockwiseTooLargeError as err:
+                # Payload is larger than we are willing to reassemble, respond with 4.13
+                self._logger.warning("Incoming CoAP Block-wise Request is too large: %s", err)
+                response = aiocoap.Message(code=aiocoap.Code.REQUEST_ENTITY_TOO_LARGE)
+                response.opt.size1 = self._binding.get_max_payload_size()
+                self._logger.info("Responding to the CoAP Request with a 4.13 Status Code")
+                return response
+            except coap_blockwise.BlockwiseIncompleteError as err:
+                # Block doesn't continue a known transfer, respond with 4.08
+                self._logger.warning("Incoming CoAP Block-wise Request is incomplete: %s", err)
+                response = aiocoap.Message(code=aiocoap.Code.REQUEST_ENTITY_INCOMPLETE)
+                self._logger.info("Responding to the CoAP Request with a 4.08 Status Code")
+                return response
+
+            if payload is None:
+                # Acknowledge the Block (asking for smaller Blocks if needed), respond with 2.31
+                response = aiocoap.Message(code=aiocoap.Code.CONTINUE)
+                response.opt.block1 = (block1.block_number, True,
+                                       min(block1.size_exponent, self._binding.get_size_exponent()))
+                self._logger.info("Responding to the CoAP Block-wise Request with a 2.31 Status Code")
+                return response
+
+            # The Response to the final Block echoes its Block1 Option (RFC 7959, Section 2.3)
+            final_block1 = (block1.block_number, False, block1.size_exponent)
+
+        if self._binding.validate_payload(payload) is not None:
+            self._logger.debug("Incoming CoAP POST Request Payload Validated")
+            if self._binding.is_async_mode():
+                # Handle the Request on this Event Loop instead of queueing it for a Binding Listener
+                request_task = asyncio.ensure_future(self._binding.handle_request(payload, reply_to_addr))
+                request_task.add_done_callback(self._log_request_failure)
+            else:
+                asyncio.get_event_loop().call_soon(self._binding.push, payload, reply_to_addr)
+            response = aiocoap.Message(code=aiocoap.Code.CHANGED)
+            self._logger.info("Responding to the CoAP Request with a 2.04 Status Code")
+        else:
+            # Failed Payload Validation, respond with 4.00
+            self._logger.warning("The payload of the Incoming CoAP Request failed the Binding's validation")
+            response = aiocoap.Message(code=aiocoap.Code.BAD_REQUEST)
+            self._logger.info("Responding to the CoAP Request with a 4.00 Status Code")
+
+        if final_block1 is not None:
+            response.opt.block1 = final_block1
+
+        return response
+
+    def _log_request_failure(self, request_task):
+        """Log the failure of a Request that was handled directly on the CoAP Event Loop"""
+        if not request_task.cancelled() and request_task.exception() is not None:
+            self._logger.error("Failed to handle an Incoming CoAP Request: %s", request_task.exception())
+
 
 class CoapReceivingThread(threading.Thread):
     """A Thread that executes the AsyncIO Event Loop Processing to receive CoAP messages"""
@@ -149,10 +211,15 @@ class CoapReceivingThread(threading.Thread):
         """Initialize the CoAP Receiving Thread"""
         threading.Thread.__init__(self, name="CoAP Receiving Thread")
         self._debug = debug
+        self._context = None
         self._resource_tree = resource_tree
         self._listening_port = listening_port
         self._logger = logging.getLogger(self.__class__.__name__)
 
+    def get_context(self):
+        """Retrieve the CoAP Server Context (None until the Event Loop has created it)"""
+        return self._context
+
     def run(self):
         """Listen for incoming CoAP messages for the Resources provided"""
         # The server context contains the "usp" resource, which ties back to our MyCoapResource, so when
@@ -163,22 +230,28 @@ class CoapReceivingThread(threading.Thread):
         my_event_loop.set_debug(self._debug)
         asyncio.set_event_loop(my_event_loop)
         self._logger.info("Creating a CoAP Server Context for the Resource Tree")
-        asyncio_ensure_future(
-            aiocoap.Context.create_server_context(self._resource_tree, bind=("::", self._listening_port)))
+        asyncio.ensure_future(self._create_context())
 
         self._logger.info("Starting the AsyncIO CoAP Event Loop")
         my_event_loop.run_forever()
         self._logger.info("The AsyncIO CoAP Event Loop has Terminated")
         my_event_loop.close()
 
+    async def _create_context(self):
+        """Create the CoAP Server Context, which is also used to send messages from this Event Loop"""
+        self._context = await aiocoap.Context.create_server_context(self._resource_tree,
+                                                                     bind=("::", self._listening_port))
+
 
 class CoapSendingThread(threading.Thread):
     """A Thread that executes the AsyncIO Event Loop Processing to send a single CoAP message"""
-    def __init__(self, my_addr, serialized_msg, to_addr, debug=False):
+    def __init__(self, my_addr, serialized_msg, to_addr, size_exponent=coap_blockwise.MAX_SIZE_EXPONENT,
+                 debug=False):
         """Initialize the CoAP Sending Thread"""
         threading.Thread.__init__(self, name="CoAP Sending Thread - " + to_addr)
         self._debug = debug
         self._to_addr = to_addr
+        self._size_exponent = size_exponent
         self._serialized_msg = serialized_msg
         self._logger = logging.getLogger(self.__class__.__name__)
 
@@ -195,21 +268,15 @@ class CoapSendingThread(threading.Thread):
         my_event_loop.run_until_complete(self._issue_request(self._to_addr, self._serialized_msg))
         my_event_loop.close()
 
-    @asyncio.coroutine
-    def _issue_request(self, to_addr, serialized_msg):
+    async def _issue_request(self, to_addr, serialized_msg):
         """Send a ProtoBuf Serialized USP Message to the specified CoAP URL via the POST Method"""
-        msg = aiocoap.Message(code=aiocoap.Code.POST, payload=serialized_msg)
-        # Per CoAP this is application/octet-stream
-        msg.opt.content_format = 42
-        msg.set_request_uri(to_addr + "?reply-to=" + self._reply_to)
-
         self._logger.debug("Creating a CoAP Client Context")
-        context = yield from aiocoap.Context.create_client_context()
+        context = await aiocoap.Context.create_client_context()
 
         self._logger.info("Sending a CoAP message to the following address: %s", to_addr)
         self._logger.debug("Payload being sent: [%s]", serialized_msg)
         try:
-            resp = yield from context.request(msg).response
+            resp = await send_usp_post(context, serialized_msg, to_addr, self._reply_to, self._size_exponent)
             self._logger.info("CoAP Message Sent and [%s] Response received", resp.code)
         except aiocoap.error.RequestTimedOut:
             self._logger.warning("CoAP Message Sent, but no Response received due to a Timeout Error")
@@ -218,16 +285,23 @@ class CoapSendingThread(threading.Thread):
 class CoapUspBinding(generic_usp_binding.GenericUspBinding):
     """A COAP to USP Binding"""
     def __init__(self, my_ip, my_endpoint_id, listen_port=5683, sending_thr_timeout=5, resource_path='usp',
-                 debug=False):
+                 block_size=1024, max_payload_size=65536, debug=False):
         """Initialize the CoAP USP Binding for a USP Endpoint
-            - 5683 is the default CoAP port, but 5684 is the default CoAPS port"""
+            - 5683 is the default CoAP port, but 5684 is the default CoAPS port
+            - block_size is the preferred Block-wise transfer size (16 - 1024 bytes, a power of 2)"""
         generic_usp_binding.GenericUspBinding.__init__(self)
         self._debug = debug
         self._listen_thread = None
         self._listen_port = listen_port
+        self._executor = None
         self._resource_path = resource_path
+        self._request_processor = None
         self._my_endpoint_id = my_endpoint_id
         self._sending_thr_timeout = sending_thr_timeout
+        self._max_payload_size = max_payload_size
+        self._size_exponent = coap_blockwise.get_size_exponent(block_size)
+        self._reassembler = coap_blockwise.BlockwiseReassembler(max_payload_size)
+        self._record_validator = record_header.RecordHeaderValidator(my_endpoint_id)
         self._resource = MyCoapResource(self, self._debug)
         self._logger = logging.getLogger(self.__class__.__name__)
         self._my_addr = "coap://" + my_ip + ":" + str(listen_port) + "/" + resource_path
@@ -247,14 +321,60 @@ class CoapUspBinding(generic_usp_binding.GenericUspBinding):
         return reply_to_addr
 
     def validate_payload(self, payload):
-        """Validate the payload of the Incoming CoAP message to ensure it is properly formed"""
-        # TODO: Implement payload validation
-        return True
+        """Validate the payload of the Incoming CoAP message to ensure it is properly formed
+            - returns the Record Header of the payload, or None if it is to be dropped"""
+        return self._record_validator.validate(payload)
+
+    def get_size_exponent(self):
+        """Retrieve the Block Option SZX value for the preferred Block-wise transfer size"""
+        return self._size_exponent
+
+    def get_max_payload_size(self):
+        """Retrieve the largest payload that will be reassembled from a Block-wise transfer"""
+        return self._max_payload_size
+
+    def reassemble_block(self, remote, reply_to_addr, block1, payload, total_size):
+        """Add an incoming Block1 block to its transfer; return the complete payload after the last Block"""
+        return self._reassembler.add_block((remote, reply_to_addr), block1.block_number, block1.more,
+                                           block1.size_exponent, payload, total_size)
+
+    def set_request_processor(self, request_processor, max_workers=1):
+        """Enable the AsyncIO-native mode: Requests are handled on the CoAP Event Loop by the provided
+            Request Processor (with the Database work offloaded to an Executor) instead of being queued"""
+        self._request_processor = request_processor
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+    def is_async_mode(self):
+        """Return True if Requests are handled directly on the CoAP Event Loop"""
+        return self._request_processor is not None
+
+    async def handle_request(self, payload, reply_to_addr):
+        """Process the Request in the Executor and send the Response from the CoAP Event Loop"""
+        event_loop = asyncio.get_event_loop()
+        serialized_resp_record = await event_loop.run_in_executor(
+            self._executor, self._request_processor.process, payload, reply_to_addr)
+
+        if serialized_resp_record is not None:
+            context = self._listen_thread.get_context()
+            if context is None:
+                self._logger.warning("No CoAP Server Context available, dropping the Response to [%s]", reply_to_addr)
+                return
+
+            reply_to = self._my_addr.split("://")[1]
+
+            self._logger.info("Sending a CoAP message to the following address: %s", reply_to_addr)
+            self._logger.debug("Payload being sent: [%s]", serialized_resp_record)
+            try:
+                resp = await send_usp_post(context, serialized_resp_record, reply_to_addr, reply_to,
+                                           self._size_exponent)
+                self._logger.info("CoAP Message Sent and [%s] Response received", resp.code)
+            except aiocoap.error.RequestTimedOut:
+                self._logger.warning("CoAP Message Sent, but no Response received due to a Timeout Error")
 
     def send_msg(self, serialized_msg, to_addr):
         """Send the ProtoBuf Serialized message to the provided CoAP address"""
         self._logger.info("Starting a CoAP Sending Thread")
-        coap_send_thr = CoapSendingThread(self._my_addr, serialized_msg, to_addr, self._debug)
+        coap_send_thr = CoapSendingThread(self._my_addr, serialized_msg, to_addr, self._size_exponent, self._debug)
         coap_send_thr.start()
         coap_send_thr.join(self._sending_thr_timeout)
 
@@ -273,7 +393,51 @@ class CoapUspBinding(generic_usp_binding.GenericUspBinding):
         self._listen_thread = CoapReceivingThread(resource_tree, self._listen_port, self._debug)
         self._listen_thread.start()
 
+    def get_listen_thread(self):
+        """Retrieve the CoAP Receiving Thread (None until listen is called)"""
+        return self._listen_thread
+
     def clean_up(self):
         """Clean up the COAP Binding - close the event loop"""
         # TODO: Maybe terminate the listening thread???
-        pass
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+def build_usp_post(serialized_msg, to_addr, reply_to):
+    """Build a CoAP POST Request that carries a ProtoBuf Serialized USP Message to the specified CoAP URL"""
+    msg = aiocoap.Message(code=aiocoap.Code.POST, payload=serialized_msg)
+    # Per CoAP this is application/octet-stream
+    msg.opt.content_format = 42
+    msg.set_request_uri(to_addr + "?reply-to=" + reply_to)
+
+    return msg
+
+
+async def send_usp_post(context, serialized_msg, to_addr, reply_to, size_exponent):
+    """Send a ProtoBuf Serialized USP Message via the POST Method, using a Block1 transfer when the
+        message is larger than the Block Size; return the CoAP Response to the final Block"""
+    if len(serialized_msg) <= coap_blockwise.get_block_size(size_exponent):
+        resp = await context.request(build_usp_post(serialized_msg, to_addr, reply_to)).response
+        return resp
+
+    block_number = 0
+    while True:
+        block, more = coap_blockwise.get_block(serialized_msg, block_number, size_exponent)
+        msg = build_usp_post(block, to_addr, reply_to)
+        msg.opt.block1 = (block_number, more, size_exponent)
+        if block_number == 0:
+            msg.opt.size1 = len(serialized_msg)
+
+        resp = await context.request(msg, handle_blockwise=False).response
+
+        # Stop on the final Block or when the Block wasn't acknowledged (older servers use 2.04 instead of 2.31)
+        if not more or resp.opt.block1 is None or resp.code not in (aiocoap.Code.CONTINUE, aiocoap.Code.CHANGED):
+            return resp
+
+        # The server may ask for smaller Blocks, which re-numbers the remaining Blocks
+        if resp.opt.block1.size_exponent < size_exponent:
+            block_number = (block_number + 1) * 2 ** (size_exponent - resp.opt.block1.size_exponent)
+            size_exponent = resp.opt.block1.size_exponent
+        else:
+            block_number += 1
@@ -28,19 +28,26 @@
 # Class Structure:
 #  - GenericUspBinding(object)
 #    - __init__(sleep_time_interval=1)
-#    - push(payload)
+#    - push(payload, reply_to_addr, ack_id=None)
 #    - pop()
 #    - get_msg(timeout=-1)
 #    - not_my_msg(payload)
+#    - ack_msg(queue_item)
 #    - send_msg(serialized_msg, to_addr)
 #    - listen()
 #    - clean_up()
+#  - BlockingUspBinding(GenericUspBinding)
+#    - __init__()
+#    - push(payload, reply_to_addr, ack_id=None)
+#    - not_my_msg(queue_item)
+#    - get_msg(timeout=-1)
 #
 """
 
 
 import time
 import logging
+import threading
 import collections
 
 
@@ -52,10 +59,11 @@ class GenericUspBinding:
         self._sleep_time_interval = sleep_time_interval
         self._logger = logging.getLogger(self.__class__.__name__)
 
-    def push(self, payload, reply_to_addr):
-        """Push the provided message payload onto the end of the incoming message queue"""
+    def push(self, payload, reply_to_addr, ack_id=None):
+        """Push the provided message payload onto the end of the incoming message queue
+            - ack_id identifies the message to the Protocol-specific USP Binding when it must be acknowledged"""
         self._logger.debug("Pushing a Queue Item onto the end of the incoming message queue")
-        self._incoming_queue.append(ExpiringQueueItem(payload, reply_to_addr))
+        self._incoming_queue.append(ExpiringQueueItem(payload, reply_to_addr, ack_id=ack_id))
 
     def pop(self):
         """Pop the next payload off of the front of the incoming message queue"""
@@ -64,6 +72,7 @@ class GenericUspBinding:
         if self._incoming_queue:
             queue_item = self._incoming_queue.popleft()
             if queue_item.is_expired():
+                self.ack_msg(queue_item)
                 queue_item = None
                 self._logger.info("Popped an expired Queue Item, try again!")
             else:
@@ -94,6 +103,11 @@ class GenericUspBinding:
         self._logger.debug("Not my Message; Re-Pushing a Queue Item onto the end of the incoming message queue")
         self._incoming_queue.append(queue_item)
 
+    def ack_msg(self, queue_item):
+        """Acknowledge that the Queue Item has been handled; only needed by Protocol-specific USP Bindings
+            that push an ack_id, so there is nothing to do by default"""
+        pass
+
     def send_msg(self, serialized_msg, to_addr):
         """Send the ProtoBuf Serialized Message to the provided address via the Protocol-specific USP Binding"""
         raise NotImplementedError()
@@ -107,11 +121,47 @@ class GenericUspBinding:
         raise NotImplementedError()
 
 
+class BlockingUspBinding(GenericUspBinding):
+    """A Generic USP Binding whose get_msg waits on a Condition instead of sleeping between polls,
+        so that an incoming message is handed to the waiting listener as soon as it is pushed"""
+    def __init__(self):
+        """Initialize the Blocking USP Binding"""
+        GenericUspBinding.__init__(self)
+        self._condition = threading.Condition()
+
+    def push(self, payload, reply_to_addr, ack_id=None):
+        """Push the payload onto the incoming message queue and wake up a waiting listener"""
+        with self._condition:
+            GenericUspBinding.push(self, payload, reply_to_addr, ack_id)
+            self._condition.notify()
+
+    def not_my_msg(self, queue_item):
+        """Re-Push the Queue Item onto the incoming message queue and wake up a waiting listener"""
+        with self._condition:
+            GenericUspBinding.not_my_msg(self, queue_item)
+            self._condition.notify()
+
+    def get_msg(self, timeout=-1):
+        """Retrieve the next incoming Queue Item, waiting up to timeout seconds for one to arrive"""
+        wait_until = time.time() + timeout
+
+        with self._condition:
+            queue_item = self.pop()
+
+            while queue_item is None and time.time() < wait_until:
+                if not self._incoming_queue:
+                    self._condition.wait(wait_until - time.time())
+                queue_item = self.pop()
+
+        return queue_item
+
+
 class ExpiringQueueItem:
     """A Queue Item that has a TTL and a Payload"""
-    def __init__(self, payload, reply_to_addr, ttl=60):
+    def __init__(self, payload, reply_to_addr, ttl=60, ack_id=None):
         """Initialize the ExpiringQueueItem with the payload and a TTL (default of 60 seconds)"""
         self._ttl = ttl
+        self._ack_id = ack_id
         self._payload = payload
         self._create_time = time.time()
         self._reply_to_addr = reply_to_addr
@@ -132,3 +182,7 @@ class ExpiringQueueItem:
     def get_reply_to_addr(self):
         """Retrieve the Reply to Address"""
         return self._reply_to_addr
+
+    def get_ack_id(self):
+        """Retrieve the Acknowledgement ID (None if the message doesn't need to be acknowledged)"""
+        return self._ack_id
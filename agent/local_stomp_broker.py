@@ -0,0 +1,506 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+#
+# File Name: local_stomp_broker.py
+#
+# Description: A lightweight, in-process STOMP 1.2 Broker that tests and benchmarks can use
+#               in place of RabbitMQ (not intended for production use)
+#
+# Class Structure:
+#  - LocalStompBroker(threading.Thread)
+#    - __init__(host="127.0.0.1", port=0, subscribe_dest_format=None, max_frame_size=1048576)
+#    - start_broker(timeout=5)
+#    - get_port()
+#    - get_queue_depth(destination)
+#    - get_num_msgs_received()
+#    - get_num_msgs_delivered()
+#    - run()
+#    - stop()
+#    - handle_frame(session, command, headers, body)
+#  - BrokerStartupError(Exception)
+#
+# Functionality:
+#  - main() - run the Broker from the command line: python3 -m agent.local_stomp_broker --port 61613
+#
+"""
+
+import asyncio
+import logging
+import argparse
+import itertools
+import threading
+import collections
+
+from agent import stomp_frame
+
+
+AUTO_ACK_MODE = "auto"
+CLIENT_ACK_MODE = "client"
+CLIENT_INDIVIDUAL_ACK_MODE = "client-individual"
+
+# Headers that describe the SEND Frame itself and are not passed along in the MESSAGE Frame
+SEND_ONLY_HEADERS = ("destination", "transaction", "receipt", "content-length")
+
+
+class LocalStompBroker(threading.Thread):
+    """An in-process STOMP 1.2 Broker running an asyncio Event Loop in its own Thread
+        - all Destinations are treated as Queues (each message goes to one Subscriber)
+        - supports CONNECT/STOMP, SUBSCRIBE/UNSUBSCRIBE, SEND, ACK/NACK, BEGIN/COMMIT/ABORT, and DISCONNECT
+        - subscribe_dest_format (e.g. "/queue/{endpoint_id}") adds a 'subscribe-dest' header to CONNECTED"""
+    def __init__(self, host="127.0.0.1", port=0, subscribe_dest_format=None, max_frame_size=1048576):
+        """Initialize the Broker; a port of 0 picks a free port (see get_port)"""
+        threading.Thread.__init__(self, name="LocalStompBroker")
+        self.daemon = True
+        self._host = host
+        self._port = port
+        self._subscribe_dest_format = subscribe_dest_format
+        self._max_frame_size = max_frame_size
+        self._loop = None
+        self._server = None
+        self._ready = threading.Event()
+        self._session_list = []
+        self._msg_ids = itertools.count(1)
+        self._queue_dict = collections.defaultdict(collections.deque)
+        self._subscriber_dict = collections.defaultdict(list)
+        self._num_msgs_received = 0
+        self._num_msgs_delivered = 0
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def start_broker(self, timeout=5):
+        """Start the Broker Thread and wait until it is accepting connections; returns the port"""
+        self.start()
+
+        if not self._ready.wait(timeout):
+            raise BrokerStartupError("The Local STOMP Broker did not start within {} seconds".format(timeout))
+
+        return self._port
+
+    def get_port(self):
+        """Retrieve the port the Broker is listening on"""
+        return self._port
+
+    def get_queue_depth(self, destination):
+        """Retrieve the number of messages waiting to be delivered on the provided Destination"""
+        return len(self._queue_dict.get(destination, ()))
+
+    def get_num_msgs_received(self):
+        """Retrieve the number of messages that have been sent to the Broker"""
+        return self._num_msgs_received
+
+    def get_num_msgs_delivered(self):
+        """Retrieve the number of messages that have been delivered to Subscribers (including redeliveries)"""
+        return self._num_msgs_delivered
+
+    def run(self):
+        """Run the Broker's Event Loop until stopped"""
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._handle_connection, self._host, self._port, limit=self._max_frame_size))
+        self._port = self._server.sockets[0].getsockname()[1]
+        self._logger.info("Local STOMP Broker listening on [%s:%s]", self._host, self._port)
+        self._ready.set()
+
+        self._loop.run_forever()
+
+        # Clean up: stop accepting connections and close all of the existing ones
+        self._server.close()
+        for session in list(self._session_list):
+            session.close()
+
+        pending_tasks = asyncio.all_tasks(self._loop)
+        self._loop.run_until_complete(asyncio.gather(*pending_tasks, return_exceptions=True))
+        self._loop.run_until_complete(self._server.wait_closed())
+        self._loop.close()
+        self._logger.info("Local STOMP Broker stopped")
+
+    def stop(self):
+        """Stop the Broker and wait for its Thread to finish"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+        self.join()
+
+    async def _handle_connection(self, reader, writer):
+        """Handle a single client connection until it is closed"""
+        session = _StompSession(self, reader, writer)
+        self._session_list.append(session)
+
+        try:
+            await session.run()
+        finally:
+            self._session_list.remove(session)
+            self._remove_session(session)
+
+    def handle_frame(self, session, command, headers, body):
+        """Handle a Frame received on the provided Session"""
+        if not session.is_connected() and command not in ("CONNECT", "STOMP"):
+            session.send_error("Expected a CONNECT Frame, received [{}]".format(command))
+            return
+
+        handler = getattr(self, "_handle_" + command.lower(), None)
+        if handler is None:
+            session.send_error("Unsupported Frame [{}]".format(command))
+            return
+
+        try:
+            handler(session, headers, body)
+        except KeyError as missing_header:
+            session.send_error("Missing required header {} on [{}]".format(missing_header, command))
+            return
+
+        if "receipt" in headers and command not in ("CONNECT", "STOMP"):
+            session.send_frame("RECEIPT", {"receipt-id": headers["receipt"]})
+
+        if command == "DISCONNECT":
+            session.close()
+
+    def _handle_connect(self, session, headers, _body):
+        """Handle a CONNECT Frame"""
+        accept_version = headers.get("accept-version", "1.2")
+        if "1.2" not in accept_version.split(","):
+            session.send_error("Only STOMP 1.2 is supported")
+            return
+
+        connected_headers = {"version": "1.2", "heart-beat": "0,0", "server": "usp-agent-local-broker"}
+        if self._subscribe_dest_format is not None and "endpoint-id" in headers:
+            connected_headers["subscribe-dest"] = self._subscribe_dest_format.format(
+                endpoint_id=headers["endpoint-id"])
+
+        session.set_connected()
+        session.send_frame("CONNECTED", connected_headers)
+
+    # STOMP is the STOMP 1.2 name for CONNECT
+    _handle_stomp = _handle_connect
+
+    def _handle_send(self, session, headers, body):
+        """Handle a SEND Frame (held until COMMIT if it is part of a transaction)"""
+        destination = headers["destination"]
+
+        if "transaction" in headers:
+            session.add_to_transaction(headers["transaction"], destination, headers, body)
+        else:
+            self._enqueue(destination, headers, body)
+
+    def _handle_subscribe(self, session, headers, _body):
+        """Handle a SUBSCRIBE Frame"""
+        subscription = _Subscription(session, headers["id"], headers["destination"],
+                                     headers.get("ack", AUTO_ACK_MODE), int(headers.get("prefetch-count", 0)))
+        session.add_subscription(subscription)
+        self._subscriber_dict[subscription.destination].append(subscription)
+        self._dispatch(subscription.destination)
+
+    def _handle_unsubscribe(self, session, headers, _body):
+        """Handle an UNSUBSCRIBE Frame"""
+        subscription = session.remove_subscription(headers["id"])
+        if subscription is not None:
+            self._remove_subscription(subscription)
+
+    def _handle_ack(self, session, headers, _body):
+        """Handle an ACK Frame"""
+        subscription = session.find_subscription_by_ack_id(headers["id"])
+        if subscription is not None:
+            subscription.ack(headers["id"])
+            self._dispatch(subscription.destination)
+
+    def _handle_nack(self, session, headers, _body):
+        """Handle a NACK Frame - the message goes back to the front of the Queue"""
+        subscription = session.find_subscription_by_ack_id(headers["id"])
+        if subscription is not None:
+            for message in reversed(subscription.ack(headers["id"])):
+                message.redelivered = True
+                self._queue_dict[subscription.destination].appendleft(message)
+            self._dispatch(subscription.destination)
+
+    def _handle_begin(self, session, headers, _body):
+        """Handle a BEGIN Frame"""
+        session.begin_transaction(headers["transaction"])
+
+    def _handle_commit(self, session, headers, _body):
+        """Handle a COMMIT Frame"""
+        for destination, send_headers, body in session.end_transaction(headers["transaction"]):
+            self._enqueue(destination, send_headers, body)
+
+    def _handle_abort(self, session, headers, _body):
+        """Handle an ABORT Frame"""
+        session.end_transaction(headers["transaction"])
+
+    def _handle_disconnect(self, _session, _headers, _body):
+        """Handle a DISCONNECT Frame (the RECEIPT and close are handled by handle_frame)"""
+        pass
+
+    def _enqueue(self, destination, headers, body):
+        """Queue a message for the Destination and deliver it if there is a Subscriber available"""
+        msg_headers = {name: value for name, value in headers.items() if name not in SEND_ONLY_HEADERS}
+        self._queue_dict[destination].append(_Message(str(next(self._msg_ids)), msg_headers, body))
+        self._num_msgs_received += 1
+        self._dispatch(destination)
+
+    def _dispatch(self, destination):
+        """Deliver queued messages round-robin to the Subscribers that have room for them"""
+        queue = self._queue_dict[destination]
+        subscriber_list = self._subscriber_dict[destination]
+
+        while queue:
+            subscription = None
+            for index, candidate in enumerate(subscriber_list):
+                if candidate.can_deliver():
+                    subscription = candidate
+                    # Rotate so that the next message goes to the next Subscriber
+                    subscriber_list.append(subscriber_list.pop(index))
+                    break
+
+            if subscription is None:
+                break
+
+            self._num_msgs_delivered += 1
+            subscription.deliver(queue.popleft())
+
+    def _remove_subscription(self, subscription):
+        """Remove the Subscription and return its unacknowledged messages to the front of the Queue"""
+        self._subscriber_dict[subscription.destination].remove(subscription)
+
+        for message in reversed(subscription.get_unacked_msgs()):
+            message.redelivered = True
+            self._queue_dict[subscription.destination].appendleft(message)
+
+        self._dispatch(subscription.destination)
+
+    def _remove_session(self, session):
+        """Remove all of the Subscriptions of a closed Session"""
+        for subscription in session.get_subscriptions():
+            self._remove_subscription(subscription)
+
+
+class _StompSession:
+    """A single client connection to the Local STOMP Broker"""
+    def __init__(self, broker, reader, writer):
+        """Initialize the Session"""
+        self._broker = broker
+        self._reader = reader
+        self._writer = writer
+        self._connected = False
+        self._closed = False
+        self._subscription_dict = {}
+        self._transaction_dict = {}
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    async def run(self):
+        """Read and handle Frames until the connection is closed"""
+        try:
+            while not self._closed:
+                frame = await self._read_frame()
+                if frame is None:
+                    break
+
+                self._broker.handle_frame(self, *frame)
+                await self._writer.drain()
+        except (stomp_frame.MalformedFrameError, ValueError) as err:
+            self.send_error("Malformed Frame: {}".format(err))
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            self._logger.debug("Client connection closed while reading a Frame")
+        finally:
+            self.close()
+
+    async def _read_frame(self):
+        """Read the next Frame as (command, headers, body); returns None at end of stream"""
+        head_lines = []
+
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                return None
+
+            line = line.rstrip(b"\n").rstrip(b"\r")
+            if line:
+                head_lines.append(line)
+            elif head_lines:
+                break
+            # else: an EOL between Frames is a heart-beat
+
+        command, headers = stomp_frame.decode_frame_head(b"\n".join(head_lines))
+
+        if "content-length" in headers:
+            body = await self._reader.readexactly(int(headers["content-length"]))
+            if await self._reader.readexactly(1) != stomp_frame.FRAME_TERMINATOR:
+                raise stomp_frame.MalformedFrameError("Frame body is longer than its content-length")
+        else:
+            body = (await self._reader.readuntil(stomp_frame.FRAME_TERMINATOR))[:-1]
+
+        return command, headers, body
+
+    def is_connected(self):
+        """Return True once the CONNECT Frame has been accepted"""
+        return self._connected
+
+    def is_closed(self):
+        """Return True once the client connection has been closed"""
+        return self._closed
+
+    def set_connected(self):
+        """The CONNECT Frame has been accepted"""
+        self._connected = True
+
+    def send_frame(self, command, headers, body=b""):
+        """Write a Frame to the client"""
+        if not self._closed:
+            self._writer.write(stomp_frame.encode_frame(command, headers, body))
+
+    def send_error(self, message):
+        """Send an ERROR Frame and close the connection (as per STOMP 1.2)"""
+        self._logger.warning("Sending an ERROR Frame: %s", message)
+        self.send_frame("ERROR", {"message": message, "content-type": "text/plain"}, message)
+        self.close()
+
+    def close(self):
+        """Close the client connection"""
+        if not self._closed:
+            self._closed = True
+            self._writer.close()
+
+    def add_subscription(self, subscription):
+        """Add a Subscription to this Session"""
+        self._subscription_dict[subscription.sub_id] = subscription
+
+    def remove_subscription(self, sub_id):
+        """Remove (and return) the Subscription with the provided ID"""
+        return self._subscription_dict.pop(sub_id, None)
+
+    def get_subscriptions(self):
+        """Retrieve all of the Subscriptions of this Session"""
+        return list(self._subscription_dict.values())
+
+    def find_subscription_by_ack_id(self, ack_id):
+        """Find the Subscription that delivered the message with the provided ack ID"""
+        for subscription in self._subscription_dict.values():
+            if subscription.has_unacked_msg(ack_id):
+                return subscription
+
+        return None
+
+    def begin_transaction(self, transaction):
+        """Start a Transaction"""
+        self._transaction_dict[transaction] = []
+
+    def add_to_transaction(self, transaction, destination, headers, body):
+        """Hold a SEND until its Transaction is committed"""
+        self._transaction_dict[transaction].append((destination, headers, body))
+
+    def end_transaction(self, transaction):
+        """End a Transaction, returning the SENDs that were held for it"""
+        return self._transaction_dict.pop(transaction)
+
+
+class _Subscription:
+    """A Subscription of a Session to a Destination"""
+    def __init__(self, session, sub_id, destination, ack_mode, prefetch_count):
+        """Initialize the Subscription"""
+        self.sub_id = sub_id
+        self.destination = destination
+        self._session = session
+        self._ack_mode = ack_mode
+        self._prefetch_count = prefetch_count
+        self._unacked_msg_dict = collections.OrderedDict()
+
+    def can_deliver(self):
+        """Return True if the prefetch window has room for another message"""
+        if self._session.is_closed():
+            return False
+
+        return (self._ack_mode == AUTO_ACK_MODE or self._prefetch_count <= 0 or
+                len(self._unacked_msg_dict) < self._prefetch_count)
+
+    def deliver(self, message):
+        """Send a MESSAGE Frame to the Session"""
+        headers = dict(message.headers)
+        headers.update({"destination": self.destination, "message-id": message.msg_id, "subscription": self.sub_id})
+
+        if message.redelivered:
+            headers["redelivered"] = "true"
+
+        if self._ack_mode != AUTO_ACK_MODE:
+            headers["ack"] = message.msg_id
+            self._unacked_msg_dict[message.msg_id] = message
+
+        self._session.send_frame("MESSAGE", headers, message.body)
+
+    def has_unacked_msg(self, ack_id):
+        """Return True if the message with the provided ack ID is waiting to be acknowledged"""
+        return ack_id in self._unacked_msg_dict
+
+    def ack(self, ack_id):
+        """Acknowledge a message (and all earlier messages in "client" ack mode); returns the messages"""
+        acked_msg_list = []
+
+        if self._ack_mode == CLIENT_ACK_MODE:
+            while self._unacked_msg_dict:
+                msg_id, message = self._unacked_msg_dict.popitem(last=False)
+                acked_msg_list.append(message)
+                if msg_id == ack_id:
+                    break
+        else:
+            acked_msg_list.append(self._unacked_msg_dict.pop(ack_id))
+
+        return acked_msg_list
+
+    def get_unacked_msgs(self):
+        """Retrieve the messages that have been delivered but not acknowledged"""
+        return list(self._unacked_msg_dict.values())
+
+
+class _Message:
+    """A message waiting in (or delivered from) a Queue"""
+    def __init__(self, msg_id, headers, body):
+        """Initialize the Message"""
+        self.msg_id = msg_id
+        self.headers = headers
+        self.body = body
+        self.redelivered = False
+
+
+class BrokerStartupError(Exception):
+    """The Local STOMP Broker could not be started"""
+    pass
+
+
+def main():
+    """Run the Local STOMP Broker from the command line"""
+    parser = argparse.ArgumentParser(description="A lightweight STOMP 1.2 Broker for local testing")
+    parser.add_argument("--host", action="store", default="127.0.0.1", help="the address to listen on")
+    parser.add_argument("--port", action="store", type=int, default=61613, help="the port to listen on")
+    parser.add_argument("--subscribe-dest-format", action="store", default=None,
+                        help="the 'subscribe-dest' to return to clients, e.g. /queue/{endpoint_id}")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)-15s %(name)s %(levelname)-8s %(message)s')
+    broker = LocalStompBroker(args.host, args.port, args.subscribe_dest_format)
+    broker.start_broker()
+
+    try:
+        broker.join()
+    except KeyboardInterrupt:
+        broker.stop()
+
+
+if __name__ == "__main__":
+    main()
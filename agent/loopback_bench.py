@@ -0,0 +1,285 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+#
+# File Name: loopback_bench.py
+#
+# Description: Drives concurrent Get/Set/Operate Requests through the BindingListener and the
+#               UspRequestHandler via the LoopbackUspBinding and reports throughput and latency
+#
+# Class Structure:
+#  - BenchmarkResult(object)
+#    - __init__(elapsed_time, latency_dict, num_timeouts, num_errors=0)
+#    - get_num_requests(req_type=None)
+#    - get_num_timeouts()
+#    - get_num_errors()
+#    - get_throughput()
+#    - get_percentile(percentile, req_type=None)
+#    - format_report()
+#  - BenchmarkCamera(object)
+#    - take_picture()
+#
+# Functionality:
+#  - run_benchmark(dm_file, db_file, num_requests=1000, concurrency=8, req_types=("get", "set", "operate"),
+#                  num_listeners=1, timeout=10, service_map=None)
+#  - main() - run from the command line: python3 -m agent.loopback_bench -t camera -n 1000 -c 8
+#
+"""
+
+import os
+import math
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import threading
+
+from agent import agent_db
+from agent import abstract_agent
+from agent import request_handler
+from agent import loopback_usp_binding
+
+
+REQ_TYPES = ("get", "set", "operate")
+PERCENTILES = (50, 90, 99)
+
+GET_PARAM_PATH = "Device.DeviceInfo."
+SET_OBJ_PATH = "Device.Time."
+SET_PARAM = "NTPServer1"
+OPERATE_COMMAND = request_handler.TAKE_PICTURE_CAMERA_OP
+
+
+class BenchmarkResult:
+    """The throughput and latency measurements of a benchmark run"""
+    def __init__(self, elapsed_time, latency_dict, num_timeouts, num_errors=0):
+        """Initialize the Result; latency_dict maps a Request type to a list of latencies (in seconds)
+            - num_errors counts the Requests that received an Error instead of a Response"""
+        self._elapsed_time = elapsed_time
+        self._num_errors = num_errors
+        self._num_timeouts = num_timeouts
+        self._latency_dict = {req_type: sorted(latency_list) for req_type, latency_list in latency_dict.items()}
+        self._all_latencies = sorted(latency for latency_list in latency_dict.values() for latency in latency_list)
+
+    def get_num_requests(self, req_type=None):
+        """Retrieve the number of Requests that received a (non-Error) Response"""
+        return len(self._get_latencies(req_type))
+
+    def get_num_timeouts(self):
+        """Retrieve the number of Requests that did not receive a Response in time"""
+        return self._num_timeouts
+
+    def get_num_errors(self):
+        """Retrieve the number of Requests that received an Error (not included in the latencies)"""
+        return self._num_errors
+
+    def get_throughput(self):
+        """Retrieve the number of Request/Response round trips per second"""
+        if self._elapsed_time <= 0:
+            return 0.0
+
+        return len(self._all_latencies) / self._elapsed_time
+
+    def get_percentile(self, percentile, req_type=None):
+        """Retrieve the latency (in seconds) at the provided percentile (nearest-rank)"""
+        latency_list = self._get_latencies(req_type)
+
+        if not latency_list:
+            return 0.0
+
+        rank = max(1, int(math.ceil(percentile / 100.0 * len(latency_list))))
+        return latency_list[rank - 1]
+
+    def format_report(self):
+        """Format the Result as a human readable report"""
+        report_lines = ["Requests: {}  Errors: {}  Timeouts: {}  Elapsed: {:.3f}s  Throughput: {:.1f} req/s".format(
+            self.get_num_requests(), self._num_errors, self._num_timeouts, self._elapsed_time, self.get_throughput())]
+
+        for req_type in [None] + sorted(self._latency_dict):
+            if self.get_num_requests(req_type) > 0:
+                percentile_strs = ["p{}={:.3f}ms".format(percentile, self.get_percentile(percentile, req_type) * 1000)
+                                   for percentile in PERCENTILES]
+                percentile_strs.append("max={:.3f}ms".format(self._get_latencies(req_type)[-1] * 1000))
+                report_lines.append("  {:<8} n={:<6} {}".format(
+                    req_type or "all", self.get_num_requests(req_type), "  ".join(percentile_strs)))
+
+        return "\n".join(report_lines)
+
+    def _get_latencies(self, req_type):
+        """Retrieve the sorted latencies for the Request type (or all of them)"""
+        if req_type is None:
+            return self._all_latencies
+
+        return self._latency_dict.get(req_type, [])
+
+
+class BenchmarkCamera:
+    """A stand-in for the Camera service, so that Operate Requests exercise the Agent without camera hardware"""
+    def take_picture(self):
+        """Return the output arguments of a TakePicture() Command without capturing anything"""
+        return ["benchmark_1.jpg", "benchmark_2.jpg"]
+
+
+class _ControllerWorker(threading.Thread):
+    """A Thread that sends its share of the Requests one at a time and records the latencies"""
+    def __init__(self, controller, first_req_num, num_requests, req_types, start_barrier, timeout):
+        """Initialize the Worker; it sends Requests first_req_num to first_req_num + num_requests - 1"""
+        threading.Thread.__init__(self, name="LoopbackBench-" + str(id(controller)))
+        self.daemon = True
+        self.num_errors = 0
+        self.num_timeouts = 0
+        self.latency_dict = {req_type: [] for req_type in req_types}
+        self._timeout = timeout
+        self._req_types = req_types
+        self._controller = controller
+        self._first_req_num = first_req_num
+        self._num_requests = num_requests
+        self._start_barrier = start_barrier
+
+    def run(self):
+        """Send the Requests, cycling through the Request types"""
+        self._start_barrier.wait()
+
+        for req_num in range(self._first_req_num, self._first_req_num + self._num_requests):
+            req_type = self._req_types[req_num % len(self._req_types)]
+            msg_id, serialized_record = self._build_request(req_type, req_num)
+            resp_msg, latency = self._controller.send_request(msg_id, serialized_record, self._timeout)
+
+            if resp_msg is None:
+                self.num_timeouts += 1
+            elif resp_msg.body.HasField("error"):
+                # An Error doesn't exercise the Request type being measured, so keep it out of the latencies
+                self.num_errors += 1
+            else:
+                self.latency_dict[req_type].append(latency)
+
+    def _build_request(self, req_type, req_num):
+        """Build the Request Record for the provided Request type"""
+        if req_type == "get":
+            return self._controller.build_get([GET_PARAM_PATH])
+
+        if req_type == "set":
+            return self._controller.build_set(SET_OBJ_PATH, {SET_PARAM: "ntp{}.example.com".format(req_num)})
+
+        return self._controller.build_operate(OPERATE_COMMAND)
+
+
+def run_benchmark(dm_file, db_file, num_requests=1000, concurrency=8, req_types=REQ_TYPES,
+                  num_listeners=1, timeout=10, service_map=None):
+    """Send num_requests Requests from concurrency Controllers through num_listeners Binding Listeners
+        - the Database is copied to a temporary file so that Set Requests don't modify db_file
+        - service_map defaults to a BenchmarkCamera for the Database's ProductClass, so Operate Requests
+          succeed against a Camera Database (e.g. camera-db.json)"""
+    temp_dir = tempfile.mkdtemp(prefix="usp-bench-")
+
+    try:
+        temp_db_file = os.path.join(temp_dir, os.path.basename(db_file))
+        shutil.copyfile(db_file, temp_db_file)
+
+        database = agent_db.Database(dm_file, temp_db_file, "lo")
+        endpoint_id = database.get("Device.LocalAgent.EndpointID")
+        if service_map is None:
+            service_map = {database.get("Device.DeviceInfo.ProductClass"): BenchmarkCamera()}
+        msg_handler = request_handler.UspRequestHandler(endpoint_id, database, service_map)
+
+        # Operations finish after their OperateResp, so count their Request objects being deleted
+        operations_done = threading.Semaphore(0)
+
+        def handle_delete(instance_path):
+            """Count each completed Operation"""
+            if instance_path.startswith(request_handler.REQUEST_TABLE):
+                operations_done.release()
+
+        database.add_delete_listener(handle_delete)
+        binding = loopback_usp_binding.LoopbackUspBinding()
+
+        for listener_num in range(num_listeners):
+            listener = abstract_agent.BindingListener("Loopback-" + str(listener_num), binding, msg_handler, 1)
+            listener.daemon = True
+            listener.start()
+
+        worker_list = []
+        first_req_num = 0
+        start_barrier = threading.Barrier(concurrency + 1)
+        for worker_num in range(concurrency):
+            # Spread the remainder over the first few Workers
+            worker_requests = num_requests // concurrency + (1 if worker_num < num_requests % concurrency else 0)
+            controller = loopback_usp_binding.LoopbackController(
+                binding, "bench-controller-" + str(worker_num), endpoint_id)
+            worker = _ControllerWorker(controller, first_req_num, worker_requests, tuple(req_types),
+                                       start_barrier, timeout)
+            worker.start()
+            worker_list.append(worker)
+            first_req_num += worker_requests
+
+        start_barrier.wait()
+        start_time = time.perf_counter()
+        for worker in worker_list:
+            worker.join()
+        elapsed_time = time.perf_counter() - start_time
+
+        # Let the Operations that are still running finish before their Database file goes away
+        num_operations = sum(len(worker.latency_dict.get("operate", [])) for worker in worker_list)
+        for _operation_num in range(num_operations):
+            operations_done.acquire(timeout=timeout)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    latency_dict = {req_type: [] for req_type in req_types}
+    for worker in worker_list:
+        for req_type, latency_list in worker.latency_dict.items():
+            latency_dict[req_type].extend(latency_list)
+
+    return BenchmarkResult(elapsed_time, latency_dict, sum(worker.num_timeouts for worker in worker_list),
+                           sum(worker.num_errors for worker in worker_list))
+
+
+def main():
+    """Run the Loopback Benchmark from the command line"""
+    parser = argparse.ArgumentParser(description="Measure Agent-side USP Request handling via the Loopback Binding")
+    parser.add_argument("-t", "--client-type", action="store", default="camera",
+                        help="specify the type of client (e.g. camera, test, motion); Operate needs camera")
+    parser.add_argument("-n", "--num-requests", action="store", type=int, default=1000,
+                        help="the total number of Requests to send")
+    parser.add_argument("-c", "--concurrency", action="store", type=int, default=8,
+                        help="the number of Controllers sending Requests concurrently")
+    parser.add_argument("-l", "--listeners", action="store", type=int, default=1,
+                        help="the number of Binding Listeners handling Requests")
+    parser.add_argument("--mix", action="store", default=",".join(REQ_TYPES),
+                        help="comma separated Request types to cycle through (get, set, operate)")
+    args = parser.parse_args()
+
+    req_types = [req_type.strip() for req_type in args.mix.split(",") if req_type.strip()]
+    for req_type in req_types:
+        if req_type not in REQ_TYPES:
+            parser.error("Unsupported Request type [{}]".format(req_type))
+
+    logging.basicConfig(level=logging.WARNING)
+    dm_file_name = "database/{}-dm.json".format(args.client_type)
+    db_file_name = "database/{}-db.json".format(args.client_type)
+    result = run_benchmark(dm_file_name, db_file_name, args.num_requests, args.concurrency,
+                           req_types, args.listeners)
+    print(result.format_report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+#
+# File Name: loopback_usp_binding.py
+#
+# Description: An in-process USP Binding (and Controller stub) that removes the network and
+#               Broker from the Request/Response path, so that the Agent-side cost can be measured
+#
+# Class Structure:
+#  - LoopbackUspBinding(generic_usp_binding.BlockingUspBinding)
+#    - __init__()
+#    - add_controller(controller_addr, controller)
+#    - send_msg(serialized_msg, to_addr)
+#    - listen(agent_addr)
+#    - clean_up()
+#  - LoopbackController(object)
+#    - __init__(binding, endpoint_id, agent_endpoint_id)
+#    - build_get(param_paths)
+#    - build_set(obj_path, param_value_dict, allow_partial=False)
+#    - build_operate(command, input_args=None)
+#    - send_request(msg_id, serialized_record, timeout=10)
+#    - receive(serialized_record)
+#
+"""
+
+import time
+import logging
+import itertools
+import threading
+
+from agent import usp_msg_pb2 as usp_msg
+from agent import usp_record_pb2 as usp_record
+from agent import generic_usp_binding
+
+
+class LoopbackUspBinding(generic_usp_binding.BlockingUspBinding):
+    """A USP Binding that delivers Requests and Responses in-process"""
+    def __init__(self):
+        """Initialize the Loopback USP Binding"""
+        generic_usp_binding.BlockingUspBinding.__init__(self)
+        self._agent_addr = None
+        self._controller_dict = {}
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def add_controller(self, controller_addr, controller):
+        """Deliver messages sent to the provided address to the provided Controller"""
+        self._controller_dict[controller_addr] = controller
+
+    def send_msg(self, serialized_msg, to_addr):
+        """Deliver the ProtoBuf Serialized message to the Controller at the provided address"""
+        controller = self._controller_dict.get(to_addr)
+
+        if controller is None:
+            self._logger.warning("No Loopback Controller at address [%s], dropping the message", to_addr)
+        else:
+            controller.receive(serialized_msg)
+
+    def listen(self, agent_addr):
+        """Nothing to subscribe to; just remember the Agent's address"""
+        self._agent_addr = agent_addr
+
+    def clean_up(self):
+        """Nothing to clean up"""
+        pass
+
+
+class LoopbackController:
+    """An in-process Controller stub that sends Requests through a LoopbackUspBinding and waits for the Responses"""
+    def __init__(self, binding, endpoint_id, agent_endpoint_id):
+        """Initialize the Loopback Controller and register it with the Binding"""
+        self._binding = binding
+        self._endpoint_id = endpoint_id
+        self._agent_endpoint_id = agent_endpoint_id
+        self._msg_ids = itertools.count(1)
+        self._pending_lock = threading.Lock()
+        self._pending_dict = {}
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        binding.add_controller(endpoint_id, self)
+
+    def build_get(self, param_paths):
+        """Build a Get Request Record; returns (msg_id, serialized_record)"""
+        msg = self._build_msg(usp_msg.Header.GET)
+        msg.body.request.get.param_paths.extend(param_paths)
+        return msg.header.msg_id, self._wrap_in_record(msg)
+
+    def build_set(self, obj_path, param_value_dict, allow_partial=False):
+        """Build a Set Request Record that updates a single Object; returns (msg_id, serialized_record)"""
+        msg = self._build_msg(usp_msg.Header.SET)
+        msg.body.request.set.allow_partial = allow_partial
+        update_obj = msg.body.request.set.update_objs.add()
+        update_obj.obj_path = obj_path
+
+        for param, value in param_value_dict.items():
+            param_setting = update_obj.param_settings.add()
+            param_setting.param = param
+            param_setting.value = value
+            param_setting.required = True
+
+        return msg.header.msg_id, self._wrap_in_record(msg)
+
+    def build_operate(self, command, input_args=None):
+        """Build an Operate Request Record; returns (msg_id, serialized_record)"""
+        msg = self._build_msg(usp_msg.Header.OPERATE)
+        msg.body.request.operate.command = command
+        msg.body.request.operate.send_resp = True
+
+        if input_args is not None:
+            msg.body.request.operate.input_args.update(input_args)
+
+        return msg.header.msg_id, self._wrap_in_record(msg)
+
+    def send_request(self, msg_id, serialized_record, timeout=10):
+        """Send the Request and wait for its Response
+            - returns the Response as a usp_msg_pb2.Msg (or None on timeout) and the latency in seconds"""
+        response_event = threading.Event()
+
+        with self._pending_lock:
+            self._pending_dict[msg_id] = [response_event, None]
+
+        start_time = time.perf_counter()
+        self._binding.push(serialized_record, self._endpoint_id)
+        response_event.wait(timeout)
+        latency = time.perf_counter() - start_time
+
+        with self._pending_lock:
+            resp_msg = self._pending_dict.pop(msg_id)[1]
+
+        return resp_msg, latency
+
+    def receive(self, serialized_record):
+        """Handle a Response Record delivered by the Binding"""
+        resp_record = usp_record.Record()
+        resp_record.ParseFromString(serialized_record)
+        resp_msg = usp_msg.Msg()
+        resp_msg.ParseFromString(resp_record.no_session_context.payload)
+
+        with self._pending_lock:
+            pending = self._pending_dict.get(resp_msg.header.msg_id)
+
+            if pending is None:
+                self._logger.warning("Received an unexpected Response with msg_id [%s]", resp_msg.header.msg_id)
+            else:
+                pending[1] = resp_msg
+                pending[0].set()
+
+    def _build_msg(self, msg_type):
+        """Build a USP Message with a unique msg_id and the provided msg_type"""
+        msg = usp_msg.Msg()
+        msg.header.msg_id = "{}-{}".format(self._endpoint_id, next(self._msg_ids))
+        msg.header.msg_type = msg_type
+        return msg
+
+    def _wrap_in_record(self, msg):
+        """Wrap the USP Message in a serialized USP Record addressed to the Agent"""
+        record = usp_record.Record()
+        record.version = "1.0"
+        record.to_id = self._agent_endpoint_id
+        record.from_id = self._endpoint_id
+        record.payload_security = usp_record.Record.PLAINTEXT
+        record.no_session_context.payload = msg.SerializeToString()
+        return record.SerializeToString()
@@ -22,21 +22,22 @@ SOFTWARE.
 #
 # File Name: main.py
 #
-# Description: The main method to start a STOMP USP Agent
+# Description: The main method to start a STOMP, CoAP, WebSocket, UDS, or Multi-MTP USP Agent
 #
 # Functionality:
 #   Class: Agent(stomp_agent.StompAgent)
 #     __init__(cfg_file_name, log_file_name, log_level=logging.INFO, debug=False)
+#   _get_agent_class(protocol)
 #
 """
 
 
 import logging
 import argparse
+import importlib
 import prometheus_client
 
-from agent import coap_agent
-from agent import stomp_agent
+from agent import multi_mtp_agent
 
 
 
@@ -55,6 +56,22 @@ class Agent:
         parser.add_argument("--coap-port", action="store", nargs="?",
                             type=int, default=5683,
                             help="specify the CoAP Port to listen on")
+        parser.add_argument("--coap-async", action="store_true",
+                            help="handle CoAP Requests directly on the CoAP Event Loop")
+        parser.add_argument("-w", "--websocket", action="store_true",
+                            help="use the WebSocket Binding instead of the STOMP Binding")
+        parser.add_argument("--websocket-port", action="store", nargs="?",
+                            type=int, default=8080,
+                            help="specify the WebSocket Port to listen on")
+        parser.add_argument("-u", "--uds", action="store_true",
+                            help="use the Unix Domain Socket Binding instead of the STOMP Binding")
+        parser.add_argument("--uds-path", action="store", nargs="?",
+                            type=str, default="/tmp/usp-agent.sock",
+                            help="specify the Unix Domain Socket Path to listen on")
+        parser.add_argument("-m", "--mtps", action="store", nargs="?",
+                            type=str, default="",
+                            help="run several MTPs at once, sharing one Database (e.g. STOMP,CoAP); one of: " +
+                            ",".join(multi_mtp_agent.SUPPORTED_PROTOCOLS))
         parser.add_argument("--intf", action="store", nargs="?",
                             type=str, default="",
                             help="specify the network interface to use")
@@ -68,6 +85,12 @@ class Agent:
         client_type = args.client_type
         use_coap = args.coap
         coap_port = args.coap_port
+        coap_async = args.coap_async
+        use_websocket = args.websocket
+        websocket_port = args.websocket_port
+        use_uds = args.uds
+        uds_path = args.uds_path
+        mtp_list = [protocol.strip() for protocol in args.mtps.split(",") if protocol.strip()]
         net_intf = args.intf
 
         dm_file_name = "database/{}-dm.json".format(client_type)
@@ -75,25 +98,65 @@ class Agent:
 
         prometheus_client.start_http_server(9001)
 
-        if use_coap:
+        if mtp_list:
+            logging.info("#######################################################")
+            logging.info("## Starting a Multi-MTP USP Agent                    ##")
+            logging.info("#######################################################")
+
+            my_multi_mtp_agent = multi_mtp_agent.MultiMtpAgent(dm_file_name, db_file_name, net_intf, mtp_list,
+                                                               cfg_file_name, debug, coap_port, websocket_port,
+                                                               uds_path)
+            my_multi_mtp_agent.start_listening()
+            my_multi_mtp_agent.clean_up()
+        elif use_coap:
             logging.info("#######################################################")
             logging.info("## Starting a CoAP USP Agent                         ##")
             logging.info("#######################################################")
 
-            my_coap_agent = coap_agent.CoapAgent(dm_file_name, db_file_name, net_intf, coap_port, cfg_file_name, debug)
+            coap_agent_class = _get_agent_class("CoAP")
+            my_coap_agent = coap_agent_class(dm_file_name, db_file_name, net_intf, coap_port, cfg_file_name, debug,
+                                             coap_async)
             my_coap_agent.start_listening()
             my_coap_agent.clean_up()
+        elif use_websocket:
+            logging.info("#######################################################")
+            logging.info("## Starting a WebSocket USP Agent                    ##")
+            logging.info("#######################################################")
+
+            websocket_agent_class = _get_agent_class("WebSocket")
+            my_websocket_agent = websocket_agent_class(dm_file_name, db_file_name, net_intf, websocket_port,
+                                                       cfg_file_name, debug)
+            my_websocket_agent.start_listening()
+            my_websocket_agent.clean_up()
+        elif use_uds:
+            logging.info("#######################################################")
+            logging.info("## Starting a UDS USP Agent                          ##")
+            logging.info("#######################################################")
+
+            uds_agent_class = _get_agent_class("UDS")
+            my_uds_agent = uds_agent_class(dm_file_name, db_file_name, net_intf, uds_path, cfg_file_name, debug)
+            my_uds_agent.start_listening()
+            my_uds_agent.clean_up()
         else:
             logging.info("#######################################################")
             logging.info("## Starting a STOMP USP Agent                        ##")
             logging.info("#######################################################")
 
-            my_stomp_agent = stomp_agent.StompAgent(dm_file_name, db_file_name, net_intf, cfg_file_name, debug)
+            stomp_agent_class = _get_agent_class("STOMP")
+            my_stomp_agent = stomp_agent_class(dm_file_name, db_file_name, net_intf, cfg_file_name, debug)
             my_stomp_agent.start_listening()
             my_stomp_agent.clean_up()
 
 
 
+def _get_agent_class(protocol):
+    """Import the protocol specific Agent only once it is chosen, so that only the Libraries of the MTPs
+        being run need to be installed"""
+    mod_name, class_name = multi_mtp_agent.MTP_AGENT_CLASS_DICT[protocol]
+    return getattr(importlib.import_module(mod_name), class_name)
+
+
+
 def main():
     """Main Processing for USP Agent"""
     Agent("cfg/agent.json", "logs/agent.log")
@@ -28,6 +28,15 @@
 #    - __init__(ip_addr, coap_port, coap_resource_path, usp_endpoint_id)
 #    - announce()
 #    - clean_up()
+#  - Listener(object)
+#    - __init__()
+#    - listen()
+#    - add_change_listener(listener)
+#    - add_service(zconf, svc_type, name)
+#    - remove_service(zconf, svc_type, name)
+#    - resolve_addr(endpoint_id)
+#    - resolve_host(host_name)
+#    - cleanup()
 #
 """
 
@@ -81,6 +90,7 @@ class Listener:
         self._browser = None
         self._host_name_to_ip_map = {}
         self._endpoint_id_to_url_map = {}
+        self._change_listener_list = []
         self._service = "_usp-ctl-coap._udp.local."
         self._logger = logging.getLogger(self.__class__.__name__)
 
@@ -89,6 +99,10 @@ class Listener:
         self._zconf = zeroconf.Zeroconf(interfaces=zeroconf.InterfaceChoice.Default)
         self._browser = zeroconf.ServiceBrowser(self._zconf, self._service, self)
 
+    def add_change_listener(self, listener):
+        """Add a listener that is called (without arguments) whenever a Service Registration changes"""
+        self._change_listener_list.append(listener)
+
     def add_service(self, zconf, svc_type, name):
         """Process an incoming mDNS Service Registration"""
         info = zconf.get_service_info(svc_type, name)
@@ -107,6 +121,7 @@ class Listener:
                               name, controller_endpoint_id, controller_coap_url)
         self._endpoint_id_to_url_map[controller_endpoint_id] = controller_coap_url
         self._host_name_to_ip_map[name] = socket.inet_ntoa(info.address)
+        self._notify_change_listeners()
 
     def remove_service(self, zconf, svc_type, name):
         """Process an incoming mDNS Service De-Registration"""
@@ -116,6 +131,7 @@ class Listener:
                           controller_endpoint_id)
         del self._endpoint_id_to_url_map[controller_endpoint_id]
         del self._host_name_to_ip_map[name]
+        self._notify_change_listeners()
 
     def resolve_addr(self, endpoint_id):
         """Retrieve the current CoAP URL for a given USP Endpoint ID"""
@@ -155,6 +171,11 @@ class Listener:
 
         return coap_url
 
+    def _notify_change_listeners(self):
+        """Let each change listener know that a Service Registration changed"""
+        for listener in self._change_listener_list:
+            listener()
+
     def _get_endpoint_id(self, name):
         """Retrieve the USP Endpoint ID from the mDNS Name"""
         return name.split(".")[0]
@@ -0,0 +1,193 @@
+# Copyright (c) 2016-2017 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+# File Name: multi_mtp_agent.py
+#
+# Description: A USP Agent that runs several MTPs at the same time
+#
+# Functionality:
+#   Class: MultiMtpAgent(abstract_agent.AbstractAgent)
+#     __init__(dm_file, db_file, net_intf, protocol_list, cfg_file_name="cfg/agent.json", debug=False,
+#              coap_port=5683, websocket_port=8080, uds_path="/tmp/usp-agent.sock")
+#     start_listening(timeout=15)
+#     clean_up()
+#     get_protocols()
+#   Class: MultiMtpValueChangeNotifPoller(value_change_notif_poller.AbstractValueChangeNotifPoller)
+#     __init__(agent_db, poll_duration=0.5)
+#     add_poller(protocol, poller)
+#
+"""
+
+
+import threading
+
+from agent import abstract_agent
+from agent import value_change_notif_poller
+
+
+# Format: { Protocol : (Module Name, Class Name) } - only the Modules for the MTPs being run are imported
+MTP_AGENT_CLASS_DICT = {
+    "STOMP": ("agent.stomp_agent", "StompAgent"),
+    "CoAP": ("agent.coap_agent", "CoapAgent"),
+    "WebSocket": ("agent.websocket_agent", "WebSocketAgent"),
+    "UDS": ("agent.uds_agent", "UdsAgent")
+}
+SUPPORTED_PROTOCOLS = list(MTP_AGENT_CLASS_DICT.keys())
+
+
+class MultiMtpAgent(abstract_agent.AbstractAgent):
+    """A USP Agent that runs a protocol specific Agent for each of its MTPs on top of one Database,
+        Message Handler, and set of Notifications
+        - each protocol specific Agent answers Requests over the Binding they arrived on
+        - Notifications are sent by the protocol specific Agent that matches the Controller's MTP"""
+    def __init__(self, dm_file, db_file, net_intf, protocol_list, cfg_file_name="cfg/agent.json", debug=False,
+                 coap_port=5683, websocket_port=8080, uds_path="/tmp/usp-agent.sock"):
+        """Initialize the Multi-MTP Agent"""
+        abstract_agent.AbstractAgent.__init__(self, dm_file, db_file, net_intf, cfg_file_name, debug)
+        self._agent_dict = {}
+        self.set_value_change_notif_poller(MultiMtpValueChangeNotifPoller(self._db))
+
+        self._init_db_for_mtp(protocol_list)
+
+        # The protocol specific arguments of each Agent's constructor
+        mtp_args_dict = {"STOMP": {}, "CoAP": {"port": coap_port}, "WebSocket": {"port": websocket_port},
+                         "UDS": {"socket_path": uds_path}}
+
+        for protocol in protocol_list:
+            if protocol not in MTP_AGENT_CLASS_DICT:
+                self._logger.warning("Skipping unsupported MTP Protocol [%s]", protocol)
+                continue
+
+            mod_name, class_name = MTP_AGENT_CLASS_DICT[protocol]
+            target_class = self._get_class(protocol, mod_name, class_name)
+            if target_class is None:
+                continue
+
+            mtp_agent = target_class(dm_file, db_file, net_intf, cfg_file_name=cfg_file_name, debug=debug,
+                                     shared_agent=self, **mtp_args_dict[protocol])
+            self._logger.info("Started the [%s] MTP", protocol)
+            self._agent_dict[protocol] = mtp_agent
+
+            if mtp_agent.get_value_change_notif_poller() is not None:
+                self._value_change_notif_poller.add_poller(protocol, mtp_agent.get_value_change_notif_poller())
+
+        self.init_subscriptions()
+
+    def start_listening(self, timeout=15):
+        """Start the Notifications, and then listen for messages on all of the MTPs"""
+        listen_thread_list = []
+        abstract_agent.AbstractAgent.start_listening(self)
+
+        # Each protocol specific Agent blocks while it listens, so give each one its own Thread
+        for protocol, mtp_agent in self._agent_dict.items():
+            listen_thread = threading.Thread(name="MtpAgent-" + protocol, target=mtp_agent.start_listening,
+                                             args=(timeout,))
+            listen_thread.start()
+            listen_thread_list.append(listen_thread)
+
+        for listen_thread in listen_thread_list:
+            listen_thread.join()
+
+    def clean_up(self):
+        """Clean up all of the protocol specific Agents"""
+        for mtp_agent in self._agent_dict.values():
+            mtp_agent.clean_up()
+
+    def get_protocols(self):
+        """Retrieve the Protocols of the MTPs that were started"""
+        return list(self._agent_dict.keys())
+
+    def _init_db_for_mtp(self, protocol_list):
+        """Disable the LocalAgent MTPs that aren't for one of the provided protocols; the protocol specific
+            Agents enable their own LocalAgent MTPs"""
+        agent_mtp_instances = self._db.find_instances("Device.LocalAgent.MTP.")
+
+        for agent_mtp_path in agent_mtp_instances:
+            if self._db.get(agent_mtp_path + "Protocol") not in protocol_list:
+                self._db.update(agent_mtp_path + "Enable", False)
+
+    def _get_valid_mtp_paths(self, controller_path):
+        """Find all valid MTPs that are Enabled and have a Protocol that this Agent is running"""
+        mtp_path_list = []
+        mtp_instances = self._db.find_instances(controller_path + "MTP.")
+
+        for mtp_path in mtp_instances:
+            if self._db.get(mtp_path + "Enable"):
+                if self._db.get(mtp_path + "Protocol") in self._agent_dict:
+                    mtp_path_list.append(mtp_path)
+
+        return mtp_path_list
+
+    def _get_supported_protocol(self):
+        """Return the supported Protocols as a comma-separated String"""
+        return ",".join(self._agent_dict.keys())
+
+    # pylint: disable-msg=protected-access
+    def _get_notification_sender(self, notif, controller_id, mtp_param_path):
+        """Return the Notification Sender of the protocol specific Agent for the Controller's MTP"""
+        mtp_agent = self._agent_dict[self._db.get(mtp_param_path + "Protocol")]
+        return mtp_agent._get_notification_sender(notif, controller_id, mtp_param_path)
+
+    # pylint: disable-msg=protected-access
+    def _get_periodic_notif_handler(self, agent_id, controller_id, mtp_param_path,
+                                    subscription_id, param_path):
+        """Return the Periodic Notification Handler of the protocol specific Agent for the Controller's MTP"""
+        mtp_agent = self._agent_dict[self._db.get(mtp_param_path + "Protocol")]
+        return mtp_agent._get_periodic_notif_handler(agent_id, controller_id, mtp_param_path,
+                                                     subscription_id, param_path)
+
+
+class MultiMtpValueChangeNotifPoller(value_change_notif_poller.AbstractValueChangeNotifPoller):
+    """Poll Parameters for Value Change Notifications once for all MTPs, and send each Notification
+        via the Poller of the protocol specific Agent for the Controller's MTP"""
+    def __init__(self, agent_db, poll_duration=0.5):
+        """Initialize the Multi-MTP Value Change Notification Poller"""
+        value_change_notif_poller.AbstractValueChangeNotifPoller.__init__(self, agent_db, poll_duration)
+        self._poller_dict = {}
+
+        # Format: { MTP Path : Protocol }
+        self._protocol_dict = {}
+
+    def add_poller(self, protocol, poller):
+        """Add the Value Change Notification Poller of a protocol specific Agent"""
+        self._poller_dict[protocol] = poller
+
+    # pylint: disable-msg=protected-access
+    def invalidate_routes(self):
+        """Forget the cached Protocols of the Controllers' MTPs along with the Routes"""
+        value_change_notif_poller.AbstractValueChangeNotifPoller.invalidate_routes(self)
+        self._protocol_dict.clear()
+
+    def _get_route(self, to_id, mtp_param_path):
+        """Retrieve the Route from the Poller for the Protocol of the Controller's MTP
+            - only the Protocol is cached here, as each Poller caches (and invalidates) its own Routes"""
+        protocol = self._protocol_dict.get(mtp_param_path)
+        if protocol is None:
+            protocol = self._db.get(mtp_param_path + "Protocol")
+            self._protocol_dict[mtp_param_path] = protocol
+
+        if protocol not in self._poller_dict:
+            self._logger.warning("Could not send ValueChange Notification over an MTP with Protocol [%s]",
+                                 protocol)
+            return None
+
+        return self._poller_dict[protocol]._get_route(to_id, mtp_param_path)
@@ -0,0 +1,206 @@
+# Copyright (c) 2016-2017 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+#
+# File Name: notif_outbox.py
+#
+# Description: A persistent Outbox for the Notifications that a Controller must acknowledge
+#               with a NotifyResp
+#
+# Class Structure:
+#  - NotificationOutbox(object)
+#    - __init__(outbox_file, max_entries=10000, retry_interval=30, max_retry_interval=600)
+#    - add(msg_id, to_id, mtp_param_path, subscription_id, serialized_record, expiration=0)
+#    - acknowledge(msg_id, from_id)
+#    - get_due_entries(limit=100)
+#    - get_next_attempt_time()
+#    - get_num_entries()
+#    - close()
+#  - OutboxRetryThread(threading.Thread)
+#    - __init__(outbox, send_record_func, max_wait=5)
+#    - run()
+#
+"""
+
+import time
+import sqlite3
+import logging
+import threading
+
+import prometheus_client
+
+
+# pylint: disable-msg=no-value-for-parameter
+NUM_OUTBOX_ACKED_METRIC = \
+    prometheus_client.Counter("number_of_outbox_notifs_acked",
+                              "Number of Outbox Notifications acknowledged by a NotifyResp")
+# pylint: disable-msg=no-value-for-parameter
+NUM_OUTBOX_RETRIES_METRIC = \
+    prometheus_client.Counter("number_of_outbox_notif_retries",
+                              "Number of times an unacknowledged Outbox Notification was sent again")
+# pylint: disable-msg=no-value-for-parameter
+NUM_OUTBOX_EVICTED_METRIC = \
+    prometheus_client.Counter("number_of_outbox_notifs_evicted",
+                              "Number of Outbox Notifications dropped because they expired or the Outbox was full")
+
+CREATE_TABLE_SQL = \
+    "CREATE TABLE IF NOT EXISTS outbox (" \
+    "msg_id TEXT PRIMARY KEY, to_id TEXT, mtp_path TEXT, subscription_id TEXT, record BLOB, " \
+    "expiration REAL, num_attempts INTEGER, next_attempt REAL)"
+CREATE_INDEX_SQL = "CREATE INDEX IF NOT EXISTS outbox_next_attempt ON outbox (next_attempt)"
+
+
+class NotificationOutbox:
+    """A SQLite backed Outbox of serialized Notification Records, kept until they are acknowledged
+        - each entry is retried with an exponential backoff, until it is acknowledged or it expires
+        - when the Outbox is full the oldest entries are evicted"""
+    def __init__(self, outbox_file, max_entries=10000, retry_interval=30, max_retry_interval=600):
+        """Initialize the Notification Outbox, re-opening the entries left by a previous run"""
+        self._max_entries = max_entries
+        self._retry_interval = retry_interval
+        self._max_retry_interval = max_retry_interval
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        self._conn = sqlite3.connect(outbox_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(CREATE_TABLE_SQL)
+        self._conn.execute(CREATE_INDEX_SQL)
+        self._conn.commit()
+
+        self._num_entries = self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        if self._num_entries > 0:
+            self._logger.info("Re-opened the Notification Outbox with %d unacknowledged entries", self._num_entries)
+
+    def add(self, msg_id, to_id, mtp_param_path, subscription_id, serialized_record, expiration=0):
+        """Add a Notification Record that has just been sent for the first time
+            - expiration is the number of seconds to keep retrying it (0 for no limit)"""
+        now = time.time()
+        expiration_time = 0
+        if expiration > 0:
+            expiration_time = now + expiration
+
+        with self._lock:
+            # A Record sent again with the same Message ID replaces its entry instead of adding one
+            num_replaced = self._conn.execute("DELETE FROM outbox WHERE msg_id = ?", (msg_id,)).rowcount
+            self._conn.execute("INSERT INTO outbox VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                               (msg_id, to_id, mtp_param_path, subscription_id, serialized_record,
+                                expiration_time, 1, now + self._retry_interval))
+            self._num_entries += 1 - num_replaced
+
+            if self._num_entries > self._max_entries:
+                # Evict the oldest entries (the rowid increases with each insert)
+                num_evicted = self._conn.execute(
+                    "DELETE FROM outbox WHERE rowid IN (SELECT rowid FROM outbox ORDER BY rowid LIMIT ?)",
+                    (self._num_entries - self._max_entries,)).rowcount
+                self._num_entries -= num_evicted
+                NUM_OUTBOX_EVICTED_METRIC.inc(num_evicted)
+                self._logger.warning("Notification Outbox is full - evicted %d entries", num_evicted)
+
+            self._conn.commit()
+
+    def acknowledge(self, msg_id, from_id):
+        """Remove the Notification Record acknowledged by a NotifyResp from the Controller, and
+            return True if it was in the Outbox"""
+        with self._lock:
+            num_deleted = self._conn.execute("DELETE FROM outbox WHERE msg_id = ? AND to_id = ?",
+                                             (msg_id, from_id)).rowcount
+            self._conn.commit()
+            self._num_entries -= num_deleted
+
+        if num_deleted > 0:
+            NUM_OUTBOX_ACKED_METRIC.inc()
+            self._logger.info("Notification [%s] acknowledged by Controller [%s]", msg_id, from_id)
+
+        return num_deleted > 0
+
+    def get_due_entries(self, limit=100):
+        """Retrieve a list of (msg_id, to_id, mtp_param_path, serialized_record) tuples for the entries
+            that are due to be sent again, and back off their next attempt; expired entries are dropped"""
+        now = time.time()
+
+        with self._lock:
+            num_expired = self._conn.execute("DELETE FROM outbox WHERE expiration > 0 AND expiration <= ?",
+                                             (now,)).rowcount
+            self._num_entries -= num_expired
+            NUM_OUTBOX_EVICTED_METRIC.inc(num_expired)
+
+            due_list = self._conn.execute(
+                "SELECT msg_id, to_id, mtp_path, record, num_attempts FROM outbox WHERE next_attempt <= ? "
+                "ORDER BY next_attempt LIMIT ?", (now, limit)).fetchall()
+
+            update_list = []
+            for msg_id, _, _, _, num_attempts in due_list:
+                backoff = min(self._retry_interval * 2 ** num_attempts, self._max_retry_interval)
+                update_list.append((num_attempts + 1, now + backoff, msg_id))
+
+            self._conn.executemany("UPDATE outbox SET num_attempts = ?, next_attempt = ? WHERE msg_id = ?",
+                                   update_list)
+            self._conn.commit()
+
+        if num_expired > 0:
+            self._logger.warning("Dropped %d expired entries from the Notification Outbox", num_expired)
+
+        return [(msg_id, to_id, mtp_path, record) for msg_id, to_id, mtp_path, record, _ in due_list]
+
+    def get_next_attempt_time(self):
+        """Retrieve the time of the next retry, or None if the Outbox is empty"""
+        with self._lock:
+            return self._conn.execute("SELECT MIN(next_attempt) FROM outbox").fetchone()[0]
+
+    def get_num_entries(self):
+        """Retrieve the number of unacknowledged entries"""
+        return self._num_entries
+
+    def close(self):
+        """Close the Outbox"""
+        with self._lock:
+            self._conn.close()
+
+
+class OutboxRetryThread(threading.Thread):
+    """Send the unacknowledged Notification Records of the Outbox again as they become due
+        - send_record_func(serialized_record, to_id, mtp_param_path) sends a Record over the Controller's MTP"""
+    def __init__(self, outbox, send_record_func, max_wait=5):
+        """Initialize the Outbox Retry Thread; the Outbox is checked at least every max_wait seconds"""
+        threading.Thread.__init__(self, name="OutboxRetryThread")
+        self.daemon = True
+        self._outbox = outbox
+        self._max_wait = max_wait
+        self._send_record_func = send_record_func
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def run(self):
+        """Thread execution code - wait for the next retry, and send the due Notification Records"""
+        while True:
+            wait_timeout = self._max_wait
+            next_attempt_time = self._outbox.get_next_attempt_time()
+            if next_attempt_time is not None:
+                wait_timeout = max(0, min(wait_timeout, next_attempt_time - time.time()))
+
+            time.sleep(wait_timeout)
+
+            for msg_id, to_id, mtp_param_path, serialized_record in self._outbox.get_due_entries():
+                NUM_OUTBOX_RETRIES_METRIC.inc()
+                self._logger.info("Sending unacknowledged Notification [%s] to Controller [%s] again", msg_id, to_id)
+                self._send_record_func(serialized_record, to_id, mtp_param_path)
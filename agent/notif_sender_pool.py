@@ -0,0 +1,207 @@
+# Copyright (c) 2016-2017 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+#
+# File Name: notif_sender_pool.py
+#
+# Description: Sends the Notifications of every Subscription from a small pool of worker Threads
+#
+# Class Structure:
+#  - NotificationSender(object)
+#    - __init__(notif, binding)
+#    - get_destination()
+#    - get_subscription_id()
+#    - send()
+#    - _retrieve_to_addr() :: Abstract Method
+#  - NotificationSenderPool(object)
+#    - __init__(num_workers=2, max_queue_size=1000, num_retries=3, retry_interval=2, max_retry_interval=60)
+#    - start()
+#    - send(notif_sender)
+#
+"""
+
+import time
+import heapq
+import logging
+import threading
+import prometheus_client
+
+
+# pylint: disable-msg=no-value-for-parameter
+NUM_NOTIFS_QUEUED_METRIC = \
+    prometheus_client.Counter("number_of_notifs_queued",
+                              "Number of Notifications queued in the Notification Sender Pool")
+# pylint: disable-msg=no-value-for-parameter
+NUM_NOTIFS_SENT_METRIC = \
+    prometheus_client.Counter("number_of_notifs_sent",
+                              "Number of Notifications sent by the Notification Sender Pool")
+# pylint: disable-msg=no-value-for-parameter
+NUM_NOTIFS_FAILED_METRIC = \
+    prometheus_client.Counter("number_of_notifs_failed",
+                              "Number of Notifications dropped by the Notification Sender Pool")
+
+
+class NotificationSender:
+    """A Generic Notification Sender, which is handed to the NotificationSenderPool to be sent"""
+    def __init__(self, notif, binding):
+        """Initialize the Notification Sender"""
+        self._binding = binding
+        self._notif_msg = notif.generate_notif_msg()
+        self._subscription_id = self._notif_msg.body.request.notify.subscription_id
+        self._notif_record = notif.wrap_notif_in_record(self._notif_msg)
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def get_destination(self):
+        """Retrieve the Endpoint ID that the Notification is being sent to"""
+        return self._notif_record.to_id
+
+    def get_subscription_id(self):
+        """Retrieve the ID of the Subscription that the Notification is for"""
+        return self._subscription_id
+
+    def send(self):
+        """Send the Notification, and return False if the destination address couldn't be retrieved"""
+        to_addr = self._retrieve_to_addr()
+
+        if to_addr is None:
+            return False
+
+        self._binding.send_msg(self._notif_record.SerializeToString(), to_addr)
+        return True
+
+    def _retrieve_to_addr(self):
+        """Retrieve the MTP specific address that indicates where the notification is to be sent"""
+        raise NotImplementedError()
+
+
+class NotificationSenderPool:
+    """Send the Notifications of every Subscription from a small pool of worker Threads
+        - Notification Senders wait in a bounded queue, ordered by when they can next be sent
+        - a Destination that can't be reached is retried with an exponential backoff, and the other
+          Notifications queued for it wait until the backoff has passed"""
+    def __init__(self, num_workers=2, max_queue_size=1000, num_retries=3, retry_interval=2, max_retry_interval=60):
+        """Initialize the Notification Sender Pool"""
+        self._num_workers = num_workers
+        self._max_queue_size = max_queue_size
+        self._num_retries = num_retries
+        self._retry_interval = retry_interval
+        self._max_retry_interval = max_retry_interval
+        self._condition = threading.Condition()
+        self._worker_list = []
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        # Format: [ (Send Time, Sequence Number, Notification Sender, Number of Attempts) ]
+        self._heap = []
+        self._next_seq_num = 0
+
+        # Format: { Destination : (Number of consecutive Failures, Retry Time) }
+        self._backoff_dict = {}
+
+    def start(self):
+        """Start the worker Threads"""
+        for worker_num in range(self._num_workers):
+            worker = threading.Thread(target=self._run_worker, name="NotificationSender-" + str(worker_num))
+            worker.daemon = True
+            worker.start()
+            self._worker_list.append(worker)
+
+    def send(self, notif_sender):
+        """Queue the Notification Sender, and return False (dropping it) if the queue is full"""
+        with self._condition:
+            if len(self._heap) >= self._max_queue_size:
+                NUM_NOTIFS_FAILED_METRIC.inc()
+                self._logger.warning("Dropping the Notification for Subscription [%s] - Queue is full",
+                                     notif_sender.get_subscription_id())
+                return False
+
+            NUM_NOTIFS_QUEUED_METRIC.inc()
+            self._push(notif_sender, time.time(), 0)
+            self._condition.notify()
+
+        return True
+
+    def _push(self, notif_sender, send_time, num_attempts):
+        """Push the Notification Sender onto the heap - must be called while holding the Condition"""
+        heapq.heappush(self._heap, (send_time, self._next_seq_num, notif_sender, num_attempts))
+        self._next_seq_num += 1
+
+    def _run_worker(self):
+        """Worker Thread execution code - send the queued Notifications as they become due"""
+        while True:
+            with self._condition:
+                notif_sender, num_attempts = self._wait_for_next_sender()
+
+            try:
+                is_sent = notif_sender.send()
+            except OSError as err:
+                self._logger.warning("Unable to send the Notification for Subscription [%s]: %s",
+                                     notif_sender.get_subscription_id(), err)
+                is_sent = False
+
+            with self._condition:
+                self._handle_send_result(notif_sender, num_attempts + 1, is_sent)
+
+    def _wait_for_next_sender(self):
+        """Wait until a queued Notification Sender is due, and return it with its Number of Attempts
+            - must be called while holding the Condition"""
+        while True:
+            now = time.time()
+
+            if self._heap and self._heap[0][0] <= now:
+                _, _, notif_sender, num_attempts = heapq.heappop(self._heap)
+                retry_time = self._backoff_dict.get(notif_sender.get_destination(), (0, 0))[1]
+
+                if retry_time <= now:
+                    return notif_sender, num_attempts
+
+                # The Destination is backing off, so wait along with its other Notifications
+                self._push(notif_sender, retry_time, num_attempts)
+            else:
+                wait_timeout = None
+                if self._heap:
+                    wait_timeout = self._heap[0][0] - now
+
+                self._condition.wait(wait_timeout)
+
+    def _handle_send_result(self, notif_sender, num_attempts, is_sent):
+        """Reset the backoff of the Destination if the Notification was sent, otherwise back off and
+            retry it - must be called while holding the Condition"""
+        destination = notif_sender.get_destination()
+
+        if is_sent:
+            NUM_NOTIFS_SENT_METRIC.inc()
+            self._backoff_dict.pop(destination, None)
+            return
+
+        num_failures = self._backoff_dict.get(destination, (0, 0))[0] + 1
+        backoff = min(self._retry_interval * 2 ** (num_failures - 1), self._max_retry_interval)
+        self._backoff_dict[destination] = (num_failures, time.time() + backoff)
+
+        if num_attempts > self._num_retries:
+            NUM_NOTIFS_FAILED_METRIC.inc()
+            self._logger.warning("Failed to send the Notification for Subscription [%s] to [%s] after %d attempts",
+                                 notif_sender.get_subscription_id(), destination, num_attempts)
+        else:
+            self._logger.info("Retrying the Notification for Subscription [%s] to [%s] in %d seconds",
+                              notif_sender.get_subscription_id(), destination, backoff)
+            self._push(notif_sender, time.time() + backoff, num_attempts)
+            self._condition.notify()
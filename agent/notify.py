@@ -26,13 +26,30 @@ SOFTWARE.
 # Functionality:
 #   Class: Notification(object)
 #    - __init__(from_endpoint_id, to_endpoint_id, subscription_id)
+#    - set_send_resp(send_resp)
 #    - generate_notif_msg()
 #   Class: BootNotification(Notification)
 #    - __init__(from_endpoint_id, to_endpoint_id, subscription_id, agent_db)
 #   Class: ValueChangeNotification(Notification)
 #    - __init__(from_endpoint_id, to_endpoint_id, subscription_id, param, value)
+#   Class: ValueChangeBatchNotification(Notification)
+#    - __init__(from_endpoint_id, to_endpoint_id, subscription_id, param_value_dict)
 #   Class: PeriodicNotification(Notification)
 #    - __init__(from_endpoint_id, to_endpoint_id, subscription_id, param)
+#   Class: ObjectCreationNotification(Notification)
+#    - __init__(from_endpoint_id, to_endpoint_id, subscription_id, obj_path, unique_key_dict=None)
+#   Class: ObjectDeletionNotification(Notification)
+#    - __init__(from_endpoint_id, to_endpoint_id, subscription_id, obj_path)
+#   Class: OperationCompleteNotification(Notification)
+#    - __init__(from_endpoint_id, to_endpoint_id, subscription_id, command, command_key,
+#               output_arg_dict=None, cmd_failure=None)
+#   Class: NotificationTemplate(object)
+#    - __init__(from_endpoint_id, to_endpoint_id, subscription_id, send_resp=False)
+#    - generate_value_change_record(param, value)
+#    - generate_periodic_record()
+#    - generate_obj_creation_record(obj_path, unique_key_dict=None)
+#    - generate_obj_deletion_record(obj_path)
+#    - generate_oper_complete_record(command, command_key, output_arg_dict=None, cmd_failure=None)
 #
 """
 
@@ -50,19 +67,24 @@ class Notification:
         self._to_id = to_id
         self._from_id = from_id
         self._subscription_id = subscription_id
+        self._send_resp = False
         self._logger = logging.getLogger(self.__class__.__name__)
 
+    def set_send_resp(self, send_resp):
+        """Configure whether the Controller is to respond to the Notification with a NotifyResp"""
+        self._send_resp = send_resp
+
     def generate_notif_msg(self):
         """Generate an appropriate USP Notification"""
         raise NotImplementedError()
 
-    def _init_notif(self, notif_msg, send_resp=False):
+    def _init_notif(self, notif_msg):
         """Set the Header Information of the Notification"""
         notif_msg.header.msg_id = utils.MessageIdHelper.get_message_id()
         notif_msg.header.msg_type = usp_msg.Header.NOTIFY
 
         notif_msg.body.request.notify.subscription_id = self._subscription_id
-        notif_msg.body.request.notify.send_resp = send_resp
+        notif_msg.body.request.notify.send_resp = self._send_resp
 
     def wrap_notif_in_record(self, notif_msg):
         """Wrap the Notification USP Message in a USP Record"""
@@ -142,6 +164,27 @@ class ValueChangeNotification(Notification):
         return notif_msg
 
 
+class ValueChangeBatchNotification(Notification):
+    """Encapsulates several Value Changes for one Subscription in a single USP Event Notification"""
+    def __init__(self, from_id, to_id, subscription_id, param_value_dict):
+        """Initialize the Notification Type"""
+        Notification.__init__(self, from_id, to_id, subscription_id)
+        self._param_value_dict = param_value_dict
+
+    def generate_notif_msg(self):
+        """Generate an appropriate USP Notification"""
+        notif_msg = usp_msg.Msg()
+        self._init_notif(notif_msg)
+
+        notif_msg.body.request.notify.event.obj_path = "Device.LocalAgent."
+        notif_msg.body.request.notify.event.event_name = "X_ARRIS-COM_ValueChange!"
+
+        for param, value in self._param_value_dict.items():
+            notif_msg.body.request.notify.event.params[param] = str(value)
+
+        return notif_msg
+
+
 class PeriodicNotification(Notification):
     """Encapsulates a Periodic USP Notification"""
     def __init__(self, from_id, to_id, subscription_id, param):
@@ -158,3 +201,156 @@ class PeriodicNotification(Notification):
         notif_msg.body.request.notify.event.event_name = "Periodic!"
 
         return notif_msg
+
+
+class ObjectCreationNotification(Notification):
+    """Encapsulates an ObjectCreation USP Notification"""
+    def __init__(self, from_id, to_id, subscription_id, obj_path, unique_key_dict=None):
+        """Initialize the Notification Type"""
+        Notification.__init__(self, from_id, to_id, subscription_id)
+        self._obj_path = obj_path
+        self._unique_key_dict = unique_key_dict or {}
+
+    def generate_notif_msg(self):
+        """Generate an appropriate USP Notification"""
+        notif_msg = usp_msg.Msg()
+        self._init_notif(notif_msg)
+
+        notif_msg.body.request.notify.obj_creation.obj_path = self._obj_path
+        for key, value in self._unique_key_dict.items():
+            notif_msg.body.request.notify.obj_creation.unique_keys[key] = str(value)
+
+        return notif_msg
+
+
+class ObjectDeletionNotification(Notification):
+    """Encapsulates an ObjectDeletion USP Notification"""
+    def __init__(self, from_id, to_id, subscription_id, obj_path):
+        """Initialize the Notification Type"""
+        Notification.__init__(self, from_id, to_id, subscription_id)
+        self._obj_path = obj_path
+
+    def generate_notif_msg(self):
+        """Generate an appropriate USP Notification"""
+        notif_msg = usp_msg.Msg()
+        self._init_notif(notif_msg)
+
+        notif_msg.body.request.notify.obj_deletion.obj_path = self._obj_path
+
+        return notif_msg
+
+
+class OperationCompleteNotification(Notification):
+    """Encapsulates an OperationComplete USP Notification"""
+    def __init__(self, from_id, to_id, subscription_id, command, command_key, output_arg_dict=None, cmd_failure=None):
+        """Initialize the Notification Type
+            - cmd_failure is None, or a tuple of the err_code and err_msg of the failed Command"""
+        Notification.__init__(self, from_id, to_id, subscription_id)
+        self._command = command
+        self._command_key = command_key
+        self._output_arg_dict = output_arg_dict
+        self._cmd_failure = cmd_failure
+
+    def generate_notif_msg(self):
+        """Generate an appropriate USP Notification"""
+        notif_msg = usp_msg.Msg()
+        self._init_notif(notif_msg)
+        _set_oper_complete(notif_msg.body.request.notify.oper_complete, self._command, self._command_key,
+                           self._output_arg_dict, self._cmd_failure)
+
+        return notif_msg
+
+
+class NotificationTemplate:
+    """The constant parts of a Subscription's Notification Records, serialized once
+        - a serialized Protocol Buffer message followed by another one is parsed as the two merged, so
+          each Record is built by appending only the msg_id and the changing fields to the cached parts"""
+    def __init__(self, from_id, to_id, subscription_id, send_resp=False):
+        """Serialize the constant parts of the Record and of the Notification Message"""
+        record_part = usp_record.Record()
+        record_part.version = "1.0"
+        record_part.to_id = to_id
+        record_part.from_id = from_id
+        record_part.payload_security = usp_record.Record.PLAINTEXT
+        self._record_part = record_part.SerializeToString()
+
+        notif_msg_part = usp_msg.Msg()
+        notif_msg_part.header.msg_type = usp_msg.Header.NOTIFY
+        notif_msg_part.body.request.notify.subscription_id = subscription_id
+        notif_msg_part.body.request.notify.send_resp = send_resp
+        self._notif_msg_part = notif_msg_part.SerializeToString()
+
+        periodic_msg_part = usp_msg.Msg()
+        periodic_msg_part.body.request.notify.event.obj_path = "Device.LocalAgent."
+        periodic_msg_part.body.request.notify.event.event_name = "Periodic!"
+        self._periodic_msg_part = self._notif_msg_part + periodic_msg_part.SerializeToString()
+
+    def generate_value_change_record(self, param, value):
+        """Return a tuple of the msg_id and the serialized ValueChange Notification Record"""
+        value_change_msg_part = usp_msg.Msg()
+        value_change_msg_part.header.msg_id = utils.MessageIdHelper.get_message_id()
+        value_change_msg_part.body.request.notify.value_change.param_path = param
+        value_change_msg_part.body.request.notify.value_change.param_value = str(value)
+
+        return value_change_msg_part.header.msg_id, \
+            self._wrap_msg(self._notif_msg_part + value_change_msg_part.SerializeToString())
+
+    def generate_periodic_record(self):
+        """Return a tuple of the msg_id and the serialized Periodic Notification Record"""
+        msg_id_part = usp_msg.Msg()
+        msg_id_part.header.msg_id = utils.MessageIdHelper.get_message_id()
+
+        return msg_id_part.header.msg_id, self._wrap_msg(self._periodic_msg_part + msg_id_part.SerializeToString())
+
+    def generate_obj_creation_record(self, obj_path, unique_key_dict=None):
+        """Return a tuple of the msg_id and the serialized ObjectCreation Notification Record"""
+        obj_creation_msg_part = usp_msg.Msg()
+        obj_creation_msg_part.header.msg_id = utils.MessageIdHelper.get_message_id()
+        obj_creation_msg_part.body.request.notify.obj_creation.obj_path = obj_path
+        for key, value in (unique_key_dict or {}).items():
+            obj_creation_msg_part.body.request.notify.obj_creation.unique_keys[key] = str(value)
+
+        return obj_creation_msg_part.header.msg_id, \
+            self._wrap_msg(self._notif_msg_part + obj_creation_msg_part.SerializeToString())
+
+    def generate_obj_deletion_record(self, obj_path):
+        """Return a tuple of the msg_id and the serialized ObjectDeletion Notification Record"""
+        obj_deletion_msg_part = usp_msg.Msg()
+        obj_deletion_msg_part.header.msg_id = utils.MessageIdHelper.get_message_id()
+        obj_deletion_msg_part.body.request.notify.obj_deletion.obj_path = obj_path
+
+        return obj_deletion_msg_part.header.msg_id, \
+            self._wrap_msg(self._notif_msg_part + obj_deletion_msg_part.SerializeToString())
+
+    def generate_oper_complete_record(self, command, command_key, output_arg_dict=None, cmd_failure=None):
+        """Return a tuple of the msg_id and the serialized OperationComplete Notification Record"""
+        oper_complete_msg_part = usp_msg.Msg()
+        oper_complete_msg_part.header.msg_id = utils.MessageIdHelper.get_message_id()
+        _set_oper_complete(oper_complete_msg_part.body.request.notify.oper_complete, command, command_key,
+                           output_arg_dict, cmd_failure)
+
+        return oper_complete_msg_part.header.msg_id, \
+            self._wrap_msg(self._notif_msg_part + oper_complete_msg_part.SerializeToString())
+
+    def _wrap_msg(self, serialized_msg):
+        """Wrap the serialized Notification Message in a serialized Record"""
+        payload_part = usp_record.Record()
+        payload_part.no_session_context.payload = serialized_msg
+
+        return self._record_part + payload_part.SerializeToString()
+
+
+def _set_oper_complete(oper_complete, command, command_key, output_arg_dict, cmd_failure):
+    """Populate an OperationComplete element; the Command's path is split into its object path and name
+        (e.g. Device.Services.HomeAutomation.1.Camera.1. and TakePicture())"""
+    obj_path, _, command_name = command.rpartition(".")
+    oper_complete.obj_path = obj_path + "."
+    oper_complete.command_name = command_name
+    oper_complete.command_key = command_key
+
+    if cmd_failure is not None:
+        oper_complete.cmd_failure.err_code, oper_complete.cmd_failure.err_msg = cmd_failure
+    else:
+        output_args = oper_complete.req_output_args.output_args
+        for key, value in (output_arg_dict or {}).items():
+            output_args[key] = str(value)
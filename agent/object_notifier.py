@@ -0,0 +1,170 @@
+# Copyright (c) 2016-2017 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+#
+# File Name: object_notifier.py
+#
+# Description: Sends the ObjectCreation, ObjectDeletion, and OperationComplete Notifications
+#
+# Class Structure:
+#  - ObjectNotifier(threading.Thread)
+#    - __init__(agent_database, notif_poller)
+#    - run()
+#    - add_subscriber(notif_type, path, agent_id, controller_id, mtp_param_path, subscription_id)
+#    - remove_subscriber(notif_type, path, controller_id, mtp_param_path, subscription_id)
+#    - queue_operation_complete(command, command_key, output_arg_dict=None, cmd_failure=None)
+#
+"""
+
+import queue
+import logging
+import threading
+
+from agent import utils
+
+
+OBJECT_CREATION = "ObjectCreation"
+OBJECT_DELETION = "ObjectDeletion"
+OPERATION_COMPLETE = "OperationComplete"
+
+
+class ObjectNotifier(threading.Thread):
+    """Send the ObjectCreation and ObjectDeletion Notifications for the Database's inserts and deletes, and
+        the OperationComplete Notifications for the completed Commands, from their own Thread
+        - each Notification is built and sent by the ValueChange Notification Poller, so that it shares
+          the Poller's Notification Templates, Outbox, and Routes"""
+    def __init__(self, agent_database, notif_poller):
+        """Initialize the Object Notifier Thread"""
+        threading.Thread.__init__(self, name="ObjectNotifier")
+        self.daemon = True
+        self._db = agent_database
+        self._notif_poller = notif_poller
+        self._notif_queue = queue.Queue()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        # Format: { (NotifType, Table or Command Path) : { (SubscriptionID, ControllerID, MTP Path) : AgentID } }
+        self._subscriber_dict = {}
+        self._subscriber_lock = threading.Lock()
+
+        self._db.add_insert_listener(self._handle_db_insert)
+        self._db.add_delete_listener(self._handle_db_delete)
+
+    def run(self):
+        """Thread execution code - send each queued Notification
+            - a Notification that fails is logged, so that it doesn't stop the Notifications queued behind it"""
+        while True:
+            notif_func, notif_args = self._notif_queue.get()
+
+            try:
+                notif_func(*notif_args)
+            # pylint: disable-msg=broad-except
+            except Exception as err:
+                self._logger.error("Failed to send a queued Notification: %s", err)
+
+    def add_subscriber(self, notif_type, path, agent_id, controller_id, mtp_param_path, subscription_id):
+        """Add a Subscriber of the ObjectCreation or ObjectDeletion Notifications for the instances of a Table
+            (e.g. Device.Services.HomeAutomation.1.Camera.1.Pic.), or of the OperationComplete Notifications
+            for a Command (e.g. Device.Services.HomeAutomation.1.Camera.1.TakePicture()), which may be Wild-carded"""
+        self._logger.info("Adding %s to the %s Notifications for Subscription [%s]",
+                          path, notif_type, subscription_id)
+
+        with self._subscriber_lock:
+            subscriber_dict = self._subscriber_dict.setdefault((notif_type, path), {})
+            subscriber_dict[(subscription_id, controller_id, mtp_param_path)] = agent_id
+
+    def remove_subscriber(self, notif_type, path, controller_id, mtp_param_path, subscription_id):
+        """Remove a Subscriber of the ObjectCreation, ObjectDeletion, or OperationComplete Notifications"""
+        self._logger.info("Removing %s from the %s Notifications", path, notif_type)
+
+        with self._subscriber_lock:
+            subscriber_dict = self._subscriber_dict.get((notif_type, path), {})
+            subscriber_dict.pop((subscription_id, controller_id, mtp_param_path), None)
+
+            if not subscriber_dict:
+                self._subscriber_dict.pop((notif_type, path), None)
+
+    def queue_operation_complete(self, command, command_key, output_arg_dict=None, cmd_failure=None):
+        """Queue an OperationComplete Notification for each Subscriber of the Command
+            - cmd_failure is None, or a tuple of the err_code and err_msg of the failed Command"""
+        notif_list = []
+
+        with self._subscriber_lock:
+            for (notif_type, command_path), subscriber_dict in self._subscriber_dict.items():
+                if notif_type == OPERATION_COMPLETE and utils.PathHelper.is_same_path(command_path, command):
+                    for (subscription_id, controller_id, mtp_param_path), agent_id in subscriber_dict.items():
+                        notif_list.append((command, command_key, output_arg_dict, cmd_failure, controller_id,
+                                           agent_id, subscription_id, mtp_param_path))
+
+        if not notif_list:
+            self._logger.info("No Subscribers for the OperationComplete of [%s]", command)
+
+        for notif_args in notif_list:
+            self._notif_queue.put((self._send_operation_complete, notif_args))
+
+    def _handle_db_insert(self, instance_path):
+        """Database Insert Listener - queue the ObjectCreation Notifications for the new instance"""
+        self._queue_object_notifs(OBJECT_CREATION, instance_path)
+
+    def _handle_db_delete(self, instance_path):
+        """Database Delete Listener - queue the ObjectDeletion Notifications for the removed instance"""
+        self._queue_object_notifs(OBJECT_DELETION, instance_path)
+
+    def _queue_object_notifs(self, notif_type, instance_path):
+        """Queue a Notification for each Subscriber of the Table that the instance belongs to
+            - the Notifications are sent from the Notifier's Thread, so the Database isn't held up sending them"""
+        notif_list = []
+
+        with self._subscriber_lock:
+            for (subscribed_notif_type, table_path), subscriber_dict in self._subscriber_dict.items():
+                if subscribed_notif_type == notif_type and \
+                        utils.PathHelper.is_table_instance(table_path, instance_path):
+                    for (subscription_id, controller_id, mtp_param_path), agent_id in subscriber_dict.items():
+                        notif_list.append((notif_type, instance_path, controller_id, agent_id,
+                                           subscription_id, mtp_param_path))
+
+        for notif_args in notif_list:
+            self._notif_queue.put((self._send_object_change, notif_args))
+
+    def _send_object_change(self, notif_type, obj_path, to_id, from_id, subscription_id, mtp_param_path):
+        """Build the ObjectCreation or ObjectDeletion Notification from the Subscription's Notification
+            Template, and send it"""
+        notif_template = self._notif_poller.get_notif_template(from_id, to_id, subscription_id)
+
+        if notif_type == OBJECT_CREATION:
+            msg_id, serialized_record = notif_template.generate_obj_creation_record(obj_path)
+        else:
+            msg_id, serialized_record = notif_template.generate_obj_deletion_record(obj_path)
+
+        self._logger.info("Sending an %s Notification for [%s] to Subscription [%s]",
+                          notif_type, obj_path, subscription_id)
+        self._notif_poller.send_notif_record(msg_id, serialized_record, to_id, subscription_id, mtp_param_path)
+
+    def _send_operation_complete(self, command, command_key, output_arg_dict, cmd_failure,
+                                 to_id, from_id, subscription_id, mtp_param_path):
+        """Build the OperationComplete Notification from the Subscription's Notification Template, and send it"""
+        notif_template = self._notif_poller.get_notif_template(from_id, to_id, subscription_id)
+        msg_id, serialized_record = notif_template.generate_oper_complete_record(command, command_key,
+                                                                                 output_arg_dict, cmd_failure)
+
+        self._logger.info("Sending an OperationComplete Notification for [%s] to Subscription [%s]",
+                          command, subscription_id)
+        self._notif_poller.send_notif_record(msg_id, serialized_record, to_id, subscription_id, mtp_param_path)
@@ -0,0 +1,177 @@
+# Copyright (c) 2016-2017 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+#
+# File Name: periodic_notif_scheduler.py
+#
+# Description: Issues the Periodic Notifications of every Periodic Subscription from a single Thread
+#
+# Class Structure:
+#  - PeriodicNotifScheduler(threading.Thread)
+#    - __init__(database, max_jitter=0)
+#    - add_handler(handler)
+#    - remove_handler(handler)
+#    - run()
+#
+"""
+
+import time
+import heapq
+import random
+import logging
+import threading
+
+from agent import agent_db
+
+
+class PeriodicNotifScheduler(threading.Thread):
+    """Issue the Periodic Notifications of every Periodic Subscription from a single Thread
+        - the Handlers are kept in a heap ordered by the time of their next Notification
+        - a change to a Controller's PeriodicNotifInterval or PeriodicNotifTime reschedules its Handlers"""
+    def __init__(self, database, max_jitter=0):
+        """Initialize the Periodic Notification Scheduler
+            - each Notification is delayed by a random jitter of up to max_jitter seconds (and at most a
+              tenth of its interval) so that Subscriptions sharing a schedule aren't all sent at once"""
+        threading.Thread.__init__(self, name="PeriodicNotifScheduler")
+        self._db = database
+        self._max_jitter = max_jitter
+        self._condition = threading.Condition()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        # Format: [ (Send Time, Sequence Number, Handler) ]
+        self._heap = []
+        self._next_seq_num = 0
+
+        # Format: { Handler : Sequence Number of its current heap entry (None when not scheduled) }
+        self._handler_dict = {}
+
+        # Format: { Handler : Due Time (before jitter) of its current heap entry }
+        self._due_time_dict = {}
+        self._changed_path_set = set()
+
+        self._db.add_update_listener(self._handle_db_update)
+
+    def add_handler(self, handler):
+        """Schedule the first Periodic Notification of the Handler"""
+        with self._condition:
+            self._schedule(handler, time.time())
+            self._condition.notify()
+
+    def remove_handler(self, handler):
+        """Stop issuing the Periodic Notifications of the Handler"""
+        with self._condition:
+            self._handler_dict.pop(handler, None)
+            self._due_time_dict.pop(handler, None)
+            self._condition.notify()
+
+    def run(self):
+        """Thread execution code - wait for the earliest scheduled Handler and send its Periodic Notification"""
+        while True:
+            with self._condition:
+                handler, seq_num = self._wait_for_next_handler()
+
+            try:
+                keep_handler = handler.send_notif()
+            # pylint: disable-msg=broad-except
+            except Exception as err:
+                self._logger.error("Periodic Notification Handler named [%s] failed to send: %s", handler.name, err)
+                keep_handler = True
+
+            with self._condition:
+                # Only reschedule the Handler if it wasn't removed or rescheduled while sending
+                if self._handler_dict.get(handler, -1) == seq_num:
+                    if keep_handler:
+                        # Follow on from the due time, so the jitter and sending time don't add up
+                        self._schedule(handler, time.time(), self._due_time_dict.get(handler))
+                    else:
+                        del self._handler_dict[handler]
+                        del self._due_time_dict[handler]
+                        self._logger.warning("Periodic Notification Handler named [%s] shutting down",
+                                             handler.name)
+
+    def _wait_for_next_handler(self):
+        """Wait until the earliest scheduled Handler is due, and return it with its Sequence Number
+            - must be called while holding the Condition"""
+        while True:
+            self._reschedule_changed()
+
+            # Discard the heap entries of Handlers that were removed or rescheduled
+            while self._heap and self._handler_dict.get(self._heap[0][2], -1) != self._heap[0][1]:
+                heapq.heappop(self._heap)
+
+            wait_timeout = None
+            if self._heap:
+                wait_timeout = self._heap[0][0] - time.time()
+                if wait_timeout <= 0:
+                    _, seq_num, handler = heapq.heappop(self._heap)
+                    return handler, seq_num
+
+            self._condition.wait(wait_timeout)
+
+    def _reschedule_changed(self):
+        """Reschedule the Handlers whose Periodic Notification Parameters changed
+            - must be called while holding the Condition"""
+        now = time.time()
+
+        for handler in list(self._handler_dict):
+            if handler.get_path() in self._changed_path_set:
+                self._logger.info("Periodic Notification Parameters changed, rescheduling [%s]", handler.name)
+                self._schedule(handler, now)
+
+        self._changed_path_set.clear()
+
+    def _schedule(self, handler, now, last_due_time=None):
+        """Push the next Periodic Notification of the Handler onto the heap
+            - when last_due_time (the previous due time, before jitter) is provided, the next Notification is
+              due an interval after it instead of an interval after now; overdue Notifications are skipped
+            - must be called while holding the Condition"""
+        seq_num = None
+
+        try:
+            next_notif_time, periodic_interval = handler.get_next_notif_time(
+                now if last_due_time is None else last_due_time)
+            if next_notif_time is not None and next_notif_time < now:
+                next_notif_time, periodic_interval = handler.get_next_notif_time(now)
+
+            if next_notif_time is not None:
+                self._due_time_dict[handler] = next_notif_time
+                send_time = next_notif_time + random.uniform(0, min(self._max_jitter, periodic_interval / 10))
+                seq_num = self._next_seq_num
+                self._next_seq_num += 1
+                heapq.heappush(self._heap, (send_time, seq_num, handler))
+                self._logger.info("Next Periodic Notification for [%s] in %.1f seconds",
+                                  handler.name, send_time - now)
+            else:
+                self._logger.warning("Not scheduling [%s] : Invalid Periodic Interval [%s]",
+                                     handler.name, periodic_interval)
+        except agent_db.NoSuchPathError as err:
+            self._logger.warning("Periodic Notification Failure : No Periodic Notification Parameter [%s]", err)
+
+        # Keep an unscheduled Handler around, so that it is rescheduled when its Parameters are fixed
+        self._handler_dict[handler] = seq_num
+
+    def _handle_db_update(self, param, value):
+        """Database Update Listener - note a change to a Controller's Periodic Notification Parameters"""
+        if param.endswith(".PeriodicNotifInterval") or param.endswith(".PeriodicNotifTime"):
+            with self._condition:
+                self._changed_path_set.add(param[:param.rindex(".") + 1])
+                self._condition.notify()
@@ -0,0 +1,188 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+#
+# File Name: record_header.py
+#
+# Description: Cheap validation of an incoming USP Record that only reads the top-level
+#               fields from the wire bytes instead of fully parsing the Record (and its payload)
+#
+# Class Structure:
+#  - RecordHeader(object)
+#    - __init__()
+#  - RecordHeaderValidator(object)
+#    - __init__(endpoint_id)
+#    - validate(payload)
+#  - MalformedRecordError(Exception)
+#  - peek_record_header(payload)
+#
+"""
+
+import logging
+import prometheus_client
+
+
+VERSION_FIELD = 1
+TO_ID_FIELD = 2
+FROM_ID_FIELD = 3
+PAYLOAD_SECURITY_FIELD = 4
+NO_SESSION_CONTEXT_FIELD = 7
+SESSION_CONTEXT_FIELD = 8
+
+PLAINTEXT = 0
+
+WIRE_TYPE_VARINT = 0
+WIRE_TYPE_64BIT = 1
+WIRE_TYPE_LENGTH_DELIMITED = 2
+WIRE_TYPE_32BIT = 5
+
+# pylint: disable-msg=no-value-for-parameter
+NUM_REJECTED_RECORDS_METRIC = \
+    prometheus_client.Counter("number_of_rejected_usp_records",
+                              "Number of USP Records rejected before being parsed")
+
+
+class RecordHeader:
+    """The top-level fields of a USP Record, without the Record's payload"""
+    def __init__(self):
+        """Initialize the Record Header with the ProtoBuf default values"""
+        self.version = ""
+        self.to_id = ""
+        self.from_id = ""
+        self.payload_security = PLAINTEXT
+        self.record_type = None
+
+
+class RecordHeaderValidator:
+    """Reject mis-addressed or unsupported USP Records before they are queued and fully parsed"""
+    def __init__(self, endpoint_id):
+        """Initialize the Record Header Validator for the USP Endpoint"""
+        self._endpoint_id = endpoint_id
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def validate(self, payload):
+        """Return the Record Header of the serialized USP Record if it could be handled by this USP Endpoint,
+            otherwise None"""
+        header = None
+        err_msg = None
+
+        try:
+            header = peek_record_header(payload)
+
+            if not header.version:
+                err_msg = "USP Record missing version"
+            elif header.to_id != self._endpoint_id:
+                err_msg = "USP Record has incorrect to_id [{}]".format(header.to_id)
+            elif not header.from_id:
+                err_msg = "USP Record missing from_id"
+            elif header.payload_security != PLAINTEXT:
+                err_msg = "USP Record has unsupported Payload Security"
+            elif header.record_type != "no_session_context":
+                err_msg = "USP Record has an unsupported Record Type"
+        except MalformedRecordError as err:
+            err_msg = "USP Record is malformed: {}".format(err)
+
+        if err_msg is not None:
+            self._logger.warning("Rejecting an incoming USP Record: %s", err_msg)
+            NUM_REJECTED_RECORDS_METRIC.inc()
+            return None
+
+        return header
+
+
+class MalformedRecordError(Exception):
+    """A USP Record that isn't valid ProtoBuf wire format"""
+    pass
+
+
+def peek_record_header(payload):
+    """Read the top-level fields of a serialized USP Record, skipping over the Record's payload"""
+    index = 0
+    header = RecordHeader()
+    data = memoryview(payload)
+    data_len = len(data)
+
+    while index < data_len:
+        tag, index = _read_varint(data, index)
+        field_number = tag >> 3
+        wire_type = tag & 0x07
+
+        if wire_type == WIRE_TYPE_VARINT:
+            value, index = _read_varint(data, index)
+            if field_number == PAYLOAD_SECURITY_FIELD:
+                header.payload_security = value
+        elif wire_type == WIRE_TYPE_LENGTH_DELIMITED:
+            length, index = _read_varint(data, index)
+            end = index + length
+            if end > data_len:
+                raise MalformedRecordError("Field [{}] is truncated".format(field_number))
+
+            if field_number == VERSION_FIELD:
+                header.version = _decode_str(data[index:end])
+            elif field_number == TO_ID_FIELD:
+                header.to_id = _decode_str(data[index:end])
+            elif field_number == FROM_ID_FIELD:
+                header.from_id = _decode_str(data[index:end])
+            elif field_number == NO_SESSION_CONTEXT_FIELD:
+                header.record_type = "no_session_context"
+            elif field_number == SESSION_CONTEXT_FIELD:
+                header.record_type = "session_context"
+
+            index = end
+        elif wire_type == WIRE_TYPE_64BIT:
+            index += 8
+        elif wire_type == WIRE_TYPE_32BIT:
+            index += 4
+        else:
+            raise MalformedRecordError("Unsupported Wire Type [{}]".format(wire_type))
+
+    if index > data_len:
+        raise MalformedRecordError("Record is truncated")
+
+    return header
+
+
+def _read_varint(data, index):
+    """Read a Base 128 Varint starting at the index; return the value and the index after the varint"""
+    shift = 0
+    value = 0
+    data_len = len(data)
+
+    while True:
+        if index >= data_len or shift > 63:
+            raise MalformedRecordError("Invalid Varint")
+
+        byte = data[index]
+        index += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+
+        if not byte & 0x80:
+            return value, index
+
+
+def _decode_str(data):
+    """Decode a ProtoBuf string field"""
+    try:
+        return bytes(data).decode("utf-8")
+    except UnicodeDecodeError:
+        raise MalformedRecordError("Invalid UTF-8 String")
@@ -26,7 +26,13 @@ SOFTWARE.
 # Functionality:
 #   Class: USPRequestHandler(object)
 #    - __init__(agent_endpoint_id, agent_database, service_map=None, debug=False)
+#    - set_notify_resp_listener(listener)
+#    - set_operation_complete_listener(listener)
 #    - handle_request(msg_payload)
+#   Class: OperationWorker(threading.Thread)
+#    - __init__()
+#    - submit(operation_func, *args)
+#    - run()
 #   Class: ProtocolViolationError(Exception)
 #   Class: ProtocolValidationError(Exception)
 #
@@ -34,7 +40,9 @@ SOFTWARE.
 
 
 import re
+import queue
 import logging
+import threading
 import prometheus_client
 
 from agent import utils
@@ -44,6 +52,7 @@ from agent import usp_record_pb2 as usp_record
 
 
 TAKE_PICTURE_CAMERA_OP = "Device.Services.HomeAutomation.1.Camera.1.TakePicture()"
+REQUEST_TABLE = "Device.LocalAgent.Request."
 
 # pylint: disable-msg=no-value-for-parameter
 NUM_GET_MSGS_METRIC = \
@@ -58,6 +67,10 @@ NUM_OPERATE_MSGS_METRIC = \
     prometheus_client.Counter("number_of_usp_operate_msgs",
                               "Number of USP Operate Messages")
 # pylint: disable-msg=no-value-for-parameter
+NUM_NOTIFY_RESP_MSGS_METRIC = \
+    prometheus_client.Counter("number_of_usp_notify_resp_msgs",
+                              "Number of USP NotifyResp Messages")
+# pylint: disable-msg=no-value-for-parameter
 NUM_UNKNOWN_MSGS_METRIC = \
     prometheus_client.Counter("number_of_usp_unknown_msgs",
                               "Number of Unknown USP Messages")
@@ -71,16 +84,35 @@ class UspRequestHandler:
         self._id = endpoint_id
         self._db = agent_database
         self._service_map = service_map
+        self._notify_resp_listener = None
+        self._operation_complete_listener = None
+        self._operation_worker = None
+        self._operation_worker_lock = threading.Lock()
         self._logger = logging.getLogger(self.__class__.__name__)
 
+    def set_notify_resp_listener(self, listener):
+        """Register a callable(msg_id, from_id) that is called with each incoming NotifyResp"""
+        self._notify_resp_listener = listener
+
+    def set_operation_complete_listener(self, listener):
+        """Register a callable(command, command_key, output_arg_dict, cmd_failure) that is called as each
+            asynchronous Operate completes - cmd_failure is None, or a tuple of the err_code and err_msg"""
+        self._operation_complete_listener = listener
+
     def handle_request(self, msg_payload):
-        """Handle a Request/Response interaction"""
+        """Handle a Request/Response interaction
+            - a NotifyResp is handed to the NotifyResp Listener, and has no Response (None)"""
         req_record = self._handle_usp_record(msg_payload)
 
         try:
             # Validate the payload before processing it
             self._validate_usp_record_request(req_record)
             req_msg = self._handle_usp_msg(req_record)
+
+            if self._is_notify_resp(req_msg):
+                self._process_notify_resp(req_record, req_msg)
+                return req_msg, req_record, None, None
+
             self._validate_usp_msg_request(req_msg)
             self._logger.info("Received a [%s] Request",
                               req_msg.body.request.WhichOneof("req_type"))
@@ -161,6 +193,25 @@ class UspRequestHandler:
 
         self._logger.info("Incoming USP Message passed validation")
 
+    def _is_notify_resp(self, req_as_msg):
+        """Determine if the USP Message from the Incoming USP Record is a NotifyResp"""
+        return req_as_msg.header.msg_type == usp_msg.Header.NOTIFY_RESP and \
+            req_as_msg.body.WhichOneof("msg_body") == "response" and \
+            req_as_msg.body.response.WhichOneof("resp_type") == "notify_resp"
+
+    def _process_notify_resp(self, req_as_record, req_as_msg):
+        """Process an incoming NotifyResp, which acknowledges the Notification with the same msg_id"""
+        NUM_NOTIFY_RESP_MSGS_METRIC.inc()
+
+        if not req_as_msg.header.msg_id:
+            raise ProtocolValidationError("USP Message Header missing msg_id")
+
+        self._logger.info("Received a NotifyResp for Notification [%s] from Endpoint ID [%s]",
+                          req_as_msg.header.msg_id, req_as_record.from_id)
+
+        if self._notify_resp_listener is not None:
+            self._notify_resp_listener(req_as_msg.header.msg_id, req_as_record.from_id)
+
     def _process_request(self, req_as_record, req_as_msg):
         """Processing the incoming Message and return a Response"""
         to_id = req_as_record.from_id
@@ -183,7 +234,7 @@ class UspRequestHandler:
             # Validate that the Request body matches the Header's msg_type
             if req_as_msg.body.request.WhichOneof("req_type") == "operate":
                 NUM_OPERATE_MSGS_METRIC.inc()
-                resp_msg = self._process_operation(req_as_msg)
+                resp_msg = self._process_operation(req_as_msg, to_id)
         else:
             err_msg = "Invalid USP Message: unknown command"
             resp_msg = usp_err_msg.generate_error(9000, err_msg)
@@ -419,8 +470,10 @@ class UspRequestHandler:
             set_failure_param_err.err_msg = sv_err.get_error_message()
             set_failure_param_err_list.append(set_failure_param_err)
 
-    def _process_operation(self, req_msg):
-        """Process an incoming Operate and generate a OperateResp"""
+    def _process_operation(self, req_msg, originator):
+        """Process an incoming Operate and generate a OperateResp
+            - the Command runs asynchronously, so the OperateResp holds the path of its Request object, and
+              the output arguments are sent in an OperationComplete Notification once it completes"""
         resp_msg = usp_msg.Msg()
         op_result_list = []
         command = req_msg.body.request.operate.command
@@ -437,11 +490,11 @@ class UspRequestHandler:
             # Validate that the Operate.command is supported
             if command == TAKE_PICTURE_CAMERA_OP:
                 op_result = usp_msg.OperateResp.OperationResult()
-                out_arg_map = op_result.req_output_args.output_args
+                op_result.executed_command = command
                 camera = self._service_map[product_class]
-                param_map = camera.take_picture()
-                for param in param_map:
-                    out_arg_map[param] = param_map[param]
+                op_result.req_obj_path = self._start_operation(originator, command,
+                                                               req_msg.body.request.operate.command_key,
+                                                               camera.take_picture)
 
                 op_result_list.append(op_result)
                 resp_msg.body.response.operate_resp.operation_results.extend(op_result_list)
@@ -458,6 +511,45 @@ class UspRequestHandler:
 
         return resp_msg
 
+    def _start_operation(self, originator, command, command_key, command_func):
+        """Create the Request object for the Command, and hand the Command to the Operation Worker
+            - returns the path of the Request object"""
+        request_path = REQUEST_TABLE + str(self._db.insert(REQUEST_TABLE)) + "."
+        self._db.update(request_path + "Originator", originator)
+        self._db.update(request_path + "Command", command)
+        self._db.update(request_path + "CommandKey", command_key)
+        self._db.update(request_path + "Status", "Active")
+
+        with self._operation_worker_lock:
+            if self._operation_worker is None:
+                self._operation_worker = OperationWorker()
+                self._operation_worker.start()
+
+        self._logger.info("Started the Operation [%s] as Request [%s]", command, request_path)
+        self._operation_worker.submit(self._run_operation, request_path, command, command_key, command_func)
+
+        return request_path
+
+    def _run_operation(self, request_path, command, command_key, command_func):
+        """Run the Command on the Operation Worker's Thread, report its completion to the Operation Complete
+            Listener, and then remove its Request object"""
+        output_arg_dict = None
+        cmd_failure = None
+
+        try:
+            output_arg_dict = command_func()
+        # pylint: disable-msg=broad-except
+        except Exception as err:
+            self._logger.error("The Operation [%s] for Request [%s] failed: %s", command, request_path, err)
+            cmd_failure = (9000, "Operate Failure: {}".format(err))
+
+        self._logger.info("Completed the Operation [%s] for Request [%s]", command, request_path)
+        try:
+            if self._operation_complete_listener is not None:
+                self._operation_complete_listener(command, command_key, output_arg_dict, cmd_failure)
+        finally:
+            self._db.delete(request_path)
+
     def _split_path(self, path):
         """Split an incoming path into its partial path and parameter name
             - Return None for param_name if a partial path was provided"""
@@ -555,6 +647,32 @@ class UspRequestHandler:
         return ".*." in partial_path
 
 
+class OperationWorker(threading.Thread):
+    """Run the asynchronous Operations one at a time, away from the Threads that handle the Requests"""
+    def __init__(self):
+        """Initialize the Operation Worker Thread"""
+        threading.Thread.__init__(self, name="OperationWorker")
+        self.daemon = True
+        self._operation_queue = queue.Queue()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def submit(self, operation_func, *args):
+        """Queue a callable to be run with the provided arguments"""
+        self._operation_queue.put((operation_func, args))
+
+    def run(self):
+        """Thread execution code - run each queued Operation
+            - a failed Operation is logged, so that it doesn't stop the Operations queued behind it"""
+        while True:
+            operation_func, args = self._operation_queue.get()
+
+            try:
+                operation_func(*args)
+            # pylint: disable-msg=broad-except
+            except Exception as err:
+                self._logger.error("Failed to run a queued Operation: %s", err)
+
+
 class ProtocolViolationError(Exception):
     """A USP Protocol Violation Error"""
     pass
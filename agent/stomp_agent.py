@@ -26,14 +26,14 @@
 #
 # Functionality:
 #   Class: StompAgent(abstract_agent.AbstractAgent)
-#     __init__(dm_file, db_file, cfg_file_name="cfg/agent.json")
+#     __init__(dm_file, db_file, net_intf, cfg_file_name="cfg/agent.json", debug=False, shared_agent=None)
 #     start_listening(timeout=15)
 #     clean_up()
 #   Class: StompPeriodicNotifHandler(abstract_agent.AbstractPeriodicNotifHandler)
 #     __init__(database, mtp_param_path, from_id, to_id, subscription_id, param)
 #     add_binding(controller_param_path, binding)
 #     remove_binding(controller_param_path)
-#   Class: StompValueChangeNotifPoller(abstract_agent.AbstractValueChangeNotifPoller)
+#   Class: StompValueChangeNotifPoller(value_change_notif_poller.AbstractValueChangeNotifPoller)
 #     __init__(agent_db, poll_duration=0.5)
 #     add_binding(mtp_param_path, binding)
 #     remove_binding(mtp_param_path)
@@ -45,16 +45,31 @@
 import time
 
 from agent import utils
-from agent import notify
 from agent import abstract_agent
+from agent import notif_sender_pool
 from agent import stomp_usp_binding
+from agent import value_change_notif_poller
+
+
+STOMP_ACK_MODE = "stomp.ack.mode"
+STOMP_PREFETCH_COUNT = "stomp.prefetch.count"
+STOMP_BATCH_WINDOW = "stomp.batch.window"
+STOMP_BATCH_MAX_FRAMES = "stomp.batch.max.frames"
+STOMP_BATCH_MAX_BYTES = "stomp.batch.max.bytes"
+STOMP_BATCH_TRANSACTION = "stomp.batch.transaction"
+STOMP_SEND_POOL_SIZE = "stomp.send.pool.size"
+STOMP_RECONNECT_MIN_DELAY = "stomp.reconnect.min.delay"
+STOMP_RECONNECT_MAX_DELAY = "stomp.reconnect.max.delay"
+STOMP_OUTBOUND_BUFFER_SIZE = "stomp.outbound.buffer.size"
+STOMP_OUTBOUND_BUFFER_TTL = "stomp.outbound.buffer.ttl"
 
 
 class StompAgent(abstract_agent.AbstractAgent):
     """A USP Agent that uses the STOMP Binding"""
-    def __init__(self, dm_file, db_file, net_intf, cfg_file_name="cfg/agent.json", debug=False):
+    def __init__(self, dm_file, db_file, net_intf, cfg_file_name="cfg/agent.json", debug=False, shared_agent=None):
         """Initialize the STOMP Agent"""
-        abstract_agent.AbstractAgent.__init__(self, dm_file, db_file, net_intf, cfg_file_name, debug)
+        abstract_agent.AbstractAgent.__init__(self, dm_file, db_file, net_intf, cfg_file_name, debug,
+                                             shared_agent)
         self._binding_dict = {}
 
         # Format: { StompConnRef : { ControllerID : StompDestination } }
@@ -190,30 +205,28 @@ class StompAgent(abstract_agent.AbstractAgent):
         username = self._db.get(stomp_conn_ref + "Username")
         password = self._db.get(stomp_conn_ref + "Password")
         virtual_host = self._db.get(stomp_conn_ref + "VirtualHost")
-        timezone = self._db.get("Device.Time.LocalTimeZone")
 
         if self._db.get(stomp_conn_ref + "EnableHeartbeats"):
             outgoing_heartbeats = self._db.get(stomp_conn_ref + "OutgoingHeartbeat")
             incoming_heartbeats = self._db.get(stomp_conn_ref + "IncomingHeartbeat")
 
-        # Set the STOMP Connection Status to Connecting
-        self._db.update(stomp_conn_ref + "Status", "Connecting")
-        self._db.update(stomp_conn_ref + "LastChangeDate", utils.TimeHelper.get_time_as_str(time.time(), timezone))
         self._logger.info("Connecting to %s", stomp_conn_ref)
 
-        binding = stomp_usp_binding.StompUspBinding(self._endpoint_id, host, port, username, password, virtual_host,
-                                                    outgoing_heartbeats, incoming_heartbeats)
-
-        # Set the STOMP Connection Status to Enabled
-        self._db.update(stomp_conn_ref + "Status", "Enabled")
-        self._db.update(stomp_conn_ref + "LastChangeDate", utils.TimeHelper.get_time_as_str(time.time(), timezone))
-        self._logger.info("Connected to %s", stomp_conn_ref)
+        # The Binding reports the STOMP Connection Status as it connects, loses, and re-gains the Broker
+        ack_mode, prefetch_count = self._get_flow_control_cfg()
+        binding_cfg = self._get_send_cfg()
+        binding_cfg.update(self._get_reconnect_cfg())
+        binding = stomp_usp_binding.StompUspBinding(
+            self._endpoint_id, host, port, username, password, virtual_host, outgoing_heartbeats, incoming_heartbeats,
+            ack_mode=ack_mode, prefetch_count=prefetch_count,
+            status_callback=lambda status: self._update_stomp_conn_status(stomp_conn_ref, status), **binding_cfg)
 
         # Start listening
         binding.listen(listen_dest)
 
         # Save the binding, and configure the ValueChangeNotifPoller
         self._binding_dict[stomp_conn_ref] = binding
+        self.invalidate_routes()
 
         # Update the ValueChangeNotifPoller for the Binding and Controller Destinations
         self.get_value_change_notif_poller().add_binding(stomp_conn_ref, binding)
@@ -221,18 +234,69 @@ class StompAgent(abstract_agent.AbstractAgent):
             self.get_value_change_notif_poller().add_controller_dest(
                 controller_endpoint_id, self._controller_stomp_conn_ref_dict[stomp_conn_ref][controller_endpoint_id])
 
+    def _get_flow_control_cfg(self):
+        """Retrieve the STOMP acknowledgement mode and prefetch count from the Agent's configuration"""
+        default_cfg = {STOMP_ACK_MODE: stomp_usp_binding.AUTO_ACK_MODE, STOMP_PREFETCH_COUNT: 0}
+        cfg_mgr = utils.ConfigMgr(self._cfg_file_name, default_cfg)
+        ack_mode = cfg_mgr.get_cfg_item(STOMP_ACK_MODE)
+        prefetch_count = int(cfg_mgr.get_cfg_item(STOMP_PREFETCH_COUNT))
+
+        if ack_mode not in (stomp_usp_binding.AUTO_ACK_MODE, stomp_usp_binding.CLIENT_INDIVIDUAL_ACK_MODE):
+            self._logger.warning("Unsupported STOMP ack mode [%s], using [%s]",
+                                 ack_mode, stomp_usp_binding.AUTO_ACK_MODE)
+            ack_mode = stomp_usp_binding.AUTO_ACK_MODE
+
+        return ack_mode, prefetch_count
+
+    def _update_stomp_conn_status(self, stomp_conn_ref, status):
+        """Update the Status and LastChangeDate of the STOMP Connection (only when the Status changes)"""
+        if self._db.get(stomp_conn_ref + "Status") != status:
+            timezone = self._db.get("Device.Time.LocalTimeZone")
+            self._db.update(stomp_conn_ref + "Status", status)
+            self._db.update(stomp_conn_ref + "LastChangeDate",
+                            utils.TimeHelper.get_time_as_str(time.time(), timezone))
+            self._logger.info("STOMP Connection [%s] is now [%s]", stomp_conn_ref, status)
+
+    def _get_reconnect_cfg(self):
+        """Retrieve the STOMP re-connect and outbound buffer settings from the Agent's configuration
+            - delays and the TTL are in seconds"""
+        default_cfg = {STOMP_RECONNECT_MIN_DELAY: 1, STOMP_RECONNECT_MAX_DELAY: 60,
+                       STOMP_OUTBOUND_BUFFER_SIZE: 100, STOMP_OUTBOUND_BUFFER_TTL: 60}
+        cfg_mgr = utils.ConfigMgr(self._cfg_file_name, default_cfg)
+
+        return {"reconnect_min_delay": float(cfg_mgr.get_cfg_item(STOMP_RECONNECT_MIN_DELAY)),
+                "reconnect_max_delay": float(cfg_mgr.get_cfg_item(STOMP_RECONNECT_MAX_DELAY)),
+                "outbound_buffer_size": int(cfg_mgr.get_cfg_item(STOMP_OUTBOUND_BUFFER_SIZE)),
+                "outbound_buffer_ttl": int(cfg_mgr.get_cfg_item(STOMP_OUTBOUND_BUFFER_TTL))}
+
+    def _get_send_cfg(self):
+        """Retrieve the outbound STOMP batching and sending Connection Pool settings from the Agent's configuration
+            - stomp.batch.window is in milliseconds; 0 disables batching
+            - stomp.batch.transaction may be a JSON boolean or a string such as "true" or "false"
+            - stomp.send.pool.size is the number of extra sending Connections per Broker; 0 disables the pool"""
+        default_cfg = {STOMP_BATCH_WINDOW: 0, STOMP_BATCH_MAX_FRAMES: 50, STOMP_BATCH_MAX_BYTES: 65536,
+                       STOMP_BATCH_TRANSACTION: False, STOMP_SEND_POOL_SIZE: 0}
+        cfg_mgr = utils.ConfigMgr(self._cfg_file_name, default_cfg)
+
+        return {"batch_window": float(cfg_mgr.get_cfg_item(STOMP_BATCH_WINDOW)) / 1000,
+                "batch_max_frames": int(cfg_mgr.get_cfg_item(STOMP_BATCH_MAX_FRAMES)),
+                "batch_max_bytes": int(cfg_mgr.get_cfg_item(STOMP_BATCH_MAX_BYTES)),
+                "batch_transaction": str(cfg_mgr.get_cfg_item(STOMP_BATCH_TRANSACTION)).lower() in ("true", "1", "yes"),
+                "send_pool_size": int(cfg_mgr.get_cfg_item(STOMP_SEND_POOL_SIZE))}
+
     def _get_supported_protocol(self):
         """Return the supported Protocol as a String: CoAP, STOMP, HTTP/2, WebSockets"""
         return "STOMP"
 
     def _init_db_for_mtp(self):
-        """Enable the LocalAgent MTPs for the supported protocol and Disable all other LocalAgent MTPs"""
+        """Enable the LocalAgent MTPs for the supported protocol and Disable all other LocalAgent MTPs
+            (unless the Database is shared with the other MTPs)"""
         agent_mtp_instances = self._db.find_instances("Device.LocalAgent.MTP.")
 
         for agent_mtp_path in agent_mtp_instances:
             if self._db.get(agent_mtp_path + "Protocol") == self._get_supported_protocol():
                 self._db.update(agent_mtp_path + "Enable", True)
-            else:
+            elif not self._is_shared:
                 self._db.update(agent_mtp_path + "Enable", False)
 
     def _get_notification_sender(self, notif, controller_id, mtp_param_path):
@@ -281,7 +345,7 @@ class StompPeriodicNotifHandler(abstract_agent.AbstractPeriodicNotifHandler):
         self._mtp_param_path = mtp_param_path
         self._controller_dest_dict = controller_dest_dict
 
-    def _handle_periodic_record(self, notif_record):
+    def _handle_periodic_record(self, serialized_record):
         """Handle the STOMP Periodic Notification"""
         binding_exists = True
 
@@ -292,7 +356,7 @@ class StompPeriodicNotifHandler(abstract_agent.AbstractPeriodicNotifHandler):
 
                 self._logger.info("Sending a Periodic Notification to ID [%s] over MTP [%s] at: %s",
                                   self._to_id, self._mtp_param_path, to_addr)
-                self._binding.send_msg(notif_record.SerializeToString(), to_addr)
+                self._binding.send_msg(serialized_record, to_addr)
             else:
                 self._logger.warning("Could not send a Periodic Notification to an unknown Controller [%s]",
                                      self._to_id)
@@ -304,11 +368,11 @@ class StompPeriodicNotifHandler(abstract_agent.AbstractPeriodicNotifHandler):
         return binding_exists
 
 
-class StompValueChangeNotifPoller(abstract_agent.AbstractValueChangeNotifPoller):
+class StompValueChangeNotifPoller(value_change_notif_poller.AbstractValueChangeNotifPoller):
     """Poll Parameters for Value Change Notifications via a STOMP Binding"""
     def __init__(self, agent_db, poll_duration=0.5):
         """Initialize the STOMP Value Change Notification Poller"""
-        abstract_agent.AbstractValueChangeNotifPoller.__init__(self, agent_db, poll_duration)
+        value_change_notif_poller.AbstractValueChangeNotifPoller.__init__(self, agent_db, poll_duration)
         self._binding_dict = {}
         self._controller_dest_dict = {}
 
@@ -319,42 +383,40 @@ class StompValueChangeNotifPoller(abstract_agent.AbstractValueChangeNotifPoller)
     def remove_binding(self, stomp_conn_ref):
         """Remove a STOMP Binding"""
         del self._binding_dict[stomp_conn_ref]
+        self.invalidate_routes()
 
     def add_controller_dest(self, controller_endpoint_id, dest_list):
         """Add a STOMP Binding associated to a Controller Parameter Path"""
         self._controller_dest_dict[controller_endpoint_id] = dest_list
+        self.invalidate_routes()
 
     def remove_controller_dest(self, controller_endpoint_id):
         """Remove a STOMP Binding"""
         del self._controller_dest_dict[controller_endpoint_id]
+        self.invalidate_routes()
 
-    def _handle_value_change(self, param, value, to_id, from_id, subscription_id, mtp_param_path):
-        """Handle the STOMP Value Change Processing"""
+    def _resolve_route(self, to_id, mtp_param_path):
+        """Resolve the STOMP Binding and Destination for the Controller's MTP"""
         controller_stomp_conn = self._db.get(mtp_param_path + "STOMP.Reference") + "."
-        notif = notify.ValueChangeNotification(from_id, to_id, subscription_id, param, value)
 
-        if controller_stomp_conn in self._binding_dict:
-            # Ensure the Controller Endpoint ID is known
-            if to_id in self._controller_dest_dict:
-                to_addr = self._controller_dest_dict[to_id]
-                notif_record = notif.wrap_notif_in_record(notif.generate_notif_msg())
-                binding = self._binding_dict[controller_stomp_conn]
-
-                self._logger.info("Sending a ValueChange Notification to Controller [%s] over MTP [%s] at: %s",
-                                  to_id, mtp_param_path, to_addr)
-                binding.send_msg(notif_record.SerializeToString(), to_addr)
-            else:
-                self._logger.warning("Could not send a Value Change Notification to an unknown Controller [%s]", to_id)
-        else:
+        if controller_stomp_conn not in self._binding_dict:
             self._logger.warning("Could not send ValueChange Notification to an unknown Controller/MTP [%s]",
                                  mtp_param_path)
+            return None
+
+        # Ensure the Controller Endpoint ID is known
+        if to_id not in self._controller_dest_dict:
+            self._logger.warning("Could not send a Value Change Notification to an unknown Controller [%s]", to_id)
+            return None
+
+        return self._binding_dict[controller_stomp_conn], self._controller_dest_dict[to_id]
 
 
-class StompNotificationSender(abstract_agent.NotificationSender):
+class StompNotificationSender(notif_sender_pool.NotificationSender):
     """A STOMP specific implementation of the Abstract Notification Sender"""
     def __init__(self, notif, binding, to_addr):
         """Initialize the STOMP Notification Sender"""
-        abstract_agent.NotificationSender.__init__(self, notif, binding)
+        notif_sender_pool.NotificationSender.__init__(self, notif, binding)
         self._to_addr = to_addr
 
     def _retrieve_to_addr(self):
@@ -0,0 +1,142 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+#
+# File Name: stomp_frame.py
+#
+# Description: Encodes and decodes STOMP 1.2 Frames
+#
+# Functionality:
+#  - escape_header_value(value)
+#  - unescape_header_value(value)
+#  - decode_frame_head(frame_head)
+#  - encode_frame(command, headers, body=b"")
+#  - get_send_headers(destination, content_type, headers=None, transaction=None)
+#  - encode_send_frame(destination, body, content_type, headers=None, transaction=None)
+#
+"""
+
+
+FRAME_TERMINATOR = b"\x00"
+
+# STOMP 1.2 header escaping (the backslash must be escaped first)
+HEADER_ESCAPES = (("\\", "\\\\"), ("\r", "\\r"), ("\n", "\\n"), (":", "\\c"))
+UNESCAPES = {escaped_char: char for char, escaped_char in HEADER_ESCAPES}
+UNESCAPED_COMMANDS = ("CONNECT", "CONNECTED")
+
+
+def escape_header_value(value):
+    """Escape a STOMP 1.2 Header name or value"""
+    escaped_value = str(value)
+
+    for char, escaped_char in HEADER_ESCAPES:
+        escaped_value = escaped_value.replace(char, escaped_char)
+
+    return escaped_value
+
+
+def unescape_header_value(value):
+    """Un-escape a STOMP 1.2 Header name or value"""
+    unescaped_chars = []
+    index = 0
+
+    while index < len(value):
+        if value[index] == "\\" and index + 1 < len(value):
+            escape_seq = value[index:index + 2]
+            unescaped_char = UNESCAPES.get(escape_seq)
+            if unescaped_char is None:
+                raise MalformedFrameError("Undefined escape sequence [{}]".format(escape_seq))
+
+            unescaped_chars.append(unescaped_char)
+            index += 2
+        else:
+            unescaped_chars.append(value[index])
+            index += 1
+
+    return "".join(unescaped_chars)
+
+
+def decode_frame_head(frame_head):
+    """Decode the command and headers of a STOMP 1.2 Frame (everything before the blank line)
+        - if a header is repeated, only the first occurrence is used (as per STOMP 1.2)"""
+    headers = {}
+    lines = frame_head.decode("utf-8").replace("\r\n", "\n").split("\n")
+    command = lines[0]
+
+    unescape = unescape_header_value
+    if command in UNESCAPED_COMMANDS:
+        unescape = str
+
+    for line in lines[1:]:
+        if line:
+            name, sep, value = line.partition(":")
+            if not sep:
+                raise MalformedFrameError("Header line without a colon [{}]".format(line))
+
+            headers.setdefault(unescape(name), unescape(value))
+
+    return command, headers
+
+
+def encode_frame(command, headers, body=b""):
+    """Encode a STOMP 1.2 Frame as bytes
+        - a content-length header is always included so that binary bodies can contain NULLs
+        - CONNECT and CONNECTED Frames don't escape their headers (as per STOMP 1.2)"""
+    escape = escape_header_value
+    if command in UNESCAPED_COMMANDS:
+        escape = str
+
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+
+    frame_lines = [command]
+    for name, value in headers.items():
+        if value is not None:
+            frame_lines.append(escape(name) + ":" + escape(value))
+    frame_lines.append("content-length:" + str(len(body)))
+
+    frame_head = ("\n".join(frame_lines) + "\n\n").encode("utf-8")
+
+    return b"".join((frame_head, body, FRAME_TERMINATOR))
+
+
+def get_send_headers(destination, content_type, headers=None, transaction=None):
+    """Build the headers of a STOMP 1.2 SEND Frame"""
+    send_headers = {"destination": destination, "content-type": content_type}
+
+    if headers is not None:
+        send_headers.update(headers)
+
+    if transaction is not None:
+        send_headers["transaction"] = transaction
+
+    return send_headers
+
+
+def encode_send_frame(destination, body, content_type, headers=None, transaction=None):
+    """Encode a STOMP 1.2 SEND Frame as bytes"""
+    return encode_frame("SEND", get_send_headers(destination, content_type, headers, transaction), body)
+
+
+class MalformedFrameError(Exception):
+    """A STOMP Frame that could not be decoded"""
+    pass
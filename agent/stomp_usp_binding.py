@@ -28,23 +28,84 @@
 #  - MyStompConnListener(stomp.ConnectionListener)
 #    - __init__(binding, debug=False)
 #    - on_error(headers, message)
+#    - on_disconnected()
 #    - on_message(headers, message)
 #  - StompUspBinding(generic_usp_binding.GenericUspBinding)
-#    - __init__(host="127.0.0.1", port=61613, username="admin", password="admin", debug=False)
+#    - __init__(host="127.0.0.1", port=61613, username="admin", password="admin", debug=False,
+#               ack_mode="auto", prefetch_count=0, batch_window=0, ..., status_callback=None,
+#               send_pool_size=0)
+#    - connect()
+#    - on_disconnected()
+#    - is_connected()
 #    - validate_payload(payload)
+#    - is_client_ack_mode()
+#    - build_ack_id(ack_header)
+#    - ack_msg(queue_item)
+#    - ack_msg_id(ack_id)
 #    - send_msg(serialized_msg, to_addr)
 #    - listen()
 #    - clean_up()
+#  - StompReconnectThread(threading.Thread)
+#    - __init__(binding, min_delay=1, max_delay=60)
+#    - trigger()
+#    - stop()
+#    - get_delay(attempt)
+#    - run()
+#  - StompSendConnectionPool(object)
+#    - __init__(conn_factory, connect_func, pool_size, flush_window=0, max_frames=50, max_bytes=65536,
+#               use_transaction=False, failure_callback=None)
+#    - get_index(destination)
+#    - is_connected()
+#    - connect()
+#    - send(destination, body, content_type, headers)
+#    - clean_up()
+#  - StompOutboundBatcher(threading.Thread)
+#    - __init__(conn, flush_window=0.05, max_frames=50, max_bytes=65536, use_transaction=False,
+#               failure_callback=None)
+#    - set_connection(conn)
+#    - add_frame(destination, body, content_type, headers)
+#    - run()
+#    - stop()
 #
 """
 
+import time
+import zlib
+import random
 import logging
+import itertools
+import threading
+import collections
 
 import stomp
+import prometheus_client
 
+from agent import stomp_frame
+from agent import record_header
 from agent import generic_usp_binding
 
 
+AUTO_ACK_MODE = "auto"
+CLIENT_INDIVIDUAL_ACK_MODE = "client-individual"
+
+# pylint: disable-msg=no-value-for-parameter
+NUM_REDELIVERED_MSGS_METRIC = \
+    prometheus_client.Counter("number_of_redelivered_stomp_msgs",
+                              "Number of STOMP Messages redelivered by the Broker")
+STOMP_BATCH_SIZE_METRIC = \
+    prometheus_client.Summary("stomp_outbound_batch_size",
+                              "Number of STOMP SEND Frames written to the socket per batch")
+NUM_DROPPED_BATCHED_FRAMES_METRIC = \
+    prometheus_client.Counter("number_of_dropped_stomp_batched_frames",
+                              "Number of batched STOMP SEND Frames that could not be written to the socket")
+NUM_DROPPED_BUFFERED_MSGS_METRIC = \
+    prometheus_client.Counter("number_of_dropped_stomp_buffered_msgs",
+                              "Number of outgoing STOMP Messages dropped from the outbound buffer")
+NUM_RECONNECT_ATTEMPTS_METRIC = \
+    prometheus_client.Counter("number_of_stomp_reconnect_attempts",
+                              "Number of attempts to re-connect to the STOMP Broker")
+
+
 class MyStompConnListener(stomp.ConnectionListener):
     """A STOMP Connection Listener for receiving USP messages"""
     def __init__(self, binding, debug=False):
@@ -72,11 +133,25 @@ class MyStompConnListener(stomp.ConnectionListener):
         else:
             self._logger.debug("The 'subscribe-dest' header was NOT found in the CONNECTED frame")
 
+    def on_disconnected(self):
+        """STOMP Connection Listener - the connection to the Broker was lost"""
+        self._binding.on_disconnected()
+
     def on_message(self, headers, body):
         """STOMP Connection Listener - record messages to the incoming queue"""
+        queued = False
+        ack_id = None
         self._logger.info("Received a STOMP message on my USP Message Queue")
         self._logger.debug("Payload received: [%s]", body)
 
+        if self._binding.is_client_ack_mode():
+            # STOMP 1.2 identifies the message to acknowledge with the 'ack' header
+            ack_id = self._binding.build_ack_id(headers.get("ack"))
+
+        if headers.get("redelivered") == "true":
+            self._logger.info("Received a STOMP message that was redelivered by the Broker")
+            NUM_REDELIVERED_MSGS_METRIC.inc()
+
         # Validate the STOMP Headers
         if "content-type" in headers:
             self._logger.debug("Validating the STOMP Headers for 'content-type'")
@@ -86,7 +161,11 @@ class MyStompConnListener(stomp.ConnectionListener):
 
                 if "reply-to-dest" in headers:
                     self._logger.debug("STOMP Message has a 'reply-to-dest'")
-                    self._binding.push(body, headers["reply-to-dest"])
+
+                    # Drop mis-addressed/unsupported Records before they are queued and fully parsed
+                    if self._binding.validate_payload(body) is not None:
+                        self._binding.push(body, headers["reply-to-dest"], ack_id)
+                        queued = True
                 else:
                     self._logger.warning("Incoming STOMP message had no 'reply-to-dest' header")
             else:
@@ -95,47 +174,228 @@ class MyStompConnListener(stomp.ConnectionListener):
         else:
             self._logger.warning("Incoming STOMP message had no Content-Type")
 
+        # Dropped messages are acknowledged right away so that they don't hold up the prefetch window
+        if not queued and ack_id is not None:
+            self._binding.ack_msg_id(ack_id)
+
 
 class StompUspBinding(generic_usp_binding.GenericUspBinding):
     """A STOMP to USP Binding"""
     def __init__(self, my_endpoint_id, host="127.0.0.1", port=61613, username="admin", password="admin",
-                 virtual_host="/", outgoing_heartbeats=0, incoming_heartbeats=0, debug=False):
+                 virtual_host="/", outgoing_heartbeats=0, incoming_heartbeats=0, debug=False,
+                 ack_mode=AUTO_ACK_MODE, prefetch_count=0, batch_window=0, batch_max_frames=50,
+                 batch_max_bytes=65536, batch_transaction=False, reconnect_min_delay=1, reconnect_max_delay=60,
+                 outbound_buffer_size=100, outbound_buffer_ttl=60, status_callback=None, send_pool_size=0):
         """Initialize the STOMP USP Binding for a USP Endpoint
-            - 61613 is the default STOMP port for RabbitMQ installations"""
+            - 61613 is the default STOMP port for RabbitMQ installations
+            - ack_mode of "client-individual" acknowledges each message after its Response has been sent
+            - prefetch_count limits the number of unacknowledged messages the Broker will deliver
+            - batch_window (in seconds) greater than 0 coalesces outgoing messages into a single socket write
+            - outgoing messages are buffered (bounded, with a TTL) while reconnecting to the Broker
+            - status_callback(status) is called with the STOMP Connection Status as it changes
+            - send_pool_size greater than 0 spreads outgoing messages across that many extra STOMP Connections"""
         generic_usp_binding.GenericUspBinding.__init__(self)
         self._host = host
         self._port = port
         self._debug = debug
+        self._virtual_host = virtual_host
+        self._heartbeats = (outgoing_heartbeats, incoming_heartbeats)
         self._my_dest = None
+        self._listen_addr = None
+        self._closing = False
+        self._connected = False
+        self._session_num = 0
+        self._status = None
+        self._ack_mode = ack_mode
+        self._prefetch_count = prefetch_count
         self._username = username
         self._password = password
         self._my_endpoint_id = my_endpoint_id
+        self._status_callback = status_callback
+        self._outbound_buffer_ttl = outbound_buffer_ttl
+        self._outbound_buffer = collections.deque(maxlen=outbound_buffer_size)
+        self._conn = None
+        self._conn_lock = threading.RLock()
+        self._status_lock = threading.RLock()
         self._listener = MyStompConnListener(self, debug)
+        self._record_validator = record_header.RecordHeaderValidator(my_endpoint_id)
         self._logger = logging.getLogger(self.__class__.__name__)
 
-        # If we don't use auto_decode=False, then we get decode problems
-        self._conn = stomp.Connection12([(host, port)], heartbeats=(outgoing_heartbeats, incoming_heartbeats),
-                                        vhost=virtual_host, auto_decode=False)
-        self._conn.set_listener("defaultListener", self._listener)
-        self._conn.start()
-        self._conn.connect(username, password, wait=True, headers={"endpoint-id": self._my_endpoint_id})
+        self._batcher = None
+        self._send_pool = None
+        if send_pool_size > 0:
+            # The pool has its own senders, which also take care of batching
+            self._send_pool = StompSendConnectionPool(self._create_connection, self._connect_connection,
+                                                      send_pool_size, batch_window, batch_max_frames,
+                                                      batch_max_bytes, batch_transaction, self._on_send_failure)
+        elif batch_window > 0:
+            self._batcher = StompOutboundBatcher(None, batch_window, batch_max_frames,
+                                                 batch_max_bytes, batch_transaction, self._on_send_failure)
+            self._batcher.start()
+
+        self._reconnect_thread = StompReconnectThread(self, reconnect_min_delay, reconnect_max_delay)
+        self._reconnect_thread.start()
+
+        if not self.connect():
+            # Keep trying in the background; outgoing messages are buffered until then
+            self._reconnect_thread.trigger()
+
+    def connect(self):
+        """Connect (or re-connect) to the STOMP Broker, returning True if successful"""
+        self._report_connecting()
+
+        with self._conn_lock:
+            try:
+                if not self._connected:
+                    self._replace_connection()
+                    self._connect_connection(self._conn)
+                    self._connected = True
+                    self._session_num += 1
+
+                    if self._listen_addr is not None:
+                        self._subscribe()
+
+                if self._send_pool is not None:
+                    self._send_pool.connect()
+            except (stomp.exception.StompException, OSError) as err:
+                self._logger.warning("Unable to connect to the STOMP Broker [%s:%s]: %s", self._host, self._port, err)
+                self._update_status("ServerNotPresent")
+                return False
+
+        self._logger.info("Connected to the STOMP Broker [%s:%s]", self._host, self._port)
+        self._update_status("Enabled")
+
+        with self._conn_lock:
+            self._flush_outbound_buffer()
+
+        return True
+
+    def on_disconnected(self):
+        """The STOMP Connection was lost; start re-connecting unless we are shutting down"""
+        self._connected = False
+
+        if not self._closing:
+            self._logger.warning("Lost the connection to the STOMP Broker [%s:%s]", self._host, self._port)
+            self._report_connecting()
+            self._reconnect_thread.trigger()
+
+    def is_connected(self):
+        """Return True if the STOMP Connection (and any sending Connections) are currently usable"""
+        return self._connected and (self._send_pool is None or self._send_pool.is_connected())
+
+    def validate_payload(self, payload):
+        """Validate the payload of the Incoming STOMP message to ensure it is addressed to this Agent
+            - returns the Record Header of the payload, or None if it is to be dropped"""
+        return self._record_validator.validate(payload)
+
+    def is_client_ack_mode(self):
+        """Return True if messages need to be acknowledged after they have been handled"""
+        return self._ack_mode == CLIENT_INDIVIDUAL_ACK_MODE
+
+    def build_ack_id(self, ack_header):
+        """Tie the 'ack' header value to the current STOMP session"""
+        return self._session_num, ack_header
+
+    def ack_msg(self, queue_item):
+        """Acknowledge the STOMP message associated with the handled Queue Item"""
+        if queue_item.get_ack_id() is not None:
+            self.ack_msg_id(queue_item.get_ack_id())
+
+    def ack_msg_id(self, ack_id):
+        """Acknowledge the STOMP message with the provided ack ID (from build_ack_id)
+            - messages received on an earlier session have already been redelivered by the Broker"""
+        session_num, ack_header = ack_id
+
+        if session_num != self._session_num or not self._connected:
+            self._logger.debug("Not acknowledging STOMP message [%s] from a previous session", ack_header)
+            return
+
+        self._logger.debug("Acknowledging STOMP message [%s]", ack_header)
+        try:
+            self._conn.ack(ack_header)
+        except (stomp.exception.NotConnectedException, OSError) as err:
+            self._logger.warning("Unable to acknowledge STOMP message [%s]: %s", ack_header, err)
 
     def send_msg(self, serialized_msg, to_addr):
-        """Send the ProtoBuf Serialized message to the provided STOMP address"""
-        content_type = "application/vnd.bbf.usp.msg"
-        usp_headers = {"reply-to-dest": self._my_dest}
-        self._logger.debug("Using [%s] as the value of the reply-to-dest header", self._my_dest)
-        self._conn.send(to_addr, serialized_msg, content_type, usp_headers)
-        self._logger.info("Sending a STOMP message to the following address: %s", to_addr)
-        self._logger.debug("Payload being sent: [%s]", serialized_msg)
+        """Send the ProtoBuf Serialized message to the provided STOMP address
+            - while there are buffered messages, the message waits behind them so that it can't overtake them"""
+        with self._conn_lock:
+            if self._outbound_buffer or not self._send(serialized_msg, to_addr):
+                self._buffer_msg(to_addr, serialized_msg)
 
     def listen(self, agent_addr):
-        """Listen to a STOMP destination for incoming messages"""
+        """Listen to a STOMP destination for incoming messages
+            - the subscription is re-established each time the Broker connection comes back"""
+        with self._conn_lock:
+            self._listen_addr = agent_addr
+
+            if self._connected:
+                self._subscribe()
+            else:
+                self._logger.info("Not connected, will subscribe to [%s] once connected", agent_addr)
+
+    def clean_up(self):
+        """Clean up the STOMP Connection"""
+        self._closing = True
+        self._reconnect_thread.stop()
+
+        if self._batcher is not None:
+            # Flush any pending Frames before the Connection goes away
+            self._batcher.stop()
+
+        if self._send_pool is not None:
+            self._send_pool.clean_up()
+
+        if self._connected:
+            self._conn.disconnect()
+
+    def _create_connection(self):
+        """Create a new (not yet connected) STOMP Connection to the Broker"""
+        # If we don't use auto_decode=False, then we get decode problems
+        return stomp.Connection12([(self._host, self._port)], heartbeats=self._heartbeats,
+                                  vhost=self._virtual_host, auto_decode=False)
+
+    def _replace_connection(self):
+        """Replace the STOMP Connection with a new one before (re-)connecting
+            - a stomp.py Connection's Transport isn't meant to be started again once it has been stopped"""
+        old_conn = self._conn
+        self._conn = self._create_connection()
+        self._conn.set_listener("defaultListener", self._listener)
+
+        if self._batcher is not None:
+            self._batcher.set_connection(self._conn)
+
+        if old_conn is not None:
+            try:
+                old_conn.transport.stop()
+                old_conn.transport.disconnect_socket()
+            except (stomp.exception.StompException, OSError) as err:
+                self._logger.debug("Unable to close the previous STOMP Connection: %s", err)
+
+    def _connect_connection(self, conn):
+        """Start and connect the provided STOMP Connection"""
+        conn.start()
+        conn.connect(self._username, self._password, wait=True, headers={"endpoint-id": self._my_endpoint_id})
+
+    def _on_send_failure(self, destination, body):
+        """A sending Connection (or the Batcher's write) failed; buffer the message and re-connect"""
+        self._buffer_msg(destination, body)
+
+        if self._send_pool is None:
+            # The Batcher writes over the receiving STOMP Connection, so that is the one to re-connect
+            self._connected = False
+
+        if not self._closing:
+            self._report_connecting()
+            self._reconnect_thread.trigger()
+
+    def _subscribe(self):
+        """Subscribe to the listen destination on the current STOMP Connection"""
         msg_id = 1
 
         self._my_dest = self._listener.get_subscribe_dest()
         if self._my_dest is None:
-            self._my_dest = agent_addr
+            self._my_dest = self._listen_addr
             self._logger.info("Using Destination [%s] as retrieved from the data model", self._my_dest)
         else:
             self._logger.info("Using Destination [%s] as discovered in the CONNECTED frame headers", self._my_dest)
@@ -148,9 +408,335 @@ class StompUspBinding(generic_usp_binding.GenericUspBinding):
         #   - Bulld the full destination: self._build_dest(dest)
         #   - Retrieve the ID from the dictionary for the destination
         #   - Unsubscribe: self._conn.unsubscribe(id)
-        self._conn.subscribe(self._my_dest, id=str(msg_id), ack="auto")
-        self._logger.info("Subscribed to Destination: %s", self._my_dest)
+        sub_headers = {}
+        if self._prefetch_count > 0:
+            # RabbitMQ limits the number of unacknowledged messages in flight via the prefetch-count header
+            sub_headers["prefetch-count"] = str(self._prefetch_count)
+
+        self._conn.subscribe(self._my_dest, id=str(msg_id), ack=self._ack_mode, headers=sub_headers)
+        self._logger.info("Subscribed to Destination [%s] with ack mode [%s]", self._my_dest, self._ack_mode)
+
+    def _buffer_msg(self, to_addr, serialized_msg):
+        """Hold an outgoing message until the STOMP Connection is re-established"""
+        if len(self._outbound_buffer) == self._outbound_buffer.maxlen:
+            NUM_DROPPED_BUFFERED_MSGS_METRIC.inc()
+            self._logger.warning("STOMP outbound buffer is full, dropping the oldest message")
+
+        self._outbound_buffer.append(
+            generic_usp_binding.ExpiringQueueItem(serialized_msg, to_addr, self._outbound_buffer_ttl))
+        self._logger.info("Buffered a STOMP message to [%s] until the Broker connection is restored", to_addr)
+
+    def _send(self, serialized_msg, to_addr):
+        """Hand the message to the STOMP Connection (or its Batcher / sending Pool)
+            - returns False if the message could not be sent and needs to be buffered"""
+        content_type = "application/vnd.bbf.usp.msg"
+        usp_headers = {"reply-to-dest": self._my_dest}
+        self._logger.debug("Using [%s] as the value of the reply-to-dest header", self._my_dest)
+
+        if not self.is_connected():
+            return False
+        elif self._send_pool is not None:
+            self._send_pool.send(to_addr, serialized_msg, content_type, usp_headers)
+        elif self._batcher is None:
+            try:
+                self._conn.send(to_addr, serialized_msg, content_type, usp_headers)
+            except (stomp.exception.NotConnectedException, OSError) as err:
+                self._logger.warning("Unable to send a STOMP message: %s", err)
+                self._connected = False
+                return False
+        else:
+            self._batcher.add_frame(to_addr, serialized_msg, content_type, usp_headers)
+
+        self._logger.info("Sending a STOMP message to the following address: %s", to_addr)
+        self._logger.debug("Payload being sent: [%s]", serialized_msg)
+        return True
+
+    def _flush_outbound_buffer(self):
+        """Send the messages that were buffered while disconnected (dropping any that have expired)
+            - a message that can't be sent goes back to the head of the buffer and the flush stops"""
+        while self._outbound_buffer and self._connected:
+            queue_item = self._outbound_buffer.popleft()
+
+            if queue_item.is_expired():
+                NUM_DROPPED_BUFFERED_MSGS_METRIC.inc()
+            elif not self._send(queue_item.get_payload(), queue_item.get_reply_to_addr()):
+                self._outbound_buffer.appendleft(queue_item)
+                break
+
+    def _report_connecting(self):
+        """Report the Connecting Status once per outage; retries keep reporting ServerNotPresent"""
+        with self._status_lock:
+            if self._status != "ServerNotPresent":
+                self._update_status("Connecting")
+
+    def _update_status(self, status):
+        """Report the STOMP Connection Status to the interested party when it changes"""
+        with self._status_lock:
+            if status == self._status:
+                return
+
+            self._status = status
+            if self._status_callback is not None:
+                self._status_callback(status)
+
+
+class StompReconnectThread(threading.Thread):
+    """A Thread that re-connects the STOMP Binding using exponential backoff with jitter"""
+    def __init__(self, binding, min_delay=1, max_delay=60):
+        """Initialize the Reconnect Thread; delays are in seconds"""
+        threading.Thread.__init__(self, name="StompReconnectThread")
+        self.daemon = True
+        self._binding = binding
+        self._running = True
+        self._min_delay = min_delay
+        self._max_delay = max_delay
+        self._stop_event = threading.Event()
+        self._reconnect_event = threading.Event()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def trigger(self):
+        """Start re-connecting"""
+        self._reconnect_event.set()
+
+    def stop(self):
+        """Stop re-connecting"""
+        self._running = False
+        self._stop_event.set()
+        self._reconnect_event.set()
+
+    def get_delay(self, attempt):
+        """Retrieve the delay before the provided (0-based) reconnect attempt"""
+        delay = min(self._max_delay, self._min_delay * (2 ** attempt))
+
+        # Spread the fleet out so that every Agent doesn't hit the Broker at the same moment
+        return random.uniform(delay / 2, delay)
+
+    def run(self):
+        """Wait for the Binding to be disconnected and then re-connect it"""
+        while self._running:
+            self._reconnect_event.wait()
+            self._reconnect_event.clear()
+            attempt = 0
+
+            while self._running and not self._binding.is_connected():
+                delay = self.get_delay(attempt)
+                self._logger.info("Re-connecting to the STOMP Broker in %.1f seconds", delay)
+
+                if self._stop_event.wait(delay):
+                    break
+
+                NUM_RECONNECT_ATTEMPTS_METRIC.inc()
+                if not self._binding.connect():
+                    attempt += 1
+
+
+class StompSendConnectionPool:
+    """A Pool of send-only STOMP Connections
+        - each Connection has its own sending Thread, so writes to different Destinations happen in parallel
+        - a Destination always maps to the same Connection, which keeps the messages for it in order"""
+    def __init__(self, conn_factory, connect_func, pool_size, flush_window=0, max_frames=50, max_bytes=65536,
+                 use_transaction=False, failure_callback=None):
+        """Initialize the Pool; conn_factory() creates a Connection and connect_func(conn) connects it"""
+        self._conn_factory = conn_factory
+        self._connect_func = connect_func
+        self._failure_callback = failure_callback
+        self._conn_list = [None] * pool_size
+        self._connected_list = [False] * pool_size
+        self._sender_list = []
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        for index in range(pool_size):
+            sender = StompOutboundBatcher(None, flush_window, max_frames, max_bytes, use_transaction,
+                                          self._get_failure_handler(index))
+            sender.start()
+            self._sender_list.append(sender)
+
+    def get_index(self, destination):
+        """Retrieve the index of the Connection used for the provided Destination"""
+        return zlib.crc32(destination.encode("utf-8")) % len(self._sender_list)
+
+    def is_connected(self):
+        """Return True if all of the sending Connections are connected"""
+        return all(self._connected_list)
+
+    def connect(self):
+        """Connect any sending Connections that are not currently connected"""
+        for index, connected in enumerate(self._connected_list):
+            if not connected:
+                self._discard_connection(index)
+                conn = self._conn_factory()
+                self._connect_func(conn)
+                self._conn_list[index] = conn
+                self._sender_list[index].set_connection(conn)
+                self._connected_list[index] = True
+                self._logger.info("Sending Connection [%d] is connected", index)
+
+    def send(self, destination, body, content_type, headers):
+        """Queue the message on the sending Connection associated with its Destination"""
+        self._sender_list[self.get_index(destination)].add_frame(destination, body, content_type, headers)
 
     def clean_up(self):
-        """Clean up the STOMP Connection"""
-        self._conn.disconnect()
+        """Flush the pending messages and disconnect all of the sending Connections"""
+        for sender in self._sender_list:
+            sender.stop()
+
+        for index, connected in enumerate(self._connected_list):
+            if connected:
+                self._conn_list[index].disconnect()
+
+    def _get_failure_handler(self, index):
+        """Retrieve the failure_callback for the sending Connection at the provided index"""
+        def handle_failure(destination, body):
+            """Mark the sending Connection as disconnected and pass the message on"""
+            self._connected_list[index] = False
+
+            if self._failure_callback is None:
+                NUM_DROPPED_BATCHED_FRAMES_METRIC.inc()
+            else:
+                self._failure_callback(destination, body)
+
+        return handle_failure
+
+    def _discard_connection(self, index):
+        """Close the socket of a broken sending Connection before it is replaced"""
+        conn = self._conn_list[index]
+
+        if conn is not None:
+            try:
+                conn.transport.stop()
+                conn.transport.disconnect_socket()
+            except (stomp.exception.StompException, OSError) as err:
+                self._logger.debug("Unable to close sending Connection [%d]: %s", index, err)
+
+
+class StompOutboundBatcher(threading.Thread):
+    """A Thread that coalesces outgoing STOMP SEND Frames into a single socket write per flush window"""
+    def __init__(self, conn, flush_window=0.05, max_frames=50, max_bytes=65536, use_transaction=False,
+                 failure_callback=None):
+        """Initialize the Outbound Batcher
+            - flush_window is the maximum time (in seconds) that a Frame waits for other Frames
+            - max_frames and max_bytes cap the size of a single batch
+            - use_transaction wraps each batch in a STOMP BEGIN/COMMIT
+            - failure_callback(destination, body) is called for each Frame of a batch that couldn't be written"""
+        threading.Thread.__init__(self, name="StompOutboundBatcher")
+        self.daemon = True
+        self._conn = conn
+        self._running = True
+        self._max_bytes = max_bytes
+        self._max_frames = max_frames
+        self._flush_window = flush_window
+        self._use_transaction = use_transaction
+        self._failure_callback = failure_callback
+        self._pending_bytes = 0
+        self._pending_frames = collections.deque()
+        self._condition = threading.Condition()
+        self._transaction_ids = itertools.count(1)
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def set_connection(self, conn):
+        """Write future batches to the provided STOMP Connection"""
+        with self._condition:
+            self._conn = conn
+
+    def add_frame(self, destination, body, content_type, headers):
+        """Queue a SEND Frame to be written with the next batch"""
+        with self._condition:
+            self._pending_frames.append((destination, body, content_type, headers))
+            self._pending_bytes += len(body)
+            self._condition.notify()
+
+    def run(self):
+        """Write batches of Frames until stopped, then flush whatever is still pending"""
+        batch = self._next_batch()
+
+        while batch is not None:
+            self._write_batch(batch)
+            batch = self._next_batch()
+
+        self._logger.info("STOMP Outbound Batcher stopped")
+
+    def stop(self):
+        """Stop the Batcher after the pending Frames have been written"""
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+        self.join()
+
+    def _is_full(self):
+        """Return True if the pending Frames have reached one of the batch caps"""
+        return len(self._pending_frames) >= self._max_frames or self._pending_bytes >= self._max_bytes
+
+    def _next_batch(self):
+        """Wait for the next batch of Frames (None once stopped and drained)"""
+        batch = []
+        batch_bytes = 0
+
+        with self._condition:
+            while self._running and not self._pending_frames:
+                self._condition.wait()
+
+            if not self._pending_frames:
+                return None
+
+            # Hold the batch open until the flush window closes or a cap is reached
+            flush_time = time.time() + self._flush_window
+            while self._running and not self._is_full() and time.time() < flush_time:
+                self._condition.wait(flush_time - time.time())
+
+            while self._pending_frames and len(batch) < self._max_frames:
+                frame_bytes = len(self._pending_frames[0][1])
+                if batch and batch_bytes + frame_bytes > self._max_bytes:
+                    break
+
+                batch.append(self._pending_frames.popleft())
+                batch_bytes += frame_bytes
+
+            self._pending_bytes -= batch_bytes
+
+        return batch
+
+    def _write_batch(self, batch):
+        """Encode the batch of Frames and write them to the socket in a single call"""
+        transaction = None
+        encoded_frames = []
+
+        if self._use_transaction:
+            transaction = "usp-batch-" + str(next(self._transaction_ids))
+            encoded_frames.append(stomp_frame.encode_frame("BEGIN", {"transaction": transaction}))
+
+        send_frames = []
+        for destination, body, content_type, headers in batch:
+            send_headers = stomp_frame.get_send_headers(destination, content_type, headers, transaction)
+            send_frames.append(stomp.utils.Frame("SEND", send_headers, body))
+            encoded_frames.append(stomp_frame.encode_frame("SEND", send_headers, body))
+
+        if self._use_transaction:
+            encoded_frames.append(stomp_frame.encode_frame("COMMIT", {"transaction": transaction}))
+
+        try:
+            if self._conn is None:
+                raise stomp.exception.NotConnectedException()
+
+            # Give the Connection Listeners the same on_send callbacks that Connection.send would, then write
+            #  the whole batch with one Transport.send, which serializes socket writes on the Transport's lock
+            self._notify_send_listeners(send_frames)
+            self._conn.transport.send(b"".join(encoded_frames))
+            STOMP_BATCH_SIZE_METRIC.observe(len(batch))
+            self._logger.info("Sent a batch of %d STOMP messages", len(batch))
+        except (stomp.exception.NotConnectedException, OSError) as err:
+            self._logger.error("Unable to send a batch of %d STOMP messages: %s", len(batch), err)
+
+            if self._failure_callback is None:
+                NUM_DROPPED_BATCHED_FRAMES_METRIC.inc(len(batch))
+            else:
+                for destination, body, _content_type, _headers in batch:
+                    self._failure_callback(destination, body)
+
+    def _notify_send_listeners(self, send_frames):
+        """Call on_send on each of the Connection's Listeners for each SEND Frame of the batch"""
+        for _name, listener in sorted(list(self._conn.transport.listeners.items())):
+            on_send = getattr(listener, "on_send", None)
+            if on_send is not None:
+                for send_frame in send_frames:
+                    on_send(send_frame)
@@ -0,0 +1,212 @@
+# Copyright (c) 2016-2017 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+# File Name: uds_agent.py
+#
+# Description: A Unix Domain Socket USP Agent
+#
+# Functionality:
+#   Class: UdsAgent(abstract_agent.AbstractAgent)
+#     __init__(dm_file, db_file, net_intf, socket_path="/tmp/usp-agent.sock", cfg_file_name="cfg/agent.json",
+#              debug=False, shared_agent=None)
+#     start_listening(timeout=15)
+#     clean_up()
+#   Class: UdsPeriodicNotifHandler(abstract_agent.AbstractPeriodicNotifHandler)
+#     __init__(database, mtp_param_path, from_id, to_id, subscription_id, param)
+#   Class: UdsValueChangeNotifPoller(value_change_notif_poller.AbstractValueChangeNotifPoller)
+#     __init__(agent_db, poll_duration=0.5)
+#     set_binding(binding)
+#   Class: UdsNotificationSender(notif_sender_pool.NotificationSender)
+#     __init__(notif, binding, to_addr)
+#   Function: get_controller_addr(database, mtp_param_path, controller_id)
+#
+"""
+
+
+from agent import utils
+from agent import abstract_agent
+from agent import notif_sender_pool
+from agent import uds_usp_binding
+from agent import value_change_notif_poller
+
+
+UDS_MAX_RECORD_SIZE = "uds.max.record.size"
+
+
+class UdsAgent(abstract_agent.AbstractAgent):
+    """A USP Agent that uses the Unix Domain Socket Binding"""
+    def __init__(self, dm_file, db_file, net_intf, socket_path="/tmp/usp-agent.sock",
+                 cfg_file_name="cfg/agent.json", debug=False, shared_agent=None):
+        """Initialize the UDS Agent"""
+        abstract_agent.AbstractAgent.__init__(self, dm_file, db_file, net_intf, cfg_file_name, debug,
+                                             shared_agent)
+        self._can_start = True
+
+        # Initialize the underlying Agent DB MTP details for Unix Domain Sockets
+        num_local_agent_uds_mtps = self._init_db_for_mtp(socket_path)
+
+        # We only support 1 Local Agent UDS MTP
+        if num_local_agent_uds_mtps == 1:
+            cfg_mgr = utils.ConfigMgr(cfg_file_name, {UDS_MAX_RECORD_SIZE: 65536})
+            self._binding = uds_usp_binding.UdsUspBinding(
+                self._endpoint_id, socket_path, int(cfg_mgr.get_cfg_item(UDS_MAX_RECORD_SIZE)), debug,
+                self.is_known_controller)
+            self._binding.listen(socket_path)
+
+            value_change_notif_poller = UdsValueChangeNotifPoller(self._db)
+            value_change_notif_poller.set_binding(self._binding)
+            self.set_value_change_notif_poller(value_change_notif_poller)
+
+            self._connect_to_controllers()
+            self.init_subscriptions()
+        else:
+            self._can_start = False
+            self._logger.error("The Agent must have 1 and only 1 UDS Local Agent MTP , %s were found - EXITING",
+                               str(num_local_agent_uds_mtps))
+
+    def start_listening(self, timeout=15):
+        """Start listening for messages and process them"""
+        if self._can_start:
+            abstract_agent.AbstractAgent.start_listening(self)
+
+            msg_handler = self.get_msg_handler()
+            listener = abstract_agent.BindingListener("UDS", self._binding, msg_handler, timeout)
+            listener.start()
+            listener.join()
+
+    def clean_up(self):
+        """Clean up the USP Binding"""
+        if self._can_start:
+            self._binding.clean_up()
+
+    def _get_supported_protocol(self):
+        """Return the supported Protocol as a String: CoAP, STOMP, HTTP/2, WebSockets"""
+        return "UDS"
+
+    def _init_db_for_mtp(self, socket_path):
+        """Enable the LocalAgent MTPs for the supported protocol and Disable all other LocalAgent MTPs
+            (unless the Database is shared with the other MTPs)"""
+        uds_mtp_count = 0
+        agent_mtp_instances = self._db.find_instances("Device.LocalAgent.MTP.")
+
+        for agent_mtp_path in agent_mtp_instances:
+            if self._db.get(agent_mtp_path + "Protocol") == self._get_supported_protocol():
+                uds_mtp_count += 1
+                self._db.update(agent_mtp_path + "Enable", True)
+                self._db.update(agent_mtp_path + "UDS.Path", socket_path)
+            elif not self._is_shared:
+                self._db.update(agent_mtp_path + "Enable", False)
+
+        return uds_mtp_count
+
+    def _connect_to_controllers(self):
+        """Open a persistent connection to each enabled Controller with a UDS MTP that has a Socket Path"""
+        controller_instances = self._db.find_instances("Device.LocalAgent.Controller.")
+
+        for controller_path in controller_instances:
+            if self._db.get(controller_path + "Enable"):
+                for mtp_path in self._db.find_instances(controller_path + "MTP."):
+                    if (self._db.get(mtp_path + "Enable") and
+                            self._db.get(mtp_path + "Protocol") == self._get_supported_protocol() and
+                            self._db.get(mtp_path + "UDS.Path")):
+                        controller_url = get_controller_addr(self._db, mtp_path,
+                                                             self._db.get(controller_path + "EndpointID"))
+                        self._binding.open_connection(controller_url)
+
+    def _get_notification_sender(self, notif, controller_id, mtp_param_path):
+        """Return an instance of a binding specific AbstractNotificationSender"""
+        return UdsNotificationSender(notif, self._binding,
+                                           get_controller_addr(self._db, mtp_param_path, controller_id))
+
+    def _get_periodic_notif_handler(self, agent_id, controller_id, mtp_param_path,
+                                    subscription_id, param_path):
+        """Return an instance of a binding specific AbstractPeriodicNotifHandler"""
+        periodic_notif_handler = UdsPeriodicNotifHandler(self._db, mtp_param_path, agent_id, controller_id,
+                                                               subscription_id, param_path)
+        periodic_notif_handler.set_binding(self._binding)
+        return periodic_notif_handler
+
+
+class UdsPeriodicNotifHandler(abstract_agent.AbstractPeriodicNotifHandler):
+    """Issue a Periodic Notifications via a UDS Binding"""
+    def __init__(self, database, mtp_param_path, from_id, to_id, subscription_id,
+                 path_to_periodic_params):
+        """Initialize the UDS Periodic Notification Handler"""
+        abstract_agent.AbstractPeriodicNotifHandler.__init__(self, database, mtp_param_path,
+                                                             from_id, to_id, subscription_id,
+                                                             path_to_periodic_params)
+        self._mtp_param_path = mtp_param_path
+
+    def _handle_periodic_record(self, serialized_record):
+        """Handle the UDS Periodic Notification"""
+        if self._binding is not None:
+            to_addr = get_controller_addr(self._db, self._mtp_param_path, self._to_id)
+            self._logger.info("Sending a Periodic Notification to ID [%s] over MTP [%s] at: %s",
+                              self._to_id, self._mtp_param_path, to_addr)
+            self._binding.send_msg(serialized_record, to_addr)
+        else:
+            self._logger.warning("Unable to send the Periodic Notification - No Binding")
+
+        return True
+
+
+class UdsValueChangeNotifPoller(value_change_notif_poller.AbstractValueChangeNotifPoller):
+    """Poll Parameters for Value Change Notifications via a UDS Binding"""
+    def __init__(self, agent_database, poll_duration=0.5):
+        """Initialize the UDS Value Change Notification Poller"""
+        value_change_notif_poller.AbstractValueChangeNotifPoller.__init__(self, agent_database, poll_duration)
+        self._binding = None
+
+    def set_binding(self, binding):
+        """Configure the UDS Binding to use when sending the Notification"""
+        self._binding = binding
+        self.invalidate_routes()
+
+    def _resolve_route(self, to_id, mtp_param_path):
+        """Resolve the UDS Binding and the Controller's address for the Controller's MTP"""
+        if self._binding is None:
+            self._logger.warning("Unable to send the ValueChange Notification - No Binding")
+            return None
+
+        return self._binding, get_controller_addr(self._db, mtp_param_path, to_id)
+
+
+class UdsNotificationSender(notif_sender_pool.NotificationSender):
+    """A UDS specific implementation of the Abstract Notification Sender"""
+    def __init__(self, notif, binding, to_addr):
+        """Initialize the UDS Notification Sender"""
+        notif_sender_pool.NotificationSender.__init__(self, notif, binding)
+        self._to_addr = to_addr
+
+    def _retrieve_to_addr(self):
+        return self._to_addr
+
+
+def get_controller_addr(database, mtp_param_path, controller_id):
+    """Retrieve the address of a Controller's UDS MTP: its Socket Path if the Agent can connect to it,
+        otherwise its Endpoint ID (for Controllers that connect to the Agent)"""
+    socket_path = database.get(mtp_param_path + "UDS.Path")
+
+    if not socket_path:
+        return controller_id
+
+    return socket_path
@@ -0,0 +1,310 @@
+# Copyright (c) 2016-2017 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+#
+# File Name: uds_usp_binding.py
+#
+# Description: Encapsulates the various aspects of a Unix Domain Socket USP Binding
+#
+# Class Structure:
+#  - UdsUspBinding(generic_usp_binding.BlockingUspBinding)
+#    - __init__(my_endpoint_id, socket_path, max_record_size=65536, debug=False, controller_validator=None)
+#    - get_max_record_size()
+#    - validate_payload(payload)
+#    - listen(agent_addr)
+#    - open_connection(socket_path)
+#    - send_msg(serialized_msg, to_addr)
+#    - clean_up()
+#    - add_connection(sock, socket_path=None)
+#    - handle_record(conn, record_view)
+#    - remove_connection(conn)
+#  - UdsConnection(threading.Thread)
+#    - __init__(binding, sock, socket_path=None)
+#    - send_record(serialized_msg)
+#    - run()
+#    - close()
+#  - UdsAcceptThread(threading.Thread)
+#    - __init__(binding, server_sock)
+#    - run()
+#
+"""
+
+import os
+import socket
+import struct
+import logging
+import threading
+
+import prometheus_client
+
+from agent import record_header
+from agent import generic_usp_binding
+
+
+# Each USP Record is preceded by its length as a 4 byte unsigned integer in network byte order
+RECORD_LENGTH_FORMAT = "!I"
+RECORD_LENGTH_SIZE = struct.calcsize(RECORD_LENGTH_FORMAT)
+
+# pylint: disable-msg=no-value-for-parameter
+NUM_FAILED_SENDS_METRIC = \
+    prometheus_client.Counter("number_of_failed_uds_sends",
+                              "Number of USP Records that could not be sent over a Unix Domain Socket")
+NUM_OVERSIZED_RECORDS_METRIC = \
+    prometheus_client.Counter("number_of_oversized_uds_records",
+                              "Number of Unix Domain Socket connections closed due to an oversized USP Record")
+
+
+class UdsUspBinding(generic_usp_binding.BlockingUspBinding):
+    """A Unix Domain Socket to USP Binding for Controllers running on the same host as the Agent
+        - USP Records are sent over SOCK_STREAM sockets, each one preceded by its length
+        - Connections are kept open and used in both directions; Requests received on a connection
+          are answered using the Controller's Endpoint ID, which maps back to that connection"""
+    def __init__(self, my_endpoint_id, socket_path, max_record_size=65536, debug=False, controller_validator=None):
+        """Initialize the UDS USP Binding for a USP Endpoint
+            - controller_validator(endpoint_id) returns True for the Endpoint IDs of known Controllers;
+              Records from any other Endpoint are dropped (all Endpoints are accepted if it is None)"""
+        generic_usp_binding.BlockingUspBinding.__init__(self)
+        self._debug = debug
+        self._server_sock = None
+        self._accept_thread = None
+        self._socket_path = socket_path
+        self._max_record_size = max_record_size
+        self._controller_validator = controller_validator
+        self._record_validator = record_header.RecordHeaderValidator(my_endpoint_id)
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        # Maps an Endpoint ID or Socket Path to an open UdsConnection
+        self._conn_dict = {}
+        self._conn_lock = threading.Lock()
+
+    def get_max_record_size(self):
+        """Retrieve the size of the largest USP Record that will be read"""
+        return self._max_record_size
+
+    def validate_payload(self, payload):
+        """Validate the payload of the Incoming UDS message to ensure it is addressed to this Agent
+            - returns the Record Header of the payload, or None if it is to be dropped"""
+        return self._record_validator.validate(payload)
+
+    def listen(self, agent_addr):
+        """Bind to the Socket Path and start accepting connections from Controllers"""
+        # A stale socket file left by a previous run would make the bind fail
+        if os.path.exists(self._socket_path):
+            os.unlink(self._socket_path)
+
+        self._server_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server_sock.bind(self._socket_path)
+        self._server_sock.listen()
+
+        self._accept_thread = UdsAcceptThread(self, self._server_sock)
+        self._accept_thread.start()
+        self._logger.info("Listening for UDS connections on [%s] for [%s]", self._socket_path, agent_addr)
+
+    def open_connection(self, socket_path):
+        """Open a persistent connection to a Controller's Socket Path, returning True if successful"""
+        try:
+            self._get_connection(socket_path)
+        except OSError as err:
+            self._logger.warning("Unable to open a UDS connection to [%s]: %s", socket_path, err)
+            return False
+
+        return True
+
+    def send_msg(self, serialized_msg, to_addr):
+        """Send the ProtoBuf Serialized message to the provided Endpoint ID or Socket Path
+            - a connection is opened (and kept open) if there isn't one for the Socket Path yet"""
+        try:
+            self._get_connection(to_addr).send_record(serialized_msg)
+            self._logger.info("Sending a UDS message to the following address: %s", to_addr)
+            self._logger.debug("Payload being sent: [%s]", serialized_msg)
+        except OSError as err:
+            NUM_FAILED_SENDS_METRIC.inc()
+            self._logger.error("Unable to send a UDS message to [%s]: %s", to_addr, err)
+
+    def clean_up(self):
+        """Close all of the connections and remove the Socket Path"""
+        if self._server_sock is not None:
+            # Unblock the accept() call so that the Accept Thread can finish
+            self._server_sock.shutdown(socket.SHUT_RDWR)
+            self._server_sock.close()
+            self._accept_thread.join()
+            os.unlink(self._socket_path)
+
+        with self._conn_lock:
+            conn_list = set(self._conn_dict.values())
+            self._conn_dict.clear()
+
+        for conn in conn_list:
+            conn.close()
+
+    def add_connection(self, sock, socket_path=None):
+        """Start reading USP Records from a newly opened connection"""
+        conn = UdsConnection(self, sock, socket_path)
+
+        if socket_path is not None:
+            with self._conn_lock:
+                self._conn_dict[socket_path] = conn
+
+        conn.start()
+        return conn
+
+    def handle_record(self, conn, record_view):
+        """Push the USP Record read into the connection's buffer onto the incoming message queue"""
+        # Drop mis-addressed/unsupported Records before they are copied out of the connection's buffer
+        header = self.validate_payload(record_view)
+
+        if header is not None:
+            from_id = header.from_id
+
+            if self._controller_validator is not None and not self._controller_validator(from_id):
+                self._logger.warning("Dropping a UDS Record from unknown Endpoint [%s]", from_id)
+                return
+
+            # Remember the connection so that Responses and Notifications can be sent to this Controller,
+            #  but don't let another connection take over an Endpoint ID while its connection is open
+            with self._conn_lock:
+                mapped_conn = self._conn_dict.setdefault(from_id, conn)
+
+            if mapped_conn is not conn:
+                self._logger.warning("Dropping a UDS Record from [%s]; another connection is open for it", from_id)
+                return
+
+            self.push(record_view.tobytes(), from_id)
+
+    def remove_connection(self, conn):
+        """Forget a connection that has been closed"""
+        with self._conn_lock:
+            for addr in [addr for addr, open_conn in self._conn_dict.items() if open_conn is conn]:
+                del self._conn_dict[addr]
+
+    def _get_connection(self, to_addr):
+        """Retrieve the open connection for the address, connecting to it as a Socket Path if needed"""
+        with self._conn_lock:
+            conn = self._conn_dict.get(to_addr)
+
+        if conn is None:
+            self._logger.info("Opening a UDS connection to [%s]", to_addr)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+            try:
+                sock.connect(to_addr)
+            except OSError:
+                sock.close()
+                raise
+
+            conn = self.add_connection(sock, to_addr)
+
+        return conn
+
+
+class UdsConnection(threading.Thread):
+    """A Unix Domain Socket connection that reads length-prefixed USP Records into a reusable buffer"""
+    def __init__(self, binding, sock, socket_path=None):
+        """Initialize the UDS Connection"""
+        threading.Thread.__init__(self, name="UdsConnection-" + str(sock.fileno()))
+        self.daemon = True
+        self._sock = sock
+        self._binding = binding
+        self._socket_path = socket_path
+        self._send_lock = threading.Lock()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        # Records are read straight into this buffer and only copied out once they are known to be for this Agent
+        self._buffer = bytearray(binding.get_max_record_size())
+        self._buffer_view = memoryview(self._buffer)
+
+    def send_record(self, serialized_msg):
+        """Send the length prefix and the USP Record in a single (scatter/gather) write without copying them"""
+        record_length = struct.pack(RECORD_LENGTH_FORMAT, len(serialized_msg))
+
+        with self._send_lock:
+            num_sent = self._sock.sendmsg([record_length, serialized_msg])
+
+            # A partial write is unlikely on a local socket, but finish sending the Record if it happens
+            if num_sent < RECORD_LENGTH_SIZE:
+                self._sock.sendall(record_length[num_sent:])
+                num_sent = RECORD_LENGTH_SIZE
+            if num_sent < RECORD_LENGTH_SIZE + len(serialized_msg):
+                self._sock.sendall(memoryview(serialized_msg)[num_sent - RECORD_LENGTH_SIZE:])
+
+    def run(self):
+        """Read USP Records until the connection is closed"""
+        try:
+            while self._read_into(RECORD_LENGTH_SIZE):
+                record_length = struct.unpack_from(RECORD_LENGTH_FORMAT, self._buffer)[0]
+
+                if record_length > len(self._buffer):
+                    NUM_OVERSIZED_RECORDS_METRIC.inc()
+                    self._logger.error("Closing the UDS connection: a %d byte USP Record exceeds the %d byte limit",
+                                       record_length, len(self._buffer))
+                    break
+
+                if not self._read_into(record_length):
+                    break
+
+                self._binding.handle_record(self, self._buffer_view[:record_length])
+        except OSError as err:
+            self._logger.info("UDS connection closed: %s", err)
+        finally:
+            self._binding.remove_connection(self)
+            self._sock.close()
+
+    def close(self):
+        """Close the connection, which ends the reading Thread"""
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _read_into(self, num_bytes):
+        """Fill the start of the buffer with exactly num_bytes bytes; return False if the connection was closed"""
+        num_read = 0
+
+        while num_read < num_bytes:
+            num_received = self._sock.recv_into(self._buffer_view[num_read:num_bytes])
+            if num_received == 0:
+                return False
+            num_read += num_received
+
+        return True
+
+
+class UdsAcceptThread(threading.Thread):
+    """A Thread that accepts connections on the Agent's Socket Path"""
+    def __init__(self, binding, server_sock):
+        """Initialize the Accept Thread"""
+        threading.Thread.__init__(self, name="UdsAcceptThread")
+        self.daemon = True
+        self._binding = binding
+        self._server_sock = server_sock
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def run(self):
+        """Accept connections until the server socket is closed"""
+        while True:
+            try:
+                sock, _ = self._server_sock.accept()
+            except OSError:
+                break
+
+            self._logger.info("Accepted a UDS connection")
+            self._binding.add_connection(sock)
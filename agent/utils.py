@@ -32,12 +32,17 @@ SOFTWARE.
 #   Class: UspErrMsg(object)
 #    - __init__(msg_id, to_endpoint_id, from_endpoint_id, reply_to_endpoint_id=None)
 #    - generate_error(error_code, error_message)
+#   Class: TimeHelper(object)
+#    - static: get_time_as_str(time_to_convert, timezone=None)
+#    - static: get_str_as_time(time_str)
 #
 """
 
 import json
-import random
+import time
+import calendar
 import datetime
+import threading
 import subprocess
 
 from agent import usp_msg_pb2 as usp_msg
@@ -105,12 +110,17 @@ class UspErrMsg:
 
 
 class MessageIdHelper:
-    """A Helper class to generate Random Message IDs"""
+    """A Helper class to generate unique, monotonically increasing Message IDs
+        - the IDs start from the current time in milliseconds, so they aren't reused after a restart"""
+    _last_msg_id = 0
+    _msg_id_lock = threading.Lock()
+
     @staticmethod
     def get_message_id():
-        """Retrieve a random message ID"""
-        rand_val = random.randint(1, 10000)
-        return str(rand_val)
+        """Retrieve the next message ID"""
+        with MessageIdHelper._msg_id_lock:
+            MessageIdHelper._last_msg_id = max(MessageIdHelper._last_msg_id + 1, int(time.time() * 1000))
+            return str(MessageIdHelper._last_msg_id)
 
 
 
@@ -141,6 +151,34 @@ class PathHelper:
 
         return built_path
 
+    @staticmethod
+    def is_path_overlap(ref_path, instance_path):
+        """Determine if a (possibly Wild-carded) Reference Path and an object instance path could share
+            Parameters, meaning that one is a prefix of the other when a '*' matches any instance number"""
+        ref_parts = ref_path.rstrip(".").split(".")
+        instance_parts = instance_path.rstrip(".").split(".")
+
+        for ref_part, instance_part in zip(ref_parts, instance_parts):
+            if ref_part != instance_part and not (ref_part == "*" and instance_part.isdigit()):
+                return False
+
+        return True
+
+    @staticmethod
+    def is_table_instance(table_path, instance_path):
+        """Determine if an object instance path (e.g. Device.Sensor.3.) is an instance of a (possibly
+            Wild-carded) Table Path (e.g. Device.Sensor.)"""
+        table_parts = table_path.rstrip(".").split(".")
+        instance_parts = instance_path.rstrip(".").split(".")
+
+        return len(instance_parts) == len(table_parts) + 1 and instance_parts[-1].isdigit() and \
+            PathHelper.is_path_overlap(table_path, instance_path)
+
+    @staticmethod
+    def is_same_path(ref_path, path):
+        """Determine if a (possibly Wild-carded) Reference Path refers to the provided path"""
+        return len(ref_path.split(".")) == len(path.split(".")) and PathHelper.is_path_overlap(ref_path, path)
+
 
 
 class IPAddr:
@@ -212,3 +250,29 @@ class TimeHelper:
             datetime_as_str += "Z"
 
         return datetime_as_str
+
+    @staticmethod
+    def get_str_as_time(time_str):
+        """Convert a dateTime String (e.g. 2017-01-01T00:00:00Z or 2017-01-01T00:00:00-06:00) to seconds
+            since the Epoch; returns None for the Unknown Time (0001-01-01T00:00:00Z) or an invalid String"""
+        utc_offset = 0
+        datetime_part = time_str
+
+        try:
+            if time_str.endswith("Z"):
+                datetime_part = time_str[:-1]
+            elif time_str[-6] in "+-":
+                datetime_part = time_str[:-6]
+                offset_hours, offset_minutes = time_str[-5:].split(":")
+                utc_offset = int(offset_hours) * 3600 + int(offset_minutes) * 60
+                if time_str[-6] == "-":
+                    utc_offset = -utc_offset
+
+            parsed_datetime = datetime.datetime.strptime(datetime_part, "%Y-%m-%dT%H:%M:%S")
+        except (ValueError, IndexError):
+            return None
+
+        if parsed_datetime.year == 1:
+            return None
+
+        return calendar.timegm(parsed_datetime.timetuple()) - utc_offset
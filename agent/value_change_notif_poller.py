@@ -0,0 +1,485 @@
+# Copyright (c) 2016-2017 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+#
+# File Name: value_change_notif_poller.py
+#
+# Description: Sends the ValueChange Notifications of every ValueChange Subscription, and the Records of
+#              the other Notifications built from the Poller's Notification Templates
+#
+# Class Structure:
+#  - AbstractValueChangeNotifPoller(threading.Thread)
+#    - __init__(agent_db, poll_duration=0.5)
+#    - run()
+#    - set_outbox(outbox)
+#    - set_notif_retry(subscription_id, controller_id, notif_retry, notif_expiration=0)
+#    - set_batch_window(batch_window)
+#    - add_param(param, agent_id, controller_id, mtp_param_path, subscription_id, min_interval=0)
+#    - remove_param(param, controller_id=None, mtp_param_path=None, subscription_id=None)
+#    - add_reference(ref_path, agent_id, controller_id, mtp_param_path, subscription_id, min_interval=0)
+#    - remove_reference(ref_path, agent_id, controller_id, mtp_param_path, subscription_id)
+#    - _handle_value_change(param, value, to_id, from_id, subscription_id, mtp_param_path)
+#    - _handle_value_change_batch(param_value_dict, to_id, from_id, subscription_id, mtp_param_path)
+#    - get_notif_template(from_id, to_id, subscription_id)
+#    - invalidate_routes()
+#    - send_record(serialized_record, to_id, mtp_param_path)
+#    - send_notif_record(msg_id, serialized_record, to_id, subscription_id, mtp_param_path)
+#    - _get_route(to_id, mtp_param_path)
+#    - _resolve_route(to_id, mtp_param_path) :: Abstract Method
+#
+"""
+
+import time
+import queue
+import logging
+import threading
+import prometheus_client
+
+from agent import utils
+from agent import notify
+from agent import agent_db
+
+
+# pylint: disable-msg=no-value-for-parameter
+NUM_VC_PARAMS_GAUGE_METRIC = \
+    prometheus_client.Gauge("number_of_value_change_params",
+                            "Number of ValueChange Parameters being monitored")
+# pylint: disable-msg=no-value-for-parameter
+NUM_VC_NOTIFS_COUNTER_METRIC = \
+    prometheus_client.Counter("number_of_value_change_notifs",
+                              "Number of ValueChange Notifications sent")
+# pylint: disable-msg=no-value-for-parameter
+NUM_VC_NOTIFS_SUPPRESSED_METRIC = \
+    prometheus_client.Counter("number_of_suppressed_value_change_notifs",
+                              "Number of Value Changes coalesced into a later ValueChange Notification")
+
+# Changes to these Tables invalidate the cached Notification Routes
+ROUTE_PATH_PREFIXES = ("Device.LocalAgent.Controller.", "Device.LocalAgent.MTP.", "Device.STOMP.")
+
+
+class AbstractValueChangeNotifPoller(threading.Thread):
+    """An Abstract Value Change Notification Poller that is extended for specific bindings such that
+        ValueChange Notifications can be issued when a Parameter's Value has Changed"""
+    TO_ID = "to.id"
+    FROM_ID = "from.id"
+    MTP = "mtp.path"
+    SUBSCRIPTION_ID = "subscription.id"
+    MIN_INTERVAL = "min.interval"
+    LAST_NOTIF_TIME = "last.notif.time"
+    LAST_NOTIF_VALUE = "last.notif.value"
+
+    def __init__(self, agent_database, poll_duration=0.5):
+        """Initialize the Value Change Notification Poller Thread
+            - Parameters are checked as soon as the Database updates them; only Parameters with a computed
+              value (e.g. UpTime) are polled, every poll_duration seconds"""
+        threading.Thread.__init__(self, name="ValueChangeNotifPoller")
+        self._db = agent_database
+        self._param_cache = {}
+        self._poll_param_set = set()
+        self._cache_lock = threading.Lock()
+        self._update_queue = queue.Queue()
+        self._poll_duration = poll_duration
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        # Format: { Param : { (SubscriptionID, ControllerID, MTP Path) : Notification Details } }
+        self._subscriber_dict = {}
+
+        # Format: { (Param, (SubscriptionID, ControllerID, MTP Path)) : (Send Time, Latest Value, Suppressed Count) }
+        self._pending_dict = {}
+
+        # Format: { (ControllerID, AgentID, MTP Path) : (Send Time, { SubscriptionID : { Param : Value } }) }
+        self._batch_window = 0
+        self._batch_dict = {}
+
+        # Format: { (SubscriptionID, ControllerID) : NotifExpiration } for the Subscriptions with NotifRetry
+        self._outbox = None
+        self._notif_retry_dict = {}
+
+        # Format: { (AgentID, ControllerID, SubscriptionID, Send Resp) : notify.NotificationTemplate }
+        self._notif_template_dict = {}
+
+        # Format: { (Reference Path, AgentID, ControllerID, MTP Path, SubscriptionID) : set of resolved Params }
+        self._reference_dict = {}
+        self._reference_min_interval_dict = {}
+        self._reference_lock = threading.Lock()
+
+        # Format: { (ControllerID, MTP Path) : (Binding, Controller Address) }
+        self._route_dict = {}
+        self._route_generation = 0
+        self._route_lock = threading.Lock()
+
+        self._db.add_update_listener(self._handle_db_update)
+        self._db.add_insert_listener(self._handle_db_object_change)
+        self._db.add_delete_listener(self._handle_db_object_change)
+
+    def run(self):
+        """Thread execution code - wait for a Database update (or the next poll of the computed Parameters, or
+             the next coalesced Notification), and then send the ValueChange Notifications"""
+        next_poll_time = time.time() + self._poll_duration
+
+        while True:
+            wait_until_list = []
+            if self._poll_param_set:
+                wait_until_list.append(next_poll_time)
+            with self._cache_lock:
+                if self._pending_dict:
+                    wait_until_list.append(min(pending[0] for pending in self._pending_dict.values()))
+                if self._batch_dict:
+                    wait_until_list.append(min(batch[0] for batch in self._batch_dict.values()))
+
+            wait_timeout = None
+            if wait_until_list:
+                wait_timeout = max(0, min(wait_until_list) - time.time())
+
+            try:
+                update = self._update_queue.get(timeout=wait_timeout)
+                if update is not None:
+                    update_func, update_args = update
+                    update_func(*update_args)
+            except queue.Empty:
+                pass
+
+            self._send_pending()
+            self._send_batches()
+
+            if time.time() >= next_poll_time:
+                next_poll_time = time.time() + self._poll_duration
+
+                with self._cache_lock:
+                    poll_param_list = list(self._poll_param_set)
+
+                for param in poll_param_list:
+                    self._logger.debug("Checking %s for a Value Change", param)
+                    self._check_value(param, self._db.get(param))
+
+    def set_outbox(self, outbox):
+        """Configure the Outbox that keeps the Notifications of Subscriptions with NotifRetry"""
+        self._outbox = outbox
+
+    def set_notif_retry(self, subscription_id, controller_id, notif_retry, notif_expiration=0):
+        """Configure whether the Notifications of a Subscription are retried until acknowledged by a NotifyResp
+            - notif_expiration is the number of seconds to keep retrying a Notification (0 for no limit)"""
+        if notif_retry:
+            self._notif_retry_dict[(subscription_id, controller_id)] = notif_expiration
+        else:
+            self._notif_retry_dict.pop((subscription_id, controller_id), None)
+
+    def set_batch_window(self, batch_window):
+        """Collect the Value Changes for a Controller for batch_window seconds and send them together
+            (0, the default, sends each Value Change as soon as it is detected)"""
+        self._batch_window = batch_window
+
+    def add_param(self, param, agent_id, controller_id, mtp_param_path, subscription_id, min_interval=0):
+        """Add a Subscriber of a Parameter to the ValueChange Notification Poller
+            - min_interval is the minimum number of seconds between Notifications to the Subscriber; changes
+              within the interval are coalesced into one Notification with the latest value"""
+        self._logger.info("Adding %s to the ValueChange Notification Poller for Subscription [%s]",
+                          param, subscription_id)
+        value_change_notif_details_dict = {}
+        value_change_notif_details_dict[self.FROM_ID] = agent_id
+        value_change_notif_details_dict[self.TO_ID] = controller_id
+        value_change_notif_details_dict[self.SUBSCRIPTION_ID] = subscription_id
+        value_change_notif_details_dict[self.MTP] = mtp_param_path
+        value_change_notif_details_dict[self.MIN_INTERVAL] = min_interval
+        value_change_notif_details_dict[self.LAST_NOTIF_TIME] = 0
+
+        with self._cache_lock:
+            if param not in self._subscriber_dict:
+                NUM_VC_PARAMS_GAUGE_METRIC.inc()
+                self._param_cache[param] = self._db.get(param)
+                self._subscriber_dict[param] = {}
+
+                if self._db.is_computed(param):
+                    self._poll_param_set.add(param)
+
+            value_change_notif_details_dict[self.LAST_NOTIF_VALUE] = self._param_cache[param]
+
+            subscriber_key = (subscription_id, controller_id, mtp_param_path)
+            self._subscriber_dict[param][subscriber_key] = value_change_notif_details_dict
+
+        # Wake up the Thread in case it is waiting without a timeout and now needs to poll
+        self._update_queue.put(None)
+
+    def remove_param(self, param, controller_id=None, mtp_param_path=None, subscription_id=None):
+        """Remove a Subscriber of a Parameter from the ValueChange Notification Poller
+            - all of the Parameter's Subscribers are removed if no Subscriber is provided"""
+        self._logger.info("Removing %s from the ValueChange Notification Poller", param)
+
+        with self._cache_lock:
+            if param not in self._subscriber_dict:
+                return
+
+            if subscription_id is None:
+                subscriber_key_list = list(self._subscriber_dict[param].keys())
+            else:
+                subscriber_key_list = [(subscription_id, controller_id, mtp_param_path)]
+
+            for subscriber_key in subscriber_key_list:
+                self._subscriber_dict[param].pop(subscriber_key, None)
+                self._pending_dict.pop((param, subscriber_key), None)
+
+            # Stop monitoring the Parameter once nobody is subscribed to it
+            if not self._subscriber_dict[param]:
+                NUM_VC_PARAMS_GAUGE_METRIC.dec()
+                del self._subscriber_dict[param]
+                del self._param_cache[param]
+                self._poll_param_set.discard(param)
+
+    def add_reference(self, ref_path, agent_id, controller_id, mtp_param_path, subscription_id, min_interval=0):
+        """Add a Subscriber of an Object Path or Wild-carded Path (e.g. Device.Services.HomeAutomation.1.Sensor.*.)
+            - the Path is resolved to its Parameters, and re-resolved as object instances are inserted/deleted
+            - returns the list of resolved Parameters, or throws a NoSuchPathError"""
+        reference_key = (ref_path, agent_id, controller_id, mtp_param_path, subscription_id)
+
+        with self._reference_lock:
+            self._reference_dict[reference_key] = set()
+            self._reference_min_interval_dict[reference_key] = min_interval
+            self._resolve_reference(reference_key)
+            return sorted(self._reference_dict[reference_key])
+
+    def remove_reference(self, ref_path, agent_id, controller_id, mtp_param_path, subscription_id):
+        """Remove a Subscriber of an Object Path or Wild-carded Path, along with its resolved Parameters"""
+        reference_key = (ref_path, agent_id, controller_id, mtp_param_path, subscription_id)
+
+        with self._reference_lock:
+            self._reference_min_interval_dict.pop(reference_key, None)
+            for param in self._reference_dict.pop(reference_key, set()):
+                self.remove_param(param, controller_id, mtp_param_path, subscription_id)
+
+    def _resolve_reference(self, reference_key):
+        """Subscribe to the Parameters that the Reference Path now matches, and Unsubscribe from the ones
+            that it no longer matches"""
+        ref_path, agent_id, controller_id, mtp_param_path, subscription_id = reference_key
+        curr_param_set = self._reference_dict[reference_key]
+        found_param_set = set(self._db.find_params(ref_path))
+
+        for param in found_param_set - curr_param_set:
+            self.add_param(param, agent_id, controller_id, mtp_param_path, subscription_id,
+                           self._reference_min_interval_dict[reference_key])
+
+        for param in curr_param_set - found_param_set:
+            self.remove_param(param, controller_id, mtp_param_path, subscription_id)
+
+        self._reference_dict[reference_key] = found_param_set
+
+    def _handle_db_object_change(self, instance_path):
+        """Database Insert/Delete Listener - re-resolve the Reference Paths that could match the
+            inserted/deleted instance"""
+        if instance_path.startswith(ROUTE_PATH_PREFIXES):
+            self.invalidate_routes()
+
+        with self._reference_lock:
+            for reference_key in self._reference_dict:
+                if utils.PathHelper.is_path_overlap(reference_key[0], instance_path):
+                    self._logger.info("Re-resolving Reference [%s] after a change to [%s]",
+                                      reference_key[0], instance_path)
+                    try:
+                        self._resolve_reference(reference_key)
+                    except agent_db.NoSuchPathError:
+                        self._logger.warning("Reference [%s] can no longer be resolved", reference_key[0])
+
+    def _handle_db_update(self, param, value):
+        """Database Update Listener - queue the update if the Parameter is being monitored"""
+        if param.startswith(ROUTE_PATH_PREFIXES):
+            self.invalidate_routes()
+
+        if param in self._subscriber_dict:
+            self._update_queue.put((self._check_value, (param, value)))
+
+    def _check_value(self, param, value):
+        """Send a ValueChange Notification to each Subscriber if the value differs from the cached value
+            - a Subscriber that was notified less than its minimum interval ago gets the latest value later"""
+        now = time.time()
+        notif_details_list = []
+
+        with self._cache_lock:
+            if param not in self._param_cache or value == self._param_cache[param]:
+                return
+
+            self._logger.info("Value Change detected for %s", param)
+            self._param_cache[param] = value
+
+            for subscriber_key, notif_details in self._subscriber_dict[param].items():
+                pending_key = (param, subscriber_key)
+                send_time = notif_details[self.LAST_NOTIF_TIME] + notif_details[self.MIN_INTERVAL]
+
+                if pending_key in self._pending_dict:
+                    # Coalesce: the latest value wins, and the replaced value is counted as suppressed
+                    send_time, _, suppressed_count = self._pending_dict[pending_key]
+                    self._pending_dict[pending_key] = (send_time, value, suppressed_count + 1)
+                elif now < send_time:
+                    self._pending_dict[pending_key] = (send_time, value, 0)
+                else:
+                    notif_details[self.LAST_NOTIF_TIME] = now
+                    notif_details[self.LAST_NOTIF_VALUE] = value
+                    notif_details_list.append(notif_details)
+
+        for notif_details in notif_details_list:
+            self._send_value_change(param, value, notif_details)
+
+    def _send_pending(self):
+        """Send the coalesced ValueChange Notifications whose minimum interval has passed"""
+        now = time.time()
+        send_list = []
+
+        with self._cache_lock:
+            for pending_key in [key for key, pending in self._pending_dict.items() if pending[0] <= now]:
+                param, subscriber_key = pending_key
+                _, value, suppressed_count = self._pending_dict.pop(pending_key)
+                notif_details = self._subscriber_dict[param][subscriber_key]
+                NUM_VC_NOTIFS_SUPPRESSED_METRIC.inc(suppressed_count)
+
+                if value == notif_details[self.LAST_NOTIF_VALUE]:
+                    # The value changed back to the one the Subscriber already has
+                    NUM_VC_NOTIFS_SUPPRESSED_METRIC.inc()
+                    self._logger.info("Dropping a coalesced ValueChange for %s to Subscription [%s] - No Change",
+                                      param, notif_details[self.SUBSCRIPTION_ID])
+                else:
+                    notif_details[self.LAST_NOTIF_TIME] = now
+                    notif_details[self.LAST_NOTIF_VALUE] = value
+                    send_list.append((param, value, notif_details, suppressed_count))
+
+        for param, value, notif_details, suppressed_count in send_list:
+            self._logger.info("Sending a coalesced ValueChange for %s to Subscription [%s], %d changes suppressed",
+                              param, notif_details[self.SUBSCRIPTION_ID], suppressed_count)
+            self._send_value_change(param, value, notif_details)
+
+    def _send_value_change(self, param, value, notif_details):
+        """Send a ValueChange Notification to a Subscriber, or add it to the Controller's batch"""
+        if self._batch_window > 0:
+            batch_key = (notif_details[self.TO_ID], notif_details[self.FROM_ID], notif_details[self.MTP])
+
+            with self._cache_lock:
+                if batch_key not in self._batch_dict:
+                    self._batch_dict[batch_key] = (time.time() + self._batch_window, {})
+                    self._update_queue.put(None)
+
+                # The latest value of a Parameter within the window wins
+                subscription_dict = self._batch_dict[batch_key][1]
+                subscription_dict.setdefault(notif_details[self.SUBSCRIPTION_ID], {})[param] = value
+        else:
+            NUM_VC_NOTIFS_COUNTER_METRIC.inc()
+            self._handle_value_change(param, value, notif_details[self.TO_ID], notif_details[self.FROM_ID],
+                                      notif_details[self.SUBSCRIPTION_ID], notif_details[self.MTP])
+
+    def _send_batches(self):
+        """Send the batched Value Changes of each Controller whose batch window has passed
+            - one Notification per Subscription, as a Notification only carries a single Subscription ID"""
+        now = time.time()
+        send_list = []
+
+        with self._cache_lock:
+            for batch_key in [key for key, batch in self._batch_dict.items() if batch[0] <= now]:
+                send_list.append((batch_key, self._batch_dict.pop(batch_key)[1]))
+
+        for (to_id, from_id, mtp_param_path), subscription_dict in send_list:
+            for subscription_id, param_value_dict in subscription_dict.items():
+                NUM_VC_NOTIFS_COUNTER_METRIC.inc()
+
+                if len(param_value_dict) == 1:
+                    param, value = next(iter(param_value_dict.items()))
+                    self._handle_value_change(param, value, to_id, from_id, subscription_id, mtp_param_path)
+                else:
+                    self._logger.info("Sending a batch of %d Value Changes to Subscription [%s]",
+                                      len(param_value_dict), subscription_id)
+                    self._handle_value_change_batch(param_value_dict, to_id, from_id,
+                                                    subscription_id, mtp_param_path)
+
+    def _handle_value_change(self, param, value, to_id, from_id, subscription_id, mtp_param_path):
+        """Build the ValueChange Notification for a single Value Change from the Subscription's
+            Notification Template, and send it"""
+        notif_template = self.get_notif_template(from_id, to_id, subscription_id)
+        msg_id, serialized_record = notif_template.generate_value_change_record(param, value)
+        self.send_notif_record(msg_id, serialized_record, to_id, subscription_id, mtp_param_path)
+
+    def _handle_value_change_batch(self, param_value_dict, to_id, from_id, subscription_id, mtp_param_path):
+        """Build one Notification carrying a batch of Value Changes and send it"""
+        notif = notify.ValueChangeBatchNotification(from_id, to_id, subscription_id, param_value_dict)
+        notif.set_send_resp(self._is_notif_retry(subscription_id, to_id))
+        notif_msg = notif.generate_notif_msg()
+        serialized_record = notif.wrap_notif_in_record(notif_msg).SerializeToString()
+
+        self.send_notif_record(notif_msg.header.msg_id, serialized_record, to_id, subscription_id, mtp_param_path)
+
+    def get_notif_template(self, from_id, to_id, subscription_id):
+        """Retrieve the Subscription's Notification Template, creating it the first time it is needed"""
+        notif_template_key = (from_id, to_id, subscription_id, self._is_notif_retry(subscription_id, to_id))
+        notif_template = self._notif_template_dict.get(notif_template_key)
+
+        if notif_template is None:
+            notif_template = notify.NotificationTemplate(*notif_template_key)
+            self._notif_template_dict[notif_template_key] = notif_template
+
+        return notif_template
+
+    def _is_notif_retry(self, subscription_id, to_id):
+        """Determine if the Notifications of the Subscription are kept in the Outbox until acknowledged"""
+        return self._outbox is not None and (subscription_id, to_id) in self._notif_retry_dict
+
+    def send_notif_record(self, msg_id, serialized_record, to_id, subscription_id, mtp_param_path):
+        """Send the serialized Notification Record over the Binding for the Controller's MTP
+            - the Notification of a Subscription with NotifRetry asks for a NotifyResp, and is kept in
+              the Outbox (to be sent again) until the NotifyResp arrives"""
+        if self._is_notif_retry(subscription_id, to_id):
+            self._outbox.add(msg_id, to_id, mtp_param_path, subscription_id, serialized_record,
+                             self._notif_retry_dict[(subscription_id, to_id)])
+
+        self.send_record(serialized_record, to_id, mtp_param_path)
+
+    def invalidate_routes(self):
+        """Forget the resolved Routes, so that each is resolved again the next time it is used"""
+        with self._route_lock:
+            self._route_dict.clear()
+            self._route_generation += 1
+
+    def send_record(self, serialized_record, to_id, mtp_param_path):
+        """Send the serialized Notification Record over the Binding for the Controller's MTP"""
+        route = self._get_route(to_id, mtp_param_path)
+
+        if route is not None:
+            binding, to_addr = route
+            self._logger.info("Sending a Notification to ID [%s] over MTP [%s] at: %s",
+                              to_id, mtp_param_path, to_addr)
+            binding.send_msg(serialized_record, to_addr)
+
+    def _get_route(self, to_id, mtp_param_path):
+        """Retrieve the (Binding, Controller Address) Route for the Controller's MTP, resolving it if not cached
+            - a Route resolved while the Routes were being invalidated isn't cached, as it could be stale"""
+        route_key = (to_id, mtp_param_path)
+
+        with self._route_lock:
+            route = self._route_dict.get(route_key)
+            route_generation = self._route_generation
+
+        if route is None:
+            route = self._resolve_route(to_id, mtp_param_path)
+
+            if route is not None:
+                with self._route_lock:
+                    if route_generation == self._route_generation:
+                        self._route_dict[route_key] = route
+
+        return route
+
+    def _resolve_route(self, to_id, mtp_param_path):
+        """Resolve the (Binding, Controller Address) Route for the Controller's MTP, or None if it can't be"""
+        raise NotImplementedError()
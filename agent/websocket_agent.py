@@ -0,0 +1,233 @@
+# Copyright (c) 2016-2017 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+# File Name: websocket_agent.py
+#
+# Description: A WebSocket USP Agent
+#
+# Functionality:
+#   Class: WebSocketAgent(abstract_agent.AbstractAgent)
+#     __init__(dm_file, db_file, net_intf, port=8080, cfg_file_name="cfg/agent.json", debug=False,
+#              shared_agent=None)
+#     start_listening(timeout=15)
+#     clean_up()
+#   Class: WebSocketPeriodicNotifHandler(abstract_agent.AbstractPeriodicNotifHandler)
+#     __init__(database, mtp_param_path, from_id, to_id, subscription_id, param)
+#   Class: WebSocketValueChangeNotifPoller(value_change_notif_poller.AbstractValueChangeNotifPoller)
+#     __init__(agent_db, poll_duration=0.5)
+#     set_binding(binding)
+#   Class: WebSocketNotificationSender(notif_sender_pool.NotificationSender)
+#     __init__(notif, binding, to_addr)
+#   Function: get_controller_addr(database, mtp_param_path, controller_id)
+#
+"""
+
+
+from agent import utils
+from agent import abstract_agent
+from agent import notif_sender_pool
+from agent import websocket_usp_binding
+from agent import value_change_notif_poller
+
+
+WEBSOCKET_MAX_PAYLOAD_SIZE = "websocket.max.payload.size"
+
+
+class WebSocketAgent(abstract_agent.AbstractAgent):
+    """A USP Agent that uses the WebSocket Binding"""
+    def __init__(self, dm_file, db_file, net_intf, port=8080, cfg_file_name="cfg/agent.json", debug=False,
+                 shared_agent=None):
+        """Initialize the WebSocket Agent"""
+        abstract_agent.AbstractAgent.__init__(self, dm_file, db_file, net_intf, cfg_file_name, debug,
+                                             shared_agent)
+        self._can_start = True
+
+        # Initialize the underlying Agent DB MTP details for WebSockets
+        resource_path = "usp"
+        ip_addr = self._get_ip_addr(net_intf)
+        if ip_addr is not None:
+            url = "ws://" + ip_addr + ":" + str(port) + "/" + resource_path
+            num_local_agent_ws_mtps = self._init_db_for_mtp(port, resource_path)
+
+            # We only support 1 Local Agent WebSocket MTP
+            if num_local_agent_ws_mtps == 1:
+                cfg_mgr = utils.ConfigMgr(cfg_file_name, {WEBSOCKET_MAX_PAYLOAD_SIZE: 65536})
+                self._binding = websocket_usp_binding.WebSocketUspBinding(
+                    self._endpoint_id, port=port, resource_path=resource_path,
+                    max_payload_size=int(cfg_mgr.get_cfg_item(WEBSOCKET_MAX_PAYLOAD_SIZE)), debug=debug,
+                    controller_validator=self.is_known_controller)
+                self._binding.listen(url)
+
+                value_change_notif_poller = WebSocketValueChangeNotifPoller(self._db)
+                value_change_notif_poller.set_binding(self._binding)
+                self.set_value_change_notif_poller(value_change_notif_poller)
+
+                self._connect_to_controllers()
+                self.init_subscriptions()
+            else:
+                self._can_start = False
+                self._logger.error(
+                    "The Agent must have 1 and only 1 WebSocket Local Agent MTP , %s were found - EXITING",
+                    str(num_local_agent_ws_mtps))
+        else:
+            self._can_start = False
+            self._logger.error("IP Address could not be found for provided Network Interface [%s] - EXITING",
+                               net_intf)
+
+    def start_listening(self, timeout=15):
+        """Start listening for messages and process them"""
+        if self._can_start:
+            abstract_agent.AbstractAgent.start_listening(self)
+
+            msg_handler = self.get_msg_handler()
+            listener = abstract_agent.BindingListener("WebSocket", self._binding, msg_handler, timeout)
+            listener.start()
+            listener.join()
+
+    def clean_up(self):
+        """Clean up the USP Binding"""
+        if self._can_start:
+            self._binding.clean_up()
+
+    def _get_ip_addr(self, net_intf):
+        """Get the IP Address for this Agent"""
+        if len(net_intf) > 1:
+            ip_addr = utils.IPAddr.get_ip_addr(net_intf)
+        else:
+            ip_addr = utils.IPAddr.get_ip_addr()
+
+        return ip_addr
+
+    def _get_supported_protocol(self):
+        """Return the supported Protocol as a String: CoAP, STOMP, HTTP/2, WebSockets"""
+        return "WebSocket"
+
+    def _init_db_for_mtp(self, port, path):
+        """Enable the LocalAgent MTPs for the supported protocol and Disable all other LocalAgent MTPs
+            (unless the Database is shared with the other MTPs)"""
+        ws_mtp_count = 0
+        agent_mtp_instances = self._db.find_instances("Device.LocalAgent.MTP.")
+
+        for agent_mtp_path in agent_mtp_instances:
+            if self._db.get(agent_mtp_path + "Protocol") == self._get_supported_protocol():
+                ws_mtp_count += 1
+                self._db.update(agent_mtp_path + "Enable", True)
+                self._db.update(agent_mtp_path + "WebSocket.Port", port)
+                self._db.update(agent_mtp_path + "WebSocket.Path", path)
+            elif not self._is_shared:
+                self._db.update(agent_mtp_path + "Enable", False)
+
+        return ws_mtp_count
+
+    def _connect_to_controllers(self):
+        """Open a persistent WebSocket connection to each enabled Controller with a reachable WebSocket MTP"""
+        controller_instances = self._db.find_instances("Device.LocalAgent.Controller.")
+
+        for controller_path in controller_instances:
+            if self._db.get(controller_path + "Enable"):
+                for mtp_path in self._db.find_instances(controller_path + "MTP."):
+                    if (self._db.get(mtp_path + "Enable") and
+                            self._db.get(mtp_path + "Protocol") == self._get_supported_protocol() and
+                            self._db.get(mtp_path + "WebSocket.Host")):
+                        controller_url = get_controller_addr(self._db, mtp_path,
+                                                             self._db.get(controller_path + "EndpointID"))
+                        self._binding.open_connection(controller_url)
+
+    def _get_notification_sender(self, notif, controller_id, mtp_param_path):
+        """Return an instance of a binding specific AbstractNotificationSender"""
+        return WebSocketNotificationSender(notif, self._binding,
+                                           get_controller_addr(self._db, mtp_param_path, controller_id))
+
+    def _get_periodic_notif_handler(self, agent_id, controller_id, mtp_param_path,
+                                    subscription_id, param_path):
+        """Return an instance of a binding specific AbstractPeriodicNotifHandler"""
+        periodic_notif_handler = WebSocketPeriodicNotifHandler(self._db, mtp_param_path, agent_id, controller_id,
+                                                               subscription_id, param_path)
+        periodic_notif_handler.set_binding(self._binding)
+        return periodic_notif_handler
+
+
+class WebSocketPeriodicNotifHandler(abstract_agent.AbstractPeriodicNotifHandler):
+    """Issue a Periodic Notifications via a WebSocket Binding"""
+    def __init__(self, database, mtp_param_path, from_id, to_id, subscription_id,
+                 path_to_periodic_params):
+        """Initialize the WebSocket Periodic Notification Handler"""
+        abstract_agent.AbstractPeriodicNotifHandler.__init__(self, database, mtp_param_path,
+                                                             from_id, to_id, subscription_id,
+                                                             path_to_periodic_params)
+        self._mtp_param_path = mtp_param_path
+
+    def _handle_periodic_record(self, serialized_record):
+        """Handle the WebSocket Periodic Notification"""
+        if self._binding is not None:
+            to_addr = get_controller_addr(self._db, self._mtp_param_path, self._to_id)
+            self._logger.info("Sending a Periodic Notification to ID [%s] over MTP [%s] at: %s",
+                              self._to_id, self._mtp_param_path, to_addr)
+            self._binding.send_msg(serialized_record, to_addr)
+        else:
+            self._logger.warning("Unable to send the Periodic Notification - No Binding")
+
+        return True
+
+
+class WebSocketValueChangeNotifPoller(value_change_notif_poller.AbstractValueChangeNotifPoller):
+    """Poll Parameters for Value Change Notifications via a WebSocket Binding"""
+    def __init__(self, agent_database, poll_duration=0.5):
+        """Initialize the WebSocket Value Change Notification Poller"""
+        value_change_notif_poller.AbstractValueChangeNotifPoller.__init__(self, agent_database, poll_duration)
+        self._binding = None
+
+    def set_binding(self, binding):
+        """Configure the WebSocket Binding to use when sending the Notification"""
+        self._binding = binding
+        self.invalidate_routes()
+
+    def _resolve_route(self, to_id, mtp_param_path):
+        """Resolve the WebSocket Binding and the Controller's address for the Controller's MTP"""
+        if self._binding is None:
+            self._logger.warning("Unable to send the ValueChange Notification - No Binding")
+            return None
+
+        return self._binding, get_controller_addr(self._db, mtp_param_path, to_id)
+
+
+class WebSocketNotificationSender(notif_sender_pool.NotificationSender):
+    """A WebSocket specific implementation of the Abstract Notification Sender"""
+    def __init__(self, notif, binding, to_addr):
+        """Initialize the WebSocket Notification Sender"""
+        notif_sender_pool.NotificationSender.__init__(self, notif, binding)
+        self._to_addr = to_addr
+
+    def _retrieve_to_addr(self):
+        return self._to_addr
+
+
+def get_controller_addr(database, mtp_param_path, controller_id):
+    """Retrieve the address of a Controller's WebSocket MTP: its URL if the Agent can connect to it,
+        otherwise its Endpoint ID (for Controllers that connect to the Agent)"""
+    host = database.get(mtp_param_path + "WebSocket.Host")
+
+    if not host:
+        return controller_id
+
+    return "ws://" + host + ":" + str(database.get(mtp_param_path + "WebSocket.Port")) + "/" + \
+           database.get(mtp_param_path + "WebSocket.Path")
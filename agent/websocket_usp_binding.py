@@ -0,0 +1,276 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+#
+# File Name: websocket_usp_binding.py
+#
+# Description: Encapsulates the various aspects of a WebSocket USP Binding
+#
+# Class Structure:
+#  - WebSocketUspBinding(generic_usp_binding.BlockingUspBinding)
+#    - __init__(my_endpoint_id, host="0.0.0.0", port=8080, resource_path="usp", max_payload_size=65536,
+#               send_timeout=10, debug=False, controller_validator=None)
+#    - validate_payload(payload)
+#    - get_port()
+#    - listen(agent_addr)
+#    - open_connection(url)
+#    - send_msg(serialized_msg, to_addr)
+#    - clean_up()
+#  - WebSocketEventLoopThread(threading.Thread)
+#    - __init__()
+#    - start_loop(timeout=5)
+#    - get_loop()
+#    - run_coroutine(coro, timeout=None)
+#    - run()
+#    - stop()
+#
+"""
+
+import asyncio
+import logging
+import threading
+import concurrent.futures
+
+import websockets
+import prometheus_client
+
+from agent import record_header
+from agent import generic_usp_binding
+
+
+USP_SUBPROTOCOL = "v1.usp"
+
+# pylint: disable-msg=no-value-for-parameter
+NUM_FAILED_SENDS_METRIC = \
+    prometheus_client.Counter("number_of_failed_websocket_sends",
+                              "Number of USP Records that could not be sent over a WebSocket")
+
+
+class WebSocketUspBinding(generic_usp_binding.BlockingUspBinding):
+    """A WebSocket to USP Binding
+        - Controllers can connect to the Agent's WebSocket server, and the Agent can connect to a Controller's
+          WebSocket server; either way the connection is kept open and used in both directions
+        - Requests received on a server connection are answered using the Controller's Endpoint ID,
+          Requests received on a client connection are answered using the Controller's URL"""
+    def __init__(self, my_endpoint_id, host="0.0.0.0", port=8080, resource_path="usp", max_payload_size=65536,
+                 send_timeout=10, debug=False, controller_validator=None):
+        """Initialize the WebSocket USP Binding for a USP Endpoint
+            - controller_validator(endpoint_id) returns True for the Endpoint IDs of known Controllers;
+              Records from any other Endpoint are dropped (all Endpoints are accepted if it is None)"""
+        generic_usp_binding.BlockingUspBinding.__init__(self)
+        self._host = host
+        self._port = port
+        self._debug = debug
+        self._server = None
+        self._resource_path = resource_path
+        self._send_timeout = send_timeout
+        self._max_payload_size = max_payload_size
+        self._my_endpoint_id = my_endpoint_id
+        self._controller_validator = controller_validator
+        self._record_validator = record_header.RecordHeaderValidator(my_endpoint_id)
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+        # Maps an Endpoint ID or URL to an open WebSocket; only used on the Event Loop
+        self._conn_dict = {}
+        self._connect_lock = None
+
+        self._loop_thread = WebSocketEventLoopThread()
+        self._loop_thread.start_loop()
+
+    def validate_payload(self, payload):
+        """Validate the payload of the Incoming WebSocket message to ensure it is addressed to this Agent
+            - returns the Record Header of the payload, or None if it is to be dropped"""
+        return self._record_validator.validate(payload)
+
+    def get_port(self):
+        """Retrieve the port the WebSocket server is listening on"""
+        return self._port
+
+    def listen(self, agent_addr):
+        """Start the WebSocket server that Controllers connect to"""
+        self._loop_thread.run_coroutine(self._start_server())
+        self._logger.info("Listening for WebSocket connections on [%s] (port %s)", agent_addr, self._port)
+
+    def open_connection(self, url):
+        """Open a persistent WebSocket connection to a Controller, returning True if successful"""
+        try:
+            self._loop_thread.run_coroutine(self._get_connection(url), self._send_timeout)
+        except (OSError, asyncio.TimeoutError, concurrent.futures.TimeoutError,
+                websockets.exceptions.WebSocketException) as err:
+            self._logger.warning("Unable to open a WebSocket connection to [%s]: %s", url, err)
+            return False
+
+        return True
+
+    def send_msg(self, serialized_msg, to_addr):
+        """Send the ProtoBuf Serialized message to the provided Endpoint ID or WebSocket URL
+            - a connection is opened (and kept open) if there isn't one for the address yet"""
+        try:
+            self._loop_thread.run_coroutine(self._send(serialized_msg, to_addr), self._send_timeout)
+            self._logger.info("Sending a WebSocket message to the following address: %s", to_addr)
+            self._logger.debug("Payload being sent: [%s]", serialized_msg)
+        except (OSError, asyncio.TimeoutError, concurrent.futures.TimeoutError,
+                websockets.exceptions.WebSocketException, UnknownAddressError) as err:
+            NUM_FAILED_SENDS_METRIC.inc()
+            self._logger.error("Unable to send a WebSocket message to [%s]: %s", to_addr, err)
+
+    def clean_up(self):
+        """Close all of the WebSocket connections and stop the Event Loop"""
+        try:
+            self._loop_thread.run_coroutine(self._close_all(), self._send_timeout)
+        except (asyncio.TimeoutError, concurrent.futures.TimeoutError):
+            self._logger.warning("Timed out closing the WebSocket connections")
+
+        self._loop_thread.stop()
+
+    async def _start_server(self):
+        """Start the WebSocket server on the Event Loop"""
+        self._server = await websockets.serve(self._handle_server_connection, self._host, self._port,
+                                              subprotocols=[USP_SUBPROTOCOL], max_size=self._max_payload_size)
+        self._port = self._server.sockets[0].getsockname()[1]
+
+    async def _handle_server_connection(self, websocket, _path=None):
+        """Handle a connection from a Controller"""
+        self._logger.info("Accepted a WebSocket connection from [%s]", websocket.remote_address)
+        await self._receive_msgs(websocket, None)
+
+    async def _get_connection(self, url):
+        """Retrieve the open connection for the URL, opening a new one if needed"""
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+
+        async with self._connect_lock:
+            websocket = self._conn_dict.get(url)
+
+            if websocket is None:
+                self._logger.info("Opening a WebSocket connection to [%s]", url)
+                websocket = await websockets.connect(url, subprotocols=[USP_SUBPROTOCOL],
+                                                     max_size=self._max_payload_size)
+                self._conn_dict[url] = websocket
+                asyncio.ensure_future(self._receive_msgs(websocket, url))
+
+        return websocket
+
+    async def _send(self, serialized_msg, to_addr):
+        """Send the message over the connection for the address"""
+        websocket = self._conn_dict.get(to_addr)
+
+        if websocket is None:
+            if not to_addr.startswith(("ws://", "wss://")):
+                raise UnknownAddressError("No WebSocket connection for [{}]".format(to_addr))
+
+            websocket = await self._get_connection(to_addr)
+
+        await websocket.send(serialized_msg)
+
+    async def _receive_msgs(self, websocket, url):
+        """Push the USP Records received on the connection onto the incoming message queue
+            - replies go back to the URL for client connections, or to the Endpoint ID for server connections"""
+        try:
+            async for payload in websocket:
+                if isinstance(payload, str):
+                    self._logger.warning("Ignoring a WebSocket text message; USP Records are sent as binary")
+                    continue
+
+                # Drop mis-addressed/unsupported Records before they are queued and fully parsed
+                header = self.validate_payload(payload)
+
+                if header is not None and self._map_connection(header.from_id, websocket):
+                    self.push(payload, url or header.from_id)
+        except websockets.exceptions.ConnectionClosed as err:
+            self._logger.info("WebSocket connection closed: %s", err)
+        finally:
+            for addr in [addr for addr, conn in self._conn_dict.items() if conn is websocket]:
+                del self._conn_dict[addr]
+
+    def _map_connection(self, from_id, websocket):
+        """Remember the connection so that Responses and Notifications can be sent to the Controller
+            - returns False (and the Record is dropped) for unknown Endpoint IDs, or if another open
+              connection already belongs to the Endpoint ID"""
+        if self._controller_validator is not None and not self._controller_validator(from_id):
+            self._logger.warning("Dropping a WebSocket Record from unknown Endpoint [%s]", from_id)
+            return False
+
+        mapped_websocket = self._conn_dict.setdefault(from_id, websocket)
+        if mapped_websocket is not websocket:
+            self._logger.warning("Dropping a WebSocket Record from [%s]; another connection is open for it", from_id)
+            return False
+
+        return True
+
+    async def _close_all(self):
+        """Close the server and all of the open connections"""
+        if self._server is not None:
+            self._server.close()
+
+        for websocket in set(self._conn_dict.values()):
+            await websocket.close()
+
+        if self._server is not None:
+            await self._server.wait_closed()
+
+
+class WebSocketEventLoopThread(threading.Thread):
+    """A Thread that runs the AsyncIO Event Loop used by the WebSocket USP Binding"""
+    def __init__(self):
+        """Initialize the Event Loop Thread"""
+        threading.Thread.__init__(self, name="WebSocketEventLoop")
+        self.daemon = True
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def start_loop(self, timeout=5):
+        """Start the Thread and wait until the Event Loop is running"""
+        self.start()
+        self._ready.wait(timeout)
+
+    def get_loop(self):
+        """Retrieve the Event Loop"""
+        return self._loop
+
+    def run_coroutine(self, coro, timeout=None):
+        """Run the coroutine on the Event Loop from another Thread and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout)
+
+    def run(self):
+        """Run the Event Loop until stopped"""
+        asyncio.set_event_loop(self._loop)
+        self._loop.call_soon(self._ready.set)
+        self._loop.run_forever()
+
+        pending_tasks = asyncio.all_tasks(self._loop)
+        for task in pending_tasks:
+            task.cancel()
+        self._loop.run_until_complete(asyncio.gather(*pending_tasks, return_exceptions=True))
+        self._loop.close()
+        self._logger.info("WebSocket Event Loop stopped")
+
+    def stop(self):
+        """Stop the Event Loop and wait for the Thread to finish"""
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self.join()
+
+
+class UnknownAddressError(Exception):
+    """There is no WebSocket connection (or URL) for the address"""
+    pass
@@ -1036,3 +1036,39 @@ def test_delete_instance_no_such_instance():
             assert False, "NoSuchPathError Expected"
         except agent_db.NoSuchPathError:
             pass
+
+
+def test_update_calls_update_listeners():
+    file_mock = dm_mock = mock.mock_open(read_data=get_dm_file_contents())
+    db_mock = mock.mock_open(read_data=get_db_file_contents())
+    file_mock.side_effect = [dm_mock.return_value, db_mock.return_value]
+    listener = mock.Mock()
+
+    with mock.patch("builtins.open", file_mock):
+        my_db = agent_db.Database("mock_dm.json", "mock_db.json", "intf")
+        my_db._save = mock.MagicMock()
+        my_db.add_update_listener(listener)
+        my_db.update("Device.LocalAgent.ProvisioningCode", "TEST")
+        my_db.remove_update_listener(listener)
+        my_db.update("Device.LocalAgent.ProvisioningCode", "TEST2")
+
+    listener.assert_called_once_with("Device.LocalAgent.ProvisioningCode", "TEST")
+
+
+def test_is_computed():
+    file_mock = dm_mock = mock.mock_open(read_data=get_dm_file_contents())
+    db_mock = mock.mock_open(read_data=get_db_file_contents())
+    file_mock.side_effect = [dm_mock.return_value, db_mock.return_value]
+
+    with mock.patch("builtins.open", file_mock):
+        my_db = agent_db.Database("mock_dm.json", "mock_db.json", "intf")
+
+    assert my_db.is_computed("Device.LocalAgent.UpTime")
+    assert my_db.is_computed("Device.LocalAgent.X_ARRIS-COM_IPAddr")
+    assert not my_db.is_computed("Device.LocalAgent.ProvisioningCode")
+
+    try:
+        my_db.is_computed("Device.NoSuchPath")
+        assert False, "NoSuchPathError Expected"
+    except agent_db.NoSuchPathError:
+        pass
@@ -0,0 +1,92 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+#
+# File Name: test_binding_listener.py
+#
+# Description: Unit tests for the BindingListener and the RequestProcessor
+#
+# Functionality: Test that a Request is only acknowledged once its Response has been sent, and that
+#                 a duplicate Request is answered with its earlier Response instead of being run again
+#
+"""
+
+import unittest.mock as mock
+
+from agent import abstract_agent
+from agent import generic_usp_binding
+
+
+def get_msg_handler_mock(serialized_resp_record=b"RESP"):
+    msg_handler = mock.Mock()
+    msg_handler.handle_request.return_value = (mock.Mock(), mock.Mock(), mock.Mock(), serialized_resp_record)
+    return msg_handler
+
+
+
+def test_request_acked_after_response():
+    binding = mock.Mock()
+    listener = abstract_agent.BindingListener("Test", binding, get_msg_handler_mock())
+    queue_item = generic_usp_binding.ExpiringQueueItem(b"REQ", "ADDR", ack_id="ACK-1")
+
+    listener._handle_request(queue_item)
+
+    binding.send_msg.assert_called_once_with(b"RESP", "ADDR")
+    binding.ack_msg.assert_called_once_with(queue_item)
+
+
+
+def test_request_without_response_acked():
+    binding = mock.Mock()
+    listener = abstract_agent.BindingListener("Test", binding, get_msg_handler_mock(None))
+    queue_item = generic_usp_binding.ExpiringQueueItem(b"REQ", "ADDR", ack_id="ACK-1")
+
+    listener._handle_request(queue_item)
+
+    assert not binding.send_msg.called
+    binding.ack_msg.assert_called_once_with(queue_item)
+
+
+
+def test_failed_response_not_acked():
+    binding = mock.Mock()
+    binding.send_msg.side_effect = OSError("send failed")
+    listener = abstract_agent.BindingListener("Test", binding, get_msg_handler_mock())
+
+    # The failure is logged rather than raised, so the Listener keeps running
+    listener._handle_request(generic_usp_binding.ExpiringQueueItem(b"REQ", "ADDR", ack_id="ACK-1"))
+
+    assert not binding.ack_msg.called
+
+
+
+def test_duplicate_request_not_run_twice():
+    msg_handler = get_msg_handler_mock()
+    req_processor = abstract_agent.RequestProcessor(msg_handler, resp_cache_size=1)
+
+    assert req_processor.process(b"REQ-1", "ADDR") == b"RESP"
+    assert req_processor.process(b"REQ-1", "ADDR") == b"RESP"
+    assert msg_handler.handle_request.call_count == 1
+
+    # Only the most recent Responses are kept
+    req_processor.process(b"REQ-2", "ADDR")
+    req_processor.process(b"REQ-1", "ADDR")
+    assert msg_handler.handle_request.call_count == 3
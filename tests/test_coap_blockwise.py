@@ -0,0 +1,160 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+#
+# File Name: test_coap_blockwise.py
+#
+# Description: Unit tests for the coap_blockwise module
+#
+# Functionality: Test the BlockwiseReassembler Class and the Block helpers
+#
+"""
+
+from agent import coap_blockwise
+
+
+
+def test_size_exponent():
+    assert coap_blockwise.get_size_exponent(16) == 0
+    assert coap_blockwise.get_size_exponent(1024) == 6
+    assert coap_blockwise.get_block_size(coap_blockwise.get_size_exponent(256)) == 256
+
+
+
+def test_size_exponent_invalid():
+    try:
+        coap_blockwise.get_size_exponent(100)
+        assert False, "BlockwiseError Expected"
+    except coap_blockwise.BlockwiseError:
+        pass
+
+    try:
+        coap_blockwise.get_size_exponent(2048)
+        assert False, "BlockwiseError Expected"
+    except coap_blockwise.BlockwiseError:
+        pass
+
+
+
+def test_get_block():
+    payload = bytes(range(40))
+
+    block, more = coap_blockwise.get_block(payload, 0, 0)
+    assert block == payload[:16]
+    assert more
+
+    block, more = coap_blockwise.get_block(payload, 2, 0)
+    assert block == payload[32:]
+    assert not more
+
+
+
+def test_reassemble_preallocated():
+    payload = bytes(range(200))
+    reassembler = coap_blockwise.BlockwiseReassembler()
+
+    for block_number in range(4):
+        block, more = coap_blockwise.get_block(payload, block_number, 2)
+        result = reassembler.add_block("KEY", block_number, more, 2, block, len(payload))
+
+    assert result == payload
+
+
+
+def test_reassemble_no_size1():
+    payload = bytes(range(100))
+    reassembler = coap_blockwise.BlockwiseReassembler()
+
+    block, more = coap_blockwise.get_block(payload, 0, 1)
+    assert reassembler.add_block("KEY", 0, more, 1, block) is None
+    block, more = coap_blockwise.get_block(payload, 1, 1)
+    assert reassembler.add_block("KEY", 1, more, 1, block) is None
+    block, more = coap_blockwise.get_block(payload, 2, 1)
+    assert reassembler.add_block("KEY", 2, more, 1, block) is None
+    block, more = coap_blockwise.get_block(payload, 3, 1)
+
+    assert reassembler.add_block("KEY", 3, more, 1, block) == payload
+
+
+
+def test_reassemble_smaller_block_size():
+    payload = bytes(range(100))
+    reassembler = coap_blockwise.BlockwiseReassembler()
+
+    # The first block is sent with 64 byte blocks, the rest with 32 byte blocks
+    block, more = coap_blockwise.get_block(payload, 0, 2)
+    assert reassembler.add_block("KEY", 0, more, 2, block, len(payload)) is None
+    block, more = coap_blockwise.get_block(payload, 2, 1)
+    assert reassembler.add_block("KEY", 2, more, 1, block) is None
+    block, more = coap_blockwise.get_block(payload, 3, 1)
+
+    assert reassembler.add_block("KEY", 3, more, 1, block) == payload
+
+
+
+def test_reassemble_out_of_order():
+    reassembler = coap_blockwise.BlockwiseReassembler()
+    reassembler.add_block("KEY", 0, True, 0, bytes(16))
+
+    try:
+        reassembler.add_block("KEY", 2, True, 0, bytes(16))
+        assert False, "BlockwiseIncompleteError Expected"
+    except coap_blockwise.BlockwiseIncompleteError:
+        pass
+
+    try:
+        reassembler.add_block("KEY", 1, True, 0, bytes(16))
+        assert False, "BlockwiseIncompleteError Expected"
+    except coap_blockwise.BlockwiseIncompleteError:
+        pass
+
+
+
+def test_reassemble_too_large():
+    reassembler = coap_blockwise.BlockwiseReassembler(max_payload_size=32)
+
+    try:
+        reassembler.add_block("KEY", 0, True, 0, bytes(16), 64)
+        assert False, "BlockwiseTooLargeError Expected"
+    except coap_blockwise.BlockwiseTooLargeError:
+        pass
+
+    reassembler.add_block("KEY", 0, True, 0, bytes(16))
+    reassembler.add_block("KEY", 1, True, 0, bytes(16))
+
+    try:
+        reassembler.add_block("KEY", 2, False, 0, bytes(16))
+        assert False, "BlockwiseTooLargeError Expected"
+    except coap_blockwise.BlockwiseTooLargeError:
+        pass
+
+
+
+def test_reassemble_expired():
+    reassembler = coap_blockwise.BlockwiseReassembler(ttl=-1)
+    reassembler.add_block("KEY", 0, True, 0, bytes(16))
+
+    try:
+        reassembler.add_block("KEY", 1, False, 0, bytes(16))
+        assert False, "BlockwiseIncompleteError Expected"
+    except coap_blockwise.BlockwiseIncompleteError:
+        pass
@@ -0,0 +1,189 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+#
+# File Name: test_coap_usp_binding.py
+#
+# Description: Unit tests for the coap_usp_binding module
+#
+# Functionality: Test the handling of Requests on the CoAP Event Loop
+#
+"""
+
+import asyncio
+import unittest.mock as mock
+
+import aiocoap
+import aiocoap.resource
+
+from agent import coap_usp_binding
+
+
+def get_binding(resp_record=b"RESPONSE"):
+    request_processor = mock.Mock()
+    request_processor.process.return_value = resp_record
+    binding = coap_usp_binding.CoapUspBinding("127.0.0.1", "AGENT-ID", listen_port=15683)
+    binding.set_request_processor(request_processor)
+    return binding
+
+
+def get_post(payload):
+    request = aiocoap.Message(code=aiocoap.Code.POST, payload=payload)
+    request.opt.content_format = 42
+    return request
+
+
+
+def test_handle_request_without_context():
+    binding = get_binding()
+    binding._listen_thread = mock.Mock()
+    binding._listen_thread.get_context.return_value = None
+
+    try:
+        with mock.patch.object(coap_usp_binding, "send_usp_post") as send_mock:
+            asyncio.run(binding.handle_request(b"REQUEST", "coap://127.0.0.1:15684/usp"))
+
+        # The Request is processed, but the Response is dropped instead of failing on a missing Context
+        binding._request_processor.process.assert_called_once_with(b"REQUEST", "coap://127.0.0.1:15684/usp")
+        send_mock.assert_not_called()
+    finally:
+        binding.clean_up()
+
+
+
+def test_handle_request_failure_logged():
+    binding = get_binding()
+    binding._request_processor.process.side_effect = RuntimeError("Database Failure")
+    binding._listen_thread = mock.Mock()
+    resource = binding._resource
+    resource._logger = mock.Mock()
+
+    async def process_post():
+        with mock.patch.object(binding, "validate_payload", return_value=True):
+            response = resource._process_payload(get_post(b"REQUEST"), "coap://127.0.0.1:15684/usp")
+
+        # Let the Request Task run to completion and its done-callback fire
+        while not resource._logger.error.called:
+            await asyncio.sleep(0.01)
+        return response
+
+    try:
+        response = asyncio.run(asyncio.wait_for(process_post(), 5))
+        assert response.code == aiocoap.Code.CHANGED
+        assert "Database Failure" in str(resource._logger.error.call_args)
+        binding._listen_thread.get_context.assert_not_called()
+    finally:
+        binding.clean_up()
+
+
+
+def test_block1_transfer():
+    binding = coap_usp_binding.CoapUspBinding("127.0.0.1", "AGENT-ID", listen_port=15683, block_size=16)
+    payload = bytes(range(40))
+
+    async def post_blocks():
+        responses = []
+        with mock.patch.object(binding, "validate_payload", return_value=True):
+            for block_number in range(3):
+                request = get_post(payload[block_number * 16:(block_number + 1) * 16])
+                request.opt.block1 = (block_number, block_number < 2, 0)
+                responses.append(binding._resource._process_payload(request, "coap://127.0.0.1:15684/usp"))
+        await asyncio.sleep(0)
+        return responses
+
+    responses = asyncio.run(post_blocks())
+    assert [resp.code for resp in responses] == [aiocoap.Code.CONTINUE, aiocoap.Code.CONTINUE, aiocoap.Code.CHANGED]
+    assert tuple(responses[0].opt.block1) == (0, True, 0)
+    assert tuple(responses[2].opt.block1) == (2, False, 0)
+    assert binding.get_msg(1).get_payload() == payload
+
+
+
+def test_block1_out_of_order():
+    binding = coap_usp_binding.CoapUspBinding("127.0.0.1", "AGENT-ID", listen_port=15683, block_size=16)
+    request = get_post(bytes(16))
+    request.opt.block1 = (0, True, 0)
+    assert binding._resource._process_payload(request, "coap://127.0.0.1:15684/usp").code == aiocoap.Code.CONTINUE
+
+    # Block 1 is skipped, so Block 2 doesn't continue the transfer
+    request = get_post(bytes(16))
+    request.opt.block1 = (2, True, 0)
+    response = binding._resource._process_payload(request, "coap://127.0.0.1:15684/usp")
+    assert response.code == aiocoap.Code.REQUEST_ENTITY_INCOMPLETE
+    assert response.opt.block1 is None
+
+    # The transfer was discarded, so the next Block is incomplete as well
+    request = get_post(bytes(16))
+    request.opt.block1 = (1, True, 0)
+    response = binding._resource._process_payload(request, "coap://127.0.0.1:15684/usp")
+    assert response.code == aiocoap.Code.REQUEST_ENTITY_INCOMPLETE
+
+
+
+def test_block1_too_large():
+    binding = coap_usp_binding.CoapUspBinding("127.0.0.1", "AGENT-ID", listen_port=15683, block_size=16,
+                                              max_payload_size=32)
+
+    # The Size1 Option announces a payload larger than the maximum
+    request = get_post(bytes(16))
+    request.opt.block1 = (0, True, 0)
+    request.opt.size1 = 64
+    response = binding._resource._process_payload(request, "coap://127.0.0.1:15684/usp")
+    assert response.code == aiocoap.Code.REQUEST_ENTITY_TOO_LARGE
+    assert response.opt.size1 == 32
+
+    # Without a Size1 Option the transfer is rejected once the Blocks exceed the maximum
+    responses = []
+    for block_number in range(3):
+        request = get_post(bytes(16))
+        request.opt.block1 = (block_number, True, 0)
+        responses.append(binding._resource._process_payload(request, "coap://127.0.0.1:15684/usp"))
+    assert [resp.code for resp in responses] == \
+        [aiocoap.Code.CONTINUE, aiocoap.Code.CONTINUE, aiocoap.Code.REQUEST_ENTITY_TOO_LARGE]
+    assert responses[2].opt.size1 == 32
+
+
+
+def test_block1_transfer_through_server_context():
+    binding = coap_usp_binding.CoapUspBinding("127.0.0.1", "AGENT-ID", listen_port=15685, block_size=64)
+    payload = bytes(range(256)) * 2
+
+    async def post_through_site():
+        site = aiocoap.resource.Site()
+        site.add_resource(("usp",), binding._resource)
+        server_context = await aiocoap.Context.create_server_context(site, bind=("127.0.0.1", 15685))
+        client_context = await aiocoap.Context.create_client_context()
+
+        try:
+            return await coap_usp_binding.send_usp_post(client_context, payload, "coap://127.0.0.1:15685/usp",
+                                                        "127.0.0.1:15686/usp", binding.get_size_exponent())
+        finally:
+            await client_context.shutdown()
+            await server_context.shutdown()
+
+    # Each Block reaches the Binding's reassembler rather than being reassembled by the CoAP library
+    with mock.patch.object(binding, "validate_payload", return_value=True), \
+            mock.patch.object(binding, "reassemble_block", wraps=binding.reassemble_block) as reassemble_mock:
+        response = asyncio.run(post_through_site())
+
+    assert response.code == aiocoap.Code.CHANGED
+    assert reassemble_mock.call_count == 8
+    assert binding.get_msg(1).get_payload() == payload
@@ -28,6 +28,7 @@ SOFTWARE.
 import unittest.mock as mock
 
 from agent import utils
+from agent import stomp_agent
 
 
 def test_item_in_config_file():
@@ -103,3 +104,17 @@ def test_item_not_in_config_file_no_default():
             assert value == "Expected a config_mgr.MissingConfigError to be raised"
         except utils.MissingConfigError:
             pass
+
+
+def test_stomp_batch_transaction_parsed_explicitly():
+    agent_mock = mock.Mock()
+    agent_mock._cfg_file_name = "mock.cfg"
+
+    for cfg_value, expected in (("\"false\"", False), ("\"False\"", False), ("false", False), ("\"0\"", False),
+                                ("\"true\"", True), ("true", True), ("\"yes\"", True), ("1", True)):
+        mock_cfg_file = "{\"stomp.batch.transaction\" : " + cfg_value + "}"
+
+        with mock.patch("builtins.open", mock.mock_open(read_data=mock_cfg_file)):
+            send_cfg = stomp_agent.StompAgent._get_send_cfg(agent_mock)
+
+        assert send_cfg["batch_transaction"] is expected
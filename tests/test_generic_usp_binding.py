@@ -162,3 +162,32 @@ def test_get_msg_not_found_not_my_msg():
         assert queue_item.get_payload() == payload3
         queue_item = binding.get_msg(timeout)
         assert queue_item.get_payload() == payload1
+
+
+
+def test_push_with_ack_id():
+    payload = "TEST"
+    reply_to_addr = "ADDR"
+    binding = generic_usp_binding.GenericUspBinding()
+    binding.push(payload, reply_to_addr, "ACK-1")
+    queue_item = binding.pop()
+
+    assert queue_item.get_payload() == payload
+    assert queue_item.get_ack_id() == "ACK-1"
+
+
+
+def test_pop_expired_item_is_acked():
+    payload = "TEST"
+    reply_to_addr = "ADDR"
+    ack_mock = mock.Mock()
+    binding = generic_usp_binding.GenericUspBinding()
+    binding.push(payload, reply_to_addr, "ACK-1")
+    binding.ack_msg = ack_mock
+
+    with mock.patch("time.time", return_value=2000000000):
+        queue_item = binding.pop()
+
+    assert queue_item is None
+    assert ack_mock.call_count == 1
+    assert ack_mock.call_args[0][0].get_ack_id() == "ACK-1"
@@ -0,0 +1,187 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+"""
+#
+# File Name: test_local_stomp_broker.py
+#
+# Description: Unit tests for the local_stomp_broker module
+#
+# Functionality: Test the LocalStompBroker Class with raw socket STOMP clients
+#
+"""
+
+import socket
+
+from agent import stomp_frame
+from agent import local_stomp_broker
+
+
+class RawStompClient:
+    def __init__(self, port, endpoint_id="CLIENT"):
+        self._buffer = b""
+        self._sock = socket.create_connection(("127.0.0.1", port), timeout=5)
+        self.send_frame("CONNECT", {"accept-version": "1.2", "host": "/", "endpoint-id": endpoint_id})
+        self.connected_frame = self.recv_frame()
+
+    def send_frame(self, command, headers, body=b""):
+        self._sock.sendall(stomp_frame.encode_frame(command, headers, body))
+
+    def recv_frame(self):
+        while b"\n\n" not in self._buffer:
+            self._buffer += self._sock.recv(4096)
+
+        head, self._buffer = self._buffer.split(b"\n\n", 1)
+        command, headers = stomp_frame.decode_frame_head(head)
+        body_len = int(headers["content-length"])
+
+        while len(self._buffer) < body_len + 1:
+            self._buffer += self._sock.recv(4096)
+
+        body, self._buffer = self._buffer[:body_len], self._buffer[body_len + 1:]
+        return command, headers, body
+
+    def close(self):
+        self._sock.close()
+
+
+def get_broker():
+    broker = local_stomp_broker.LocalStompBroker(subscribe_dest_format="/queue/{endpoint_id}")
+    broker.start_broker()
+    return broker
+
+
+
+def test_connect_subscribe_dest():
+    broker = get_broker()
+    client = RawStompClient(broker.get_port(), "proto::agent")
+
+    assert client.connected_frame[0] == "CONNECTED"
+    assert client.connected_frame[1]["version"] == "1.2"
+    assert client.connected_frame[1]["subscribe-dest"] == "/queue/proto::agent"
+
+    client.close()
+    broker.stop()
+
+
+
+def test_send_and_receive():
+    broker = get_broker()
+    agent = RawStompClient(broker.get_port(), "agent")
+    controller = RawStompClient(broker.get_port(), "controller")
+    agent.send_frame("SUBSCRIBE", {"id": "1", "destination": "/queue/agent", "receipt": "sub-1"})
+    assert agent.recv_frame()[1]["receipt-id"] == "sub-1"
+
+    controller.send_frame("SEND", {"destination": "/queue/agent", "content-type": "application/vnd.bbf.usp.msg",
+                                   "reply-to-dest": "/queue/controller"}, b"\x0a\x00\x0b")
+    command, headers, body = agent.recv_frame()
+
+    assert command == "MESSAGE"
+    assert headers["destination"] == "/queue/agent"
+    assert headers["reply-to-dest"] == "/queue/controller"
+    assert headers["content-type"] == "application/vnd.bbf.usp.msg"
+    assert "ack" not in headers
+    assert body == b"\x0a\x00\x0b"
+
+    agent.close()
+    controller.close()
+    broker.stop()
+
+
+
+def test_prefetch_and_ack():
+    broker = get_broker()
+    agent = RawStompClient(broker.get_port(), "agent")
+    agent.send_frame("SUBSCRIBE", {"id": "1", "destination": "/queue/agent", "ack": "client-individual",
+                                   "prefetch-count": "1"})
+
+    agent.send_frame("SEND", {"destination": "/queue/agent"}, "0")
+    agent.send_frame("SEND", {"destination": "/queue/agent", "receipt": "sent"}, "1")
+
+    command, headers, body = agent.recv_frame()
+    assert command == "MESSAGE"
+    assert body == b"0"
+    assert agent.recv_frame()[0] == "RECEIPT"
+    assert broker.get_queue_depth("/queue/agent") == 1
+
+    agent.send_frame("ACK", {"id": headers["ack"]})
+    command, headers, body = agent.recv_frame()
+    assert body == b"1"
+    assert broker.get_queue_depth("/queue/agent") == 0
+
+    agent.close()
+    broker.stop()
+
+
+
+def test_redelivery_after_disconnect():
+    broker = get_broker()
+    agent1 = RawStompClient(broker.get_port(), "agent")
+    agent1.send_frame("SUBSCRIBE", {"id": "1", "destination": "/queue/agent", "ack": "client-individual"})
+    agent1.send_frame("SEND", {"destination": "/queue/agent"}, "MSG")
+    assert "redelivered" not in agent1.recv_frame()[1]
+    agent1.send_frame("DISCONNECT", {"receipt": "bye"})
+    assert agent1.recv_frame()[0] == "RECEIPT"
+    agent1.close()
+
+    agent2 = RawStompClient(broker.get_port(), "agent")
+    agent2.send_frame("SUBSCRIBE", {"id": "1", "destination": "/queue/agent", "ack": "client-individual"})
+    command, headers, body = agent2.recv_frame()
+
+    assert command == "MESSAGE"
+    assert headers["redelivered"] == "true"
+    assert body == b"MSG"
+
+    agent2.close()
+    broker.stop()
+
+
+
+def test_transaction():
+    broker = get_broker()
+    client = RawStompClient(broker.get_port())
+    client.send_frame("BEGIN", {"transaction": "tx-1"})
+    client.send_frame("SEND", {"destination": "/queue/other", "transaction": "tx-1"}, "MSG1")
+    client.send_frame("SEND", {"destination": "/queue/other", "transaction": "tx-1", "receipt": "r1"}, "MSG2")
+    client.recv_frame()
+    assert broker.get_queue_depth("/queue/other") == 0
+
+    client.send_frame("COMMIT", {"transaction": "tx-1", "receipt": "r2"})
+    client.recv_frame()
+    assert broker.get_queue_depth("/queue/other") == 2
+    assert broker.get_num_msgs_received() == 2
+
+    client.close()
+    broker.stop()
+
+
+
+def test_frame_before_connect():
+    broker = get_broker()
+    sock = socket.create_connection(("127.0.0.1", broker.get_port()), timeout=5)
+    sock.sendall(stomp_frame.encode_frame("SEND", {"destination": "/queue/agent"}, "MSG"))
+    data = sock.recv(4096)
+
+    assert data.startswith(b"ERROR\n")
+
+    sock.close()
+    broker.stop()
@@ -0,0 +1,119 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+"""
+#
+# File Name: test_loopback_usp_binding.py
+#
+# Description: Unit tests for the loopback_usp_binding and loopback_bench modules
+#
+# Functionality: Test the LoopbackUspBinding and LoopbackController Classes and the run_benchmark function
+#
+"""
+
+import os
+import threading
+
+from agent import usp_msg_pb2 as usp_msg
+from agent import loopback_bench
+from agent import loopback_usp_binding
+
+
+DB_DIR = os.path.join(os.path.dirname(__file__), "..", "database")
+
+
+
+def test_get_msg_wakes_up_on_push():
+    binding = loopback_usp_binding.LoopbackUspBinding()
+    timer = threading.Timer(0.05, binding.push, ("PAYLOAD", "ADDR"))
+    timer.start()
+    queue_item = binding.get_msg(5)
+
+    assert queue_item.get_payload() == "PAYLOAD"
+    assert queue_item.get_reply_to_addr() == "ADDR"
+
+
+
+def test_get_msg_timeout():
+    binding = loopback_usp_binding.LoopbackUspBinding()
+
+    assert binding.get_msg(0.05) is None
+
+
+
+def test_controller_round_trip():
+    binding = loopback_usp_binding.LoopbackUspBinding()
+    controller = loopback_usp_binding.LoopbackController(binding, "CONTROLLER-ID", "AGENT-ID")
+    msg_id, serialized_record = controller.build_get(["Device.DeviceInfo."])
+
+    def respond():
+        queue_item = binding.get_msg(5)
+        resp_msg = usp_msg.Msg()
+        resp_msg.header.msg_id = msg_id
+        resp_msg.header.msg_type = usp_msg.Header.GET_RESP
+        binding.send_msg(controller._wrap_in_record(resp_msg), queue_item.get_reply_to_addr())
+
+    responder = threading.Thread(target=respond)
+    responder.start()
+    resp_msg, latency = controller.send_request(msg_id, serialized_record, 5)
+    responder.join()
+
+    assert resp_msg.header.msg_type == usp_msg.Header.GET_RESP
+    assert latency > 0
+
+
+
+def test_run_benchmark():
+    result = loopback_bench.run_benchmark(os.path.join(DB_DIR, "camera-dm.json"),
+                                          os.path.join(DB_DIR, "camera-db.json"), num_requests=30, concurrency=3)
+
+    assert result.get_num_timeouts() == 0
+    assert result.get_num_errors() == 0
+    assert result.get_num_requests() == 30
+    assert result.get_num_requests("get") == 10
+    assert result.get_num_requests("set") == 10
+    assert result.get_num_requests("operate") == 10
+    assert result.get_percentile(50) <= result.get_percentile(90) <= result.get_percentile(99)
+    assert result.get_throughput() > 0
+    assert "req/s" in result.format_report()
+
+
+
+def test_run_benchmark_counts_errors():
+    # The Test Database has no Camera, so every Operate Request gets an Error
+    result = loopback_bench.run_benchmark(os.path.join(DB_DIR, "test-dm.json"), os.path.join(DB_DIR, "test-db.json"),
+                                          num_requests=30, concurrency=3)
+
+    assert result.get_num_timeouts() == 0
+    assert result.get_num_errors() == 10
+    assert result.get_num_requests("get") == 10
+    assert result.get_num_requests("operate") == 0
+    assert "Errors: 10" in result.format_report()
+
+
+
+def test_percentile_nearest_rank():
+    result = loopback_bench.BenchmarkResult(1.0, {"get": [0.004, 0.001, 0.003, 0.002]}, 0)
+
+    assert result.get_percentile(50) == 0.002
+    assert result.get_percentile(99) == 0.004
+    assert result.get_throughput() == 4.0
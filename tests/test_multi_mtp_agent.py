@@ -0,0 +1,90 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+
+"""
+#
+# File Name: test_multi_mtp_agent.py
+#
+# Description: Unit tests for the multi_mtp_agent module
+#
+# Functionality: Test the MultiMtpAgent and MultiMtpValueChangeNotifPoller Classes
+#
+"""
+
+import os
+import shutil
+import tempfile
+import unittest.mock as mock
+
+from agent import multi_mtp_agent
+
+
+def get_agent(tmp_dir, protocol_list):
+    db_file = os.path.join(tmp_dir, "test-db.json")
+    shutil.copyfile("database/test-db.json", db_file)
+    return multi_mtp_agent.MultiMtpAgent("database/test-dm.json", db_file, "lo", protocol_list,
+                                         cfg_file_name=os.path.join(tmp_dir, "agent.json"), websocket_port=0,
+                                         uds_path=os.path.join(tmp_dir, "agent.sock"))
+
+
+
+def test_mtps_share_the_database():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        agent = get_agent(tmp_dir, ["WebSocket", "UDS", "HTTP"])
+
+        try:
+            database = agent.get_database()
+            assert agent.get_protocols() == ["WebSocket", "UDS"]
+
+            # Each MTP enabled its own LocalAgent MTP without disabling the other one
+            for mtp_path in database.find_instances("Device.LocalAgent.MTP."):
+                protocol = database.get(mtp_path + "Protocol")
+                assert database.get(mtp_path + "Enable") == (protocol in ["WebSocket", "UDS"])
+
+            assert database.get("Device.LocalAgent.MTP.5.UDS.Path") == os.path.join(tmp_dir, "agent.sock")
+        finally:
+            agent.clean_up()
+
+
+
+def test_value_change_sent_via_mtp_poller():
+    database = mock.Mock()
+    database.get.return_value = "UDS"
+    stomp_poller = mock.Mock()
+    uds_poller = mock.Mock()
+    uds_binding = mock.Mock()
+    uds_poller._get_route.return_value = (uds_binding, "/tmp/controller.sock")
+    serialized_record = b"RECORD"
+    mtp_path = "Device.LocalAgent.Controller.1.MTP.1."
+
+    poller = multi_mtp_agent.MultiMtpValueChangeNotifPoller(database)
+    poller.add_poller("STOMP", stomp_poller)
+    poller.add_poller("UDS", uds_poller)
+    poller.send_record(serialized_record, "CONTROLLER-ID", mtp_path)
+    poller.send_record(serialized_record, "CONTROLLER-ID", mtp_path)
+
+    # The Protocol of the MTP is only read once
+    database.get.assert_called_once_with(mtp_path + "Protocol")
+    assert stomp_poller._get_route.call_count == 0
+    uds_poller._get_route.assert_called_with("CONTROLLER-ID", mtp_path)
+    assert uds_binding.send_msg.call_args_list == [mock.call(serialized_record, "/tmp/controller.sock")] * 2
@@ -0,0 +1,168 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+#
+# File Name: test_notif_outbox.py
+#
+# Description: Unit tests for the NotificationOutbox
+#
+# Functionality: Test that Notification Records are kept until acknowledged, retried with a
+#                 backoff, evicted when the Outbox is full, and survive a restart
+#
+"""
+
+import os
+import shutil
+import tempfile
+import unittest.mock as mock
+
+from agent import utils
+from agent import notif_outbox
+from agent import value_change_notif_poller
+from agent import usp_msg_pb2 as usp_msg
+from agent import usp_record_pb2 as usp_record
+
+
+
+def test_entry_kept_until_acknowledged():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        outbox = notif_outbox.NotificationOutbox(os.path.join(tmp_dir, "outbox.db"))
+        outbox.add("1", "CONTROLLER-1", "MTP.", "SUB-1", b"RECORD-1")
+        outbox.add("2", "CONTROLLER-1", "MTP.", "SUB-1", b"RECORD-2")
+        assert outbox.get_num_entries() == 2
+
+        # Only the Controller that the Notification was sent to can acknowledge it
+        assert not outbox.acknowledge("1", "CONTROLLER-2")
+        assert outbox.acknowledge("1", "CONTROLLER-1")
+        assert outbox.get_num_entries() == 1
+        outbox.close()
+
+        # The unacknowledged entry is still there after a restart
+        outbox = notif_outbox.NotificationOutbox(os.path.join(tmp_dir, "outbox.db"))
+        assert outbox.get_num_entries() == 1
+        assert outbox.acknowledge("2", "CONTROLLER-1")
+        outbox.close()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+
+def test_same_message_id_replaced():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        outbox = notif_outbox.NotificationOutbox(os.path.join(tmp_dir, "outbox.db"), max_entries=2)
+        outbox.add("1", "CONTROLLER-1", "MTP.", "SUB-1", b"RECORD-1")
+        outbox.add("1", "CONTROLLER-1", "MTP.", "SUB-1", b"RECORD-1")
+        outbox.add("2", "CONTROLLER-1", "MTP.", "SUB-1", b"RECORD-2")
+
+        # Adding the same Message ID again neither counts twice nor causes an eviction
+        assert outbox.get_num_entries() == 2
+        assert outbox.acknowledge("1", "CONTROLLER-1")
+        assert outbox.acknowledge("2", "CONTROLLER-1")
+        assert outbox.get_num_entries() == 0
+        outbox.close()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+
+def test_due_entries_backed_off():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        outbox = notif_outbox.NotificationOutbox(os.path.join(tmp_dir, "outbox.db"), retry_interval=10,
+                                                 max_retry_interval=35)
+
+        with mock.patch("time.time", return_value=1000):
+            outbox.add("1", "CONTROLLER-1", "MTP.", "SUB-1", b"RECORD-1")
+            assert outbox.get_due_entries() == []
+            assert outbox.get_next_attempt_time() == 1010
+
+        with mock.patch("time.time", return_value=1010):
+            assert outbox.get_due_entries() == [("1", "CONTROLLER-1", "MTP.", b"RECORD-1")]
+            assert outbox.get_next_attempt_time() == 1030
+
+        with mock.patch("time.time", return_value=1030):
+            assert len(outbox.get_due_entries()) == 1
+            assert outbox.get_next_attempt_time() == 1065
+
+        outbox.close()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+
+def test_expired_and_oldest_entries_evicted():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        outbox = notif_outbox.NotificationOutbox(os.path.join(tmp_dir, "outbox.db"), max_entries=3)
+
+        with mock.patch("time.time", return_value=1000):
+            outbox.add("1", "CONTROLLER-1", "MTP.", "SUB-1", b"RECORD-1", expiration=60)
+            for msg_id in ["2", "3", "4"]:
+                outbox.add(msg_id, "CONTROLLER-1", "MTP.", "SUB-1", b"RECORD-" + msg_id.encode())
+
+        assert outbox.get_num_entries() == 3
+        assert not outbox.acknowledge("1", "CONTROLLER-1")
+
+        with mock.patch("time.time", return_value=2000):
+            outbox.add("5", "CONTROLLER-1", "MTP.", "SUB-1", b"RECORD-5", expiration=60)
+
+        with mock.patch("time.time", return_value=3000):
+            due_entry_list = outbox.get_due_entries()
+
+        assert [entry[0] for entry in due_entry_list] == ["3", "4"]
+        assert outbox.get_num_entries() == 2
+        outbox.close()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+
+def test_message_ids_increase():
+    msg_id_list = [int(utils.MessageIdHelper.get_message_id()) for _ in range(1000)]
+
+    assert msg_id_list == sorted(set(msg_id_list))
+
+
+
+def test_notif_retry_subscription_uses_outbox():
+    outbox_mock = mock.Mock()
+    poller = value_change_notif_poller.AbstractValueChangeNotifPoller(mock.Mock())
+    poller.send_record = mock.Mock()
+    poller.set_outbox(outbox_mock)
+    poller.set_notif_retry("SUB-1", "CONTROLLER-1", True, 3600)
+
+    poller._handle_value_change("Device.Test.Param", "1", "CONTROLLER-1", "AGENT-ID", "SUB-1", "MTP.")
+    poller._handle_value_change("Device.Test.Param", "1", "CONTROLLER-2", "AGENT-ID", "SUB-2", "MTP.")
+
+    assert poller.send_record.call_count == 2
+    msg_id, to_id, mtp_param_path, subscription_id, serialized_record, expiration = outbox_mock.add.call_args[0]
+    assert (to_id, mtp_param_path, subscription_id, expiration) == ("CONTROLLER-1", "MTP.", "SUB-1", 3600)
+    assert serialized_record == poller.send_record.call_args_list[0][0][0]
+
+    sent_msg = usp_msg.Msg()
+    sent_record = usp_record.Record()
+    sent_record.ParseFromString(serialized_record)
+    sent_msg.ParseFromString(sent_record.no_session_context.payload)
+    assert sent_msg.header.msg_id == msg_id
+    assert sent_msg.body.request.notify.send_resp
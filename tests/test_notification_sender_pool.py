@@ -0,0 +1,128 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+#
+# File Name: test_notification_sender_pool.py
+#
+# Description: Unit tests for the NotificationSenderPool
+#
+# Functionality: Test that queued Notifications are sent by the worker Threads, that an
+#                 unreachable Destination is retried with a backoff, and that the queue is bounded
+#
+"""
+
+import time
+import threading
+import unittest.mock as mock
+
+from agent import notify
+from agent import notif_sender_pool
+
+
+class FakeNotificationSender(notif_sender_pool.NotificationSender):
+    """A Notification Sender whose address can't be retrieved for the first num_failures attempts"""
+    def __init__(self, binding, to_id, num_failures=0):
+        notif = notify.PeriodicNotification("AGENT-ID", to_id, "SUB-1", "Device.LocalAgent.Controller.1.")
+        notif_sender_pool.NotificationSender.__init__(self, notif, binding)
+        self.num_failures = num_failures
+        self.attempt_time_list = []
+
+    def _retrieve_to_addr(self):
+        self.attempt_time_list.append(time.time())
+        if len(self.attempt_time_list) <= self.num_failures:
+            return None
+
+        return "ADDR-" + self.get_destination()
+
+
+def wait_for(condition, timeout=5):
+    wait_until = time.time() + timeout
+    while not condition() and time.time() < wait_until:
+        time.sleep(0.01)
+
+    return condition()
+
+
+
+def test_notifications_sent_by_workers():
+    binding = mock.Mock()
+    pool = notif_sender_pool.NotificationSenderPool(num_workers=2)
+    num_threads = threading.active_count()
+    pool.start()
+
+    for num in range(100):
+        assert pool.send(FakeNotificationSender(binding, "CONTROLLER-" + str(num)))
+
+    assert wait_for(lambda: binding.send_msg.call_count == 100)
+    assert threading.active_count() == num_threads + 2
+    assert set(call[0][1] for call in binding.send_msg.call_args_list) == \
+        set("ADDR-CONTROLLER-" + str(num) for num in range(100))
+
+
+
+def test_unreachable_destination_backs_off():
+    binding = mock.Mock()
+    pool = notif_sender_pool.NotificationSenderPool(num_workers=2, num_retries=3, retry_interval=0.05)
+    notif_sender = FakeNotificationSender(binding, "CONTROLLER-1", num_failures=2)
+    other_sender = FakeNotificationSender(binding, "CONTROLLER-1")
+    pool.start()
+
+    pool.send(notif_sender)
+    assert wait_for(lambda: notif_sender.attempt_time_list)
+
+    # The other Notification for the same Destination waits for the backoff
+    pool.send(other_sender)
+    assert wait_for(lambda: binding.send_msg.call_count == 2)
+
+    attempt_time_list = notif_sender.attempt_time_list
+    assert len(attempt_time_list) == 3
+    assert attempt_time_list[1] - attempt_time_list[0] >= 0.05
+    assert other_sender.attempt_time_list[0] - attempt_time_list[0] >= 0.05
+
+
+
+def test_notification_dropped_after_retries():
+    binding = mock.Mock()
+    pool = notif_sender_pool.NotificationSenderPool(num_workers=1, num_retries=2, retry_interval=0.02)
+    notif_sender = FakeNotificationSender(binding, "CONTROLLER-1", num_failures=10)
+    pool.start()
+
+    pool.send(notif_sender)
+    assert wait_for(lambda: len(notif_sender.attempt_time_list) == 3)
+    time.sleep(0.2)
+
+    # The backoff doubles with each failure
+    attempt_time_list = notif_sender.attempt_time_list
+    assert len(attempt_time_list) == 3
+    assert attempt_time_list[1] - attempt_time_list[0] >= 0.02
+    assert attempt_time_list[2] - attempt_time_list[1] >= 0.04
+    assert binding.send_msg.call_count == 0
+
+
+
+def test_full_queue_drops_notification():
+    binding = mock.Mock()
+    pool = notif_sender_pool.NotificationSenderPool(max_queue_size=2)
+
+    assert pool.send(FakeNotificationSender(binding, "CONTROLLER-1"))
+    assert pool.send(FakeNotificationSender(binding, "CONTROLLER-2"))
+    assert not pool.send(FakeNotificationSender(binding, "CONTROLLER-3"))
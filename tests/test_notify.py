@@ -0,0 +1,119 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+#
+# File Name: test_notify.py
+#
+# Description: Unit tests for the Notifications
+#
+# Functionality: Test that the Records built from a NotificationTemplate match the ones
+#                 built by the Notification classes
+#
+"""
+
+from agent import notify
+from agent import usp_msg_pb2 as usp_msg
+from agent import usp_record_pb2 as usp_record
+
+
+def parse_record(serialized_record):
+    record = usp_record.Record()
+    record.ParseFromString(serialized_record)
+    msg = usp_msg.Msg()
+    msg.ParseFromString(record.no_session_context.payload)
+    return record, msg
+
+
+def assert_same_notification(template_record, template_msg_id, notif):
+    notif_msg = notif.generate_notif_msg()
+    notif_record = notif.wrap_notif_in_record(notif_msg)
+    record, msg = parse_record(template_record)
+
+    assert msg.header.msg_id == template_msg_id
+    notif_msg.header.msg_id = template_msg_id
+    assert msg == notif_msg
+
+    record.no_session_context.payload = b""
+    notif_record.no_session_context.payload = b""
+    assert record == notif_record
+
+
+
+def test_value_change_template():
+    notif_template = notify.NotificationTemplate("AGENT-ID", "CONTROLLER-ID", "SUB-1", send_resp=True)
+    notif = notify.ValueChangeNotification("AGENT-ID", "CONTROLLER-ID", "SUB-1", "Device.Test.Param", 42)
+    notif.set_send_resp(True)
+
+    msg_id, serialized_record = notif_template.generate_value_change_record("Device.Test.Param", 42)
+    assert_same_notification(serialized_record, msg_id, notif)
+
+    # Each Record gets its own msg_id and value
+    next_msg_id, serialized_record = notif_template.generate_value_change_record("Device.Test.Other", "abc")
+    _, msg = parse_record(serialized_record)
+    assert next_msg_id != msg_id
+    assert msg.body.request.notify.value_change.param_path == "Device.Test.Other"
+    assert msg.body.request.notify.value_change.param_value == "abc"
+
+
+
+def test_periodic_template():
+    notif_template = notify.NotificationTemplate("AGENT-ID", "CONTROLLER-ID", "SUB-2")
+    notif = notify.PeriodicNotification("AGENT-ID", "CONTROLLER-ID", "SUB-2", "Device.LocalAgent.Controller.1.")
+
+    msg_id, serialized_record = notif_template.generate_periodic_record()
+    assert_same_notification(serialized_record, msg_id, notif)
+
+
+
+def test_object_creation_and_deletion_templates():
+    obj_path = "Device.Services.HomeAutomation.1.Camera.1.Pic.3."
+    notif_template = notify.NotificationTemplate("AGENT-ID", "CONTROLLER-ID", "SUB-3")
+
+    msg_id, serialized_record = notif_template.generate_obj_creation_record(obj_path, {"Alias": "pic-3"})
+    notif = notify.ObjectCreationNotification("AGENT-ID", "CONTROLLER-ID", "SUB-3", obj_path, {"Alias": "pic-3"})
+    assert_same_notification(serialized_record, msg_id, notif)
+
+    msg_id, serialized_record = notif_template.generate_obj_deletion_record(obj_path)
+    notif = notify.ObjectDeletionNotification("AGENT-ID", "CONTROLLER-ID", "SUB-3", obj_path)
+    assert_same_notification(serialized_record, msg_id, notif)
+
+
+
+def test_operation_complete_template():
+    command = "Device.Services.HomeAutomation.1.Camera.1.TakePicture()"
+    notif_template = notify.NotificationTemplate("AGENT-ID", "CONTROLLER-ID", "SUB-4")
+
+    msg_id, serialized_record = notif_template.generate_oper_complete_record(command, "KEY-1", {"URL": "http://pic"})
+    notif = notify.OperationCompleteNotification("AGENT-ID", "CONTROLLER-ID", "SUB-4", command, "KEY-1",
+                                                 {"URL": "http://pic"})
+    assert_same_notification(serialized_record, msg_id, notif)
+
+    _, msg = parse_record(serialized_record)
+    assert msg.body.request.notify.oper_complete.obj_path == "Device.Services.HomeAutomation.1.Camera.1."
+    assert msg.body.request.notify.oper_complete.command_name == "TakePicture()"
+
+    msg_id, serialized_record = notif_template.generate_oper_complete_record(command, "KEY-2",
+                                                                             cmd_failure=(9000, "No Camera"))
+    notif = notify.OperationCompleteNotification("AGENT-ID", "CONTROLLER-ID", "SUB-4", command, "KEY-2",
+                                                 cmd_failure=(9000, "No Camera"))
+    assert_same_notification(serialized_record, msg_id, notif)
+
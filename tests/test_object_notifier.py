@@ -0,0 +1,144 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+#
+# File Name: test_object_notifier.py
+#
+# Description: Unit tests for the ObjectNotifier
+#
+# Functionality: Test that Database inserts/deletes drive ObjectCreation/ObjectDeletion Notifications,
+#                 that completed Commands drive OperationComplete Notifications, and that a failed
+#                 Notification doesn't stop the Notifier
+#
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest.mock as mock
+
+from agent import notify
+from agent import agent_db
+from agent import object_notifier
+from agent import usp_msg_pb2 as usp_msg
+from agent import usp_record_pb2 as usp_record
+
+
+def get_poller_mock(num_notifs):
+    poller_mock = mock.Mock()
+    poller_mock.sent_list = []
+    poller_mock.sent_event = threading.Event()
+
+    def send_notif_record(msg_id, serialized_record, to_id, subscription_id, mtp_param_path):
+        record = usp_record.Record()
+        record.ParseFromString(serialized_record)
+        msg = usp_msg.Msg()
+        msg.ParseFromString(record.no_session_context.payload)
+        poller_mock.sent_list.append((msg.body.request.notify, to_id, mtp_param_path))
+        if len(poller_mock.sent_list) >= num_notifs:
+            poller_mock.sent_event.set()
+
+    poller_mock.get_notif_template.side_effect = notify.NotificationTemplate
+    poller_mock.send_notif_record.side_effect = send_notif_record
+    return poller_mock
+
+
+
+def test_insert_and_delete_send_object_notifs():
+    pic_path = "Device.Services.HomeAutomation.1.Camera.1.Pic."
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, "camera-db.json")
+        shutil.copyfile("database/camera-db.json", db_file)
+        database = agent_db.Database("database/camera-dm.json", db_file, "lo")
+        poller_mock = get_poller_mock(2)
+        notifier = object_notifier.ObjectNotifier(database, poller_mock)
+
+        notifier.add_subscriber("ObjectCreation", pic_path, "AGENT-ID", "CONTROLLER-ID", "MTP.", "SUB-1")
+        notifier.add_subscriber("ObjectDeletion", "Device.Services.HomeAutomation.*.Camera.*.Pic.",
+                                "AGENT-ID", "CONTROLLER-ID", "MTP.", "SUB-2")
+        notifier.start()
+
+        inst_path = pic_path + str(database.insert(pic_path)) + "."
+        database.delete(inst_path)
+        assert poller_mock.sent_event.wait(5)
+
+        creation_notif, to_id, mtp_param_path = poller_mock.sent_list[0]
+        assert creation_notif.subscription_id == "SUB-1"
+        assert creation_notif.obj_creation.obj_path == inst_path
+        assert (to_id, mtp_param_path) == ("CONTROLLER-ID", "MTP.")
+
+        deletion_notif, _, _ = poller_mock.sent_list[1]
+        assert deletion_notif.subscription_id == "SUB-2"
+        assert deletion_notif.obj_deletion.obj_path == inst_path
+
+        # Once the Subscriber is removed, inserts are no longer notified
+        notifier.remove_subscriber("ObjectCreation", pic_path, "CONTROLLER-ID", "MTP.", "SUB-1")
+        database.insert(pic_path)
+        notifier.queue_operation_complete("Device.Test()", "KEY-1")
+        assert len(poller_mock.sent_list) == 2
+
+
+
+def test_operation_complete_sent_to_command_subscribers():
+    command = "Device.Services.HomeAutomation.1.Camera.1.TakePicture()"
+    poller_mock = get_poller_mock(1)
+    notifier = object_notifier.ObjectNotifier(mock.Mock(), poller_mock)
+
+    notifier.add_subscriber("OperationComplete", "Device.Services.HomeAutomation.1.Camera.*.TakePicture()",
+                            "AGENT-ID", "CONTROLLER-ID", "MTP.", "SUB-1")
+    notifier.add_subscriber("OperationComplete", "Device.Services.HomeAutomation.1.Camera.1.Reboot()",
+                            "AGENT-ID", "CONTROLLER-ID", "MTP.", "SUB-2")
+    notifier.start()
+
+    notifier.queue_operation_complete(command, "KEY-1", {"URL": "http://pic"})
+    assert poller_mock.sent_event.wait(5)
+
+    oper_complete_notif, _, _ = poller_mock.sent_list[0]
+    assert len(poller_mock.sent_list) == 1
+    assert oper_complete_notif.subscription_id == "SUB-1"
+    assert oper_complete_notif.oper_complete.obj_path == "Device.Services.HomeAutomation.1.Camera.1."
+    assert oper_complete_notif.oper_complete.command_name == "TakePicture()"
+    assert oper_complete_notif.oper_complete.command_key == "KEY-1"
+
+
+
+def test_failed_notif_does_not_stop_notifier():
+    command = "Device.Services.HomeAutomation.1.Camera.1.TakePicture()"
+    poller_mock = get_poller_mock(1)
+    send_notif_record = poller_mock.send_notif_record.side_effect
+
+    def fail_once(*args):
+        poller_mock.send_notif_record.side_effect = send_notif_record
+        raise RuntimeError("send failed")
+
+    poller_mock.send_notif_record.side_effect = fail_once
+    notifier = object_notifier.ObjectNotifier(mock.Mock(), poller_mock)
+
+    notifier.add_subscriber("OperationComplete", command, "AGENT-ID", "CONTROLLER-ID", "MTP.", "SUB-1")
+    notifier.start()
+
+    # The Notification queued behind the failed one is still sent
+    notifier.queue_operation_complete(command, "KEY-1")
+    notifier.queue_operation_complete(command, "KEY-2")
+    assert poller_mock.sent_event.wait(5)
+    assert poller_mock.sent_list[0][0].oper_complete.command_key == "KEY-2"
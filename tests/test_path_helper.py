@@ -118,3 +118,25 @@ def test_error_path_instead_of_path_parts():
     path = "Device.Object.Table.1.Parameter"
     built_path = utils.PathHelper.build_path_from_parts(path, 1)
     assert built_path == ""
+
+
+def test_is_path_overlap():
+    assert utils.PathHelper.is_path_overlap("Device.Sensor.*.", "Device.Sensor.3.")
+    assert utils.PathHelper.is_path_overlap("Device.Sensor.*.Value", "Device.Sensor.3.")
+    assert utils.PathHelper.is_path_overlap("Device.", "Device.Sensor.3.")
+    assert not utils.PathHelper.is_path_overlap("Device.Sensor.1.", "Device.Sensor.3.")
+    assert not utils.PathHelper.is_path_overlap("Device.Camera.*.", "Device.Sensor.3.")
+
+
+def test_is_table_instance():
+    assert utils.PathHelper.is_table_instance("Device.Sensor.", "Device.Sensor.3.")
+    assert utils.PathHelper.is_table_instance("Device.*.Sensor.", "Device.2.Sensor.3.")
+    assert not utils.PathHelper.is_table_instance("Device.Sensor.", "Device.Sensor.3.Reading.1.")
+    assert not utils.PathHelper.is_table_instance("Device.Sensor.", "Device.Camera.3.")
+
+
+def test_is_same_path():
+    assert utils.PathHelper.is_same_path("Device.Camera.*.TakePicture()", "Device.Camera.1.TakePicture()")
+    assert utils.PathHelper.is_same_path("Device.Camera.1.TakePicture()", "Device.Camera.1.TakePicture()")
+    assert not utils.PathHelper.is_same_path("Device.Camera.*.TakePicture()", "Device.Camera.1.Reset()")
+    assert not utils.PathHelper.is_same_path("Device.Camera.*.TakePicture()", "Device.Camera.1.Lens.TakePicture()")
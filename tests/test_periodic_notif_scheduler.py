@@ -0,0 +1,169 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+#
+# File Name: test_periodic_notif_scheduler.py
+#
+# Description: Unit tests for the PeriodicNotifScheduler and AbstractPeriodicNotifHandler
+#
+# Functionality: Test that Periodic Notifications are aligned to PeriodicNotifTime, and that
+#                 one Thread issues them and reschedules them when the interval changes
+#
+"""
+
+import time
+import threading
+import unittest.mock as mock
+
+from agent import utils
+from agent import abstract_agent
+from agent import periodic_notif_scheduler
+
+
+class RecordingHandler(abstract_agent.AbstractPeriodicNotifHandler):
+    """Record the Periodic Notification Records instead of sending them"""
+    def __init__(self, database, name):
+        abstract_agent.AbstractPeriodicNotifHandler.__init__(self, database, name, "AGENT-ID", "CONTROLLER-ID",
+                                                             "SUB-" + name, "Device.LocalAgent.Controller.1.")
+        self.notif_time_list = []
+        self.notif_event = threading.Event()
+
+    def _handle_periodic_record(self, notif_record):
+        self.notif_time_list.append(time.time())
+        self.notif_event.set()
+        return True
+
+
+def get_db_mock(value_dict):
+    db_mock = mock.Mock()
+    db_mock.get.side_effect = lambda path: value_dict[path]
+    return db_mock
+
+
+
+def test_get_str_as_time():
+    assert utils.TimeHelper.get_str_as_time("1970-01-01T00:01:00Z") == 60
+    assert utils.TimeHelper.get_str_as_time("1970-01-01T00:01:00-06:00") == 60 + 6 * 3600
+    assert utils.TimeHelper.get_str_as_time("0001-01-01T00:00:00Z") is None
+    assert utils.TimeHelper.get_str_as_time("not a time") is None
+
+
+
+def test_next_notif_time_aligned_to_reference():
+    value_dict = {"Device.LocalAgent.Controller.1.PeriodicNotifInterval": 60,
+                  "Device.LocalAgent.Controller.1.PeriodicNotifTime": "1970-01-01T00:00:30Z"}
+    handler = RecordingHandler(get_db_mock(value_dict), "1")
+
+    assert handler.get_next_notif_time(1000) == (1050, 60)
+    assert handler.get_next_notif_time(1050) == (1110, 60)
+
+    value_dict["Device.LocalAgent.Controller.1.PeriodicNotifTime"] = "0001-01-01T00:00:00Z"
+    assert handler.get_next_notif_time(1000) == (1060, 60)
+
+    value_dict["Device.LocalAgent.Controller.1.PeriodicNotifInterval"] = 0
+    assert handler.get_next_notif_time(1000) == (None, 0)
+
+
+
+def test_one_thread_issues_all_notifications():
+    value_dict = {"Device.LocalAgent.Controller.1.PeriodicNotifInterval": 3600,
+                  "Device.LocalAgent.Controller.1.PeriodicNotifTime": "0001-01-01T00:00:00Z"}
+    db_mock = get_db_mock(value_dict)
+    scheduler = periodic_notif_scheduler.PeriodicNotifScheduler(db_mock)
+    scheduler.daemon = True
+    update_listener = db_mock.add_update_listener.call_args[0][0]
+    handler_list = [RecordingHandler(db_mock, str(num)) for num in range(50)]
+    num_threads = threading.active_count()
+
+    for handler in handler_list:
+        scheduler.add_handler(handler)
+    scheduler.start()
+
+    time.sleep(0.1)
+    assert threading.active_count() == num_threads + 1
+    assert not any(handler.notif_time_list for handler in handler_list)
+
+    # Shortening the interval takes effect immediately, instead of after the hour already scheduled
+    value_dict["Device.LocalAgent.Controller.1.PeriodicNotifInterval"] = 1
+    update_listener("Device.LocalAgent.Controller.1.PeriodicNotifInterval", 1)
+
+    for handler in handler_list:
+        assert handler.notif_event.wait(5)
+
+    scheduler.remove_handler(handler_list[0])
+    num_notifs = len(handler_list[0].notif_time_list)
+    time.sleep(1.5)
+    assert len(handler_list[0].notif_time_list) == num_notifs
+    assert len(handler_list[1].notif_time_list) >= 2
+
+
+
+def test_no_drift_with_unknown_time():
+    value_dict = {"Device.LocalAgent.Controller.1.PeriodicNotifInterval": 1,
+                  "Device.LocalAgent.Controller.1.PeriodicNotifTime": "0001-01-01T00:00:00Z"}
+    db_mock = get_db_mock(value_dict)
+    scheduler = periodic_notif_scheduler.PeriodicNotifScheduler(db_mock, max_jitter=0.05)
+    scheduler.daemon = True
+    handler = RecordingHandler(db_mock, "1")
+    slow_send = handler._handle_periodic_record
+
+    def send_slowly(notif_record):
+        time.sleep(0.3)
+        return slow_send(notif_record)
+
+    handler._handle_periodic_record = send_slowly
+    start_time = time.time()
+    scheduler.add_handler(handler)
+    scheduler.start()
+
+    while len(handler.notif_time_list) < 3:
+        assert handler.notif_event.wait(5)
+        handler.notif_event.clear()
+
+    # Each Notification is due an interval after the previous due time, not after the previous send finished
+    assert handler.notif_time_list[2] - start_time < 3.3 + 0.2
+
+
+
+def test_send_failure_keeps_handler():
+    value_dict = {"Device.LocalAgent.Controller.1.PeriodicNotifInterval": 1,
+                  "Device.LocalAgent.Controller.1.PeriodicNotifTime": "0001-01-01T00:00:00Z"}
+    db_mock = get_db_mock(value_dict)
+    scheduler = periodic_notif_scheduler.PeriodicNotifScheduler(db_mock)
+    scheduler.daemon = True
+    handler = RecordingHandler(db_mock, "1")
+    record_send = handler._handle_periodic_record
+    failure_list = [RuntimeError("Binding Failure")]
+
+    def fail_once(notif_record):
+        if failure_list:
+            raise failure_list.pop()
+        return record_send(notif_record)
+
+    handler._handle_periodic_record = fail_once
+    scheduler.add_handler(handler)
+    scheduler.start()
+
+    # The first send fails, but the Handler is rescheduled and sends again an interval later
+    assert handler.notif_event.wait(5)
+    assert not failure_list
+    assert len(handler.notif_time_list) == 1
@@ -0,0 +1,104 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+"""
+#
+# File Name: test_record_header.py
+#
+# Description: Unit tests for the record_header module
+#
+# Functionality: Test the peek_record_header function and the RecordHeaderValidator Class
+#
+"""
+
+from agent import record_header
+from agent import usp_record_pb2 as usp_record
+
+
+def get_record(to_id="ENDPOINT-ID", from_id="CONTROLLER-ID"):
+    record = usp_record.Record()
+    record.version = "1.0"
+    record.to_id = to_id
+    record.from_id = from_id
+    record.payload_security = usp_record.Record.PLAINTEXT
+    record.no_session_context.payload = b"\x0a\x05" + b"x" * 500
+    return record
+
+
+
+def test_peek_record_header():
+    header = record_header.peek_record_header(get_record().SerializeToString())
+
+    assert header.version == "1.0"
+    assert header.to_id == "ENDPOINT-ID"
+    assert header.from_id == "CONTROLLER-ID"
+    assert header.payload_security == record_header.PLAINTEXT
+    assert header.record_type == "no_session_context"
+
+
+
+def test_peek_record_header_session_context():
+    record = get_record()
+    record.payload_security = usp_record.Record.TLS12
+    record.session_context.session_id = 300
+    header = record_header.peek_record_header(record.SerializeToString())
+
+    assert header.payload_security == usp_record.Record.TLS12
+    assert header.record_type == "session_context"
+
+
+
+def test_peek_record_header_truncated():
+    serialized_record = get_record().SerializeToString()
+
+    try:
+        record_header.peek_record_header(serialized_record[:-10])
+        assert False, "MalformedRecordError Expected"
+    except record_header.MalformedRecordError:
+        pass
+
+
+
+def test_validate_valid_record():
+    validator = record_header.RecordHeaderValidator("ENDPOINT-ID")
+
+    header = validator.validate(get_record().SerializeToString())
+    assert header is not None
+    assert header.to_id == "ENDPOINT-ID"
+    assert header.from_id == "CONTROLLER-ID"
+
+
+
+def test_validate_invalid_records():
+    validator = record_header.RecordHeaderValidator("ENDPOINT-ID")
+    no_version_record = get_record()
+    no_version_record.version = ""
+    tls_record = get_record()
+    tls_record.payload_security = usp_record.Record.TLS12
+    no_payload_record = get_record()
+    no_payload_record.ClearField("no_session_context")
+
+    assert validator.validate(get_record(to_id="OTHER-ID").SerializeToString()) is None, "Wrong to_id"
+    assert validator.validate(get_record(from_id="").SerializeToString()) is None, "Missing from_id"
+    assert validator.validate(no_version_record.SerializeToString()) is None, "Missing version"
+    assert validator.validate(tls_record.SerializeToString()) is None, "Unsupported Payload Security"
+    assert validator.validate(no_payload_record.SerializeToString()) is None, "Missing Record Type"
+    assert validator.validate(b"\xff\xff\xff") is None, "Malformed Record"
@@ -25,10 +25,16 @@ SOFTWARE.
 #
 """
 
+import os
+import shutil
+import tempfile
+import threading
 import unittest.mock as mock
 
 from agent import agent_db
 from agent import request_handler
+from agent import usp_msg_pb2 as usp_msg
+from agent import usp_record_pb2 as usp_record
 
 
 """
@@ -260,3 +266,130 @@ def test_get_affected_paths_for_get_three_layers():
         affected_path_list = req_handler._get_affected_paths_for_get(partial_path)
 
     assert len(affected_path_list) == 5, "expecting 5, found " + str(len(affected_path_list))
+
+
+"""
+ Tests for NotifyResp handling
+"""
+
+def test_notify_resp_sent_to_listener():
+    endpoint_id = "ENDPOINT-ID"
+    listener_mock = mock.Mock()
+    req_handler = request_handler.UspRequestHandler(endpoint_id, mock.Mock())
+    req_handler.set_notify_resp_listener(listener_mock)
+
+    notify_resp_msg = usp_msg.Msg()
+    notify_resp_msg.header.msg_id = "1234"
+    notify_resp_msg.header.msg_type = usp_msg.Header.NOTIFY_RESP
+    notify_resp_msg.body.response.notify_resp.subscription_id = "SUB-1"
+
+    notify_resp_record = usp_record.Record()
+    notify_resp_record.version = "1.0"
+    notify_resp_record.to_id = endpoint_id
+    notify_resp_record.from_id = "CONTROLLER-ID"
+    notify_resp_record.payload_security = usp_record.Record.PLAINTEXT
+    notify_resp_record.no_session_context.payload = notify_resp_msg.SerializeToString()
+
+    req_msg, _, resp_msg, serialized_resp_record = \
+        req_handler.handle_request(notify_resp_record.SerializeToString())
+
+    assert req_msg.header.msg_id == "1234"
+    assert resp_msg is None and serialized_resp_record is None
+    listener_mock.assert_called_once_with("1234", "CONTROLLER-ID")
+
+
+
+"""
+ Tests for asynchronous Operate handling
+"""
+
+def get_operate_record(endpoint_id, command):
+    operate_msg = usp_msg.Msg()
+    operate_msg.header.msg_id = "5678"
+    operate_msg.header.msg_type = usp_msg.Header.OPERATE
+    operate_msg.body.request.operate.command = command
+    operate_msg.body.request.operate.command_key = "KEY-1"
+
+    operate_record = usp_record.Record()
+    operate_record.version = "1.0"
+    operate_record.to_id = endpoint_id
+    operate_record.from_id = "CONTROLLER-ID"
+    operate_record.payload_security = usp_record.Record.PLAINTEXT
+    operate_record.no_session_context.payload = operate_msg.SerializeToString()
+
+    return operate_record
+
+
+def test_operate_completes_asynchronously():
+    endpoint_id = "ENDPOINT-ID"
+    command = request_handler.TAKE_PICTURE_CAMERA_OP
+    picture_event = threading.Event()
+    complete_event = threading.Event()
+    camera_mock = mock.Mock()
+    camera_mock.take_picture.side_effect = lambda: picture_event.wait(5) and {"URL": "http://pic"}
+    listener_mock = mock.Mock(side_effect=lambda *args: complete_event.set())
+
+    operate_record = get_operate_record(endpoint_id, command)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, "camera-db.json")
+        shutil.copyfile("database/camera-db.json", db_file)
+        my_db = agent_db.Database("database/camera-dm.json", db_file, "lo")
+        req_handler = request_handler.UspRequestHandler(endpoint_id, my_db, {"RPi_Camera": camera_mock})
+        req_handler.set_operation_complete_listener(listener_mock)
+        delete_event = threading.Event()
+        my_db.add_delete_listener(lambda instance_path: delete_event.set())
+
+        # The OperateResp is sent while the Command is still running
+        _, _, resp_msg, _ = req_handler.handle_request(operate_record.SerializeToString())
+        op_result = resp_msg.body.response.operate_resp.operation_results[0]
+        assert op_result.executed_command == command
+        assert op_result.req_obj_path == "Device.LocalAgent.Request.1."
+        assert my_db.get("Device.LocalAgent.Request.1.Originator") == "CONTROLLER-ID"
+        assert my_db.get("Device.LocalAgent.Request.1.Status") == "Active"
+        assert not listener_mock.called
+
+        # Once the Command completes, its output is reported and its Request object removed
+        picture_event.set()
+        assert complete_event.wait(5)
+        listener_mock.assert_called_once_with(command, "KEY-1", {"URL": "http://pic"}, None)
+        assert delete_event.wait(5)
+        assert my_db.get("Device.LocalAgent.RequestNumberOfEntries") == 0
+
+
+
+def test_request_removed_when_listener_fails():
+    endpoint_id = "ENDPOINT-ID"
+    camera_mock = mock.Mock()
+    camera_mock.take_picture.return_value = {"URL": "http://pic"}
+    listener_mock = mock.Mock(side_effect=RuntimeError("listener failed"))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, "camera-db.json")
+        shutil.copyfile("database/camera-db.json", db_file)
+        my_db = agent_db.Database("database/camera-dm.json", db_file, "lo")
+        req_handler = request_handler.UspRequestHandler(endpoint_id, my_db, {"RPi_Camera": camera_mock})
+        req_handler.set_operation_complete_listener(listener_mock)
+        delete_event = threading.Event()
+        my_db.add_delete_listener(lambda instance_path: delete_event.set())
+
+        req_handler.handle_request(get_operate_record(endpoint_id, request_handler.TAKE_PICTURE_CAMERA_OP)
+                                   .SerializeToString())
+
+        # The Request object is removed even though reporting the completion failed
+        assert delete_event.wait(5)
+        assert listener_mock.called
+        assert my_db.get("Device.LocalAgent.RequestNumberOfEntries") == 0
+
+
+
+def test_operation_worker_survives_failure():
+    done_event = threading.Event()
+    worker = request_handler.OperationWorker()
+    worker.start()
+
+    worker.submit(mock.Mock(side_effect=RuntimeError("operation failed")))
+    worker.submit(done_event.set)
+
+    # The Operation queued behind the failed one still runs
+    assert done_event.wait(5)
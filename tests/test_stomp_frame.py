@@ -0,0 +1,117 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+"""
+#
+# File Name: test_stomp_frame.py
+#
+# Description: Unit tests for the stomp_frame module and the StompOutboundBatcher
+#
+# Functionality: Test the STOMP Frame encoding and the batching of outgoing SEND Frames
+#
+"""
+
+import unittest.mock as mock
+
+from agent import stomp_frame
+from agent import stomp_usp_binding
+
+
+
+def test_escape_header_value():
+    assert stomp_frame.escape_header_value("a:b\nc\rd\\e") == "a\\cb\\nc\\rd\\\\e"
+
+
+
+def test_encode_send_frame():
+    body = b"\x0a\x00\x0b"
+    frame = stomp_frame.encode_send_frame("/queue/ctrl", body, "application/vnd.bbf.usp.msg",
+                                          {"reply-to-dest": "/queue/agent"})
+    head, sent_body = frame.split(b"\n\n", 1)
+    head_lines = head.decode("utf-8").split("\n")
+
+    assert head_lines[0] == "SEND"
+    assert "destination:/queue/ctrl" in head_lines
+    assert "content-type:application/vnd.bbf.usp.msg" in head_lines
+    assert "reply-to-dest:/queue/agent" in head_lines
+    assert "content-length:3" in head_lines
+    assert sent_body == body + b"\x00"
+
+
+
+def test_encode_send_frame_transaction():
+    frame = stomp_frame.encode_send_frame("/queue/ctrl", b"x", "text/plain", transaction="tx-1")
+
+    assert b"\ntransaction:tx-1\n" in frame
+
+
+
+def test_batcher_coalesces_frames():
+    conn = mock.Mock()
+    listener = mock.Mock()
+    conn.transport.listeners = {"defaultListener": listener}
+    batcher = stomp_usp_binding.StompOutboundBatcher(conn, flush_window=10, max_frames=3)
+    batcher.start()
+
+    for index in range(3):
+        batcher.add_frame("/queue/ctrl", b"msg" + str(index).encode("utf-8"), "text/plain", {})
+
+    batcher.stop()
+
+    assert conn.transport.send.call_count == 1
+    sent_data = conn.transport.send.call_args[0][0]
+    assert sent_data.count(b"SEND\n") == 3
+    assert sent_data.index(b"msg0") < sent_data.index(b"msg1") < sent_data.index(b"msg2")
+
+    # The Connection Listeners see each SEND Frame, as they would through Connection.send
+    assert [call[0][0].cmd for call in listener.on_send.call_args_list] == ["SEND"] * 3
+    assert [call[0][0].body for call in listener.on_send.call_args_list] == [b"msg0", b"msg1", b"msg2"]
+    assert listener.on_send.call_args[0][0].headers["destination"] == "/queue/ctrl"
+
+
+
+def test_batcher_transaction():
+    conn = mock.Mock()
+    conn.transport.listeners = {}
+    batcher = stomp_usp_binding.StompOutboundBatcher(conn, flush_window=10, max_frames=2, use_transaction=True)
+    batcher.start()
+    batcher.add_frame("/queue/ctrl", b"msg1", "text/plain", {})
+    batcher.add_frame("/queue/ctrl", b"msg2", "text/plain", {})
+    batcher.stop()
+
+    sent_data = conn.transport.send.call_args[0][0]
+    assert sent_data.startswith(b"BEGIN\ntransaction:usp-batch-1\n")
+    assert sent_data.count(b"transaction:usp-batch-1\n") == 4
+    assert sent_data.rstrip(b"\x00").rsplit(b"\x00", 1)[1].startswith(b"COMMIT\n")
+
+
+
+def test_batcher_max_bytes():
+    conn = mock.Mock()
+    conn.transport.listeners = {}
+    batcher = stomp_usp_binding.StompOutboundBatcher(conn, flush_window=0.01, max_bytes=10)
+    batcher.start()
+    batcher.add_frame("/queue/ctrl", b"x" * 8, "text/plain", {})
+    batcher.add_frame("/queue/ctrl", b"y" * 8, "text/plain", {})
+    batcher.stop()
+
+    assert conn.transport.send.call_count == 2
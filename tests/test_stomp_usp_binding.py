@@ -0,0 +1,283 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+"""
+#
+# File Name: test_stomp_usp_binding.py
+#
+# Description: Unit tests for the stomp_usp_binding module
+#
+# Functionality: Test the re-connect and outbound buffer behavior of the StompUspBinding Class
+#
+"""
+
+import time
+import unittest.mock as mock
+
+from agent import stomp_usp_binding
+
+
+
+def get_binding(conn_mock, status_list, **kwargs):
+    with mock.patch("stomp.Connection12", return_value=conn_mock):
+        binding = stomp_usp_binding.StompUspBinding("ENDPOINT-ID", reconnect_min_delay=60,
+                                                    status_callback=status_list.append, **kwargs)
+    return binding
+
+
+
+def test_connect_status():
+    status_list = []
+    conn_mock = mock.Mock()
+    binding = get_binding(conn_mock, status_list)
+    binding.listen("/queue/agent")
+
+    assert binding.is_connected()
+    assert status_list == ["Connecting", "Enabled"]
+    assert conn_mock.subscribe.call_count == 1
+    binding.clean_up()
+
+
+
+def test_buffer_while_disconnected():
+    status_list = []
+    conn_mock = mock.Mock()
+    conn_mock.connect.side_effect = OSError("Connection refused")
+    binding = get_binding(conn_mock, status_list)
+    binding.listen("/queue/agent")
+
+    assert not binding.is_connected()
+    assert status_list == ["Connecting", "ServerNotPresent"]
+    assert conn_mock.subscribe.call_count == 0
+
+    binding.send_msg(b"MSG1", "/queue/controller")
+    assert conn_mock.send.call_count == 0
+
+    # The Broker comes back: re-subscribe and flush the buffered message
+    conn_mock.connect.side_effect = None
+    with mock.patch("stomp.Connection12", return_value=conn_mock):
+        assert binding.connect()
+    assert status_list[-1] == "Enabled"
+    assert conn_mock.subscribe.call_count == 1
+    assert conn_mock.send.call_count == 1
+    assert conn_mock.send.call_args[0][:2] == ("/queue/controller", b"MSG1")
+    binding.clean_up()
+
+
+
+def test_buffer_is_bounded():
+    status_list = []
+    conn_mock = mock.Mock()
+    conn_mock.connect.side_effect = OSError("Connection refused")
+    binding = get_binding(conn_mock, status_list, outbound_buffer_size=2)
+
+    for index in range(3):
+        binding.send_msg(str(index).encode("utf-8"), "/queue/controller")
+
+    conn_mock.connect.side_effect = None
+    with mock.patch("stomp.Connection12", return_value=conn_mock):
+        binding.connect()
+
+    sent_payloads = [call[0][1] for call in conn_mock.send.call_args_list]
+    assert sent_payloads == [b"1", b"2"]
+    binding.clean_up()
+
+
+
+def test_ack_from_previous_session():
+    status_list = []
+    conn_mock = mock.Mock()
+    binding = get_binding(conn_mock, status_list, ack_mode=stomp_usp_binding.CLIENT_INDIVIDUAL_ACK_MODE)
+    old_ack_id = binding.build_ack_id("ACK-1")
+
+    binding.on_disconnected()
+    assert status_list[-1] == "Connecting"
+    with mock.patch("stomp.Connection12", return_value=conn_mock):
+        binding.connect()
+    binding.ack_msg_id(old_ack_id)
+    binding.ack_msg_id(binding.build_ack_id("ACK-2"))
+
+    assert conn_mock.ack.call_count == 1
+    assert conn_mock.ack.call_args[0][0] == "ACK-2"
+    binding.clean_up()
+
+
+
+def test_status_once_per_outage():
+    status_list = []
+    conn_mock = mock.Mock()
+    binding = get_binding(conn_mock, status_list)
+
+    # Every retry during the outage fails, but Connecting is only reported when the outage starts
+    binding.on_disconnected()
+    conn_mock.connect.side_effect = OSError("Connection refused")
+    with mock.patch("stomp.Connection12", return_value=conn_mock):
+        for _attempt in range(3):
+            assert not binding.connect()
+
+        conn_mock.connect.side_effect = None
+        assert binding.connect()
+
+    assert status_list == ["Connecting", "Enabled", "Connecting", "ServerNotPresent", "Enabled"]
+    binding.clean_up()
+
+
+
+def test_reconnect_uses_new_connection():
+    status_list = []
+    old_conn_mock = mock.Mock()
+    new_conn_mock = mock.Mock()
+    binding = get_binding(old_conn_mock, status_list)
+    binding.listen("/queue/agent")
+
+    binding.on_disconnected()
+    with mock.patch("stomp.Connection12", return_value=new_conn_mock):
+        assert binding.connect()
+
+    # The stopped Connection is discarded instead of being started again
+    assert old_conn_mock.start.call_count == 1
+    assert old_conn_mock.transport.disconnect_socket.call_count == 1
+    assert new_conn_mock.start.call_count == 1
+    assert new_conn_mock.subscribe.call_count == 1
+    binding.clean_up()
+
+
+
+def test_flush_failure_keeps_order():
+    status_list = []
+    conn_mock = mock.Mock()
+    conn_mock.connect.side_effect = OSError("Connection refused")
+    binding = get_binding(conn_mock, status_list)
+
+    for index in range(3):
+        binding.send_msg(str(index).encode("utf-8"), "/queue/controller")
+
+    # The second message fails, so it goes back to the head of the buffer and the flush stops
+    conn_mock.connect.side_effect = None
+    conn_mock.send.side_effect = [None, OSError("Broken pipe")]
+    with mock.patch("stomp.Connection12", return_value=conn_mock):
+        binding.connect()
+    assert [call[0][1] for call in conn_mock.send.call_args_list] == [b"0", b"1"]
+
+    conn_mock.send.side_effect = None
+    with mock.patch("stomp.Connection12", return_value=conn_mock):
+        binding.connect()
+    assert [call[0][1] for call in conn_mock.send.call_args_list] == [b"0", b"1", b"1", b"2"]
+    binding.clean_up()
+
+
+
+def test_send_waits_behind_buffer():
+    status_list = []
+    conn_mock = mock.Mock()
+    conn_mock.connect.side_effect = OSError("Connection refused")
+    binding = get_binding(conn_mock, status_list)
+    binding.send_msg(b"OLD", "/queue/controller")
+
+    # Connected, but the buffer hasn't been flushed yet: the new message must not overtake the buffered one
+    binding._connected = True
+    binding.send_msg(b"NEW", "/queue/controller")
+    assert conn_mock.send.call_count == 0
+
+    binding._flush_outbound_buffer()
+    assert [call[0][1] for call in conn_mock.send.call_args_list] == [b"OLD", b"NEW"]
+    binding.clean_up()
+
+
+
+def test_batch_failure_reconnects():
+    status_list = []
+    conn_mock = mock.Mock()
+    conn_mock.transport.listeners = {}
+    conn_mock.transport.send.side_effect = OSError("Broken pipe")
+    binding = get_binding(conn_mock, status_list, batch_window=0.01)
+    binding._reconnect_thread = mock.Mock()
+
+    # The failed batch is buffered, and the receiving Connection (which the Batcher writes to) re-connected
+    binding.send_msg(b"MSG1", "/queue/controller")
+    for _attempt in range(500):
+        if not binding.is_connected():
+            break
+        time.sleep(0.01)
+
+    assert not binding.is_connected()
+    assert binding._reconnect_thread.trigger.call_count == 1
+    assert status_list[-1] == "Connecting"
+
+    conn_mock.transport.send.side_effect = None
+    with mock.patch("stomp.Connection12", return_value=conn_mock):
+        assert binding.connect()
+    binding.clean_up()
+    assert b"MSG1" in conn_mock.transport.send.call_args[0][0]
+
+
+
+def test_reconnect_delay():
+    thread = stomp_usp_binding.StompReconnectThread(None, min_delay=1, max_delay=30)
+
+    for attempt in range(10):
+        expected_delay = min(30, 2 ** attempt)
+        delay = thread.get_delay(attempt)
+        assert expected_delay / 2 <= delay <= expected_delay
+
+
+
+def test_send_pool_keeps_destination_order():
+    conn_list = []
+
+    def conn_factory():
+        conn_list.append(mock.Mock())
+        conn_list[-1].transport.listeners = {}
+        return conn_list[-1]
+
+    pool = stomp_usp_binding.StompSendConnectionPool(conn_factory, mock.Mock(), 3)
+    pool.connect()
+    destinations = ["/queue/controller-" + str(index) for index in range(6)]
+
+    for msg_num in range(5):
+        for dest in destinations:
+            pool.send(dest, (dest + ":" + str(msg_num)).encode("utf-8"), "text/plain", {})
+
+    pool.clean_up()
+
+    assert pool.is_connected()
+    assert len(conn_list) == 3
+    for dest in destinations:
+        sent_data = b"".join(call[0][0] for call in conn_list[pool.get_index(dest)].transport.send.call_args_list)
+        positions = [sent_data.index((dest + ":" + str(msg_num)).encode("utf-8")) for msg_num in range(5)]
+        assert positions == sorted(positions)
+
+
+
+def test_send_pool_failure():
+    failed_list = []
+    conn_mock = mock.Mock()
+    conn_mock.transport.listeners = {}
+    conn_mock.transport.send.side_effect = OSError("Broken pipe")
+    pool = stomp_usp_binding.StompSendConnectionPool(lambda: conn_mock, mock.Mock(), 1,
+                                                     failure_callback=lambda dest, body: failed_list.append(body))
+    pool.connect()
+    pool.send("/queue/controller", b"MSG1", "text/plain", {})
+    pool.clean_up()
+
+    assert not pool.is_connected()
+    assert failed_list == [b"MSG1"]
@@ -0,0 +1,132 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+
+
+"""
+#
+# File Name: test_subscription_reconciliation.py
+#
+# Description: Unit tests for the Subscription Handling of the AbstractAgent
+#
+# Functionality: Test that changes to the Subscription and Controller Tables only add/remove the
+#                 Notifications of the affected Subscriptions
+#
+"""
+
+import os
+import shutil
+import tempfile
+import unittest.mock as mock
+
+from agent import abstract_agent
+from agent import notif_sender_pool
+
+
+class StompTestAgent(abstract_agent.AbstractAgent):
+    """An Agent that records its Notification Senders and Periodic Notification Handlers"""
+    def __init__(self, dm_file, db_file, cfg_file_name):
+        abstract_agent.AbstractAgent.__init__(self, dm_file, db_file, "lo", cfg_file_name)
+        self._periodic_notif_scheduler = mock.Mock()
+        self.set_value_change_notif_poller(mock.Mock())
+
+    def clean_up(self):
+        self._notif_outbox.close()
+
+    def _get_supported_protocol(self):
+        return "STOMP"
+
+    def _get_notification_sender(self, notif, controller_id, mtp_param_path):
+        return notif_sender_pool.NotificationSender(notif, None)
+
+    def _get_periodic_notif_handler(self, agent_id, controller_id, mtp_param_path, subscription_id, param_path):
+        return mock.Mock(controller_id=controller_id, subscription_id=subscription_id)
+
+
+
+def get_boot_subscription_ids(agent):
+    return sorted(sender.get_subscription_id() for sender in agent._boot_notif_sender_list)
+
+
+
+def test_controller_enable_adds_and_removes_its_subscriptions():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, "test-db.json")
+        shutil.copyfile("database/test-db.json", db_file)
+        agent = StompTestAgent("database/test-dm.json", db_file, os.path.join(tmp_dir, "agent.json"))
+        database = agent.get_database()
+        scheduler = agent._periodic_notif_scheduler
+
+        try:
+            agent.init_subscriptions()
+            boot_sub_id_list = get_boot_subscription_ids(agent)
+            num_periodic_handlers = scheduler.add_handler.call_count
+
+            # Enabling Controller 1 only adds its Boot and Periodic Subscriptions
+            database.update("Device.LocalAgent.Controller.1.Enable", True)
+            assert get_boot_subscription_ids(agent) == sorted(boot_sub_id_list + ["sub-boot-stomp-ctrl-1"])
+            assert scheduler.add_handler.call_count == num_periodic_handlers + 1
+            periodic_handler = scheduler.add_handler.call_args[0][0]
+            assert periodic_handler.subscription_id == "sub-periodic-stomp-ctrl-1"
+            assert scheduler.remove_handler.call_count == 0
+
+            # A change to an unrelated Controller Parameter doesn't re-process anything
+            database.update("Device.LocalAgent.Controller.1.PeriodicNotifInterval", 30)
+            assert scheduler.add_handler.call_count == num_periodic_handlers + 1
+
+            # Disabling a Subscription only removes its own Notifications
+            database.update("Device.LocalAgent.Subscription.2.Enable", False)
+            scheduler.remove_handler.assert_called_once_with(periodic_handler)
+            assert "sub-boot-stomp-ctrl-1" in get_boot_subscription_ids(agent)
+
+            # Disabling the Controller removes the rest
+            database.update("Device.LocalAgent.Controller.1.Enable", False)
+            assert get_boot_subscription_ids(agent) == boot_sub_id_list
+        finally:
+            agent.clean_up()
+
+
+
+def test_value_change_subscription_rewired_on_reference_list_change():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, "test-db.json")
+        shutil.copyfile("database/test-db.json", db_file)
+        agent = StompTestAgent("database/test-dm.json", db_file, os.path.join(tmp_dir, "agent.json"))
+        database = agent.get_database()
+        poller = agent.get_value_change_notif_poller()
+        sub_path = "Device.LocalAgent.Subscription.1."
+
+        try:
+            agent.init_subscriptions()
+            database.update("Device.LocalAgent.Controller.1.Enable", True)
+            database.update(sub_path + "NotifType", "ValueChange")
+            database.update(sub_path + "ReferenceList", "Device.LocalAgent.UpTime")
+            poller.add_param.assert_called_with("Device.LocalAgent.UpTime", agent._endpoint_id,
+                                                "controller-stomp-johnb", "Device.LocalAgent.Controller.1.MTP.1.",
+                                                "sub-boot-stomp-ctrl-1", 0)
+
+            database.update(sub_path + "ReferenceList", "Device.DeviceInfo.SoftwareVersion")
+            poller.remove_param.assert_called_with("Device.LocalAgent.UpTime", "controller-stomp-johnb",
+                                                   "Device.LocalAgent.Controller.1.MTP.1.", "sub-boot-stomp-ctrl-1")
+            assert poller.add_param.call_args[0][0] == "Device.DeviceInfo.SoftwareVersion"
+        finally:
+            agent.clean_up()
@@ -0,0 +1,172 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+
+"""
+#
+# File Name: test_uds_usp_binding.py
+#
+# Description: Unit tests for the uds_usp_binding module
+#
+# Functionality: Test the UdsUspBinding Class with two Bindings talking to each other
+#
+"""
+
+import os
+import socket
+import struct
+import tempfile
+
+from agent import uds_usp_binding
+from agent import usp_record_pb2 as usp_record
+
+
+def get_record(to_id, from_id, payload=b"\x0a\x02\x08\x01"):
+    record = usp_record.Record()
+    record.version = "1.0"
+    record.to_id = to_id
+    record.from_id = from_id
+    record.payload_security = usp_record.Record.PLAINTEXT
+    record.no_session_context.payload = payload
+    return record.SerializeToString()
+
+
+
+def test_request_response_over_one_connection():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        agent_path = os.path.join(tmp_dir, "agent.sock")
+        agent = uds_usp_binding.UdsUspBinding("AGENT-ID", agent_path)
+        controller = uds_usp_binding.UdsUspBinding("CONTROLLER-ID", os.path.join(tmp_dir, "controller.sock"))
+
+        try:
+            agent.listen(agent_path)
+
+            # The Controller connects to the Agent and sends a Request
+            request = get_record("AGENT-ID", "CONTROLLER-ID")
+            controller.send_msg(request, agent_path)
+            queue_item = agent.get_msg(5)
+            assert queue_item.get_payload() == request
+            assert queue_item.get_reply_to_addr() == "CONTROLLER-ID"
+
+            # The Agent answers over the same connection using the Controller's Endpoint ID
+            response = get_record("CONTROLLER-ID", "AGENT-ID", b"\x0a\x02\x08\x02" * 1000)
+            agent.send_msg(response, queue_item.get_reply_to_addr())
+            queue_item = controller.get_msg(5)
+            assert queue_item.get_payload() == response
+            assert queue_item.get_reply_to_addr() == "AGENT-ID"
+        finally:
+            controller.clean_up()
+            agent.clean_up()
+
+        assert not os.path.exists(agent_path)
+
+
+
+def test_misaddressed_record_dropped():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        agent_path = os.path.join(tmp_dir, "agent.sock")
+        agent = uds_usp_binding.UdsUspBinding("AGENT-ID", agent_path)
+        controller = uds_usp_binding.UdsUspBinding("CONTROLLER-ID", os.path.join(tmp_dir, "controller.sock"))
+
+        try:
+            agent.listen(agent_path)
+            controller.send_msg(get_record("OTHER-AGENT-ID", "CONTROLLER-ID"), agent_path)
+
+            assert agent.get_msg(0.2) is None
+        finally:
+            controller.clean_up()
+            agent.clean_up()
+
+
+
+def test_unknown_controller_dropped():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        agent_path = os.path.join(tmp_dir, "agent.sock")
+        agent = uds_usp_binding.UdsUspBinding("AGENT-ID", agent_path,
+                                              controller_validator=lambda endpoint_id: endpoint_id == "CTRL-1")
+        controller = uds_usp_binding.UdsUspBinding("CTRL-2", os.path.join(tmp_dir, "controller.sock"))
+
+        try:
+            agent.listen(agent_path)
+            controller.send_msg(get_record("AGENT-ID", "CTRL-2"), agent_path)
+
+            assert agent.get_msg(0.2) is None
+        finally:
+            controller.clean_up()
+            agent.clean_up()
+
+
+
+def test_open_connection_not_hijacked():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        agent_path = os.path.join(tmp_dir, "agent.sock")
+        agent = uds_usp_binding.UdsUspBinding("AGENT-ID", agent_path)
+        controller = uds_usp_binding.UdsUspBinding("CTRL-1", os.path.join(tmp_dir, "controller.sock"))
+        impostor = uds_usp_binding.UdsUspBinding("IMPOSTOR-ID", os.path.join(tmp_dir, "impostor.sock"))
+
+        try:
+            agent.listen(agent_path)
+            controller.send_msg(get_record("AGENT-ID", "CTRL-1"), agent_path)
+            assert agent.get_msg(5).get_reply_to_addr() == "CTRL-1"
+
+            # A second connection claiming the same Endpoint ID is ignored while the first one is open
+            impostor.send_msg(get_record("AGENT-ID", "CTRL-1"), agent_path)
+            assert agent.get_msg(0.2) is None
+
+            agent.send_msg(get_record("CTRL-1", "AGENT-ID"), "CTRL-1")
+            assert controller.get_msg(5) is not None
+            assert impostor.get_msg(0.2) is None
+        finally:
+            impostor.clean_up()
+            controller.clean_up()
+            agent.clean_up()
+
+
+
+def test_oversized_record_closes_connection():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        agent_path = os.path.join(tmp_dir, "agent.sock")
+        agent = uds_usp_binding.UdsUspBinding("AGENT-ID", agent_path, max_record_size=64)
+        client_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        try:
+            agent.listen(agent_path)
+            client_sock.connect(agent_path)
+            client_sock.settimeout(5)
+            client_sock.sendall(struct.pack("!I", 65))
+
+            assert client_sock.recv(1) == b""
+            assert agent.get_msg(0.1) is None
+        finally:
+            client_sock.close()
+            agent.clean_up()
+
+
+
+def test_send_to_unknown_endpoint():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        agent = uds_usp_binding.UdsUspBinding("AGENT-ID", os.path.join(tmp_dir, "agent.sock"))
+
+        # Not a Socket Path and no open connection, so the message is dropped (and logged)
+        agent.send_msg(get_record("CONTROLLER-ID", "AGENT-ID"), "CONTROLLER-ID")
+        assert not agent.open_connection(os.path.join(tmp_dir, "missing.sock"))
+        agent.clean_up()
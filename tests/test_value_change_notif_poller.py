@@ -0,0 +1,241 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+
+"""
+#
+# File Name: test_value_change_notif_poller.py
+#
+# Description: Unit tests for the AbstractValueChangeNotifPoller
+#
+# Functionality: Test that Database updates drive ValueChange Notifications, and that only
+#                 computed Parameters are polled
+#
+"""
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest.mock as mock
+
+from agent import agent_db
+from agent import value_change_notif_poller
+
+
+class RecordingPoller(value_change_notif_poller.AbstractValueChangeNotifPoller):
+    """Record the ValueChanges instead of sending Notifications"""
+    def __init__(self, agent_db, poll_duration=0.5):
+        value_change_notif_poller.AbstractValueChangeNotifPoller.__init__(self, agent_db, poll_duration)
+        self.daemon = True
+        self.value_change_list = []
+        self.value_change_batch_list = []
+        self.value_change_event = threading.Event()
+
+    def _handle_value_change(self, param, value, to_id, from_id, subscription_id, mtp_param_path):
+        self.value_change_list.append((param, value, subscription_id))
+        self.value_change_event.set()
+
+    def _handle_value_change_batch(self, param_value_dict, to_id, from_id, subscription_id, mtp_param_path):
+        self.value_change_batch_list.append((param_value_dict, to_id, subscription_id))
+        self.value_change_event.set()
+
+
+def get_db_mock(value_dict, computed_list):
+    db_mock = mock.Mock()
+    db_mock.get.side_effect = lambda path: value_dict[path]
+    db_mock.is_computed.side_effect = lambda path: path in computed_list
+    return db_mock
+
+
+
+def test_update_sends_value_change():
+    value_dict = {"Device.Test.Param": "1"}
+    db_mock = get_db_mock(value_dict, [])
+    poller = RecordingPoller(db_mock, poll_duration=60)
+    update_listener = db_mock.add_update_listener.call_args[0][0]
+
+    poller.add_param("Device.Test.Param", "AGENT-ID", "CONTROLLER-ID", "MTP.", "SUB-1")
+    poller.start()
+
+    # An update to an unmonitored Parameter, or to the same value, doesn't send a Notification
+    update_listener("Device.Test.Other", "2")
+    update_listener("Device.Test.Param", "1")
+    update_listener("Device.Test.Param", "2")
+
+    assert poller.value_change_event.wait(5)
+    assert poller.value_change_list == [("Device.Test.Param", "2", "SUB-1")]
+
+    # The monitored Parameter isn't computed, so the Database isn't polled for it
+    assert db_mock.get.call_count == 1
+
+
+
+def test_computed_param_polled():
+    value_dict = {"Device.LocalAgent.UpTime": 1}
+    db_mock = get_db_mock(value_dict, ["Device.LocalAgent.UpTime"])
+    poller = RecordingPoller(db_mock, poll_duration=0.01)
+
+    poller.add_param("Device.LocalAgent.UpTime", "AGENT-ID", "CONTROLLER-ID", "MTP.", "SUB-1")
+    poller.start()
+    time.sleep(0.05)
+    assert not poller.value_change_list
+
+    value_dict["Device.LocalAgent.UpTime"] = 2
+    assert poller.value_change_event.wait(5)
+    assert poller.value_change_list == [("Device.LocalAgent.UpTime", 2, "SUB-1")]
+
+
+
+def test_value_change_fans_out_to_subscribers():
+    value_dict = {"Device.Test.Param": "1"}
+    db_mock = get_db_mock(value_dict, [])
+    poller = RecordingPoller(db_mock, poll_duration=60)
+    update_listener = db_mock.add_update_listener.call_args[0][0]
+
+    poller.add_param("Device.Test.Param", "AGENT-ID", "CONTROLLER-1", "MTP.", "SUB-1")
+    poller.add_param("Device.Test.Param", "AGENT-ID", "CONTROLLER-2", "MTP.", "SUB-2")
+    poller.add_param("Device.Test.Param", "AGENT-ID", "CONTROLLER-3", "MTP.", "SUB-3")
+    poller.remove_param("Device.Test.Param", "CONTROLLER-2", "MTP.", "SUB-2")
+
+    # The value is only read once, when the first Subscriber is added
+    assert db_mock.get.call_count == 1
+
+    update_listener("Device.Test.Param", "2")
+    poller.start()
+    assert poller.value_change_event.wait(5)
+    time.sleep(0.05)
+    assert sorted(poller.value_change_list) == [("Device.Test.Param", "2", "SUB-1"),
+                                                ("Device.Test.Param", "2", "SUB-3")]
+
+    # Once the last Subscriber is removed, updates are ignored
+    poller.remove_param("Device.Test.Param")
+    update_listener("Device.Test.Param", "3")
+    time.sleep(0.05)
+    assert len(poller.value_change_list) == 2
+
+
+
+def test_wildcard_reference_follows_inserts_and_deletes():
+    pic_path = "Device.Services.HomeAutomation.1.Camera.1.Pic."
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = os.path.join(tmp_dir, "camera-db.json")
+        shutil.copyfile("database/camera-db.json", db_file)
+        database = agent_db.Database("database/camera-dm.json", db_file, "lo")
+        poller = RecordingPoller(database, poll_duration=60)
+
+        assert poller.add_reference(pic_path + "*.URL", "AGENT-ID", "CONTROLLER-ID", "MTP.", "SUB-1") == []
+
+        # A new Pic instance is subscribed to as soon as it is inserted
+        poller.start()
+        inst_num = database.insert(pic_path)
+        database.update(pic_path + str(inst_num) + ".URL", "http://pic")
+        assert poller.value_change_event.wait(5)
+        assert poller.value_change_list == [(pic_path + str(inst_num) + ".URL", "http://pic", "SUB-1")]
+
+        # ...and unsubscribed from once it is deleted
+        database.delete(pic_path + str(inst_num) + ".")
+        assert not poller._subscriber_dict
+
+
+
+def test_changes_within_min_interval_coalesced():
+    value_dict = {"Device.Test.Param": "1"}
+    db_mock = get_db_mock(value_dict, [])
+    poller = RecordingPoller(db_mock, poll_duration=60)
+
+    poller.add_param("Device.Test.Param", "AGENT-ID", "CONTROLLER-1", "MTP.", "SUB-FAST")
+    poller.add_param("Device.Test.Param", "AGENT-ID", "CONTROLLER-2", "MTP.", "SUB-SLOW", min_interval=10)
+
+    with mock.patch("time.time", return_value=1000):
+        poller._check_value("Device.Test.Param", "2")
+    with mock.patch("time.time", return_value=1001):
+        poller._check_value("Device.Test.Param", "3")
+        poller._check_value("Device.Test.Param", "4")
+        poller._send_pending()
+
+    # Both Subscribers get the first change; only SUB-FAST gets the changes within SUB-SLOW's interval
+    assert poller.value_change_list == [("Device.Test.Param", "2", "SUB-FAST"), ("Device.Test.Param", "2", "SUB-SLOW"),
+                                        ("Device.Test.Param", "3", "SUB-FAST"), ("Device.Test.Param", "4", "SUB-FAST")]
+
+    # Once the interval has passed SUB-SLOW gets the latest value
+    with mock.patch("time.time", return_value=1010):
+        poller._send_pending()
+
+    assert poller.value_change_list[4:] == [("Device.Test.Param", "4", "SUB-SLOW")]
+    assert not poller._pending_dict
+
+
+
+def test_value_changes_batched_per_controller():
+    value_dict = {"Device.Test.Param1": "1", "Device.Test.Param2": "1", "Device.Test.Param3": "1"}
+    db_mock = get_db_mock(value_dict, [])
+    poller = RecordingPoller(db_mock, poll_duration=60)
+    poller.set_batch_window(1)
+    update_listener = db_mock.add_update_listener.call_args[0][0]
+
+    poller.add_param("Device.Test.Param1", "AGENT-ID", "CONTROLLER-1", "MTP.", "SUB-1")
+    poller.add_param("Device.Test.Param2", "AGENT-ID", "CONTROLLER-1", "MTP.", "SUB-1")
+    poller.add_param("Device.Test.Param3", "AGENT-ID", "CONTROLLER-2", "MTP.", "SUB-2")
+    poller.start()
+
+    update_listener("Device.Test.Param1", "2")
+    update_listener("Device.Test.Param2", "2")
+    update_listener("Device.Test.Param1", "3")
+    update_listener("Device.Test.Param3", "2")
+
+    time.sleep(0.1)
+    assert not poller.value_change_event.is_set()
+
+    time.sleep(1.5)
+    # The latest value of each Parameter is batched for CONTROLLER-1; a batch of one is a plain ValueChange
+    assert poller.value_change_batch_list == [({"Device.Test.Param1": "3", "Device.Test.Param2": "2"},
+                                               "CONTROLLER-1", "SUB-1")]
+    assert poller.value_change_list == [("Device.Test.Param3", "2", "SUB-2")]
+
+
+
+def test_route_resolved_once_until_invalidated():
+    db_mock = get_db_mock({}, [])
+    poller = RecordingPoller(db_mock, poll_duration=60)
+    update_listener = db_mock.add_update_listener.call_args[0][0]
+    binding = mock.Mock()
+    poller._resolve_route = mock.Mock(side_effect=[None, (binding, "ADDR-1"), (binding, "ADDR-2")])
+    mtp_path = "Device.LocalAgent.Controller.1.MTP.1."
+
+    # A Route that can't be resolved isn't cached
+    poller.send_record(b"RECORD-1", "CONTROLLER-1", mtp_path)
+    poller.send_record(b"RECORD-2", "CONTROLLER-1", mtp_path)
+    poller.send_record(b"RECORD-3", "CONTROLLER-1", mtp_path)
+    assert poller._resolve_route.call_count == 2
+
+    # Only a change to the Controller, MTP, or STOMP Tables resolves the Route again
+    update_listener("Device.Test.Param", "2")
+    poller.send_record(b"RECORD-4", "CONTROLLER-1", mtp_path)
+    update_listener(mtp_path + "STOMP.Reference", "Device.STOMP.Connection.2")
+    poller.send_record(b"RECORD-5", "CONTROLLER-1", mtp_path)
+    assert poller._resolve_route.call_count == 3
+
+    assert binding.send_msg.call_args_list == [mock.call(b"RECORD-2", "ADDR-1"), mock.call(b"RECORD-3", "ADDR-1"),
+                                               mock.call(b"RECORD-4", "ADDR-1"), mock.call(b"RECORD-5", "ADDR-2")]
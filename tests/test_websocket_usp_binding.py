@@ -0,0 +1,137 @@
+# Copyright (c) 2016 John Blackford
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+
+"""
+#
+# File Name: test_websocket_usp_binding.py
+#
+# Description: Unit tests for the websocket_usp_binding module
+#
+# Functionality: Test the WebSocketUspBinding Class with two Bindings talking to each other
+#
+"""
+
+from agent import websocket_usp_binding
+from agent import usp_record_pb2 as usp_record
+
+
+def get_record(to_id, from_id, payload=b"\x0a\x02\x08\x01"):
+    record = usp_record.Record()
+    record.version = "1.0"
+    record.to_id = to_id
+    record.from_id = from_id
+    record.payload_security = usp_record.Record.PLAINTEXT
+    record.no_session_context.payload = payload
+    return record.SerializeToString()
+
+
+
+def test_request_response_over_one_connection():
+    agent = websocket_usp_binding.WebSocketUspBinding("AGENT-ID", "127.0.0.1", 0)
+    controller = websocket_usp_binding.WebSocketUspBinding("CONTROLLER-ID", "127.0.0.1", 0)
+
+    try:
+        agent.listen("ws://127.0.0.1/usp")
+        agent_url = "ws://127.0.0.1:{}/usp".format(agent.get_port())
+
+        # The Controller connects to the Agent and sends a Request
+        controller.send_msg(get_record("AGENT-ID", "CONTROLLER-ID"), agent_url)
+        queue_item = agent.get_msg(5)
+        assert queue_item.get_reply_to_addr() == "CONTROLLER-ID"
+
+        # The Agent answers over the same connection using the Controller's Endpoint ID
+        agent.send_msg(get_record("CONTROLLER-ID", "AGENT-ID"), queue_item.get_reply_to_addr())
+        queue_item = controller.get_msg(5)
+        assert queue_item.get_reply_to_addr() == agent_url
+    finally:
+        controller.clean_up()
+        agent.clean_up()
+
+
+
+def test_misaddressed_record_dropped():
+    agent = websocket_usp_binding.WebSocketUspBinding("AGENT-ID", "127.0.0.1", 0)
+    controller = websocket_usp_binding.WebSocketUspBinding("CONTROLLER-ID", "127.0.0.1", 0)
+
+    try:
+        agent.listen("ws://127.0.0.1/usp")
+        agent_url = "ws://127.0.0.1:{}/usp".format(agent.get_port())
+        controller.send_msg(get_record("OTHER-AGENT-ID", "CONTROLLER-ID"), agent_url)
+
+        assert agent.get_msg(0.2) is None
+    finally:
+        controller.clean_up()
+        agent.clean_up()
+
+
+
+def test_send_to_unknown_endpoint():
+    agent = websocket_usp_binding.WebSocketUspBinding("AGENT-ID", "127.0.0.1", 0)
+
+    try:
+        # Not a URL and no open connection, so the message is dropped (and logged)
+        agent.send_msg(get_record("CONTROLLER-ID", "AGENT-ID"), "CONTROLLER-ID")
+        assert not agent.open_connection("ws://127.0.0.1:1/usp")
+    finally:
+        agent.clean_up()
+
+
+
+def test_unknown_controller_dropped():
+    agent = websocket_usp_binding.WebSocketUspBinding("AGENT-ID", "127.0.0.1", 0,
+                                                      controller_validator=lambda endpoint_id: endpoint_id == "CTRL-1")
+    controller = websocket_usp_binding.WebSocketUspBinding("CTRL-2", "127.0.0.1", 0)
+
+    try:
+        agent.listen("ws://127.0.0.1/usp")
+        agent_url = "ws://127.0.0.1:{}/usp".format(agent.get_port())
+        controller.send_msg(get_record("AGENT-ID", "CTRL-2"), agent_url)
+
+        assert agent.get_msg(0.2) is None
+    finally:
+        controller.clean_up()
+        agent.clean_up()
+
+
+
+def test_open_connection_not_hijacked():
+    agent = websocket_usp_binding.WebSocketUspBinding("AGENT-ID", "127.0.0.1", 0)
+    controller = websocket_usp_binding.WebSocketUspBinding("CTRL-1", "127.0.0.1", 0)
+    impostor = websocket_usp_binding.WebSocketUspBinding("IMPOSTOR-ID", "127.0.0.1", 0)
+
+    try:
+        agent.listen("ws://127.0.0.1/usp")
+        agent_url = "ws://127.0.0.1:{}/usp".format(agent.get_port())
+        controller.send_msg(get_record("AGENT-ID", "CTRL-1"), agent_url)
+        assert agent.get_msg(5).get_reply_to_addr() == "CTRL-1"
+
+        # A second connection claiming the same Endpoint ID is ignored while the first one is open
+        impostor.send_msg(get_record("AGENT-ID", "CTRL-1"), agent_url)
+        assert agent.get_msg(0.2) is None
+
+        agent.send_msg(get_record("CTRL-1", "AGENT-ID"), "CTRL-1")
+        assert controller.get_msg(5) is not None
+        assert impostor.get_msg(0.2) is None
+    finally:
+        impostor.clean_up()
+        controller.clean_up()
+        agent.clean_up()